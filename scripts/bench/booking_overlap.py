@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Concurrency test for overlap-safe booking (no_overlapping_appointments).
+
+Seeds a throwaway tenant with --professionals professionals offering one
+--duration minute service, then lets --workers connections book at once:
+every attempt calls create_appointment() for a random start on a 15-minute
+grid of --slots starts, so most candidate appointments overlap their
+neighbours. After the run the table is checked directly: no two active
+appointments of a professional may overlap, and every successful call must
+match exactly one stored appointment. Reports booking latency, the conflict
+rate and the latency of the local availability probe (is_slot_available).
+
+Usage:
+    python scripts/bench/booking_overlap.py --workers 16 --attempts 200
+    python scripts/bench/booking_overlap.py --professionals 1 --slots 8 --json booking_bench.json
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+from common import BENCH_SLUG_PREFIX, get_conn, print_table, summarize, write_json
+
+SLOT_STEP_MINUTES = 15
+
+
+def seed(cur, professionals: int, duration: int) -> Dict:
+    """Create a bench tenant, one service and professionals offering it."""
+    run_id = uuid.uuid4().hex[:8]
+    slug = f"{BENCH_SLUG_PREFIX}booking-{run_id}"
+    cur.execute(
+        """
+        INSERT INTO tenant_config (
+            tenant_name, tenant_slug, evolution_instance_name, clinic_name,
+            system_prompt_patient, system_prompt_internal, system_prompt_confirmation
+        ) VALUES (%s, %s, %s, %s, '-', '-', '-')
+        RETURNING tenant_id
+        """,
+        (slug, slug, slug, slug),
+    )
+    tenant_id = str(cur.fetchone()[0])
+    cur.execute(
+        """
+        INSERT INTO services_catalog (service_code, service_name, service_category,
+                                      service_keywords, default_duration_minutes)
+        VALUES (%s, 'Bench booking', 'bench', ARRAY['bench'], %s)
+        RETURNING service_id
+        """,
+        (f"BENCH-{run_id}", duration),
+    )
+    service_id = str(cur.fetchone()[0])
+    cur.execute(
+        """
+        INSERT INTO professionals (tenant_id, professional_name, professional_slug, specialty)
+        SELECT %s, 'Dr(a). Bench ' || i, 'bench-' || i, 'bench'
+        FROM generate_series(1, %s) AS i
+        RETURNING professional_id
+        """,
+        (tenant_id, professionals),
+    )
+    professional_ids = [str(r[0]) for r in cur.fetchall()]
+    cur.execute(
+        """
+        INSERT INTO professional_services (professional_id, service_id, custom_duration_minutes,
+                                           custom_price_cents, price_display)
+        SELECT unnest(%s::uuid[]), %s, %s, 10000, 'R$ 100,00'
+        """,
+        (professional_ids, service_id, duration),
+    )
+    return {"run_id": run_id, "tenant_id": tenant_id, "service_id": service_id,
+            "professional_ids": professional_ids}
+
+
+def cleanup(cur, data: Dict):
+    """Remove the bench tenant (appointments first: professionals are RESTRICT)."""
+    cur.execute("DELETE FROM appointments WHERE tenant_id = %s", (data["tenant_id"],))
+    cur.execute("DELETE FROM tenant_config WHERE tenant_id = %s", (data["tenant_id"],))
+    cur.execute("DELETE FROM services_catalog WHERE service_id = %s", (data["service_id"],))
+
+
+def book(data: Dict, starts: List[datetime], workers: int, attempts: int,
+         seed_value: int) -> Tuple[Dict, List[str], Dict[str, int]]:
+    """All workers book random starts at once; returns latencies, ids and outcomes."""
+    barrier = threading.Barrier(workers)
+
+    def worker(n: int):
+        import psycopg2
+
+        rng = random.Random(seed_value * 1000 + n)
+        conn = get_conn()
+        conn.autocommit = True
+        samples, booked = [], []
+        outcomes = {"booked": 0, "conflict": 0, "error": 0}
+        try:
+            with conn.cursor() as cur:
+                barrier.wait()
+                for i in range(attempts):
+                    professional_id = rng.choice(data["professional_ids"])
+                    started = time.perf_counter()
+                    try:
+                        cur.execute(
+                            "SELECT appointment_id FROM create_appointment(%s, %s, %s, %s, %s, 'Bench', 'api')",
+                            (data["tenant_id"], professional_id, data["service_id"],
+                             rng.choice(starts), f"5511{n:04d}{i:05d}"),
+                        )
+                        booked.append(str(cur.fetchone()[0]))
+                        outcomes["booked"] += 1
+                    except psycopg2.Error as e:
+                        # 23P01 = exclusion_violation: the slot was taken first
+                        key = "conflict" if e.pgcode == "23P01" else "error"
+                        outcomes[key] += 1
+                        if key == "error" and outcomes["error"] == 1:
+                            print(f"  ⚠️  {type(e).__name__}: {str(e).strip()[:120]}", file=sys.stderr)
+                    samples.append((time.perf_counter() - started) * 1000.0)
+        finally:
+            conn.close()
+        return samples, booked, outcomes
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(worker, range(workers)))
+
+    samples = [ms for s, _, _ in results for ms in s]
+    booked = [a for _, b, _ in results for a in b]
+    outcomes = {k: sum(o[k] for _, _, o in results) for k in ("booked", "conflict", "error")}
+    return summarize(samples), booked, outcomes
+
+
+def verify(cur, data: Dict, booked: List[str]) -> Dict[str, int]:
+    """Overlapping active pairs and calls whose appointment is missing or extra."""
+    cur.execute(
+        """
+        SELECT COUNT(*)
+        FROM appointments a
+        JOIN appointments b
+          ON b.professional_id = a.professional_id
+         AND b.appointment_id > a.appointment_id
+         AND b.period && a.period
+        WHERE a.tenant_id = %s AND b.tenant_id = %s
+        AND a.deleted_at IS NULL AND a.status IN ('scheduled', 'confirmed', 'in_progress')
+        AND b.deleted_at IS NULL AND b.status IN ('scheduled', 'confirmed', 'in_progress')
+        """,
+        (data["tenant_id"], data["tenant_id"]),
+    )
+    overlaps = cur.fetchone()[0]
+    cur.execute(
+        "SELECT appointment_id::text FROM appointments WHERE tenant_id = %s AND deleted_at IS NULL",
+        (data["tenant_id"],),
+    )
+    stored = {r[0] for r in cur.fetchall()}
+    return {"overlaps": overlaps, "mismatched": len(stored.symmetric_difference(booked))}
+
+
+def probe(cur, data: Dict, starts: List[datetime], duration: int, iterations: int) -> Dict:
+    """Latency of the local "is this slot free?" answer after the run."""
+    rng = random.Random(7)
+    samples = []
+    for _ in range(iterations):
+        start = rng.choice(starts)
+        t0 = time.perf_counter()
+        cur.execute("SELECT is_slot_available(%s, %s, %s)",
+                    (rng.choice(data["professional_ids"]), start, start + timedelta(minutes=duration)))
+        cur.fetchone()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent booking test for overlapping appointments")
+    parser.add_argument("--professionals", type=int, default=3, help="Professionals sharing the slots")
+    parser.add_argument("--duration", type=int, default=30, help="Service duration in minutes")
+    parser.add_argument("--slots", type=int, default=32, help=f"Candidate starts, {SLOT_STEP_MINUTES} min apart")
+    parser.add_argument("--workers", type=int, default=16, help="Concurrent connections booking")
+    parser.add_argument("--attempts", type=int, default=100, help="Booking attempts per worker")
+    parser.add_argument("--probes", type=int, default=2000, help="is_slot_available calls to time")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    parser.add_argument("--json", metavar="PATH", help="Write results as JSON ('-' for stdout)")
+    parser.add_argument("--keep", action="store_true", help="Keep the bench tenant afterwards")
+    args = parser.parse_args()
+
+    # Far enough ahead not to meet real appointments or reminder jobs
+    first = (datetime.now(timezone.utc) + timedelta(days=400)).replace(hour=12, minute=0, second=0,
+                                                                        microsecond=0)
+    starts = [first + timedelta(minutes=SLOT_STEP_MINUTES * i) for i in range(args.slots)]
+
+    conn = get_conn()
+    conn.autocommit = True
+    data = None
+    try:
+        with conn.cursor() as cur:
+            data = seed(cur, args.professionals, args.duration)
+        print(f"Booking with {args.workers} workers x {args.attempts} attempts over "
+              f"{args.slots} starts and {args.professionals} professional(s)...", file=sys.stderr)
+        started = time.perf_counter()
+        results = {}
+        results["create_appointment"], booked, outcomes = book(data, starts, args.workers,
+                                                               args.attempts, args.seed)
+        elapsed = time.perf_counter() - started
+        with conn.cursor() as cur:
+            checks = verify(cur, data, booked)
+            results["is_slot_available"] = probe(cur, data, starts, args.duration, args.probes)
+    finally:
+        if data and not args.keep:
+            with conn.cursor() as cur:
+                cleanup(cur, data)
+        conn.close()
+
+    print_table(results)
+    print()
+    print(f"{'attempts':>9} {'booked':>7} {'conflicts':>10} {'errors':>7} {'overlaps':>9} "
+          f"{'mismatched':>11} {'calls/s':>9}")
+    print("─" * 70)
+    total = sum(outcomes.values())
+    print(f"{total:>9} {outcomes['booked']:>7} {outcomes['conflict']:>10} {outcomes['error']:>7} "
+          f"{checks['overlaps']:>9} {checks['mismatched']:>11} {total / elapsed if elapsed else 0:>9.1f}")
+
+    double_booked = bool(checks["overlaps"] or checks["mismatched"])
+    print("\n" + ("❌ Double booking detected" if double_booked else "✅ No double booking")
+          + (f" ({outcomes['error']} unexpected errors)" if outcomes["error"] else ""))
+    failed = double_booked or bool(outcomes["error"])
+    if args.json:
+        write_json(args.json, {"benchmark": "booking_overlap", "workers": args.workers,
+                               "attempts": args.attempts, "slots": args.slots,
+                               "professionals": args.professionals, "duration": args.duration,
+                               "results": results, "outcomes": outcomes, "checks": checks})
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
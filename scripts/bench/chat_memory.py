@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark chat memory reads before and after compaction.
+
+Seeds a throwaway tenant with one Postgres Chat Memory session per
+--lengths entry (a session with that many stored messages), then times the
+read the n8n memory node issues on every agent call (the whole session,
+ORDER BY id) for each length. Runs compact_chat_memory() to completion in
+--batch-size batches and times the reads again, plus the summary lookup the
+prompts add. After compaction every session holds the tenant's
+chat_memory_keep_messages rows, so read latency should no longer depend on
+the session's length.
+
+Usage:
+    python scripts/bench/chat_memory.py --lengths 10,100,1000,10000 --reads 200
+    python scripts/bench/chat_memory.py --keep 10 --json chat_memory_bench.json
+"""
+
+import argparse
+import sys
+import time
+import uuid
+from typing import Dict, List
+
+from common import BENCH_SLUG_PREFIX, get_conn, print_table, summarize, timed, write_json
+
+# What n8n's Postgres Chat Memory (LangChain PostgresChatMessageHistory) runs
+READ_QUERY = "SELECT message FROM n8n_chat_histories WHERE session_id = %s ORDER BY id"
+
+
+def seed(cur, lengths: List[int], keep: int) -> Dict:
+    """Create a bench tenant and one session per requested length."""
+    tenant_id = str(uuid.uuid4())
+    slug = f"{BENCH_SLUG_PREFIX}memory-{tenant_id[:8]}"
+    cur.execute(
+        """
+        INSERT INTO tenant_config (
+            tenant_id, tenant_name, tenant_slug, evolution_instance_name, clinic_name,
+            system_prompt_patient, system_prompt_internal, system_prompt_confirmation,
+            chat_memory_keep_messages
+        ) VALUES (%s, %s, %s, %s, %s, '-', '-', '-', %s)
+        """,
+        (tenant_id, slug, slug, slug, slug, keep),
+    )
+    sessions = {}
+    for length in lengths:
+        session_id = f"{tenant_id}_5511{length:09d}@s.whatsapp.net"
+        cur.execute(
+            """
+            INSERT INTO n8n_chat_histories (session_id, message)
+            SELECT %s, jsonb_build_object(
+                'type', CASE WHEN i %% 2 = 1 THEN 'human' ELSE 'ai' END,
+                'content', 'Mensagem ' || i || ' sobre agendamento, horários e valores da consulta',
+                'additional_kwargs', '{}'::jsonb,
+                'response_metadata', '{}'::jsonb)
+            FROM generate_series(1, %s) AS i
+            """,
+            (session_id, length),
+        )
+        sessions[length] = session_id
+    cur.execute("ANALYZE n8n_chat_histories")
+    return {"tenant_id": tenant_id, "sessions": sessions}
+
+
+def cleanup(cur, data: Dict):
+    """Remove the bench sessions and tenant (summaries and archive cascade)."""
+    cur.execute("DELETE FROM n8n_chat_histories WHERE session_id LIKE %s", (data["tenant_id"] + "_%",))
+    cur.execute("DELETE FROM tenant_config WHERE tenant_id = %s", (data["tenant_id"],))
+
+
+def reads(cur, data: Dict, iterations: int, label: str) -> Dict[str, Dict]:
+    """Latency of the memory node's read, per session length."""
+    results = {}
+    for length, session_id in data["sessions"].items():
+        results[f"read/{length}/{label}"] = summarize(
+            [timed(lambda: (cur.execute(READ_QUERY, (session_id,)), cur.fetchall())) for _ in range(iterations)]
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat memory read latency before/after compaction")
+    parser.add_argument("--lengths", default="10,100,1000,10000",
+                        help="Messages per seeded session, comma-separated")
+    parser.add_argument("--keep", type=int, default=20, help="chat_memory_keep_messages of the bench tenant")
+    parser.add_argument("--reads", type=int, default=200, help="Timed reads per session and phase")
+    parser.add_argument("--batch-size", type=int, default=1000, help="compact_chat_memory() batch size")
+    parser.add_argument("--json", metavar="PATH", help="Write results as JSON ('-' for stdout)")
+    parser.add_argument("--keep-data", action="store_true", help="Keep the bench tenant afterwards")
+    args = parser.parse_args()
+    lengths = sorted({int(n) for n in args.lengths.split(",") if n.strip()})
+
+    conn = get_conn()
+    conn.autocommit = True
+    data = None
+    try:
+        with conn.cursor() as cur:
+            print(f"Seeding sessions of {', '.join(map(str, lengths))} messages...", file=sys.stderr)
+            data = seed(cur, lengths, args.keep)
+            results = reads(cur, data, args.reads, "before")
+
+            started = time.perf_counter()
+            batches = folded = 0
+            more = True
+            while more:
+                cur.execute("SELECT folded_messages, more FROM compact_chat_memory(%s, %s)",
+                            (args.batch_size, data["tenant_id"]))
+                n, more = cur.fetchone()
+                folded += n
+                batches += 1
+            compaction_s = time.perf_counter() - started
+
+            results.update(reads(cur, data, args.reads, "after"))
+            longest = data["sessions"][lengths[-1]]
+            results["get_chat_memory_summary"] = summarize(
+                [timed(lambda: (cur.execute("SELECT get_chat_memory_summary(%s)", (longest,)), cur.fetchone()))
+                 for _ in range(args.reads)]
+            )
+            cur.execute("SELECT length(summary) FROM chat_memory_summaries WHERE session_id = %s", (longest,))
+            summary_chars = (cur.fetchone() or [0])[0]
+    finally:
+        if data and not args.keep_data:
+            with conn.cursor() as cur:
+                cleanup(cur, data)
+        conn.close()
+
+    print_table(results)
+    before = results[f"read/{lengths[-1]}/before"]["p50_ms"]
+    after = results[f"read/{lengths[-1]}/after"]["p50_ms"]
+    print(f"\nCompaction: {folded} messages folded in {batches} batch(es), {compaction_s:.2f} s; "
+          f"summary {summary_chars} chars")
+    print(f"Longest session read p50: {before:.3f} ms -> {after:.3f} ms")
+    if args.json:
+        write_json(args.json, {"benchmark": "chat_memory", "lengths": lengths, "keep": args.keep,
+                               "batch_size": args.batch_size, "folded": folded, "batches": batches,
+                               "compaction_s": round(compaction_s, 3), "results": results})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Shared helpers for the database benchmarks in scripts/bench.
+
+Connection settings follow scripts/cli/cli.py (PGHOST, PGPORT, PGDATABASE,
+PGUSER, PGPASSWORD). Benchmarks create their own throwaway tenants with a
+'bench-' slug prefix and remove them afterwards unless --keep is given.
+"""
+
+import json
+import math
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Sequence
+
+BENCH_SLUG_PREFIX = "bench-"
+
+
+def get_conn():
+    """Get database connection using environment variables."""
+    try:
+        import psycopg2
+    except ImportError:
+        print("ERROR: psycopg2 not installed. Run: pip install psycopg2-binary", file=sys.stderr)
+        sys.exit(1)
+
+    return psycopg2.connect(
+        host=os.getenv("PGHOST", "localhost"),
+        port=os.getenv("PGPORT", "5432"),
+        dbname=os.getenv("PGDATABASE", os.getenv("POSTGRES_DB", "n8n_clinic_db")),
+        user=os.getenv("PGUSER", os.getenv("POSTGRES_USER", "n8n_clinic")),
+        password=os.getenv("PGPASSWORD", os.getenv("POSTGRES_PASSWORD", "")),
+        connect_timeout=5,
+    )
+
+
+def percentile(sorted_samples: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted sample list."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    """Latency summary (milliseconds) for a list of samples."""
+    ordered = sorted(samples_ms)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50), 3),
+        "p90_ms": round(percentile(ordered, 90), 3),
+        "p99_ms": round(percentile(ordered, 99), 3),
+        "max_ms": round(ordered[-1], 3) if ordered else 0.0,
+    }
+
+
+def timed(fn: Callable[[], object]) -> float:
+    """Run fn once and return its wall time in milliseconds."""
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000.0
+
+
+def print_table(results: Dict[str, Dict[str, float]]):
+    """Print one latency summary line per benchmark case."""
+    width = max([32] + [len(name) + 1 for name in results])
+    print(f"{'Case':<{width}} {'N':>7} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    print("─" * (width + 58))
+    for name, r in results.items():
+        print(f"{name:<{width}} {r['count']:>7} {r['mean_ms']:>9.3f} {r['p50_ms']:>9.3f} "
+              f"{r['p90_ms']:>9.3f} {r['p99_ms']:>9.3f} {r['max_ms']:>9.3f}")
+    print("(milliseconds)")
+
+
+def write_json(path: str, payload: Dict):
+    """Write a benchmark report as JSON ('-' for stdout)."""
+    text = json.dumps(payload, indent=2, default=str)
+    if path == "-":
+        print(text)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
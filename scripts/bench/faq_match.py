@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Benchmark FAQ cache lookups: match_faq() vs the legacy leading-wildcard ILIKE.
+
+Seeds a throwaway tenant with --rows synthetic Portuguese FAQ questions,
+then replays a mix of lookups (exact, typo, partial, miss) and reports
+p50/p90/p99 latency per strategy.
+
+Usage:
+    python scripts/bench/faq_match.py --rows 100000 --queries 2000
+    python scripts/bench/faq_match.py --json faq_bench.json --compare-legacy
+"""
+
+import argparse
+import csv
+import io
+import random
+import sys
+import uuid
+from typing import Dict, List, Tuple
+
+from common import BENCH_SLUG_PREFIX, get_conn, print_table, summarize, timed, write_json
+
+VOCABULARY = [
+    "qual", "horário", "funcionamento", "clínica", "endereço", "estacionamento",
+    "consulta", "valor", "preço", "limpeza", "clareamento", "implante", "canal",
+    "botox", "preenchimento", "convênio", "particular", "pagamento", "cartão",
+    "pix", "parcelar", "retorno", "exame", "resultado", "atestado", "receita",
+    "sábado", "domingo", "feriado", "manhã", "tarde", "noite", "urgência",
+    "dor", "dente", "pele", "mancha", "acne", "peeling", "laser", "depilação",
+    "criança", "gestante", "idoso", "acessibilidade", "whatsapp", "telefone",
+    "agendar", "remarcar", "cancelar", "confirmar", "atraso", "documentos",
+]
+
+LEGACY_QUERY = """
+    SELECT answer, view_count, question_original, intent
+    FROM tenant_faq
+    WHERE tenant_id = %s::uuid
+      AND is_active = true
+      AND (
+        question_normalized ILIKE '%%' || %s || '%%'
+        OR (%s != '' AND keywords @> ARRAY[%s])
+      )
+    ORDER BY view_count DESC, COALESCE(last_used_at, created_at) DESC
+    LIMIT 1
+"""
+
+
+def seed(cur, rows: int, rng: random.Random) -> str:
+    """Create a bench tenant and COPY synthetic questions into tenant_faq."""
+    tenant_id = str(uuid.uuid4())
+    slug = f"{BENCH_SLUG_PREFIX}faq-{tenant_id[:8]}"
+    cur.execute(
+        """
+        INSERT INTO tenant_config (
+            tenant_id, tenant_name, tenant_slug, evolution_instance_name, clinic_name,
+            system_prompt_patient, system_prompt_internal, system_prompt_confirmation
+        ) VALUES (%s, %s, %s, %s, %s, '-', '-', '-')
+        """,
+        (tenant_id, slug, slug, slug, slug),
+    )
+
+    # Each question is 3-8 random vocabulary words; the row number keeps the
+    # unique (tenant_id, question_normalized) key from colliding
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    intents = ("hours", "location", "appointment", "info")
+    for i in range(rows):
+        words = rng.choices(VOCABULARY, k=3 + i % 6)
+        question = f"{' '.join(words)} {i}"
+        writer.writerow([tenant_id, question, question, f"resposta {i}",
+                         "{" + words[0] + "}", intents[i % 4], rng.randrange(100)])
+    buf.seek(0)
+    cur.copy_expert(
+        """COPY tenant_faq (tenant_id, question_original, question_normalized,
+                            answer, keywords, intent, view_count)
+           FROM STDIN WITH (FORMAT csv)""",
+        buf,
+    )
+    cur.execute("ANALYZE tenant_faq")
+    return tenant_id
+
+
+def typo(text: str, rng: random.Random) -> str:
+    """Drop, duplicate or swap one character."""
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 2)
+    op = rng.choice(("drop", "dup", "swap"))
+    if op == "drop":
+        return text[:i] + text[i + 1:]
+    if op == "dup":
+        return text[:i] + text[i] + text[i:]
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+
+def build_workload(cur, tenant_id: str, count: int, rng: random.Random) -> List[Tuple[str, str]]:
+    """(kind, text) lookups drawn from the seeded questions."""
+    cur.execute(
+        "SELECT question_normalized FROM tenant_faq WHERE tenant_id = %s ORDER BY random() LIMIT %s",
+        (tenant_id, count),
+    )
+    questions = [r[0] for r in cur.fetchall()]
+    workload = []
+    for i, q in enumerate(questions):
+        kind = ("exact", "typo", "partial", "miss")[i % 4]
+        if kind == "typo":
+            q = typo(q, rng)
+        elif kind == "partial":
+            q = " ".join(q.split()[:2])
+        elif kind == "miss":
+            q = " ".join(rng.choice(VOCABULARY)[::-1] for _ in range(3))
+        workload.append((kind, q))
+    return workload
+
+
+def run(cur, tenant_id: str, workload, threshold: float, legacy: bool) -> Dict[str, Dict]:
+    """Time every lookup, grouped by strategy and lookup kind."""
+    samples: Dict[str, List[float]] = {}
+    hits: Dict[str, int] = {}
+
+    def record(case: str, ms: float, found: bool):
+        samples.setdefault(case, []).append(ms)
+        hits[case] = hits.get(case, 0) + int(found)
+
+    for kind, text in workload:
+        rows = []
+
+        def lookup():
+            cur.execute("SELECT * FROM match_faq(%s, %s, NULL, %s)", (tenant_id, text, threshold))
+            rows.extend(cur.fetchall())
+
+        record(f"match_faq/{kind}", timed(lookup), bool(rows))
+        if legacy:
+            rows = []
+
+            def legacy_lookup():
+                cur.execute(LEGACY_QUERY, (tenant_id, text, text, text))
+                rows.extend(cur.fetchall())
+
+            record(f"legacy_ilike/{kind}", timed(legacy_lookup), bool(rows))
+
+    results = {}
+    for case in sorted(samples):
+        results[case] = summarize(samples[case])
+        results[case]["hit_rate"] = round(hits[case] / len(samples[case]), 3)
+    for prefix in ("match_faq", "legacy_ilike"):
+        merged = [ms for case, s in samples.items() if case.startswith(prefix) for ms in s]
+        if merged:
+            results[f"{prefix}/all"] = summarize(merged)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAQ cache lookups")
+    parser.add_argument("--rows", type=int, default=100000, help="FAQ rows for the bench tenant")
+    parser.add_argument("--queries", type=int, default=2000, help="Lookups to replay")
+    parser.add_argument("--threshold", type=float, default=0.45, help="match_faq similarity threshold")
+    parser.add_argument("--compare-legacy", action="store_true", help="Also time the old ILIKE query")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", metavar="PATH", help="Write results as JSON ('-' for stdout)")
+    parser.add_argument("--keep", action="store_true", help="Keep the bench tenant afterwards")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    conn = get_conn()
+    conn.autocommit = True
+    tenant_id = None
+    try:
+        with conn.cursor() as cur:
+            print(f"Seeding {args.rows} FAQ rows...", file=sys.stderr)
+            tenant_id = seed(cur, args.rows, rng)
+            workload = build_workload(cur, tenant_id, args.queries, rng)
+            # Warm the cache and plans so the first samples are not outliers
+            run(cur, tenant_id, workload[:50], args.threshold, args.compare_legacy)
+            results = run(cur, tenant_id, workload, args.threshold, args.compare_legacy)
+    finally:
+        if tenant_id and not args.keep:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM tenant_config WHERE tenant_id = %s", (tenant_id,))
+        conn.close()
+
+    print_table(results)
+    if args.json:
+        write_json(args.json, {"benchmark": "faq_match", "rows": args.rows,
+                               "threshold": args.threshold, "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Benchmark intent classification: the compiled intent_rules matcher
+(scripts/ops/intent_engine.py) vs the hard-coded regex chain it replaced.
+
+Scores the labeled corpus in tests/intent-corpus.jsonl (every text payload of
+tests/sample-payloads plus hand-labeled messages, some per clinic type) with
+the default rules of each clinic type, or with one tenant's effective rules
+(--tenant-slug). Reports accuracy, the share of messages sent to the LLM, the
+two routing errors (a message that needed the LLM answered by a template, and
+an LLM call for a message the rules should have handled), per-message latency
+and throughput.
+
+--check-js runs the workflow's own Intent Classifier code node under node.js
+over the same corpus and fails on any decision that differs from Python.
+
+Usage:
+    python scripts/bench/intent_classifier.py
+    python scripts/bench/intent_classifier.py --repeat 200 --check-js --json intent_bench.json
+    python scripts/bench/intent_classifier.py --tenant-slug clinica-moreira --min-accuracy 0.9
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from common import get_conn, print_table, summarize, write_json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ops"))
+from intent_engine import IntentMatcher, load_rules, requires_ai  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+CORPUS = os.path.join(ROOT, "tests", "intent-corpus.jsonl")
+PAYLOADS = os.path.join(ROOT, "tests", "sample-payloads")
+WORKFLOW = os.path.join(ROOT, "workflows", "main", "01-whatsapp-main.json")
+DEFAULT_CLINIC_TYPE = "mixed"
+
+# The Intent Classifier node before intent_rules, kept for comparison
+LEGACY_MENU = {"1": (r"^1$|^um$", "appointment"), "2": (r"^2$|^dois$", "reschedule"),
+               "3": (r"^3$|^tr[êe]s$", "info"), "4": (r"^4$|^quatro$", "hours_location")}
+LEGACY_PATTERNS = [
+    ("greeting", r"^(oi|olá|ola|bom dia|boa tarde|boa noite|hey|hello)"),
+    ("hours", r"(horário|horario|hora|abre|fecha|aberto|funciona|atende)"),
+    ("location", r"(endereço|endereco|onde|localização|localizacao|fica|chegar)"),
+    ("appointment", r"(agendar|marcar|consulta|horário disponível|horario disponivel|vaga)"),
+    ("cancel", r"(cancelar|desmarcar|não vou|nao vou)"),
+    ("reschedule", r"(remarcar|mudar|alterar|trocar dia|trocar hora)"),
+    ("confirmation", r"(sim|confirmo|confirmar|ok|tudo bem|pode ser)"),
+    ("help", r"(ajuda|help|socorro|não entendi|nao entendi)"),
+]
+_LEGACY_MENU = [(re.compile(p, re.I), intent) for p, intent in LEGACY_MENU.values()]
+_LEGACY = [(intent, re.compile(p)) for intent, p in LEGACY_PATTERNS]
+
+# Runs the code node with the nodes it reads stubbed out; one JSON line per case
+JS_HARNESS = r"""
+const fs = require('fs');
+const { code, cases } = JSON.parse(fs.readFileSync(0, 'utf8'));
+const run = new Function('$', '$json', code);
+const results = cases.map((c) => {
+  const nodes = { 'Restore Context': c.context };
+  const $ = (name) => ({ isExecuted: name in nodes, first: () => ({ json: nodes[name] || {} }) });
+  const r = run($, {});
+  return { intent: r.intent, confidence: r.confidence, menu_number: r.menu_number,
+           service_number: r.service_number, requires_ai: r.requires_ai };
+});
+process.stdout.write(JSON.stringify(results));
+"""
+
+
+def legacy_classify(text: str) -> Dict:
+    """Port of the removed regex chain (first match wins, substring matching)."""
+    text = (text or "").strip()
+    lower = text.lower()
+    for pattern, intent in _LEGACY_MENU:
+        if pattern.search(text):
+            return {"intent": intent, "confidence": 0.95}
+    if re.fullmatch(r"\d+", text) and int(text) >= 5:
+        return {"intent": "service_selection", "confidence": 0.95}
+    for intent, pattern in _LEGACY:
+        if pattern.search(lower):
+            return {"intent": intent, "confidence": 0.9}
+    return {"intent": "complex", "confidence": 0}
+
+
+def payload_text(name: str) -> str:
+    """Message text the way Parse Webhook Data extracts it."""
+    with open(os.path.join(PAYLOADS, name), encoding="utf-8") as f:
+        body = json.load(f)
+    body = body.get("body", body)
+    message = (body.get("data") or {}).get("message") or {}
+    return (message.get("conversation")
+            or (message.get("extendedTextMessage") or {}).get("text")
+            or (message.get("imageMessage") or {}).get("caption")
+            or "")
+
+
+def load_corpus(path: str) -> List[Dict]:
+    cases = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            if "payload" in case:
+                case["text"] = payload_text(case["payload"])
+            case.setdefault("clinic_type", DEFAULT_CLINIC_TYPE)
+            cases.append(case)
+    return cases
+
+
+def score(cases: List[Dict], predictions: List[Dict]) -> Dict:
+    """Accuracy plus the two ways a wrong intent costs us."""
+    correct = wrong_skip = extra_ai = ai_calls = 0
+    confusion = Counter()
+    for case, pred in zip(cases, predictions):
+        expected, got = case["intent"], pred["intent"]
+        needs_ai = requires_ai(pred)
+        correct += int(expected == got)
+        ai_calls += int(needs_ai)
+        # Labeled complex but routed away from the LLM: a templated non-answer
+        wrong_skip += int(expected == "complex" and not needs_ai)
+        # Labeled with an intent the rules cover, but still sent to the LLM
+        extra_ai += int(expected != "complex" and needs_ai)
+        if expected != got:
+            confusion[(expected, got)] += 1
+    total = len(cases)
+    return {
+        "messages": total,
+        "accuracy": round(correct / total, 4),
+        "ai_rate": round(ai_calls / total, 4),
+        "wrong_skip": wrong_skip,
+        "extra_ai": extra_ai,
+        "confusion": {f"{e} -> {g}": n for (e, g), n in confusion.most_common()},
+    }
+
+
+def time_classifier(classify, texts: List[str], repeat: int) -> Tuple[Dict, float]:
+    """Per-message latency (ms) over `repeat` passes, plus messages per second."""
+    samples = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            t0 = time.perf_counter()
+            classify(text)
+            samples.append((time.perf_counter() - t0) * 1000.0)
+    elapsed = time.perf_counter() - started
+    return summarize(samples), round(len(samples) / elapsed, 1) if elapsed else 0.0
+
+
+def check_js(cases: List[Dict], rules: Dict[str, List[Dict]], predictions: List[Dict]) -> List[str]:
+    """Differences between the workflow's code node and the Python engine."""
+    with open(WORKFLOW, encoding="utf-8") as f:
+        node = next(n for n in json.load(f)["nodes"] if n["name"] == "Intent Classifier")
+    versions = {ct: i + 1 for i, ct in enumerate(sorted(rules))}
+    payload = {
+        "code": node["parameters"]["jsCode"],
+        "cases": [{"context": {
+            "message_text": c["text"],
+            "tenant_id": c["clinic_type"],
+            "context_version": versions[c["clinic_type"]],
+            "intent_rules": rules[c["clinic_type"]],
+        }} for c in cases],
+    }
+    proc = subprocess.run(["node", "-e", JS_HARNESS], input=json.dumps(payload),
+                          capture_output=True, text=True, check=True)
+    mismatches = []
+    for case, py, js in zip(cases, predictions, json.loads(proc.stdout)):
+        py = dict(py, requires_ai=requires_ai(py))
+        diff = {k: (py[k], js[k]) for k in js if py.get(k) != js[k]}
+        if diff:
+            mismatches.append(f"{case['text']!r}: {diff}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark intent classification")
+    parser.add_argument("--corpus", default=CORPUS, help="Labeled JSONL corpus")
+    parser.add_argument("--tenant-slug", help="Score with this tenant's rules instead of the defaults")
+    parser.add_argument("--repeat", type=int, default=50, help="Timing passes over the corpus")
+    parser.add_argument("--check-js", action="store_true", help="Compare with the workflow node under node.js")
+    parser.add_argument("--min-accuracy", type=float, default=0.0, help="Exit 1 below this accuracy")
+    parser.add_argument("--errors", action="store_true", help="List every misclassified message")
+    parser.add_argument("--json", metavar="PATH", help="Write results as JSON ('-' for stdout)")
+    args = parser.parse_args()
+
+    cases = load_corpus(args.corpus)
+    conn = get_conn()
+    try:
+        with conn.cursor() as cur:
+            if args.tenant_slug:
+                cur.execute("SELECT tenant_id FROM tenant_config WHERE tenant_slug = %s", (args.tenant_slug,))
+                row = cur.fetchone()
+                if not row:
+                    print(f"❌ Tenant not found: {args.tenant_slug}", file=sys.stderr)
+                    return 1
+                tenant_rules = load_rules(cur, str(row[0]))
+                rules = {ct: tenant_rules for ct in {c["clinic_type"] for c in cases}}
+            else:
+                rules = {ct: load_rules(cur, None, ct) for ct in {c["clinic_type"] for c in cases}}
+    finally:
+        conn.close()
+
+    compile_ms = []
+    matchers = {}
+    for ct, ct_rules in rules.items():
+        started = time.perf_counter()
+        matchers[ct] = IntentMatcher(ct_rules)
+        compile_ms.append((time.perf_counter() - started) * 1000.0)
+
+    predictions = [matchers[c["clinic_type"]].classify(c["text"]) for c in cases]
+    legacy = [legacy_classify(c["text"]) for c in cases]
+    quality = {"rules": score(cases, predictions), "legacy": score(cases, legacy)}
+
+    # Throughput on the default clinic type's matcher (or the tenant's)
+    texts = [c["text"] for c in cases]
+    matcher = matchers.get(DEFAULT_CLINIC_TYPE) or next(iter(matchers.values()))
+    results = {}
+    results["classify/rules"], rules_rate = time_classifier(matcher.classify, texts, args.repeat)
+    results["classify/legacy"], legacy_rate = time_classifier(legacy_classify, texts, args.repeat)
+    results["compile/rules"] = summarize(compile_ms)
+    quality["rules"]["msg_per_s"], quality["legacy"]["msg_per_s"] = rules_rate, legacy_rate
+
+    print_table(results)
+    print()
+    print(f"{'Classifier':<12} {'accuracy':>9} {'ai_rate':>8} {'wrong_skip':>11} {'extra_ai':>9} {'msg/s':>11}")
+    print("─" * 64)
+    for name, q in quality.items():
+        print(f"{name:<12} {q['accuracy']:>9.1%} {q['ai_rate']:>8.1%} {q['wrong_skip']:>11} "
+              f"{q['extra_ai']:>9} {q['msg_per_s']:>11.0f}")
+    print(f"\nRules: {sum(len(r) for r in rules.values())} across {len(rules)} clinic type(s); "
+          f"automaton states ({DEFAULT_CLINIC_TYPE}): {len(matcher.next)}")
+
+    if args.errors:
+        print()
+        for case, pred in zip(cases, predictions):
+            if case["intent"] != pred["intent"]:
+                print(f"  {case['intent']:<16} -> {pred['intent']:<16} {pred['rule'] or '-':<26} {case['text']}")
+
+    failed = quality["rules"]["accuracy"] < args.min_accuracy
+    mismatches = []
+    if args.check_js:
+        mismatches = check_js(cases, rules, predictions)
+        print(f"\nJS parity: {len(cases) - len(mismatches)}/{len(cases)} identical")
+        for m in mismatches[:20]:
+            print(f"  ❌ {m}")
+        failed = failed or bool(mismatches)
+
+    if args.json:
+        write_json(args.json, {"benchmark": "intent_classifier", "corpus": os.path.basename(args.corpus),
+                               "tenant_slug": args.tenant_slug, "repeat": args.repeat,
+                               "results": results, "quality": quality,
+                               "js_mismatches": mismatches if args.check_js else None})
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Benchmark message_queue draining with claim_messages() across worker processes.
+
+Seeds a throwaway tenant with --messages queued messages spread over
+--conversations patients, drains them with 1..N worker processes (the loop
+from scripts/ops/queue_worker.py) and reports throughput plus the per-message
+claim latency. Every run also checks the ordering guarantee: no two messages
+of one conversation overlap in time, and each conversation is handled in
+arrival order.
+
+Usage:
+    python scripts/bench/message_queue.py --messages 5000 --conversations 500 --processes 1,2,4,8
+    python scripts/bench/message_queue.py --work-ms 20 --json queue_bench.json
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import uuid
+from typing import Dict, List
+
+from common import BENCH_SLUG_PREFIX, get_conn, print_table, summarize, write_json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ops"))
+from queue_worker import claim, complete  # noqa: E402
+
+
+def seed(cur, messages: int, conversations: int) -> str:
+    """Create a bench tenant and queue messages round-robin over conversations."""
+    tenant_id = str(uuid.uuid4())
+    slug = f"{BENCH_SLUG_PREFIX}queue-{tenant_id[:8]}"
+    cur.execute(
+        """
+        INSERT INTO tenant_config (
+            tenant_id, tenant_name, tenant_slug, evolution_instance_name, clinic_name,
+            system_prompt_patient, system_prompt_internal, system_prompt_confirmation
+        ) VALUES (%s, %s, %s, %s, %s, '-', '-', '-')
+        """,
+        (tenant_id, slug, slug, slug, slug),
+    )
+    # created_at grows with the sequence number so arrival order is unambiguous
+    cur.execute(
+        """
+        INSERT INTO message_queue (tenant_id, phone, message_id, payload, consumer, created_at)
+        SELECT %s, '55' || (i %% %s), 'bench-' || i, jsonb_build_object('seq', i), 'worker',
+               NOW() - INTERVAL '1 hour' + i * INTERVAL '1 millisecond'
+        FROM generate_series(0, %s - 1) AS i
+        """,
+        (tenant_id, conversations, messages),
+    )
+    cur.execute("ANALYZE message_queue")
+    return tenant_id
+
+
+def drain(worker_id: str, batch: int, work_ms: float, events):
+    """Worker process: claim until the queue is empty, reporting every message."""
+    conn = get_conn()
+    conn.autocommit = True
+    claim_ms: List[float] = []
+    try:
+        with conn.cursor() as cur:
+            while True:
+                started = time.perf_counter()
+                messages = claim(cur, batch, worker_id)
+                elapsed = (time.perf_counter() - started) * 1000.0
+                if not messages:
+                    break
+                claim_ms.append(elapsed / len(messages))
+                for m in messages:
+                    begin = time.time()
+                    if work_ms:
+                        time.sleep(work_ms / 1000.0)
+                    events.put((m["phone"], m["payload"]["seq"], begin, time.time()))
+                complete(cur, [m["queue_id"] for m in messages])
+    finally:
+        conn.close()
+        events.put(("__claims__", claim_ms, 0, 0))
+
+
+def check_order(records) -> Dict[str, int]:
+    """Count overlapping and out-of-order handling per conversation."""
+    by_phone: Dict[str, list] = {}
+    for phone, seq, begin, end in records:
+        by_phone.setdefault(phone, []).append((begin, end, seq))
+    overlaps = out_of_order = 0
+    for items in by_phone.values():
+        items.sort()
+        for prev, cur in zip(items, items[1:]):
+            overlaps += int(cur[0] < prev[1])
+            out_of_order += int(cur[2] < prev[2])
+    return {"overlaps": overlaps, "out_of_order": out_of_order}
+
+
+def run(processes: int, args) -> Dict:
+    """Seed, drain with `processes` workers and collect the results."""
+    conn = get_conn()
+    conn.autocommit = True
+    tenant_id = None
+    try:
+        with conn.cursor() as cur:
+            tenant_id = seed(cur, args.messages, args.conversations)
+
+        events = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=drain, args=(f"bench-{i}", args.batch, args.work_ms, events))
+            for i in range(processes)
+        ]
+        started = time.perf_counter()
+        for w in workers:
+            w.start()
+
+        records, claim_ms, finished = [], [], 0
+        while finished < processes:
+            item = events.get()
+            if item[0] == "__claims__":
+                claim_ms.extend(item[1])
+                finished += 1
+            else:
+                records.append(item)
+        elapsed = time.perf_counter() - started
+        for w in workers:
+            w.join()
+    finally:
+        if tenant_id and not args.keep:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM message_queue WHERE tenant_id = %s", (tenant_id,))
+                cur.execute("DELETE FROM tenant_config WHERE tenant_id = %s", (tenant_id,))
+        conn.close()
+
+    result = summarize(claim_ms)
+    result.update(check_order(records))
+    result["handled"] = len(records)
+    result["elapsed_s"] = round(elapsed, 3)
+    result["msg_per_s"] = round(len(records) / elapsed, 1) if elapsed else 0.0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark message_queue claiming")
+    parser.add_argument("--messages", type=int, default=5000, help="Messages to queue per run")
+    parser.add_argument("--conversations", type=int, default=500, help="Distinct patients (tenant + phone)")
+    parser.add_argument("--processes", default="1,2,4,8", help="Comma-separated worker counts to run")
+    parser.add_argument("--batch", type=int, default=10, help="claim_messages batch size")
+    parser.add_argument("--work-ms", type=float, default=0.0, help="Simulated handling time per message")
+    parser.add_argument("--json", metavar="PATH", help="Write results as JSON ('-' for stdout)")
+    parser.add_argument("--keep", action="store_true", help="Keep the bench tenant afterwards")
+    args = parser.parse_args()
+
+    results = {}
+    for n in [int(p) for p in args.processes.split(",") if p]:
+        print(f"Draining {args.messages} messages with {n} worker(s)...", file=sys.stderr)
+        results[f"claim/{n}_workers"] = run(n, args)
+
+    print_table(results)
+    print()
+    print(f"{'Case':<32} {'handled':>8} {'msg/s':>10} {'overlaps':>9} {'reorders':>9}")
+    print("─" * 72)
+    for name, r in results.items():
+        print(f"{name:<32} {r['handled']:>8} {r['msg_per_s']:>10.1f} {r['overlaps']:>9} {r['out_of_order']:>9}")
+
+    failed = any(r["overlaps"] or r["out_of_order"] or r["handled"] != args.messages for r in results.values())
+    if args.json:
+        write_json(args.json, {"benchmark": "message_queue", "messages": args.messages,
+                               "conversations": args.conversations, "batch": args.batch,
+                               "work_ms": args.work_ms, "results": results})
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Benchmark service search: find_professionals_for_service() (search_services)
+vs the legacy ILIKE / reverse-ILIKE scan.
+
+Seeds --services synthetic catalog entries and one bench tenant whose
+--professionals each offer --services-per-professional of them, then replays
+a mix of lookups (exact name, accent/case variant, typo, keyword, sentence,
+miss). Reports p50/p90/p99 latency per strategy and lookup kind, plus hit@1:
+how often the expected service is the top-ranked result.
+
+Usage:
+    python scripts/bench/service_search.py --services 5000 --queries 2000
+    python scripts/bench/service_search.py --services 20000 --json search_bench.json --compare-legacy
+"""
+
+import argparse
+import random
+import sys
+import unicodedata
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from common import BENCH_SLUG_PREFIX, get_conn, print_table, summarize, timed, write_json
+
+PROCEDURES = [
+    "limpeza", "clareamento", "implante", "canal", "extração", "restauração",
+    "botox", "preenchimento", "peeling", "depilação", "drenagem", "massagem",
+    "harmonização", "bioestimulador", "microagulhamento", "ortodontia",
+    "aparelho", "faceta", "lente", "prótese", "gengivoplastia", "enxerto",
+    "radiofrequência", "criolipólise", "carboxiterapia", "laser", "avaliação",
+    "consulta", "retorno", "exame", "ultrassom", "biópsia", "curativo",
+]
+QUALIFIERS = [
+    "dental", "facial", "corporal", "labial", "capilar", "infantil", "estético",
+    "preventivo", "completo", "simples", "avançado", "premium", "rápido",
+    "clínico", "cirúrgico", "digital", "invisível", "fracionado", "íntimo",
+]
+SENTENCES = ["quero marcar {}", "vocês fazem {}?", "qual o valor do {}", "preciso de {} urgente"]
+
+LEGACY_QUERY = """
+    SELECT p.professional_id, sc.service_id, sc.service_name,
+        CASE
+            WHEN LOWER(sc.service_name) = LOWER(%(q)s) THEN 1.0
+            WHEN LOWER(sc.service_code) = UPPER(%(q)s) THEN 0.95
+            WHEN LOWER(sc.service_name) ILIKE '%%' || LOWER(%(q)s) || '%%' THEN 0.8
+            WHEN EXISTS (
+                SELECT 1 FROM unnest(sc.service_keywords) kw
+                WHERE LOWER(%(q)s) ILIKE '%%' || LOWER(kw) || '%%'
+            ) THEN 0.7
+            ELSE 0.5
+        END::NUMERIC as match_score
+    FROM professional_services ps
+    JOIN professionals p ON ps.professional_id = p.professional_id
+    JOIN services_catalog sc ON ps.service_id = sc.service_id
+    WHERE p.tenant_id = %(t)s
+    AND p.is_active = true
+    AND ps.is_active = true
+    AND sc.is_active = true
+    AND (
+        LOWER(sc.service_name) ILIKE '%%' || LOWER(%(q)s) || '%%'
+        OR LOWER(sc.service_code) ILIKE '%%' || LOWER(%(q)s) || '%%'
+        OR EXISTS (
+            SELECT 1 FROM unnest(sc.service_keywords) kw
+            WHERE LOWER(%(q)s) ILIKE '%%' || LOWER(kw) || '%%'
+        )
+    )
+    ORDER BY match_score DESC, p.display_order
+"""
+
+
+def strip_accents(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+
+
+def seed(cur, args, rng: random.Random, run_id: str) -> Tuple[str, List[Tuple[str, str, List[str]]]]:
+    """Create catalog entries and a bench tenant offering a subset of them."""
+    tenant_id = str(uuid.uuid4())
+    slug = f"{BENCH_SLUG_PREFIX}search-{tenant_id[:8]}"
+    cur.execute(
+        """
+        INSERT INTO tenant_config (
+            tenant_id, tenant_name, tenant_slug, evolution_instance_name, clinic_name,
+            system_prompt_patient, system_prompt_internal, system_prompt_confirmation
+        ) VALUES (%s, %s, %s, %s, %s, '-', '-', '-')
+        """,
+        (tenant_id, slug, slug, slug, slug),
+    )
+
+    services = []
+    for i in range(args.services):
+        procedure, qualifier = rng.choice(PROCEDURES), rng.choice(QUALIFIERS)
+        keywords = [procedure, rng.choice(QUALIFIERS)]
+        services.append((f"BENCH-{run_id}-{i}", f"{procedure.capitalize()} {qualifier}", keywords))
+    cur.executemany(
+        """
+        INSERT INTO services_catalog (service_code, service_name, service_category, service_keywords)
+        VALUES (%s, %s, 'bench', %s)
+        """,
+        services,
+    )
+
+    cur.execute(
+        """
+        INSERT INTO professionals (tenant_id, professional_name, professional_slug, specialty)
+        SELECT %s, 'Bench ' || i, 'bench-' || i, 'bench' FROM generate_series(1, %s) AS i
+        """,
+        (tenant_id, args.professionals),
+    )
+    cur.execute(
+        """
+        INSERT INTO professional_services (professional_id, service_id, custom_duration_minutes, custom_price_cents)
+        SELECT p.professional_id, s.service_id, 30, 10000
+        FROM professionals p
+        CROSS JOIN LATERAL (
+            SELECT sc.service_id FROM services_catalog sc
+            WHERE sc.service_code LIKE %s
+            ORDER BY md5(p.professional_id::text || sc.service_id::text)
+            LIMIT %s
+        ) s
+        WHERE p.tenant_id = %s
+        """,
+        (f"BENCH-{run_id}-%", args.services_per_professional, tenant_id),
+    )
+    cur.execute(
+        """
+        SELECT DISTINCT sc.service_code, sc.service_name, sc.service_keywords
+        FROM professional_services ps
+        JOIN professionals p USING (professional_id)
+        JOIN services_catalog sc USING (service_id)
+        WHERE p.tenant_id = %s
+        """,
+        (tenant_id,),
+    )
+    offered = cur.fetchall()
+    for table in ("services_catalog", "professionals", "professional_services"):
+        cur.execute(f"ANALYZE {table}")
+    return tenant_id, offered
+
+
+def typo(text: str, rng: random.Random) -> str:
+    """Swap one letter for a common Portuguese misspelling, or drop one."""
+    for a, b in (("z", "s"), ("ç", "ss"), ("x", "ks"), ("ss", "ç"), ("s", "z")):
+        if a in text and rng.random() < 0.5:
+            return text.replace(a, b, 1)
+    i = rng.randrange(1, max(2, len(text) - 1))
+    return text[:i] + text[i + 1:]
+
+
+def build_workload(offered, count: int, rng: random.Random) -> List[Tuple[str, str, Optional[str]]]:
+    """(kind, query, expected service name) lookups; expected None for misses."""
+    workload = []
+    for i in range(count):
+        _, name, keywords = rng.choice(offered)
+        kind = ("exact", "variant", "typo", "keyword", "sentence", "miss")[i % 6]
+        if kind == "exact":
+            query = name
+        elif kind == "variant":
+            query = strip_accents(name).upper()
+        elif kind == "typo":
+            query = typo(name.lower(), rng)
+        elif kind == "keyword":
+            query, name = keywords[0], None  # many services share a keyword; latency only
+        elif kind == "sentence":
+            query = rng.choice(SENTENCES).format(name.lower())
+        else:
+            query, name = "".join(rng.choice("bcdfghjklmnpqrstvwxz") for _ in range(7)), None
+        workload.append((kind, query, name))
+    return workload
+
+
+def run(cur, tenant_id: str, workload, legacy: bool) -> Dict[str, Dict]:
+    """Time every lookup, grouped by strategy and lookup kind."""
+    samples: Dict[str, List[float]] = {}
+    hits: Dict[str, List[int]] = {}
+
+    for kind, query, expected in workload:
+        strategies = [("search", "SELECT service_name FROM find_professionals_for_service(%(t)s, %(q)s)")]
+        if legacy:
+            strategies.append(("legacy_ilike", LEGACY_QUERY))
+        for strategy, sql in strategies:
+            rows = []
+
+            def lookup():
+                cur.execute(sql, {"t": tenant_id, "q": query})
+                rows.extend(cur.fetchall())
+
+            case = f"{strategy}/{kind}"
+            samples.setdefault(case, []).append(timed(lookup))
+            top = rows[0][-2] if strategy == "legacy_ilike" and rows else (rows[0][0] if rows else None)
+            if expected is not None:
+                hits.setdefault(case, []).append(int(top == expected))
+            elif kind == "miss":
+                hits.setdefault(case, []).append(int(not rows))
+
+    results = {}
+    for case in sorted(samples):
+        results[case] = summarize(samples[case])
+        if case in hits:
+            results[case]["hit_rate"] = round(sum(hits[case]) / len(hits[case]), 3)
+    for prefix in ("search", "legacy_ilike"):
+        merged = [ms for case, s in samples.items() if case.startswith(prefix + "/") for ms in s]
+        if merged:
+            results[f"{prefix}/all"] = summarize(merged)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark service search")
+    parser.add_argument("--services", type=int, default=5000, help="Catalog entries to create")
+    parser.add_argument("--professionals", type=int, default=20, help="Professionals of the bench tenant")
+    parser.add_argument("--services-per-professional", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=1200, help="Lookups to replay")
+    parser.add_argument("--compare-legacy", action="store_true", help="Also time the old ILIKE query")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", metavar="PATH", help="Write results as JSON ('-' for stdout)")
+    parser.add_argument("--keep", action="store_true", help="Keep the bench data afterwards")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    run_id = uuid.uuid4().hex[:8]
+    conn = get_conn()
+    conn.autocommit = True
+    tenant_id = None
+    try:
+        with conn.cursor() as cur:
+            print(f"Seeding {args.services} catalog services...", file=sys.stderr)
+            tenant_id, offered = seed(cur, args, rng, run_id)
+            workload = build_workload(offered, args.queries, rng)
+            # Warm the cache and plans so the first samples are not outliers
+            run(cur, tenant_id, workload[:30], args.compare_legacy)
+            results = run(cur, tenant_id, workload, args.compare_legacy)
+    finally:
+        if not args.keep:
+            with conn.cursor() as cur:
+                if tenant_id:
+                    cur.execute("DELETE FROM tenant_config WHERE tenant_id = %s", (tenant_id,))
+                cur.execute("DELETE FROM services_catalog WHERE service_code LIKE %s", (f"BENCH-{run_id}-%",))
+        conn.close()
+
+    print_table(results)
+    print()
+    print(f"{'Case':<32} {'hit@1':>7}")
+    for case, r in results.items():
+        if "hit_rate" in r:
+            print(f"{case:<32} {r['hit_rate']:>7.1%}")
+    if args.json:
+        write_json(args.json, {"benchmark": "service_search", "services": args.services,
+                               "professionals": args.professionals,
+                               "services_per_professional": args.services_per_professional,
+                               "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+"""
+Benchmark the hot PL/pgSQL functions under concurrent load.
+
+Seeds synthetic bench tenants at the requested scale (tenants x professionals
+x services x appointments x conversations), then calls each function from
+1..N concurrent connections and reports per-call latency and throughput.
+
+Every run also captures EXPLAIN (ANALYZE, BUFFERS) for one representative
+call per function. PL/pgSQL bodies show up as a single Function Scan there,
+so when auto_explain can be loaded the plans of the statements inside the
+function (log_nested_statements) are captured too.
+
+Results are stored under --results-dir, tagged with a fingerprint of the
+benchmarked function definitions, so runs against different schema versions
+can be compared with --compare (latest run of another fingerprint, or a
+result file).
+
+Usage:
+    python scripts/bench/stored_functions.py --tenants 20 --professionals 10 --appointments 20000
+    python scripts/bench/stored_functions.py --concurrency 1,8,32 --iterations 500 --compare latest
+    python scripts/bench/stored_functions.py --only create_appointment,transition --no-explain
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from common import BENCH_SLUG_PREFIX, get_conn, print_table, summarize, write_json
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", ".cache", "bench")
+
+FUNCTIONS = (
+    "get_or_create_conversation_state",
+    "transition_conversation_state",
+    "process_inbound_turn",
+    "find_professionals_for_service",
+    "validate_slot_for_service",
+    "create_appointment",
+    "is_slot_available",
+    "get_appointments_for_reminders",
+    "lookup_media_result",
+    "increment_message_count",
+    "get_message_quota_remaining",
+)
+
+KEYWORDS = [
+    "limpeza", "clareamento", "implante", "canal", "botox", "preenchimento",
+    "peeling", "laser", "depilação", "consulta", "retorno", "exame", "avaliação",
+    "ortodontia", "aparelho", "restauração", "extração", "harmonização",
+]
+
+STATE_INPUTS = ["1", "2", "3", "4", "sim", "não", "oi", "voltar", "menu"]
+
+# (text, intent) pairs as the Intent Classifier would hand them over
+TURN_INPUTS = STATE_INPUTS + ["qual o endereço da clínica?", "quanto custa uma limpeza de pele?"]
+TURN_INTENTS = ["menu_option", "service_selection", "greeting", "location", "complex"]
+
+
+# ============================================================================
+# Seeding
+# ============================================================================
+
+def seed(cur, args, run_id: str) -> Dict:
+    """Create bench tenants, catalog, professionals, appointments and conversations."""
+    started = time.perf_counter()
+    prefix = f"{BENCH_SLUG_PREFIX}fn-{run_id}"
+
+    cur.execute(
+        """
+        INSERT INTO tenant_config (
+            tenant_name, tenant_slug, evolution_instance_name, clinic_name,
+            system_prompt_patient, system_prompt_internal, system_prompt_confirmation
+        )
+        SELECT s, s, s, s, '-', '-', '-'
+        FROM (SELECT %s || '-' || i AS s FROM generate_series(1, %s) AS i) t
+        RETURNING tenant_id
+        """,
+        (prefix, args.tenants),
+    )
+    tenant_ids = [r[0] for r in cur.fetchall()]
+
+    # services_catalog is shared by all tenants; codes carry the run id for cleanup
+    cur.execute(
+        """
+        INSERT INTO services_catalog (service_code, service_name, service_category,
+                                      service_keywords, default_duration_minutes)
+        SELECT 'BENCH-' || %s || '-' || i,
+               kw[1 + i %% cardinality(kw)] || ' ' || i,
+               'bench',
+               ARRAY[kw[1 + i %% cardinality(kw)], kw[1 + (i * 7) %% cardinality(kw)]],
+               30 + (i %% 4) * 15
+        FROM generate_series(1, %s) AS i, (SELECT %s::text[] AS kw) k
+        RETURNING service_id
+        """,
+        (run_id, args.services, KEYWORDS),
+    )
+    service_ids = [r[0] for r in cur.fetchall()]
+
+    cur.execute(
+        """
+        INSERT INTO professionals (tenant_id, professional_name, professional_slug, specialty)
+        SELECT t.tenant_id, 'Dr(a). Bench ' || i, 'bench-' || i, 'bench'
+        FROM unnest(%s::uuid[]) AS t(tenant_id), generate_series(1, %s) AS i
+        """,
+        (tenant_ids, args.professionals),
+    )
+    cur.execute(
+        """
+        INSERT INTO professional_services (professional_id, service_id,
+                                           custom_duration_minutes, custom_price_cents, price_display)
+        SELECT p.professional_id, s.service_id, 30 + (abs(hashtext(s.service_id::text)) %% 4) * 15,
+               10000, 'R$ 100,00'
+        FROM professionals p
+        CROSS JOIN LATERAL (
+            SELECT service_id FROM unnest(%s::uuid[]) AS service_id
+            ORDER BY md5(p.professional_id::text || service_id::text)
+            LIMIT %s
+        ) s
+        WHERE p.tenant_id = ANY(%s::uuid[])
+        """,
+        (service_ids, args.services_per_professional, tenant_ids),
+    )
+
+    # Appointments over the next 30 days on 15-minute marks; ~4% fall inside
+    # the 24h reminder window so get_appointments_for_reminders has work.
+    # Draws that overlap a booked appointment are skipped by the exclusion
+    # constraint (ON CONFLICT DO NOTHING)
+    cur.execute(
+        """
+        INSERT INTO appointments (tenant_id, professional_id, service_id, start_at, end_at,
+                                  duration_minutes, patient_contact, patient_name,
+                                  service_name, professional_name, status)
+        SELECT ps.tenant_id, ps.professional_id, ps.service_id, slot.start_at,
+               slot.start_at + make_interval(mins => ps.custom_duration_minutes),
+               ps.custom_duration_minutes, '55119' || lpad(i::text, 8, '0'), 'Paciente ' || i,
+               'bench', 'bench', CASE WHEN i %% 10 = 0 THEN 'cancelled' ELSE 'scheduled' END
+        FROM generate_series(1, %s) AS i
+        CROSS JOIN LATERAL (
+            SELECT x.* FROM (
+                SELECT p.tenant_id, ps.professional_id, ps.service_id, ps.custom_duration_minutes,
+                       row_number() OVER () AS n
+                FROM professional_services ps JOIN professionals p USING (professional_id)
+                WHERE p.tenant_id = ANY(%s::uuid[])
+            ) x
+            WHERE x.n = 1 + (i * 7919) %% %s
+        ) ps
+        CROSS JOIN LATERAL (
+            SELECT date_trunc('hour', NOW()) + make_interval(mins => 15 * ((i * 104729) %% 2880)) AS start_at
+        ) slot
+        ON CONFLICT DO NOTHING
+        """,
+        (args.appointments * args.tenants, tenant_ids,
+         args.tenants * args.professionals * args.services_per_professional),
+    )
+
+    cur.execute(
+        """
+        INSERT INTO conversation_state (tenant_id, remote_jid, current_state)
+        SELECT t.tenant_id, '5511' || lpad(i::text, 9, '0') || '@s.whatsapp.net',
+               (ARRAY['initial', 'awaiting_service', 'awaiting_professional', 'awaiting_date'])[1 + i %% 4]
+        FROM unnest(%s::uuid[]) AS t(tenant_id), generate_series(1, %s) AS i
+        """,
+        (tenant_ids, args.conversations),
+    )
+
+    # One cached transcription per conversation, keyed like the media tools do
+    cur.execute(
+        """
+        INSERT INTO media_cache (tenant_id, media_kind, content_hash, result_text, result_bytes, expires_at)
+        SELECT t.tenant_id, 'audio', encode(sha256((t.tenant_id::text || i)::bytea), 'hex'),
+               'Transcrição bench ' || i, 20, NOW() + INTERVAL '30 days'
+        FROM unnest(%s::uuid[]) AS t(tenant_id), generate_series(1, %s) AS i
+        """,
+        (tenant_ids, args.conversations),
+    )
+
+    cur.execute(
+        """
+        SELECT p.tenant_id, ps.professional_id, ps.service_id, ps.custom_duration_minutes
+        FROM professional_services ps JOIN professionals p USING (professional_id)
+        WHERE p.tenant_id = ANY(%s::uuid[])
+        """,
+        (tenant_ids,),
+    )
+    offers = cur.fetchall()
+    for table in ("tenant_config", "services_catalog", "professionals",
+                  "professional_services", "appointments", "conversation_state", "media_cache"):
+        cur.execute(f"ANALYZE {table}")
+
+    print(f"Seeded {len(tenant_ids)} tenants, {len(service_ids)} services, {len(offers)} offers "
+          f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return {"tenant_ids": tenant_ids, "service_ids": service_ids, "offers": offers}
+
+
+def cleanup(cur, data: Dict, run_id: str):
+    """Remove everything seeded (appointments first: professionals are RESTRICT)."""
+    tenant_ids = data.get("tenant_ids") or []
+    cur.execute("DELETE FROM appointments WHERE tenant_id = ANY(%s::uuid[])", (tenant_ids,))
+    cur.execute("DELETE FROM tenant_config WHERE tenant_id = ANY(%s::uuid[])", (tenant_ids,))
+    cur.execute("DELETE FROM services_catalog WHERE service_code LIKE %s", (f"BENCH-{run_id}-%",))
+
+
+# ============================================================================
+# Cases
+# ============================================================================
+
+def build_cases(data: Dict, conversations: int) -> Dict[str, Callable[[random.Random], Tuple[str, tuple]]]:
+    """Function name -> generator of (sql, params) for one call."""
+    tenants = data["tenant_ids"]
+    offers = data["offers"]
+
+    def known_jid(rng):
+        return f"5511{rng.randint(1, conversations):09d}@s.whatsapp.net"
+
+    def slot(rng):
+        day = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        return day.timestamp() + 900 * rng.randint(4, 2880)
+
+    def get_state(rng):
+        # 90% returning patients, 10% new conversations
+        jid = known_jid(rng) if rng.random() < 0.9 else f"5599{uuid.uuid4().int % 10**9:09d}@s.whatsapp.net"
+        return "SELECT * FROM get_or_create_conversation_state(%s, %s)", (rng.choice(tenants), jid)
+
+    def transition(rng):
+        return ("SELECT * FROM transition_conversation_state(%s, %s, %s)",
+                (rng.choice(tenants), known_jid(rng), rng.choice(STATE_INPUTS)))
+
+    def inbound_turn(rng):
+        return ("SELECT process_inbound_turn(%s, %s, %s, %s)",
+                (rng.choice(tenants), known_jid(rng), rng.choice(TURN_INPUTS), rng.choice(TURN_INTENTS)))
+
+    def find_professionals(rng):
+        return ("SELECT * FROM find_professionals_for_service(%s, %s)",
+                (rng.choice(tenants), rng.choice(KEYWORDS)))
+
+    def validate_slot(rng):
+        _, professional_id, service_id, duration = rng.choice(offers)
+        start = slot(rng)
+        return ("SELECT * FROM validate_slot_for_service(to_timestamp(%s), to_timestamp(%s), %s, %s)",
+                (start, start + 60 * (duration + rng.choice((-15, 0, 15))), professional_id, service_id))
+
+    def create(rng):
+        # Past the seeded 30 days, so only bench bookings can collide
+        tenant_id, professional_id, service_id, _ = rng.choice(offers)
+        return ("SELECT * FROM create_appointment(%s, %s, %s, to_timestamp(%s), %s, 'Bench', 'api')",
+                (tenant_id, professional_id, service_id, slot(rng) + 30 * 86400,
+                 f"5511{rng.randint(0, 10**9):09d}"))
+
+    def slot_available(rng):
+        _, professional_id, _, duration = rng.choice(offers)
+        start = slot(rng)
+        return ("SELECT is_slot_available(%s, to_timestamp(%s), to_timestamp(%s))",
+                (professional_id, start, start + 60 * duration))
+
+    def reminders(rng):
+        return "SELECT * FROM get_appointments_for_reminders(%s)", (rng.choice(("24h", "1h")),)
+
+    def media_lookup(rng):
+        # 80% repeated media (cache hit), 20% first sightings
+        tenant_id = rng.choice(tenants)
+        n = rng.randint(1, conversations) if rng.random() < 0.8 else -rng.randint(1, 10**9)
+        digest = hashlib.sha256(f"{tenant_id}{n}".encode()).hexdigest()
+        return ("SELECT * FROM lookup_media_result(%s, 'audio', %s, %s)",
+                (tenant_id, digest, rng.randint(10**4, 10**6)))
+
+    def increment(rng):
+        # One tenant for every worker: a traffic burst of a single clinic
+        return "SELECT increment_message_count(%s)", (tenants[0],)
+
+    def quota(rng):
+        return "SELECT get_message_quota_remaining(%s)", (rng.choice(tenants),)
+
+    return {
+        "get_or_create_conversation_state": get_state,
+        "transition_conversation_state": transition,
+        "process_inbound_turn": inbound_turn,
+        "find_professionals_for_service": find_professionals,
+        "validate_slot_for_service": validate_slot,
+        "create_appointment": create,
+        "is_slot_available": slot_available,
+        "get_appointments_for_reminders": reminders,
+        "lookup_media_result": media_lookup,
+        "increment_message_count": increment,
+        "get_message_quota_remaining": quota,
+    }
+
+
+def run_case(make_call, workers: int, iterations: int, seed_value: int) -> Dict:
+    """Run `iterations` calls on each of `workers` connections at once."""
+    barrier = threading.Barrier(workers)
+
+    def worker(n: int) -> Tuple[List[float], int]:
+        rng = random.Random(seed_value * 1000 + n)
+        conn = get_conn()
+        conn.autocommit = True
+        samples, errors = [], 0
+        try:
+            with conn.cursor() as cur:
+                barrier.wait()
+                for _ in range(iterations):
+                    sql, params = make_call(rng)
+                    started = time.perf_counter()
+                    try:
+                        cur.execute(sql, params)
+                        cur.fetchall()
+                    except Exception as e:  # keep going; the error rate is part of the result
+                        errors += 1
+                        if errors == 1:
+                            print(f"  ⚠️  {type(e).__name__}: {str(e).strip()[:120]}", file=sys.stderr)
+                        continue
+                    samples.append((time.perf_counter() - started) * 1000.0)
+        finally:
+            conn.close()
+        return samples, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outcomes = list(pool.map(worker, range(workers)))
+    elapsed = time.perf_counter() - started
+
+    samples = [ms for s, _ in outcomes for ms in s]
+    result = summarize(samples)
+    result["errors"] = sum(e for _, e in outcomes)
+    result["calls_per_s"] = round(len(samples) / elapsed, 1) if elapsed else 0.0
+    return result
+
+
+# ============================================================================
+# Plans and fingerprints
+# ============================================================================
+
+def capture_plan(cur, sql: str, params: tuple, nested: bool) -> Dict:
+    """EXPLAIN (ANALYZE, BUFFERS) one call; nested statement plans via auto_explain."""
+    conn = cur.connection
+    del conn.notices[:]
+    # ANALYZE really executes the call; keep writes out of the bench data
+    conn.autocommit = False
+    try:
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+        plan = cur.fetchone()[0]
+    finally:
+        conn.rollback()
+        conn.autocommit = True
+    result = {"plan": plan}
+    if nested:
+        result["nested_plans"] = [n.strip() for n in conn.notices if "Query Text" in n]
+    return result
+
+
+def enable_auto_explain(cur) -> bool:
+    """Send nested statement plans to the client as NOTICEs, if available."""
+    try:
+        cur.execute("LOAD 'auto_explain'")
+    except Exception as e:
+        print(f"auto_explain unavailable ({str(e).strip()}); top-level plans only", file=sys.stderr)
+        return False
+    for setting in ("log_level = 'notice'", "log_min_duration = 0", "log_nested_statements = on",
+                    "log_analyze = on", "log_buffers = on"):
+        cur.execute(f"SET auto_explain.{setting}")
+    return True
+
+
+def schema_fingerprint(cur) -> Dict:
+    """Hash of the benchmarked function definitions plus the latest migration."""
+    cur.execute(
+        """
+        SELECT p.proname, pg_get_functiondef(p.oid)
+        FROM pg_proc p JOIN pg_namespace n ON n.oid = p.pronamespace
+        WHERE n.nspname = 'public' AND p.proname = ANY(%s)
+        ORDER BY p.proname, p.oid
+        """,
+        (list(FUNCTIONS),),
+    )
+    digest = hashlib.sha256()
+    for name, definition in cur.fetchall():
+        digest.update(name.encode())
+        digest.update(definition.encode())
+    cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    migration = None
+    if cur.fetchone()[0]:
+        cur.execute("SELECT MAX(version) FROM schema_migrations")
+        migration = cur.fetchone()[0]
+    cur.execute("SHOW server_version")
+    return {"functions_sha256": digest.hexdigest()[:16], "latest_migration": migration,
+            "server_version": cur.fetchone()[0]}
+
+
+# ============================================================================
+# Result storage and comparison
+# ============================================================================
+
+def store(results_dir: str, report: Dict) -> str:
+    os.makedirs(results_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(results_dir, f"stored_functions-{report['schema']['functions_sha256']}-{stamp}.json")
+    write_json(path, report)
+    return path
+
+
+def load_baseline(spec: str, results_dir: str, fingerprint: str) -> Optional[Tuple[str, Dict]]:
+    """'latest' = newest stored run with a different fingerprint; else a file path."""
+    if spec != "latest":
+        with open(spec, encoding="utf-8") as f:
+            return spec, json.load(f)
+    for path in sorted(glob.glob(os.path.join(results_dir, "stored_functions-*.json")),
+                       key=os.path.getmtime, reverse=True):
+        with open(path, encoding="utf-8") as f:
+            report = json.load(f)
+        if report.get("schema", {}).get("functions_sha256") != fingerprint:
+            return path, report
+    return None
+
+
+def compare(results: Dict, baseline: Dict, threshold_pct: float) -> List[str]:
+    """Print p50/p99 deltas per case; return the cases slower than threshold."""
+    regressions = []
+    print()
+    print(f"{'Case':<44} {'p50 base':>9} {'p50 now':>9} {'Δ%':>7} {'p99 base':>9} {'p99 now':>9} {'Δ%':>7}")
+    print("─" * 100)
+    for case, now in results.items():
+        base = baseline.get("results", {}).get(case)
+        if not base:
+            continue
+        deltas = []
+        for key in ("p50_ms", "p99_ms"):
+            deltas.append((now[key] - base[key]) / base[key] * 100.0 if base[key] else 0.0)
+        flag = " ⚠️" if max(deltas) > threshold_pct else ""
+        if flag:
+            regressions.append(case)
+        print(f"{case:<44} {base['p50_ms']:>9.3f} {now['p50_ms']:>9.3f} {deltas[0]:>+7.1f} "
+              f"{base['p99_ms']:>9.3f} {now['p99_ms']:>9.3f} {deltas[1]:>+7.1f}{flag}")
+    return regressions
+
+
+# ============================================================================
+# Main
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hot stored functions")
+    parser.add_argument("--tenants", type=int, default=10, help="Bench tenants")
+    parser.add_argument("--professionals", type=int, default=8, help="Professionals per tenant")
+    parser.add_argument("--services", type=int, default=40, help="Catalog services (shared)")
+    parser.add_argument("--services-per-professional", type=int, default=6)
+    parser.add_argument("--appointments", type=int, default=2000, help="Appointments per tenant")
+    parser.add_argument("--conversations", type=int, default=2000, help="Conversations per tenant")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated connection counts")
+    parser.add_argument("--iterations", type=int, default=200, help="Calls per connection per case")
+    parser.add_argument("--only", help="Comma-separated function names (prefixes) to run")
+    parser.add_argument("--no-explain", action="store_true", help="Skip EXPLAIN (ANALYZE, BUFFERS) capture")
+    parser.add_argument("--results-dir", default=os.path.normpath(RESULTS_DIR),
+                        help="Where result files are stored (default: .cache/bench)")
+    parser.add_argument("--compare", metavar="latest|PATH", help="Compare against a stored result")
+    parser.add_argument("--regression-pct", type=float, default=20.0, help="p50/p99 slowdown that counts as regression")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", metavar="PATH", help="Also write the report here ('-' for stdout)")
+    parser.add_argument("--keep", action="store_true", help="Keep the bench data afterwards")
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    only = [o for o in (args.only or "").split(",") if o]
+    levels = [int(c) for c in args.concurrency.split(",") if c]
+
+    conn = get_conn()
+    conn.autocommit = True
+    data: Dict = {}
+    results: Dict[str, Dict] = {}
+    plans: Dict[str, Dict] = {}
+    try:
+        with conn.cursor() as cur:
+            fingerprint = schema_fingerprint(cur)
+            data = seed(cur, args, run_id)
+            cases = build_cases(data, args.conversations)
+            selected = {name: make for name, make in cases.items()
+                        if not only or any(name.startswith(o) for o in only)}
+
+            for name, make_call in selected.items():
+                for workers in levels:
+                    print(f"{name} x{workers}...", file=sys.stderr)
+                    results[f"{name}/c{workers}"] = run_case(make_call, workers, args.iterations, args.seed)
+
+            if not args.no_explain:
+                nested = enable_auto_explain(cur)
+                rng = random.Random(args.seed)
+                for name, make_call in selected.items():
+                    try:
+                        plans[name] = capture_plan(cur, *make_call(rng), nested)
+                    except Exception as e:
+                        plans[name] = {"error": str(e).strip().splitlines()[0]}
+    finally:
+        if data and not args.keep:
+            with conn.cursor() as cur:
+                cleanup(cur, data, run_id)
+        conn.close()
+
+    print_table(results)
+    print(f"{'Case':<44} {'calls/s':>10} {'errors':>8}")
+    for case, r in results.items():
+        print(f"{case:<44} {r['calls_per_s']:>10.1f} {r['errors']:>8}")
+
+    report = {
+        "benchmark": "stored_functions",
+        "run_at": datetime.now(timezone.utc).isoformat(),
+        "schema": fingerprint,
+        "scale": {k: getattr(args, k) for k in ("tenants", "professionals", "services",
+                                                "services_per_professional", "appointments",
+                                                "conversations", "iterations")},
+        "concurrency": levels,
+        "results": results,
+        "plans": plans,
+    }
+    path = store(args.results_dir, report)
+    print(f"\nStored {path}", file=sys.stderr)
+    if args.json:
+        write_json(args.json, report)
+
+    if args.compare:
+        baseline = load_baseline(args.compare, args.results_dir, fingerprint["functions_sha256"])
+        if not baseline:
+            print("No stored run with a different schema fingerprint to compare against", file=sys.stderr)
+            return 0
+        print(f"\nBaseline: {baseline[0]} (schema {baseline[1]['schema'].get('functions_sha256')})")
+        if baseline[1].get("scale") != report["scale"]:
+            print("⚠️  Baseline was run at a different scale; deltas are not like-for-like")
+        regressions = compare(results, baseline[1], args.regression_pct)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than {args.regression_pct:g}%: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
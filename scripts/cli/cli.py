@@ -7,12 +7,19 @@ Usage:
     python cli.py add-professional --clinic "Clinic Name" --name "Dr. Smith"
     python cli.py list-tenants
     python cli.py list-professionals --clinic "Clinic Name"
+    python cli.py import --file tenants.jsonl
 """
 
 import argparse
+import csv
+import json
 import os
 import sys
+import tempfile
 import uuid
+from typing import Dict, Iterator, List, Optional, Tuple
+
+CLINIC_TYPES = ["medical", "aesthetic", "mixed", "dental", "other"]
 
 def get_conn():
     """Get database connection using environment variables."""
@@ -32,11 +39,30 @@ def get_conn():
     )
 
 
+def default_instance_name(name: str) -> str:
+    """Derive the Evolution instance name from a tenant name."""
+    return name.lower().replace(" ", "_").replace("-", "_") + "_instance"
+
+
+def default_slug(name: str, max_length: int) -> str:
+    """Derive a URL-safe slug from a display name."""
+    return name.lower().replace(" ", "-").replace(".", "")[:max_length]
+
+
+def default_prompts(name: str) -> Tuple[str, str, str]:
+    """Initial (patient, internal, confirmation) system prompts for a tenant."""
+    return (
+        f"Você é a atendente virtual da {name}. Responda de forma objetiva e profissional.",
+        f"Você é o assistente interno da {name} para a equipe.",
+        f"Você envia lembretes de consulta da {name}.",
+    )
+
+
 def cmd_add_tenant(args):
     """Create a new tenant (clinic)."""
     name = args.name
-    evolution_instance = args.evolution_instance or name.lower().replace(" ", "_").replace("-", "_") + "_instance"
-    slug = args.slug or name.lower().replace(" ", "-").replace(".", "")[:50]
+    evolution_instance = args.evolution_instance or default_instance_name(name)
+    slug = args.slug or default_slug(name, 50)
     
     with get_conn() as conn:
         with conn.cursor() as cur:
@@ -70,9 +96,7 @@ def cmd_add_tenant(args):
                     name,
                     args.clinic_type or "mixed",
                     args.timezone or "America/Sao_Paulo",
-                    f"Você é a atendente virtual da {name}. Responda de forma objetiva e profissional.",
-                    f"Você é o assistente interno da {name} para a equipe.",
-                    f"Você envia lembretes de consulta da {name}.",
+                    *default_prompts(name),
                     args.whatsapp or None,
                 ),
             )
@@ -112,7 +136,7 @@ def cmd_add_professional(args):
                 sys.exit(1)
             
             tenant_id, clinic_name = row
-            slug = args.slug or professional_name.lower().replace(" ", "-").replace(".", "")[:100]
+            slug = args.slug or default_slug(professional_name, 100)
             
             # Check for duplicate
             cur.execute(
@@ -151,31 +175,121 @@ def cmd_add_professional(args):
     print(f"   Professional ID: {professional_id}")
 
 
-def cmd_list_tenants(args):
-    """List all tenants."""
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """SELECT tenant_name, tenant_slug, evolution_instance_name, 
-                          clinic_type, is_active, subscription_tier, created_at
-                   FROM tenant_config ORDER BY created_at DESC"""
-            )
-            rows = cur.fetchall()
-    
-    if not rows:
-        print("No tenants found.")
-        return
-    
-    print(f"{'Name':<30} {'Slug':<20} {'Instance':<25} {'Type':<10} {'Active':<8} {'Tier':<12}")
-    print("─" * 115)
+# Rows are fetched from a server-side (named) cursor in batches of this size,
+# so listings start printing immediately and never hold the whole table
+LIST_FETCH_SIZE = 500
+
+TENANT_LIST_COLUMNS = [
+    "tenant_name", "tenant_slug", "evolution_instance_name",
+    "clinic_type", "is_active", "subscription_tier", "created_at",
+]
+PROFESSIONAL_LIST_COLUMNS = [
+    "professional_name", "professional_slug", "specialty",
+    "google_calendar_id", "is_active", "slot_interval_minutes",
+]
+
+
+def stream_query(conn, name: str, sql: str, params: List) -> Iterator[tuple]:
+    """Iterate a query through a named cursor, LIST_FETCH_SIZE rows at a time."""
+    with conn.cursor(name=name) as cur:
+        cur.itersize = LIST_FETCH_SIZE
+        cur.execute(sql, params)
+        for row in cur:
+            yield row
+
+
+def write_rows(rows: Iterator[tuple], columns: List[str], fmt: str, print_table_row,
+               table_header: str, table_width: int) -> Tuple[int, Optional[tuple]]:
+    """Write rows as they arrive; returns (row count, last row) for paging."""
+    count, last = 0, None
+    if fmt == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
     for row in rows:
+        if fmt == "jsonl":
+            print(json.dumps(dict(zip(columns, row)), default=str, ensure_ascii=False))
+        elif fmt == "csv":
+            writer.writerow(row)
+        else:
+            if last is None:
+                print(table_header)
+                print("─" * table_width)
+            print_table_row(row)
+        count, last = count + 1, row
+    return count, last
+
+
+def print_next_page(count: int, last: Optional[tuple], limit: Optional[int]):
+    """Tell the operator how to fetch the following page (stderr keeps pipes clean)."""
+    # Both listings carry the slug in column 1, which is what --after takes
+    if limit and count == limit:
+        print(f"Next page: --after {last[1]}", file=sys.stderr)
+
+
+def fetch_cursor(conn, sql: str, params: Tuple, what: str, slug: str) -> tuple:
+    """Sort key of the --after row; exits when no such row exists."""
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        row = cur.fetchone()
+    if not row:
+        print(f"ERROR: --after: {what} with slug '{slug}' not found.", file=sys.stderr)
+        sys.exit(1)
+    return row
+
+
+def cmd_list_tenants(args):
+    """List tenants, newest first, with keyset pagination."""
+    where, params = [], []
+    if args.active is not None:
+        where.append("is_active = %s")
+        params.append(args.active)
+    if args.tier:
+        where.append("subscription_tier = %s")
+        params.append(args.tier)
+    if args.clinic_type:
+        where.append("clinic_type = %s")
+        params.append(args.clinic_type)
+
+    def print_row(row):
         name, slug, instance, ctype, active, tier, created = row
         status = "✅" if active else "❌"
         print(f"{name:<30} {slug:<20} {instance:<25} {ctype:<10} {status:<8} {tier:<12}")
 
+    with get_conn() as conn:
+        if args.after:
+            # Keyset pagination: resume strictly after the given tenant in
+            # (created_at DESC, tenant_id DESC) order, served by idx_tenant_created
+            where.append("(created_at, tenant_id) < (%s, %s)")
+            params.extend(fetch_cursor(
+                conn,
+                "SELECT created_at, tenant_id FROM tenant_config WHERE tenant_slug = %s",
+                (args.after,), "tenant", args.after,
+            ))
+
+        sql = f"""SELECT {', '.join(TENANT_LIST_COLUMNS)}
+                  FROM tenant_config
+                  {'WHERE ' + ' AND '.join(where) if where else ''}
+                  ORDER BY created_at DESC, tenant_id DESC"""
+        if args.limit:
+            sql += " LIMIT %s"
+            params.append(args.limit)
+
+        count, last = write_rows(
+            stream_query(conn, "list_tenants", sql, params),
+            TENANT_LIST_COLUMNS,
+            args.format,
+            print_row,
+            f"{'Name':<30} {'Slug':<20} {'Instance':<25} {'Type':<10} {'Active':<8} {'Tier':<12}",
+            115,
+        )
+
+    if count == 0 and args.format == "table":
+        print("No tenants found.")
+    print_next_page(count, last, args.limit)
+
 
 def cmd_list_professionals(args):
-    """List professionals for a clinic."""
+    """List professionals for a clinic with keyset pagination."""
     clinic = args.clinic
     
     with get_conn() as conn:
@@ -193,29 +307,519 @@ def cmd_list_professionals(args):
                 sys.exit(1)
             
             tenant_id, clinic_name = row
-            
-            cur.execute(
-                """SELECT professional_name, professional_slug, specialty, 
-                          google_calendar_id, is_active, slot_interval_minutes
-                   FROM professionals 
-                   WHERE tenant_id = %s
-                   ORDER BY display_order, professional_name""",
-                (tenant_id,)
+
+        where, params = ["tenant_id = %s"], [tenant_id]
+        if args.active is not None:
+            where.append("is_active = %s")
+            params.append(args.active)
+        if args.after:
+            # Resume after the given professional in listing order; slugs are
+            # unique per tenant so the key is unambiguous. display_order is
+            # nullable, so the key uses the same COALESCE as
+            # idx_professionals_listing_order (a NULL would match no row).
+            where.append(
+                "(COALESCE(display_order, 0), professional_name, professional_id) > (%s, %s, %s)"
             )
-            rows = cur.fetchall()
-    
-    print(f"\n📋 Professionals at {clinic_name}\n")
-    if not rows:
+            params.extend(fetch_cursor(
+                conn,
+                """SELECT COALESCE(display_order, 0), professional_name, professional_id
+                   FROM professionals WHERE tenant_id = %s AND professional_slug = %s""",
+                (tenant_id, args.after), "professional", args.after,
+            ))
+
+        sql = f"""SELECT {', '.join(PROFESSIONAL_LIST_COLUMNS)}
+                  FROM professionals
+                  WHERE {' AND '.join(where)}
+                  ORDER BY COALESCE(display_order, 0), professional_name, professional_id"""
+        if args.limit:
+            sql += " LIMIT %s"
+            params.append(args.limit)
+
+        def print_row(row):
+            name, slug, specialty, calendar, active, slot = row
+            status = "✅" if active else "❌"
+            cal_status = "✅" if calendar else "❌"
+            print(f"{name:<25} {slug:<20} {specialty:<25} {cal_status:<10} {status:<8} {slot:<6}")
+
+        if args.format == "table":
+            print(f"\n📋 Professionals at {clinic_name}\n")
+        count, last = write_rows(
+            stream_query(conn, "list_professionals", sql, params),
+            PROFESSIONAL_LIST_COLUMNS,
+            args.format,
+            print_row,
+            f"{'Name':<25} {'Slug':<20} {'Specialty':<25} {'Calendar':<10} {'Active':<8} {'Slot':<6}",
+            100,
+        )
+
+    if count == 0 and args.format == "table":
         print("No professionals found.")
-        return
-    
-    print(f"{'Name':<25} {'Slug':<20} {'Specialty':<25} {'Calendar':<10} {'Active':<8} {'Slot':<6}")
-    print("─" * 100)
-    for row in rows:
-        name, slug, specialty, calendar, active, slot = row
-        status = "✅" if active else "❌"
-        cal_status = "✅" if calendar else "❌"
-        print(f"{name:<25} {slug:<20} {specialty:<25} {cal_status:<10} {status:<8} {slot:<6}")
+    print_next_page(count, last, args.limit)
+
+
+# ============================================================================
+# BULK IMPORT
+# ============================================================================
+#
+# Records are streamed from the input file, normalized with the same defaults
+# as add-tenant / add-professional, and spooled as CSV into temp tables with
+# COPY. Duplicate and reference checks then run as set-based joins against
+# the live tables, failing rows are removed from the temp tables (and
+# reported), and the survivors are inserted with one INSERT ... SELECT per
+# target table -- all inside a single transaction. Each of those inserts runs
+# under a savepoint: when a constraint the checks do not cover rejects it
+# (a CHECK, a row another session just inserted), it is rolled back and
+# retried one record per savepoint, so only the offending records fail and
+# are reported with the database's error.
+#
+# JSONL records:
+#   {"kind": "tenant", "name": "Clinic A", "whatsapp": "+55...", "apikey": "..."}
+#   {"kind": "professional", "clinic": "clinic-a", "name": "Dr. X",
+#    "services": [{"code": "BOTOX_FACIAL", "duration": 45, "price_cents": 90000}]}
+#
+# CSV columns use the same names; "services" is "CODE[:duration[:price_cents]]"
+# entries separated by ";". When "kind" is omitted it is inferred from the
+# presence of "clinic".
+
+TENANT_COLUMNS = [
+    "line_no", "tenant_id", "tenant_name", "tenant_slug", "evolution_instance_name",
+    "clinic_type", "timezone", "system_prompt_patient", "system_prompt_internal",
+    "system_prompt_confirmation", "whatsapp_number", "apikey",
+]
+PROFESSIONAL_COLUMNS = [
+    "line_no", "professional_id", "clinic", "professional_name", "professional_slug",
+    "specialty", "google_calendar_id", "slot_interval_minutes",
+]
+PROFESSIONAL_SERVICE_COLUMNS = [
+    "line_no", "professional_id", "service_code", "custom_duration_minutes", "custom_price_cents",
+]
+
+# Keep up to this much CSV in memory per table before spilling to disk
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+IMPORT_TEMP_TABLES = """
+    CREATE TEMP TABLE import_tenants (
+        line_no INTEGER PRIMARY KEY, tenant_id UUID, tenant_name TEXT,
+        tenant_slug TEXT, evolution_instance_name TEXT, clinic_type TEXT,
+        timezone TEXT, system_prompt_patient TEXT, system_prompt_internal TEXT,
+        system_prompt_confirmation TEXT, whatsapp_number TEXT, apikey TEXT
+    ) ON COMMIT DROP;
+    CREATE TEMP TABLE import_professionals (
+        line_no INTEGER PRIMARY KEY, professional_id UUID, clinic TEXT,
+        tenant_id UUID, professional_name TEXT, professional_slug TEXT,
+        specialty TEXT, google_calendar_id TEXT, slot_interval_minutes INTEGER
+    ) ON COMMIT DROP;
+    CREATE TEMP TABLE import_professional_services (
+        line_no INTEGER, professional_id UUID, service_code TEXT,
+        custom_duration_minutes INTEGER, custom_price_cents INTEGER
+    ) ON COMMIT DROP;
+"""
+
+# Tenant name, slug and instance are each unique, both against the database
+# and within the file (the first occurrence in the file wins).
+REJECT_DUPLICATE_TENANTS = """
+    WITH bad AS (
+        SELECT i.line_no, 1 AS priority
+        FROM import_tenants i JOIN tenant_config t ON t.tenant_name = i.tenant_name
+        UNION ALL
+        SELECT i.line_no, 1
+        FROM import_tenants i JOIN tenant_config t ON t.tenant_slug = i.tenant_slug
+        UNION ALL
+        SELECT i.line_no, 1
+        FROM import_tenants i
+        JOIN tenant_config t ON t.evolution_instance_name = i.evolution_instance_name
+        UNION ALL
+        SELECT line_no, 2
+        FROM (
+            SELECT line_no,
+                   ROW_NUMBER() OVER (PARTITION BY tenant_name ORDER BY line_no) AS rn_name,
+                   ROW_NUMBER() OVER (PARTITION BY tenant_slug ORDER BY line_no) AS rn_slug,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY evolution_instance_name ORDER BY line_no) AS rn_instance
+            FROM import_tenants
+        ) ranked
+        WHERE rn_name > 1 OR rn_slug > 1 OR rn_instance > 1
+    ), first_reason AS (
+        SELECT line_no, MIN(priority) AS priority FROM bad GROUP BY line_no
+    )
+    DELETE FROM import_tenants i USING first_reason b
+    WHERE i.line_no = b.line_no
+    RETURNING i.line_no, CASE b.priority
+        WHEN 1 THEN 'Tenant with that name, instance or slug already exists.'
+        ELSE 'Duplicate tenant name, instance or slug earlier in the file.'
+    END
+"""
+
+INSERT_TENANTS = """
+    INSERT INTO tenant_config (
+        tenant_id, tenant_name, tenant_slug, evolution_instance_name,
+        clinic_name, clinic_type, timezone,
+        system_prompt_patient, system_prompt_internal, system_prompt_confirmation,
+        whatsapp_number
+    )
+    SELECT tenant_id, tenant_name, tenant_slug, evolution_instance_name,
+           tenant_name, clinic_type, timezone,
+           system_prompt_patient, system_prompt_internal, system_prompt_confirmation,
+           whatsapp_number
+    FROM import_tenants
+    WHERE %(line_no)s::integer IS NULL OR line_no = %(line_no)s
+    ORDER BY line_no
+"""
+
+INSERT_TENANT_SECRETS = """
+    INSERT INTO tenant_secrets (tenant_id, secret_key, secret_value_encrypted, secret_type)
+    SELECT tenant_id, 'evolution_api_key', apikey, 'api_key'
+    FROM import_tenants
+    WHERE apikey IS NOT NULL
+    AND (%(line_no)s::integer IS NULL OR line_no = %(line_no)s)
+"""
+
+# Resolve the clinic the same way add-professional does, one hash join per
+# identifier; tenants loaded earlier in this transaction are visible.
+RESOLVE_PROFESSIONAL_TENANTS = [
+    f"""
+    UPDATE import_professionals p SET tenant_id = t.tenant_id
+    FROM tenant_config t
+    WHERE p.tenant_id IS NULL AND t.is_active AND t.{column} = p.clinic
+    """
+    for column in ("tenant_name", "tenant_slug", "evolution_instance_name")
+]
+
+REJECT_UNKNOWN_CLINICS = """
+    DELETE FROM import_professionals
+    WHERE tenant_id IS NULL
+    RETURNING line_no, format('Clinic ''%s'' not found.', clinic)
+"""
+
+REJECT_DUPLICATE_PROFESSIONALS = """
+    WITH bad AS (
+        SELECT i.line_no, 1 AS priority
+        FROM import_professionals i
+        JOIN professionals p
+          ON p.tenant_id = i.tenant_id AND p.professional_slug = i.professional_slug
+        UNION ALL
+        SELECT line_no, 2
+        FROM (
+            SELECT line_no, ROW_NUMBER() OVER (
+                PARTITION BY tenant_id, professional_slug ORDER BY line_no) AS rn
+            FROM import_professionals
+        ) ranked
+        WHERE rn > 1
+    ), first_reason AS (
+        SELECT line_no, MIN(priority) AS priority FROM bad GROUP BY line_no
+    )
+    DELETE FROM import_professionals i USING first_reason b
+    WHERE i.line_no = b.line_no
+    RETURNING i.line_no, CASE b.priority
+        WHEN 1 THEN format('Professional with slug ''%s'' already exists in this clinic.',
+                           i.professional_slug)
+        ELSE format('Duplicate professional slug ''%s'' earlier in the file.',
+                    i.professional_slug)
+    END
+"""
+
+REJECT_UNKNOWN_SERVICES = """
+    WITH bad AS (
+        SELECT s.line_no, string_agg(s.service_code, ', ' ORDER BY s.service_code) AS codes
+        FROM import_professional_services s
+        LEFT JOIN services_catalog sc ON sc.service_code = s.service_code AND sc.is_active
+        WHERE sc.service_id IS NULL
+        GROUP BY s.line_no
+    )
+    DELETE FROM import_professionals i USING bad b
+    WHERE i.line_no = b.line_no
+    RETURNING i.line_no, 'Unknown service code(s): ' || b.codes
+"""
+
+INSERT_PROFESSIONALS = """
+    INSERT INTO professionals (
+        professional_id, tenant_id, professional_name, professional_slug,
+        specialty, google_calendar_id, slot_interval_minutes
+    )
+    SELECT professional_id, tenant_id, professional_name, professional_slug,
+           specialty, google_calendar_id, slot_interval_minutes
+    FROM import_professionals
+    WHERE %(line_no)s::integer IS NULL OR line_no = %(line_no)s
+    ORDER BY line_no
+"""
+
+# Duration and price fall back to the catalog defaults when not given
+INSERT_PROFESSIONAL_SERVICES = """
+    INSERT INTO professional_services (
+        professional_id, service_id, custom_duration_minutes, custom_price_cents
+    )
+    SELECT s.professional_id, sc.service_id,
+           COALESCE(s.custom_duration_minutes, sc.default_duration_minutes),
+           COALESCE(s.custom_price_cents, sc.default_price_cents)
+    FROM import_professional_services s
+    JOIN import_professionals p ON p.line_no = s.line_no
+    JOIN services_catalog sc ON sc.service_code = s.service_code
+    WHERE %(line_no)s::integer IS NULL OR s.line_no = %(line_no)s
+"""
+
+
+class RecordError(ValueError):
+    """A record that cannot be imported; it is reported and skipped."""
+
+
+def read_records(path: str, fmt: str) -> Iterator[Tuple[int, Dict]]:
+    """Yield (line number, record) pairs without loading the whole file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, {"__error__": f"Invalid JSON: {e.msg}"}
+
+
+def _text(record: Dict, key: str) -> Optional[str]:
+    """Return a stripped string field, or None when missing or blank."""
+    value = record.get(key)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _int(record: Dict, key: str, default: Optional[int], low: int, high: int) -> Optional[int]:
+    """Return an integer field checked against the schema's CHECK range."""
+    value = _text(record, key)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise RecordError(f"'{key}' must be an integer")
+    if not low <= number <= high:
+        raise RecordError(f"'{key}' must be between {low} and {high}")
+    return number
+
+
+def parse_services(value) -> List[Dict]:
+    """Accept a JSON list of service dicts or the CSV 'CODE:dur:price;...' form."""
+    if not value:
+        return []
+    if isinstance(value, list):
+        return value
+    services = []
+    for entry in str(value).split(";"):
+        parts = [p.strip() for p in entry.split(":")]
+        if not parts[0]:
+            continue
+        services.append({
+            "code": parts[0],
+            "duration": parts[1] if len(parts) > 1 else None,
+            "price_cents": parts[2] if len(parts) > 2 else None,
+        })
+    return services
+
+
+def normalize_tenant(line_no: int, record: Dict) -> List:
+    """Build an import_tenants row, applying the add-tenant defaults."""
+    name = _text(record, "name")
+    if not name:
+        raise RecordError("'name' is required")
+    clinic_type = _text(record, "clinic_type") or "mixed"
+    if clinic_type not in CLINIC_TYPES:
+        raise RecordError(f"invalid clinic_type '{clinic_type}'")
+    return [
+        line_no,
+        str(uuid.uuid4()),
+        name,
+        _text(record, "slug") or default_slug(name, 50),
+        _text(record, "evolution_instance") or default_instance_name(name),
+        clinic_type,
+        _text(record, "timezone") or "America/Sao_Paulo",
+        *default_prompts(name),
+        _text(record, "whatsapp"),
+        _text(record, "apikey"),
+    ]
+
+
+def normalize_professional(line_no: int, record: Dict) -> Tuple[List, List[List]]:
+    """Build import_professionals and import_professional_services rows."""
+    name = _text(record, "name")
+    clinic = _text(record, "clinic")
+    if not name or not clinic:
+        raise RecordError("'name' and 'clinic' are required")
+    professional_id = str(uuid.uuid4())
+    professional = [
+        line_no,
+        professional_id,
+        clinic,
+        name,
+        _text(record, "slug") or default_slug(name, 100),
+        _text(record, "specialty") or "Geral",
+        _text(record, "calendar_id"),
+        _int(record, "slot_minutes", 30, 5, 120),
+    ]
+
+    services, seen = [], set()
+    for service in parse_services(record.get("services")):
+        code = _text(service, "code")
+        if not code:
+            raise RecordError("service entry without 'code'")
+        if code in seen:
+            raise RecordError(f"service '{code}' listed twice")
+        seen.add(code)
+        services.append([
+            line_no,
+            professional_id,
+            code,
+            _int(service, "duration", None, 5, 480),
+            _int(service, "price_cents", None, 0, 2**31 - 1),
+        ])
+    return professional, services
+
+
+def copy_rows(cur, table: str, columns: List[str], spool) -> None:
+    """COPY a spooled CSV buffer into a temp table."""
+    spool.seek(0)
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", spool
+    )
+    # Temp tables are never auto-analyzed; give the planner real row counts
+    cur.execute(f"ANALYZE {table}")
+
+
+def insert_staged(cur, table: str, inserts: Dict[str, str],
+                  failures: List[Tuple[int, str]]) -> Dict[str, int]:
+    """Run INSERT ... SELECTs from a staging table; returns rows inserted per key.
+
+    The statements run together under a savepoint. If the database rejects
+    them, they are retried for one staged record at a time, each under its
+    own savepoint; records that still fail are reported and dropped from
+    the staging table so later steps ignore them.
+    """
+    import psycopg2
+
+    counts = dict.fromkeys(inserts, 0)
+    cur.execute("SAVEPOINT import_batch")
+    try:
+        for key, sql in inserts.items():
+            cur.execute(sql, {"line_no": None})
+            counts[key] = cur.rowcount
+        cur.execute("RELEASE SAVEPOINT import_batch")
+        return counts
+    except psycopg2.Error:
+        cur.execute("ROLLBACK TO SAVEPOINT import_batch")
+
+    counts = dict.fromkeys(inserts, 0)
+    cur.execute(f"SELECT line_no FROM {table} ORDER BY line_no")
+    for (line_no,) in cur.fetchall():
+        cur.execute("SAVEPOINT import_row")
+        try:
+            inserted = {}
+            for key, sql in inserts.items():
+                cur.execute(sql, {"line_no": line_no})
+                inserted[key] = cur.rowcount
+            cur.execute("RELEASE SAVEPOINT import_row")
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT import_row")
+            failures.append((line_no, e.diag.message_primary or str(e).strip()))
+            cur.execute(f"DELETE FROM {table} WHERE line_no = %s", (line_no,))
+            continue
+        for key, n in inserted.items():
+            counts[key] += n
+    cur.execute("RELEASE SAVEPOINT import_batch")
+    return counts
+
+
+def load_import(cur, tenants, professionals, services,
+                failures: List[Tuple[int, str]]) -> Dict[str, int]:
+    """Validate and insert the staged rows set-wise; returns per-table counts."""
+    cur.execute(IMPORT_TEMP_TABLES)
+    copy_rows(cur, "import_tenants", TENANT_COLUMNS, tenants)
+    copy_rows(cur, "import_professionals", PROFESSIONAL_COLUMNS, professionals)
+    copy_rows(cur, "import_professional_services", PROFESSIONAL_SERVICE_COLUMNS, services)
+
+    cur.execute(REJECT_DUPLICATE_TENANTS)
+    failures.extend(cur.fetchall())
+    counts = insert_staged(cur, "import_tenants", {
+        "tenants": INSERT_TENANTS,
+        "secrets": INSERT_TENANT_SECRETS,
+    }, failures)
+
+    for sql in RESOLVE_PROFESSIONAL_TENANTS:
+        cur.execute(sql)
+    for sql in (REJECT_UNKNOWN_CLINICS, REJECT_DUPLICATE_PROFESSIONALS, REJECT_UNKNOWN_SERVICES):
+        cur.execute(sql)
+        failures.extend(cur.fetchall())
+    counts.update(insert_staged(cur, "import_professionals", {
+        "professionals": INSERT_PROFESSIONALS,
+        "professional_services": INSERT_PROFESSIONAL_SERVICES,
+    }, failures))
+    return counts
+
+
+def cmd_import(args):
+    """Bulk-load tenants and professionals from a JSONL or CSV file."""
+    fmt = args.format or ("csv" if args.file.lower().endswith(".csv") else "jsonl")
+    failures: List[Tuple[int, str]] = []
+    records = 0
+    spools = [
+        tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode="w+", newline="")
+        for _ in range(3)
+    ]
+    tenant_out, professional_out, service_out = (csv.writer(sp) for sp in spools)
+
+    try:
+        for line_no, record in read_records(args.file, fmt):
+            records += 1
+            try:
+                if "__error__" in record:
+                    raise RecordError(record["__error__"])
+                kind = _text(record, "kind") or ("professional" if _text(record, "clinic") else "tenant")
+                if kind == "tenant":
+                    tenant_out.writerow(normalize_tenant(line_no, record))
+                elif kind == "professional":
+                    professional, services = normalize_professional(line_no, record)
+                    professional_out.writerow(professional)
+                    service_out.writerows(services)
+                else:
+                    raise RecordError(f"unknown kind '{kind}'")
+            except RecordError as e:
+                failures.append((line_no, str(e)))
+    except OSError as e:
+        print(f"ERROR: Cannot read {args.file}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            counts = load_import(cur, *spools, failures)
+        if args.dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    for spool in spools:
+        spool.close()
+
+    verb = "Would import" if args.dry_run else "Imported"
+    print(f"✅ {verb} {counts['tenants']} tenants ({counts['secrets']} API keys), "
+          f"{counts['professionals']} professionals, "
+          f"{counts['professional_services']} professional services")
+    if failures:
+        print(f"❌ {len(failures)} of {records} records failed:", file=sys.stderr)
+        for line_no, reason in sorted(failures):
+            print(f"   line {line_no}: {reason}", file=sys.stderr)
+        sys.exit(1)
+
+
+def add_list_arguments(parser: argparse.ArgumentParser):
+    """Paging, filtering and output options shared by the list commands."""
+    active = parser.add_mutually_exclusive_group()
+    active.add_argument("--active", dest="active", action="store_const", const=True, help="Only active rows")
+    active.add_argument("--inactive", dest="active", action="store_const", const=False, help="Only inactive rows")
+    parser.add_argument("--after", metavar="SLUG", help="Start after this slug (keyset pagination)")
+    parser.add_argument("--limit", type=int, help="Maximum rows to return")
+    parser.add_argument("--format", choices=["table", "jsonl", "csv"], default="table", help="Output format")
 
 
 def main():
@@ -233,7 +837,7 @@ def main():
     p_tenant.add_argument("--whatsapp", help="WhatsApp number")
     p_tenant.add_argument("--apikey", help="API key (stored in tenant_secrets)")
     p_tenant.add_argument("--timezone", default="America/Sao_Paulo")
-    p_tenant.add_argument("--clinic-type", choices=["medical", "aesthetic", "mixed", "dental", "other"], default="mixed")
+    p_tenant.add_argument("--clinic-type", choices=CLINIC_TYPES, default="mixed")
     p_tenant.set_defaults(func=cmd_add_tenant)
     
     # add-professional
@@ -248,13 +852,24 @@ def main():
     
     # list-tenants
     p_list = sub.add_parser("list-tenants", help="List all tenants")
+    add_list_arguments(p_list)
+    p_list.add_argument("--tier", choices=["basic", "professional", "enterprise"], help="Only this subscription tier")
+    p_list.add_argument("--clinic-type", choices=CLINIC_TYPES, help="Only this clinic type")
     p_list.set_defaults(func=cmd_list_tenants)
     
     # list-professionals
     p_list_pro = sub.add_parser("list-professionals", help="List professionals for a clinic")
     p_list_pro.add_argument("--clinic", required=True, help="Clinic name, slug, or evolution instance name")
+    add_list_arguments(p_list_pro)
     p_list_pro.set_defaults(func=cmd_list_professionals)
     
+    # import
+    p_import = sub.add_parser("import", help="Bulk-load tenants and professionals from JSONL or CSV")
+    p_import.add_argument("--file", required=True, help="Path to a .jsonl or .csv file")
+    p_import.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from file extension)")
+    p_import.add_argument("--dry-run", action="store_true", help="Validate and report without committing")
+    p_import.set_defaults(func=cmd_import)
+    
     args = parser.parse_args()
     args.func(args)
 
@@ -19,6 +19,12 @@
 -- Enable pgcrypto for gen_random_uuid() if not already enabled
 CREATE EXTENSION IF NOT EXISTS pgcrypto;
 
+-- Trigram similarity for fuzzy FAQ matching (ships with postgres contrib)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- UUID equality inside GiST exclusion constraints (overlap-safe booking)
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
 -- ============================================================================
 -- 1. TENANT_CONFIG TABLE (Core multi-tenant configuration)
 -- ============================================================================
@@ -63,6 +69,8 @@ CREATE TABLE IF NOT EXISTS tenant_config (
     telegram_bot_token TEXT,
     whatsapp_number VARCHAR(20),
     messaging_provider VARCHAR(20) DEFAULT 'evolution',
+    message_coalesce_window_ms INTEGER NOT NULL DEFAULT 2500,
+    message_coalesce_max_ms INTEGER NOT NULL DEFAULT 8000,
     
     -- AI Configuration
     system_prompt_patient TEXT NOT NULL,
@@ -84,6 +92,13 @@ CREATE TABLE IF NOT EXISTS tenant_config (
     monthly_message_limit INTEGER DEFAULT 10000,
     current_message_count INTEGER DEFAULT 0,
     last_quota_reset DATE DEFAULT CURRENT_DATE,
+    media_max_bytes INTEGER NOT NULL DEFAULT 16777216,
+    media_cache_ttl_days INTEGER NOT NULL DEFAULT 30,
+    media_cache_budget_bytes BIGINT NOT NULL DEFAULT 10485760,
+    chat_memory_keep_messages INTEGER NOT NULL DEFAULT 20,
+    chat_memory_summary_chars INTEGER NOT NULL DEFAULT 2000,
+    chat_memory_retention_days INTEGER NOT NULL DEFAULT 365,
+    chat_memory_archive BOOLEAN NOT NULL DEFAULT false,
     
     -- Subscription & Billing
     subscription_tier VARCHAR(50) DEFAULT 'basic',
@@ -100,12 +115,48 @@ CREATE TABLE IF NOT EXISTS tenant_config (
     CONSTRAINT valid_tier CHECK (subscription_tier IN ('basic', 'professional', 'enterprise')),
     CONSTRAINT valid_status CHECK (subscription_status IN ('active', 'suspended', 'cancelled', 'trial')),
     CONSTRAINT valid_clinic_type CHECK (clinic_type IN ('medical', 'aesthetic', 'mixed', 'dental', 'other')),
-    CONSTRAINT valid_messaging_provider CHECK (messaging_provider IN ('evolution', 'chatwoot'))
+    CONSTRAINT valid_messaging_provider CHECK (messaging_provider IN ('evolution', 'chatwoot')),
+    CONSTRAINT valid_coalesce_window CHECK (message_coalesce_window_ms >= 0 AND message_coalesce_max_ms >= message_coalesce_window_ms),
+    CONSTRAINT valid_media_limits CHECK (media_max_bytes > 0 AND media_cache_ttl_days > 0 AND media_cache_budget_bytes >= 0),
+    CONSTRAINT valid_chat_memory_limits CHECK (chat_memory_keep_messages >= 2 AND chat_memory_summary_chars >= 0 AND chat_memory_retention_days > 0)
 );
 
+-- Databases created before media result caching
+ALTER TABLE tenant_config ADD COLUMN IF NOT EXISTS media_max_bytes INTEGER NOT NULL DEFAULT 16777216;
+ALTER TABLE tenant_config ADD COLUMN IF NOT EXISTS media_cache_ttl_days INTEGER NOT NULL DEFAULT 30;
+ALTER TABLE tenant_config ADD COLUMN IF NOT EXISTS media_cache_budget_bytes BIGINT NOT NULL DEFAULT 10485760;
+ALTER TABLE tenant_config DROP CONSTRAINT IF EXISTS valid_media_limits;
+ALTER TABLE tenant_config ADD CONSTRAINT valid_media_limits
+CHECK (media_max_bytes > 0 AND media_cache_ttl_days > 0 AND media_cache_budget_bytes >= 0);
+
+-- Databases created before chat memory compaction
+ALTER TABLE tenant_config ADD COLUMN IF NOT EXISTS chat_memory_keep_messages INTEGER NOT NULL DEFAULT 20;
+ALTER TABLE tenant_config ADD COLUMN IF NOT EXISTS chat_memory_summary_chars INTEGER NOT NULL DEFAULT 2000;
+ALTER TABLE tenant_config ADD COLUMN IF NOT EXISTS chat_memory_retention_days INTEGER NOT NULL DEFAULT 365;
+ALTER TABLE tenant_config ADD COLUMN IF NOT EXISTS chat_memory_archive BOOLEAN NOT NULL DEFAULT false;
+ALTER TABLE tenant_config DROP CONSTRAINT IF EXISTS valid_chat_memory_limits;
+ALTER TABLE tenant_config ADD CONSTRAINT valid_chat_memory_limits
+CHECK (chat_memory_keep_messages >= 2 AND chat_memory_summary_chars >= 0 AND chat_memory_retention_days > 0);
+
+-- Databases created before message coalescing
+ALTER TABLE tenant_config ADD COLUMN IF NOT EXISTS message_coalesce_window_ms INTEGER NOT NULL DEFAULT 2500;
+ALTER TABLE tenant_config ADD COLUMN IF NOT EXISTS message_coalesce_max_ms INTEGER NOT NULL DEFAULT 8000;
+ALTER TABLE tenant_config DROP CONSTRAINT IF EXISTS valid_coalesce_window;
+ALTER TABLE tenant_config ADD CONSTRAINT valid_coalesce_window
+CHECK (message_coalesce_window_ms >= 0 AND message_coalesce_max_ms >= message_coalesce_window_ms);
+
 COMMENT ON TABLE tenant_config IS 'Core multi-tenant configuration table';
 COMMENT ON COLUMN tenant_config.clinic_type IS 'Type of clinic: medical, aesthetic, mixed, dental, other';
 COMMENT ON COLUMN tenant_config.default_google_credential_id IS 'Default n8n credential ID for Google Calendar';
+COMMENT ON COLUMN tenant_config.message_coalesce_window_ms IS 'Quiet period before a burst of text messages is answered as one turn (0 disables coalescing)';
+COMMENT ON COLUMN tenant_config.message_coalesce_max_ms IS 'Cap on how long late arrivals can keep extending the coalescing window';
+COMMENT ON COLUMN tenant_config.media_max_bytes IS 'Largest audio/image accepted for transcription or OCR; larger media is rejected before download';
+COMMENT ON COLUMN tenant_config.media_cache_ttl_days IS 'How long a cached transcription/OCR result is reused';
+COMMENT ON COLUMN tenant_config.media_cache_budget_bytes IS 'Total size of cached transcription/OCR text kept per tenant (0 disables the cache)';
+COMMENT ON COLUMN tenant_config.chat_memory_keep_messages IS 'Newest chat memory messages kept verbatim per session; older ones are folded into chat_memory_summaries';
+COMMENT ON COLUMN tenant_config.chat_memory_summary_chars IS 'Cap on a session''s folded-history summary (oldest lines are dropped first; 0 keeps no summary)';
+COMMENT ON COLUMN tenant_config.chat_memory_retention_days IS 'Chat memory sessions idle longer than this are removed, summary included';
+COMMENT ON COLUMN tenant_config.chat_memory_archive IS 'Move folded chat memory messages to chat_memory_archive instead of deleting them';
 
 -- Indexes for tenant_config
 CREATE INDEX IF NOT EXISTS idx_tenant_evolution_instance 
@@ -122,6 +173,10 @@ ON tenant_config(is_active);
 CREATE INDEX IF NOT EXISTS idx_tenant_quota_reset 
 ON tenant_config(last_quota_reset);
 
+-- Keyset pagination for clinic-cli list-tenants (newest first)
+CREATE INDEX IF NOT EXISTS idx_tenant_created
+ON tenant_config(created_at DESC, tenant_id DESC);
+
 -- ============================================================================
 -- 2. TENANT_SECRETS TABLE
 -- ============================================================================
@@ -148,9 +203,54 @@ CREATE INDEX IF NOT EXISTS idx_tenant_secrets_expiry ON tenant_secrets(expires_a
 -- ============================================================================
 -- 3. TENANT_ACTIVITY_LOG TABLE
 -- ============================================================================
+-- Range-partitioned by month on created_at; partitions are created ahead and
+-- expired whole by maintain_partitions() (see PARTITION MAINTENANCE).
+
+-- Function: Move a plain (pre-partitioning) table out of the way
+-- Renames the table, its indexes and owned sequences with an _unpartitioned
+-- suffix so the partitioned table can be created under the original name;
+-- adopt_unpartitioned_rows() later copies the rows still within retention.
+CREATE OR REPLACE FUNCTION retire_unpartitioned_table(p_table TEXT)
+RETURNS BOOLEAN AS $$
+DECLARE
+    v_name TEXT;
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_class c
+        WHERE c.oid = to_regclass(p_table) AND c.relkind = 'r'
+    ) THEN
+        RETURN false;
+    END IF;
+
+    FOR v_name IN
+        SELECT i.relname
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = to_regclass(p_table)
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', v_name, left(v_name, 49) || '_unpartitioned');
+    END LOOP;
+
+    FOR v_name IN
+        SELECT s.relname
+        FROM pg_depend d
+        JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+        WHERE d.refobjid = to_regclass(p_table)
+        AND d.deptype IN ('a', 'i')
+    LOOP
+        EXECUTE format('ALTER SEQUENCE %I RENAME TO %I', v_name, left(v_name, 49) || '_unpartitioned');
+    END LOOP;
+
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', p_table, p_table || '_unpartitioned');
+    RAISE NOTICE '% renamed to %_unpartitioned; recent rows are copied into the partitioned table', p_table, p_table;
+    RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$ BEGIN PERFORM retire_unpartitioned_table('tenant_activity_log'); END $$;
 
 CREATE TABLE IF NOT EXISTS tenant_activity_log (
-    log_id BIGSERIAL PRIMARY KEY,
+    log_id BIGSERIAL,
     tenant_id UUID NOT NULL REFERENCES tenant_config(tenant_id) ON DELETE CASCADE,
     
     activity_type VARCHAR(50) NOT NULL,
@@ -162,11 +262,17 @@ CREATE TABLE IF NOT EXISTS tenant_activity_log (
     
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     
+    PRIMARY KEY (log_id, created_at),
     CONSTRAINT valid_activity_type CHECK (activity_type IN (
         'message_received', 'message_sent', 'workflow_executed', 
         'error', 'quota_exceeded', 'unknown_instance', 'config_updated'
     ))
-);
+) PARTITION BY RANGE (created_at);
+
+-- Catches rows outside the premade partitions; create_partitions() moves
+-- them into their own partition
+CREATE TABLE IF NOT EXISTS tenant_activity_log_default
+PARTITION OF tenant_activity_log DEFAULT;
 
 CREATE INDEX IF NOT EXISTS idx_tenant_activity_tenant_date 
 ON tenant_activity_log(tenant_id, created_at DESC);
@@ -193,6 +299,7 @@ CREATE TABLE IF NOT EXISTS tenant_faq (
     -- Metadata for matching
     keywords TEXT[] DEFAULT '{}',
     intent VARCHAR(50),
+    question_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('portuguese', question_normalized)) STORED,
     
     -- Performance tracking
     view_count INTEGER DEFAULT 0,
@@ -207,20 +314,52 @@ CREATE TABLE IF NOT EXISTS tenant_faq (
     UNIQUE(tenant_id, question_normalized)
 );
 
+-- Databases created before stemmed FAQ matching
+ALTER TABLE tenant_faq ADD COLUMN IF NOT EXISTS question_tsv TSVECTOR
+GENERATED ALWAYS AS (to_tsvector('portuguese', question_normalized)) STORED;
+
 COMMENT ON TABLE tenant_faq IS 'Caches frequently asked questions to reduce AI API calls';
 COMMENT ON COLUMN tenant_faq.question_normalized IS 'Lowercase normalized version for efficient matching';
 COMMENT ON COLUMN tenant_faq.keywords IS 'Array of keywords for fuzzy matching via GIN index';
+COMMENT ON COLUMN tenant_faq.question_tsv IS 'Portuguese-stemmed question lexemes for match_faq()';
 
 CREATE INDEX IF NOT EXISTS idx_faq_tenant ON tenant_faq(tenant_id) WHERE is_active = true;
 CREATE INDEX IF NOT EXISTS idx_faq_normalized ON tenant_faq(question_normalized) WHERE is_active = true;
 CREATE INDEX IF NOT EXISTS idx_faq_keywords ON tenant_faq USING GIN(keywords);
 CREATE INDEX IF NOT EXISTS idx_faq_intent ON tenant_faq(intent) WHERE is_active = true;
 CREATE INDEX IF NOT EXISTS idx_faq_popularity ON tenant_faq(tenant_id, view_count DESC) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS idx_faq_question_trgm ON tenant_faq USING GIN(question_normalized gin_trgm_ops) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS idx_faq_question_tsv ON tenant_faq USING GIN(question_tsv) WHERE is_active = true;
 
 -- ============================================================================
 -- 5. SERVICES_CATALOG TABLE (Global Service Definitions)
 -- ============================================================================
 
+-- Search text normalization: lowercase, accents folded, punctuation to spaces.
+-- unaccent() is not IMMUTABLE (its rules file can change), so it cannot back
+-- generated columns or indexes; translate() covers the Portuguese alphabet.
+CREATE OR REPLACE FUNCTION normalize_search_text(p_text TEXT)
+RETURNS TEXT AS $$
+    SELECT btrim(regexp_replace(
+        translate(lower(COALESCE(p_text, '')),
+                  'áàâãäéèêëíìîïóòôõöúùûüçñ',
+                  'aaaaaeeeeiiiiooooouuuucn'),
+        '[^a-z0-9]+', ' ', 'g'));
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+-- Trigram document of a service: name, code and keywords
+CREATE OR REPLACE FUNCTION service_search_document(p_name TEXT, p_code TEXT, p_keywords TEXT[])
+RETURNS TEXT AS $$
+    SELECT normalize_search_text(p_name || ' ' || p_code || ' ' || array_to_string(p_keywords, ' '));
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+-- Portuguese-stemmed lexemes of a service: name weighted A, keywords B
+CREATE OR REPLACE FUNCTION service_search_vector(p_name TEXT, p_keywords TEXT[])
+RETURNS TSVECTOR AS $$
+    SELECT setweight(to_tsvector('portuguese', normalize_search_text(p_name)), 'A')
+        || setweight(to_tsvector('portuguese', normalize_search_text(array_to_string(p_keywords, ' '))), 'B');
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
 CREATE TABLE IF NOT EXISTS services_catalog (
     service_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     
@@ -232,6 +371,8 @@ CREATE TABLE IF NOT EXISTS services_catalog (
     -- Search & AI Matching
     service_keywords TEXT[] NOT NULL DEFAULT '{}',
     service_description TEXT,
+    search_document TEXT GENERATED ALWAYS AS (service_search_document(service_name, service_code, service_keywords)) STORED,
+    search_tsv TSVECTOR GENERATED ALWAYS AS (service_search_vector(service_name, service_keywords)) STORED,
     
     -- Default Values (can be overridden per professional)
     default_duration_minutes INTEGER NOT NULL DEFAULT 30,
@@ -251,14 +392,24 @@ CREATE TABLE IF NOT EXISTS services_catalog (
     updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
+-- Databases created before catalog search
+ALTER TABLE services_catalog ADD COLUMN IF NOT EXISTS search_document TEXT
+GENERATED ALWAYS AS (service_search_document(service_name, service_code, service_keywords)) STORED;
+ALTER TABLE services_catalog ADD COLUMN IF NOT EXISTS search_tsv TSVECTOR
+GENERATED ALWAYS AS (service_search_vector(service_name, service_keywords)) STORED;
+
 COMMENT ON TABLE services_catalog IS 'Global catalog of all services - professionals customize via junction table';
 COMMENT ON COLUMN services_catalog.service_code IS 'Unique machine-readable code for programmatic access';
 COMMENT ON COLUMN services_catalog.default_duration_minutes IS 'Default duration - professionals can override';
 COMMENT ON COLUMN services_catalog.default_price_cents IS 'Default price in cents - professionals can override';
+COMMENT ON COLUMN services_catalog.search_document IS 'Accent-folded name, code and keywords for trigram search (search_services)';
+COMMENT ON COLUMN services_catalog.search_tsv IS 'Portuguese-stemmed name (A) and keywords (B) for search_services()';
 
 CREATE INDEX IF NOT EXISTS idx_services_catalog_category ON services_catalog(service_category) WHERE is_active = true;
 CREATE INDEX IF NOT EXISTS idx_services_catalog_keywords ON services_catalog USING gin(service_keywords);
 CREATE INDEX IF NOT EXISTS idx_services_catalog_code ON services_catalog(service_code);
+CREATE INDEX IF NOT EXISTS idx_services_catalog_search_trgm ON services_catalog USING GIN(search_document gin_trgm_ops) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS idx_services_catalog_search_tsv ON services_catalog USING GIN(search_tsv) WHERE is_active = true;
 
 -- ============================================================================
 -- 6. PROFESSIONALS TABLE (Clinic Staff)
@@ -330,6 +481,10 @@ CREATE INDEX IF NOT EXISTS idx_professionals_tenant ON professionals(tenant_id)
 CREATE INDEX IF NOT EXISTS idx_professionals_specialty ON professionals(tenant_id, specialty) WHERE is_active = true;
 CREATE INDEX IF NOT EXISTS idx_professionals_keywords ON professionals USING gin(specialty_keywords);
 CREATE INDEX IF NOT EXISTS idx_professionals_slug ON professionals(tenant_id, professional_slug);
+-- clinic-cli list-professionals order; display_order is nullable, NULL sorts as 0
+DROP INDEX IF EXISTS idx_professionals_listing;
+CREATE INDEX IF NOT EXISTS idx_professionals_listing_order
+ON professionals(tenant_id, (COALESCE(display_order, 0)), professional_name, professional_id);
 
 -- ============================================================================
 -- 7. PROFESSIONAL_SERVICES TABLE (Custom Pricing & Duration)
@@ -497,6 +652,7 @@ CREATE TABLE IF NOT EXISTS calendars (
     google_refresh_token TEXT,
     google_access_token TEXT,
     google_token_expires_at TIMESTAMPTZ,
+    google_token_refresh_lease_until TIMESTAMPTZ,
     google_oauth_scope TEXT DEFAULT 'https://www.googleapis.com/auth/calendar',
     
     -- Constraints
@@ -505,6 +661,9 @@ CREATE TABLE IF NOT EXISTS calendars (
     CONSTRAINT valid_calendar_type CHECK (calendar_type IN ('appointments', 'availability', 'shared', 'other'))
 );
 
+-- Databases created before token refresh leases
+ALTER TABLE calendars ADD COLUMN IF NOT EXISTS google_token_refresh_lease_until TIMESTAMPTZ;
+
 COMMENT ON TABLE calendars IS 'Centralizes Google Calendar configuration per professional/tenant';
 COMMENT ON COLUMN calendars.google_calendar_id IS 'Google Calendar ID - unique per tenant';
 COMMENT ON COLUMN calendars.credential_ref IS 'Reference to n8n credential or env variable key';
@@ -514,6 +673,7 @@ COMMENT ON COLUMN calendars.google_client_secret IS 'Google OAuth Client Secret
 COMMENT ON COLUMN calendars.google_refresh_token IS 'Long-lived refresh token for obtaining access tokens';
 COMMENT ON COLUMN calendars.google_access_token IS 'Short-lived access token (cached, regenerated on expiry)';
 COMMENT ON COLUMN calendars.google_token_expires_at IS 'Timestamp when the current access token expires';
+COMMENT ON COLUMN calendars.google_token_refresh_lease_until IS 'Set while one caller refreshes the access token; others reuse or wait';
 COMMENT ON COLUMN calendars.google_oauth_scope IS 'OAuth scope granted during authorization';
 
 CREATE INDEX IF NOT EXISTS idx_calendars_tenant 
@@ -565,6 +725,7 @@ CREATE TABLE IF NOT EXISTS appointments (
     start_at TIMESTAMPTZ NOT NULL,
     end_at TIMESTAMPTZ NOT NULL,
     duration_minutes INTEGER NOT NULL,
+    period TSTZRANGE GENERATED ALWAYS AS (tstzrange(start_at, end_at, '[)')) STORED,
     
     -- Patient Information
     patient_contact VARCHAR(50) NOT NULL,
@@ -588,6 +749,9 @@ CREATE TABLE IF NOT EXISTS appointments (
     confirmation_sent_at TIMESTAMPTZ,
     reminder_24h_sent_at TIMESTAMPTZ,
     reminder_1h_sent_at TIMESTAMPTZ,
+    reminder_claimed_type VARCHAR(10),
+    reminder_claimed_until TIMESTAMPTZ,
+    reminder_claim_token UUID,
     patient_confirmed_at TIMESTAMPTZ,
     
     -- Reschedule Tracking
@@ -622,9 +786,58 @@ CREATE TABLE IF NOT EXISTS appointments (
     CONSTRAINT valid_duration CHECK (duration_minutes BETWEEN 5 AND 480)
 );
 
+-- Databases created before reminder claims
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS reminder_claimed_type VARCHAR(10);
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS reminder_claimed_until TIMESTAMPTZ;
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS reminder_claim_token UUID;
+
 COMMENT ON TABLE appointments IS 'Appointment records with audit trail, soft delete, and Google Calendar sync';
 COMMENT ON COLUMN appointments.deleted_at IS 'Soft delete - NULL means active, timestamp means deleted';
 COMMENT ON COLUMN appointments.google_event_id IS 'Google Calendar event ID for sync operations';
+COMMENT ON COLUMN appointments.reminder_claimed_until IS 'Set by claim_due_reminders() while a reminder is being sent; expired claims are retried';
+COMMENT ON COLUMN appointments.reminder_claim_token IS 'Claim of the claim_due_reminders() run sending the reminder; mark_reminders_sent() checks it';
+
+-- Databases created before the period column
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS period TSTZRANGE
+GENERATED ALWAYS AS (tstzrange(start_at, end_at, '[)')) STORED;
+
+COMMENT ON COLUMN appointments.period IS '[start_at, end_at) - back-to-back appointments do not overlap';
+
+-- No two active appointments of one professional may overlap: enforced by
+-- the database, so concurrent conversations cannot book the same slot. The
+-- constraint's GiST index also serves is_slot_available(). Existing overlaps
+-- are reported and the constraint is left out until they are resolved.
+DO $$
+DECLARE
+    v_overlaps BIGINT;
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = 'appointments'::regclass
+        AND conname = 'no_overlapping_appointments'
+    ) THEN
+        RETURN;
+    END IF;
+
+    SELECT COUNT(*) INTO v_overlaps
+    FROM appointments a
+    JOIN appointments b
+      ON b.professional_id = a.professional_id
+     AND b.appointment_id > a.appointment_id
+     AND b.period && a.period
+    WHERE a.deleted_at IS NULL AND a.status IN ('scheduled', 'confirmed', 'in_progress')
+    AND b.deleted_at IS NULL AND b.status IN ('scheduled', 'confirmed', 'in_progress');
+
+    IF v_overlaps > 0 THEN
+        RAISE WARNING 'no_overlapping_appointments not added: % overlapping pair(s) of active appointments. Cancel or reschedule them and re-run the schema.', v_overlaps;
+        RETURN;
+    END IF;
+
+    ALTER TABLE appointments
+    ADD CONSTRAINT no_overlapping_appointments
+    EXCLUDE USING gist (professional_id WITH =, period WITH &&)
+    WHERE (deleted_at IS NULL AND status IN ('scheduled', 'confirmed', 'in_progress'));
+END $$;
 
 CREATE INDEX IF NOT EXISTS idx_appointments_tenant_date 
 ON appointments(tenant_id, start_at) 
@@ -658,6 +871,18 @@ CREATE INDEX IF NOT EXISTS idx_appointments_deleted
 ON appointments(tenant_id, deleted_at) 
 WHERE deleted_at IS NOT NULL;
 
+-- Per-tenant token bucket for reminder sends (one WhatsApp instance per tenant)
+CREATE TABLE IF NOT EXISTS reminder_rate_limits (
+    tenant_id UUID PRIMARY KEY REFERENCES tenant_config(tenant_id) ON DELETE CASCADE,
+    capacity INTEGER NOT NULL DEFAULT 60,
+    refill_per_minute NUMERIC(8,2) NOT NULL DEFAULT 12,
+    tokens NUMERIC(10,3) NOT NULL DEFAULT 60,
+    refilled_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    CONSTRAINT valid_reminder_rate CHECK (capacity > 0 AND refill_per_minute > 0)
+);
+
+COMMENT ON TABLE reminder_rate_limits IS 'Token bucket per tenant: claim_due_reminders() spends one token per reminder';
+
 -- ============================================================================
 -- 13. TRIGGERS (Shared update_timestamp function)
 -- ============================================================================
@@ -777,34 +1002,675 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Function: Number of rows a per-tenant counter is split over
+-- tenant_message_usage and pipeline_counters both spread concurrent writers
+-- of one tenant over this many rows, picked by backend pid.
+CREATE OR REPLACE FUNCTION counter_shards()
+RETURNS INTEGER AS $$
+    SELECT 16;
+$$ LANGUAGE sql IMMUTABLE;
+
 -- Function to increment message count
+-- Counts go to the tenant's tenant_message_usage shard of this backend, not to
+-- tenant_config: concurrent messages of a tenant update different narrow rows.
+-- tenant_config.current_message_count follows via rollup_message_usage().
 CREATE OR REPLACE FUNCTION increment_message_count(p_tenant_id UUID)
 RETURNS VOID AS $$
 BEGIN
-    UPDATE tenant_config
-    SET current_message_count = current_message_count + 1
-    WHERE tenant_id = p_tenant_id;
+    INSERT INTO tenant_message_usage (tenant_id, period, shard, message_count)
+    VALUES (p_tenant_id, DATE_TRUNC('month', CURRENT_DATE)::DATE,
+            pg_backend_pid() % counter_shards(), 1)
+    ON CONFLICT ON CONSTRAINT tenant_message_usage_pkey DO UPDATE
+    SET message_count = tenant_message_usage.message_count + 1;
 END;
 $$ LANGUAGE plpgsql;
 
 -- Function to reset monthly quotas
+-- Usage is counted per month, so a new month starts from zero by itself; this
+-- moves the rolled-up count of tenants not reset yet to the new month and
+-- drops usage rows older than 13 months.
 CREATE OR REPLACE FUNCTION reset_monthly_quotas()
 RETURNS INTEGER AS $$
 DECLARE
     reset_count INTEGER;
 BEGIN
-    UPDATE tenant_config
+    UPDATE tenant_config tc
     SET 
-        current_message_count = 0,
+        current_message_count = COALESCE((
+            SELECT SUM(u.message_count)
+            FROM tenant_message_usage u
+            WHERE u.tenant_id = tc.tenant_id
+            AND u.period = DATE_TRUNC('month', CURRENT_DATE)::DATE
+        ), 0),
         last_quota_reset = CURRENT_DATE
     WHERE last_quota_reset < DATE_TRUNC('month', CURRENT_DATE)
     AND is_active = true;
     
     GET DIAGNOSTICS reset_count = ROW_COUNT;
+
+    DELETE FROM tenant_message_usage
+    WHERE period < DATE_TRUNC('month', CURRENT_DATE) - INTERVAL '13 months';
+
     RETURN reset_count;
 END;
 $$ LANGUAGE plpgsql;
 
+-- ----------------------------------------------------------------------------
+-- Intent rules
+-- ----------------------------------------------------------------------------
+-- Patterns behind the workflow's Intent Classifier. Rules with tenant_id NULL
+-- are defaults, optionally narrowed to one clinic_type; a tenant rule with the
+-- same match_type + pattern overrides the default (is_active = false disables
+-- it for that tenant). Non-regex patterns are stored normalized
+-- (normalize_search_text) and matched against the normalized message:
+--   exact    whole message equals the pattern (menu options: '1', 'um')
+--   prefix   phrase at the start of the message ('bom dia')
+--   keyword  phrase anywhere, on word boundaries ('remarcar')
+--   regex    regular expression (common subset of JS and Python syntax)
+-- The highest priority match wins, then confidence. max_words skips a rule
+-- for longer messages, so "oi, minha filha esta com febre" is not a greeting.
+-- The effective rule set is cached in tenant_context_cache and compiled by the
+-- workflow into one keyword automaton plus one combined regex per version.
+
+CREATE TABLE IF NOT EXISTS intent_rules (
+    rule_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    tenant_id UUID REFERENCES tenant_config(tenant_id) ON DELETE CASCADE,
+    clinic_type VARCHAR(50),
+    intent VARCHAR(50) NOT NULL,
+    match_type VARCHAR(20) NOT NULL DEFAULT 'keyword',
+    pattern TEXT NOT NULL,
+    priority SMALLINT NOT NULL DEFAULT 0,
+    confidence REAL NOT NULL DEFAULT 0.9,
+    max_words SMALLINT,
+    menu_number SMALLINT,
+    is_active BOOLEAN NOT NULL DEFAULT true,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+
+    CONSTRAINT intent_rules_unique UNIQUE NULLS NOT DISTINCT (tenant_id, clinic_type, match_type, pattern),
+    CONSTRAINT valid_intent_rule_clinic_type CHECK (clinic_type IN ('medical', 'aesthetic', 'mixed', 'dental', 'other')),
+    CONSTRAINT valid_intent_match_type CHECK (match_type IN ('exact', 'prefix', 'keyword', 'regex')),
+    CONSTRAINT valid_intent_confidence CHECK (confidence BETWEEN 0 AND 1),
+    CONSTRAINT intent_pattern_normalized CHECK (
+        match_type = 'regex' OR (pattern <> '' AND pattern = normalize_search_text(pattern))
+    ),
+    -- Named groups and lookbehind differ between JS and Python
+    CONSTRAINT intent_regex_portable CHECK (match_type <> 'regex' OR pattern !~ '\(\?(P|<)')
+);
+
+CREATE INDEX IF NOT EXISTS idx_intent_rules_tenant ON intent_rules(tenant_id) WHERE tenant_id IS NOT NULL;
+
+DROP TRIGGER IF EXISTS intent_rules_updated_at ON intent_rules;
+CREATE TRIGGER intent_rules_updated_at
+    BEFORE UPDATE ON intent_rules
+    FOR EACH ROW EXECUTE FUNCTION update_timestamp();
+
+COMMENT ON TABLE intent_rules IS 'Intent classification patterns: defaults (tenant_id NULL) per clinic_type plus tenant overrides';
+COMMENT ON COLUMN intent_rules.max_words IS 'Rule only applies to messages with at most this many words (NULL = any length)';
+COMMENT ON COLUMN intent_rules.menu_number IS 'Main menu option selected when this rule wins';
+
+-- Function: Effective intent rules of a tenant (or of a clinic type's defaults)
+CREATE OR REPLACE FUNCTION get_intent_rules(p_tenant_id UUID, p_clinic_type VARCHAR DEFAULT NULL)
+RETURNS JSONB AS $$
+    WITH target AS (
+        SELECT COALESCE(
+            (SELECT tc.clinic_type FROM tenant_config tc WHERE tc.tenant_id = p_tenant_id),
+            p_clinic_type
+        ) AS clinic_type
+    ),
+    effective AS (
+        -- Most specific definition of each pattern: tenant > clinic type > default
+        SELECT DISTINCT ON (r.match_type, r.pattern) r.*
+        FROM intent_rules r, target t
+        WHERE (r.tenant_id IS NULL OR r.tenant_id = p_tenant_id)
+        AND (r.clinic_type IS NULL OR r.clinic_type = t.clinic_type)
+        ORDER BY r.match_type, r.pattern, r.tenant_id IS NULL, r.clinic_type IS NULL
+    )
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'intent', e.intent,
+        'match_type', e.match_type,
+        'pattern', e.pattern,
+        'priority', e.priority,
+        'confidence', e.confidence,
+        'max_words', e.max_words,
+        'menu_number', e.menu_number
+    ) ORDER BY e.priority DESC, e.match_type, e.pattern), '[]'::jsonb)
+    FROM effective e
+    WHERE e.is_active;
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION get_intent_rules(UUID, VARCHAR) IS 'Effective intent rules, highest priority first; p_clinic_type is used when the tenant is NULL or unknown';
+
+-- ----------------------------------------------------------------------------
+-- Tenant context cache
+-- ----------------------------------------------------------------------------
+-- The Tenant Config Loader runs once per inbound message. Instead of reading
+-- the whole tenant_config row and rebuilding the services catalog every time,
+-- it reads a prebuilt context from tenant_context_cache.
+--
+-- Each row has a version that triggers bump whenever tenant_config,
+-- professionals, professional_services, services_catalog or intent_rules
+-- change for the tenant. A row is current when built_version = version. A
+-- stale row is rebuilt lazily by the next get_tenant_context() call. Every
+-- bump also sends NOTIFY tenant_context with the tenant_id as payload, so
+-- external processes can drop their own copies.
+
+CREATE TABLE IF NOT EXISTS tenant_context_cache (
+    tenant_id UUID PRIMARY KEY REFERENCES tenant_config(tenant_id) ON DELETE CASCADE,
+    version BIGINT NOT NULL DEFAULT 1,
+    built_version BIGINT,
+    tenant_config JSONB,
+    services_catalog TEXT,
+    intent_rules JSONB,
+    built_at TIMESTAMPTZ
+);
+
+COMMENT ON TABLE tenant_context_cache IS 'Prebuilt per-tenant context for the Tenant Config Loader, invalidated by version bumps';
+COMMENT ON COLUMN tenant_context_cache.version IS 'Bumped by triggers whenever the tenant context sources change';
+COMMENT ON COLUMN tenant_context_cache.built_version IS 'Version the cached payload was built from (NULL = never built)';
+
+-- Backfill rows for tenants that existed before the cache table
+INSERT INTO tenant_context_cache (tenant_id)
+SELECT tenant_id FROM tenant_config
+ON CONFLICT (tenant_id) DO NOTHING;
+
+-- Function: Invalidate the cached context of the given tenants
+CREATE OR REPLACE FUNCTION bump_tenant_context_version(p_tenant_ids UUID[])
+RETURNS VOID AS $$
+BEGIN
+    -- Lock in tenant_id order so concurrent bumps cannot deadlock
+    UPDATE tenant_context_cache c
+    SET version = c.version + 1
+    FROM (
+        SELECT l.tenant_id
+        FROM tenant_context_cache l
+        WHERE l.tenant_id = ANY(p_tenant_ids)
+        ORDER BY l.tenant_id
+        FOR UPDATE
+    ) AS locked
+    WHERE c.tenant_id = locked.tenant_id;
+
+    UPDATE tenant_prompt_artifacts a
+    SET version = a.version + 1
+    FROM (
+        SELECT l.tenant_id
+        FROM tenant_prompt_artifacts l
+        WHERE l.tenant_id = ANY(p_tenant_ids)
+        ORDER BY l.tenant_id
+        FOR UPDATE
+    ) AS locked
+    WHERE a.tenant_id = locked.tenant_id;
+
+    PERFORM pg_notify('tenant_context', t.id::text)
+    FROM (SELECT DISTINCT id FROM unnest(p_tenant_ids) AS u(id) WHERE id IS NOT NULL) AS t;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Rebuild the cached context of one tenant
+-- (intent_rules was added to the result; CREATE OR REPLACE cannot change it)
+DROP FUNCTION IF EXISTS get_tenant_context(VARCHAR);
+DROP FUNCTION IF EXISTS refresh_tenant_context(UUID);
+
+CREATE OR REPLACE FUNCTION refresh_tenant_context(p_tenant_id UUID)
+RETURNS TABLE (
+    tenant_id UUID,
+    tenant_config JSONB,
+    services_catalog TEXT,
+    intent_rules JSONB,
+    context_version BIGINT
+) AS $$
+DECLARE
+    v_version BIGINT;
+    v_config JSONB;
+    v_catalog TEXT;
+    v_rules JSONB;
+BEGIN
+    INSERT INTO tenant_context_cache (tenant_id)
+    VALUES (p_tenant_id)
+    ON CONFLICT ON CONSTRAINT tenant_context_cache_pkey DO NOTHING;
+
+    -- Read the version before the sources: a bump that lands while we build
+    -- leaves the row stale instead of marking newer data as current.
+    SELECT c.version INTO v_version
+    FROM tenant_context_cache c
+    WHERE c.tenant_id = p_tenant_id;
+
+    -- Usage counters change on every message and are not part of the context
+    SELECT to_jsonb(tc) - ARRAY['current_message_count', 'last_quota_reset', 'updated_at']
+    INTO v_config
+    FROM tenant_config tc
+    WHERE tc.tenant_id = p_tenant_id;
+
+    IF v_config IS NULL THEN
+        RETURN;
+    END IF;
+
+    v_catalog := get_services_catalog_for_prompt(p_tenant_id);
+    v_rules := get_intent_rules(p_tenant_id);
+
+    UPDATE tenant_context_cache c
+    SET tenant_config = v_config,
+        services_catalog = v_catalog,
+        intent_rules = v_rules,
+        built_version = v_version,
+        built_at = NOW()
+    WHERE c.tenant_id = p_tenant_id
+    AND c.version = v_version;
+
+    RETURN QUERY SELECT p_tenant_id, v_config, v_catalog, v_rules, v_version;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Resolve an active tenant and its prompt context by instance name
+-- Hot path is one index lookup on tenant_config plus one primary-key read on
+-- the cache; only a stale or missing entry triggers a rebuild.
+CREATE OR REPLACE FUNCTION get_tenant_context(p_instance_name VARCHAR)
+RETURNS TABLE (
+    tenant_id UUID,
+    tenant_config JSONB,
+    services_catalog TEXT,
+    intent_rules JSONB,
+    context_version BIGINT
+) AS $$
+DECLARE
+    v_tenant_id UUID;
+BEGIN
+    RETURN QUERY
+    SELECT c.tenant_id, c.tenant_config, c.services_catalog, c.intent_rules, c.version
+    FROM tenant_config tc
+    JOIN tenant_context_cache c ON c.tenant_id = tc.tenant_id
+    WHERE tc.evolution_instance_name = p_instance_name
+    AND tc.is_active = true
+    AND c.built_version = c.version;
+
+    IF FOUND THEN
+        RETURN;
+    END IF;
+
+    SELECT tc.tenant_id INTO v_tenant_id
+    FROM tenant_config tc
+    WHERE tc.evolution_instance_name = p_instance_name
+    AND tc.is_active = true;
+
+    IF v_tenant_id IS NOT NULL THEN
+        RETURN QUERY SELECT * FROM refresh_tenant_context(v_tenant_id);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION get_tenant_context(VARCHAR) IS 'Cached tenant_config row, services catalog and intent rules for an active Evolution instance';
+
+-- ----------------------------------------------------------------------------
+-- Tenant prompt artifacts
+-- ----------------------------------------------------------------------------
+-- Pre-rendered text that the prompt helpers used to rebuild from joins on every
+-- call: the services catalog, the numbered service index behind
+-- get_service_by_number(), the professionals summary and the tenant's response
+-- templates. Versioned and invalidated together with tenant_context_cache
+-- (bump_tenant_context_version), rebuilt lazily for the affected tenant only.
+
+CREATE TABLE IF NOT EXISTS tenant_prompt_artifacts (
+    tenant_id UUID PRIMARY KEY REFERENCES tenant_config(tenant_id) ON DELETE CASCADE,
+    version BIGINT NOT NULL DEFAULT 1,
+    built_version BIGINT,
+    services_catalog TEXT,
+    service_index JSONB,
+    professionals_summary JSONB,
+    templates JSONB,
+    built_at TIMESTAMPTZ
+);
+
+COMMENT ON TABLE tenant_prompt_artifacts IS 'Pre-rendered per-tenant prompt text (catalog, service index, professionals, templates)';
+COMMENT ON COLUMN tenant_prompt_artifacts.service_index IS 'Array of services in catalog order; element n-1 is service number n';
+COMMENT ON COLUMN tenant_prompt_artifacts.templates IS 'Active response templates as {template_key: template_text}';
+
+INSERT INTO tenant_prompt_artifacts (tenant_id)
+SELECT tenant_id FROM tenant_config
+ON CONFLICT (tenant_id) DO NOTHING;
+
+-- Function: Rebuild the prompt artifacts of one tenant
+CREATE OR REPLACE FUNCTION refresh_tenant_prompt_artifacts(p_tenant_id UUID)
+RETURNS tenant_prompt_artifacts AS $$
+DECLARE
+    v_row tenant_prompt_artifacts;
+    v_version BIGINT;
+BEGIN
+    INSERT INTO tenant_prompt_artifacts (tenant_id)
+    SELECT tc.tenant_id FROM tenant_config tc WHERE tc.tenant_id = p_tenant_id
+    ON CONFLICT (tenant_id) DO NOTHING;
+
+    -- Version first, sources second (see refresh_tenant_context)
+    SELECT a.version INTO v_version
+    FROM tenant_prompt_artifacts a
+    WHERE a.tenant_id = p_tenant_id;
+
+    IF v_version IS NULL THEN
+        RETURN v_row;
+    END IF;
+
+    v_row.tenant_id := p_tenant_id;
+    v_row.version := v_version;
+    v_row.built_version := v_version;
+    v_row.built_at := NOW();
+
+    -- Services offered by at least one active professional, numbered in
+    -- catalog order
+    WITH offered AS (
+        SELECT
+            sc.service_id,
+            sc.service_name,
+            sc.service_code,
+            sc.service_category,
+            ROW_NUMBER() OVER (
+                ORDER BY sc.service_category, sc.display_order, sc.service_name, sc.service_id
+            ) AS service_number
+        FROM services_catalog sc
+        WHERE sc.is_active = true
+        AND EXISTS (
+            SELECT 1
+            FROM professionals p
+            JOIN professional_services ps ON p.professional_id = ps.professional_id
+            WHERE p.tenant_id = p_tenant_id
+            AND p.is_active = true
+            AND ps.is_active = true
+            AND ps.service_id = sc.service_id
+        )
+    ),
+    categories AS (
+        SELECT
+            MIN(o.service_number) AS first_number,
+            format('%s *%s*',
+                CASE o.service_category
+                    WHEN 'Odontologia' THEN '🦷'
+                    WHEN 'Estética' THEN '💆'
+                    WHEN 'Cardiologia' THEN '❤️'
+                    WHEN 'Clínico Geral' THEN '👨‍⚕️'
+                    ELSE '📋'
+                END,
+                UPPER(o.service_category)
+            ) || string_agg(
+                E'\n' || format('%s. %s', o.service_number, o.service_name),
+                '' ORDER BY o.service_number
+            ) AS block
+        FROM offered o
+        GROUP BY o.service_category
+    )
+    SELECT
+        COALESCE((SELECT string_agg(c.block, E'\n' ORDER BY c.first_number) FROM categories c), ''),
+        COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'service_number', o.service_number,
+                'service_id', o.service_id,
+                'service_name', o.service_name,
+                'service_code', o.service_code,
+                'service_category', o.service_category
+            ) ORDER BY o.service_number)
+            FROM offered o
+        ), '[]'::jsonb)
+    INTO v_row.services_catalog, v_row.service_index;
+
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'professional_id', v.professional_id,
+        'professional_name', v.professional_name,
+        'specialty', v.specialty,
+        'services_summary', v.services_summary
+    ) ORDER BY v.professional_name), '[]'::jsonb)
+    INTO v_row.professionals_summary
+    FROM v_professionals_services_prompt v
+    WHERE v.tenant_id = p_tenant_id;
+
+    SELECT COALESCE(jsonb_object_agg(rt.template_key, rt.template_text), '{}'::jsonb)
+    INTO v_row.templates
+    FROM response_templates rt
+    WHERE rt.tenant_id = p_tenant_id
+    AND rt.is_active = true;
+
+    UPDATE tenant_prompt_artifacts a
+    SET services_catalog = v_row.services_catalog,
+        service_index = v_row.service_index,
+        professionals_summary = v_row.professionals_summary,
+        templates = v_row.templates,
+        built_version = v_version,
+        built_at = v_row.built_at
+    WHERE a.tenant_id = p_tenant_id
+    AND a.version = v_version;
+
+    RETURN v_row;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Current prompt artifacts of a tenant (primary-key fetch when fresh)
+CREATE OR REPLACE FUNCTION get_tenant_prompt_artifacts(p_tenant_id UUID)
+RETURNS tenant_prompt_artifacts AS $$
+DECLARE
+    v_row tenant_prompt_artifacts;
+BEGIN
+    SELECT * INTO v_row
+    FROM tenant_prompt_artifacts a
+    WHERE a.tenant_id = p_tenant_id;
+
+    IF v_row.built_version = v_row.version THEN
+        RETURN v_row;
+    END IF;
+
+    RETURN refresh_tenant_prompt_artifacts(p_tenant_id);
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION get_tenant_prompt_artifacts(UUID) IS 'Pre-rendered prompt artifacts for a tenant, rebuilt only after a version bump';
+
+-- Invalidation triggers. Statement-level with transition tables so bulk
+-- loads (clinic-cli import) bump each tenant once per statement.
+CREATE OR REPLACE FUNCTION tenant_config_context_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO tenant_context_cache (tenant_id)
+        VALUES (NEW.tenant_id)
+        ON CONFLICT ON CONSTRAINT tenant_context_cache_pkey DO NOTHING;
+        INSERT INTO tenant_prompt_artifacts (tenant_id)
+        VALUES (NEW.tenant_id)
+        ON CONFLICT ON CONSTRAINT tenant_prompt_artifacts_pkey DO NOTHING;
+    ELSE
+        PERFORM bump_tenant_context_version(ARRAY[NEW.tenant_id]);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION professionals_context_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM bump_tenant_context_version(ARRAY(SELECT tenant_id FROM new_rows));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM bump_tenant_context_version(ARRAY(
+            SELECT tenant_id FROM new_rows UNION SELECT tenant_id FROM old_rows));
+    ELSE
+        PERFORM bump_tenant_context_version(ARRAY(SELECT tenant_id FROM old_rows));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION professional_services_context_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM bump_tenant_context_version(ARRAY(
+            SELECT p.tenant_id FROM new_rows r
+            JOIN professionals p ON p.professional_id = r.professional_id));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM bump_tenant_context_version(ARRAY(
+            SELECT p.tenant_id FROM (SELECT professional_id FROM new_rows
+                                     UNION SELECT professional_id FROM old_rows) r
+            JOIN professionals p ON p.professional_id = r.professional_id));
+    ELSE
+        -- Rows removed by a professionals cascade are already covered there
+        PERFORM bump_tenant_context_version(ARRAY(
+            SELECT p.tenant_id FROM old_rows r
+            JOIN professionals p ON p.professional_id = r.professional_id));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- services_catalog is global: only tenants offering a changed service are bumped
+CREATE OR REPLACE FUNCTION services_catalog_context_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM bump_tenant_context_version(ARRAY(
+        SELECT DISTINCT p.tenant_id
+        FROM old_rows r
+        JOIN professional_services ps ON ps.service_id = r.service_id
+        JOIN professionals p ON p.professional_id = ps.professional_id));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tenant_config_context_insert ON tenant_config;
+CREATE TRIGGER tenant_config_context_insert
+    AFTER INSERT ON tenant_config
+    FOR EACH ROW EXECUTE FUNCTION tenant_config_context_changed();
+
+DROP TRIGGER IF EXISTS tenant_config_context_update ON tenant_config;
+CREATE TRIGGER tenant_config_context_update
+    AFTER UPDATE ON tenant_config
+    FOR EACH ROW
+    WHEN ((to_jsonb(OLD) - ARRAY['current_message_count', 'last_quota_reset', 'updated_at'])
+          IS DISTINCT FROM
+          (to_jsonb(NEW) - ARRAY['current_message_count', 'last_quota_reset', 'updated_at']))
+    EXECUTE FUNCTION tenant_config_context_changed();
+
+DROP TRIGGER IF EXISTS professionals_context_insert ON professionals;
+CREATE TRIGGER professionals_context_insert
+    AFTER INSERT ON professionals
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION professionals_context_changed();
+
+DROP TRIGGER IF EXISTS professionals_context_update ON professionals;
+CREATE TRIGGER professionals_context_update
+    AFTER UPDATE ON professionals
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION professionals_context_changed();
+
+DROP TRIGGER IF EXISTS professionals_context_delete ON professionals;
+CREATE TRIGGER professionals_context_delete
+    AFTER DELETE ON professionals
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION professionals_context_changed();
+
+DROP TRIGGER IF EXISTS professional_services_context_insert ON professional_services;
+CREATE TRIGGER professional_services_context_insert
+    AFTER INSERT ON professional_services
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION professional_services_context_changed();
+
+DROP TRIGGER IF EXISTS professional_services_context_update ON professional_services;
+CREATE TRIGGER professional_services_context_update
+    AFTER UPDATE ON professional_services
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION professional_services_context_changed();
+
+DROP TRIGGER IF EXISTS professional_services_context_delete ON professional_services;
+CREATE TRIGGER professional_services_context_delete
+    AFTER DELETE ON professional_services
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION professional_services_context_changed();
+
+CREATE OR REPLACE FUNCTION response_templates_context_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM bump_tenant_context_version(ARRAY(SELECT tenant_id FROM new_rows));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM bump_tenant_context_version(ARRAY(
+            SELECT tenant_id FROM new_rows UNION SELECT tenant_id FROM old_rows));
+    ELSE
+        PERFORM bump_tenant_context_version(ARRAY(SELECT tenant_id FROM old_rows));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS response_templates_context_insert ON response_templates;
+CREATE TRIGGER response_templates_context_insert
+    AFTER INSERT ON response_templates
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION response_templates_context_changed();
+
+DROP TRIGGER IF EXISTS response_templates_context_update ON response_templates;
+CREATE TRIGGER response_templates_context_update
+    AFTER UPDATE ON response_templates
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION response_templates_context_changed();
+
+DROP TRIGGER IF EXISTS response_templates_context_delete ON response_templates;
+CREATE TRIGGER response_templates_context_delete
+    AFTER DELETE ON response_templates
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION response_templates_context_changed();
+
+-- Default rules (tenant_id NULL) affect every tenant of their clinic type
+CREATE OR REPLACE FUNCTION intent_rules_context_changed()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_rows JSONB;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT jsonb_agg(jsonb_build_object('tenant_id', r.tenant_id, 'clinic_type', r.clinic_type))
+        INTO v_rows FROM new_rows r;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT jsonb_agg(jsonb_build_object('tenant_id', r.tenant_id, 'clinic_type', r.clinic_type))
+        INTO v_rows FROM (SELECT tenant_id, clinic_type FROM new_rows
+                          UNION SELECT tenant_id, clinic_type FROM old_rows) r;
+    ELSE
+        SELECT jsonb_agg(jsonb_build_object('tenant_id', r.tenant_id, 'clinic_type', r.clinic_type))
+        INTO v_rows FROM old_rows r;
+    END IF;
+
+    PERFORM bump_tenant_context_version(ARRAY(
+        SELECT DISTINCT tc.tenant_id
+        FROM jsonb_to_recordset(COALESCE(v_rows, '[]'::jsonb)) AS changed(tenant_id UUID, clinic_type VARCHAR)
+        JOIN tenant_config tc
+          ON tc.tenant_id = changed.tenant_id
+          OR (changed.tenant_id IS NULL
+              AND (changed.clinic_type IS NULL OR changed.clinic_type = tc.clinic_type))));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS intent_rules_context_insert ON intent_rules;
+CREATE TRIGGER intent_rules_context_insert
+    AFTER INSERT ON intent_rules
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION intent_rules_context_changed();
+
+DROP TRIGGER IF EXISTS intent_rules_context_update ON intent_rules;
+CREATE TRIGGER intent_rules_context_update
+    AFTER UPDATE ON intent_rules
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION intent_rules_context_changed();
+
+DROP TRIGGER IF EXISTS intent_rules_context_delete ON intent_rules;
+CREATE TRIGGER intent_rules_context_delete
+    AFTER DELETE ON intent_rules
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION intent_rules_context_changed();
+
+-- New services are not offered by anyone yet, so only UPDATE/DELETE matter
+DROP TRIGGER IF EXISTS services_catalog_context_update ON services_catalog;
+CREATE TRIGGER services_catalog_context_update
+    AFTER UPDATE ON services_catalog
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION services_catalog_context_changed();
+
+DROP TRIGGER IF EXISTS services_catalog_context_delete ON services_catalog;
+CREATE TRIGGER services_catalog_context_delete
+    AFTER DELETE ON services_catalog
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION services_catalog_context_changed();
+
 -- ============================================================================
 -- 15. FAQ FUNCTIONS
 -- ============================================================================
@@ -828,11 +1694,212 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Function: Ranked FAQ lookup for the inbound message path
+-- Tries, in order, and stops at the first tier with a hit:
+--   1. exact normalized question  (unique index on tenant_id, question_normalized)
+--   2. exact keyword              (idx_faq_keywords)
+--   3. fuzzy: trigram word similarity (idx_faq_question_trgm), scored 0..1;
+--      a question containing every stemmed word of the message
+--      (idx_faq_question_tsv) counts as meeting the threshold
+--   4. intent fallback (most viewed FAQ for the classified intent)
+-- The threshold defaults to tenant_config.features->>'faq_match_threshold'
+-- and then to 0.45. Every input is a parameter; nothing is interpolated.
+CREATE OR REPLACE FUNCTION match_faq(
+    p_tenant_id UUID,
+    p_text TEXT,
+    p_intent VARCHAR DEFAULT NULL,
+    p_threshold REAL DEFAULT NULL,
+    p_limit INTEGER DEFAULT 1
+)
+RETURNS TABLE (
+    faq_id UUID,
+    answer TEXT,
+    view_count INTEGER,
+    question_original TEXT,
+    intent VARCHAR,
+    score REAL,
+    match_type VARCHAR
+) AS $$
+DECLARE
+    v_text TEXT := lower(btrim(COALESCE(p_text, '')));
+    v_threshold REAL := p_threshold;
+    v_query TSQUERY;
+BEGIN
+    IF v_threshold IS NULL THEN
+        SELECT (tc.features->>'faq_match_threshold')::REAL INTO v_threshold
+        FROM tenant_config tc WHERE tc.tenant_id = p_tenant_id;
+        v_threshold := COALESCE(v_threshold, 0.45);
+    END IF;
+
+    IF v_text <> '' THEN
+        RETURN QUERY
+        SELECT f.faq_id, f.answer, f.view_count, f.question_original, f.intent,
+               1.0::REAL, 'exact'::VARCHAR
+        FROM tenant_faq f
+        WHERE f.tenant_id = p_tenant_id
+          AND f.question_normalized = v_text
+          AND f.is_active = true;
+        IF FOUND THEN RETURN; END IF;
+
+        RETURN QUERY
+        SELECT f.faq_id, f.answer, f.view_count, f.question_original, f.intent,
+               1.0::REAL, 'keyword'::VARCHAR
+        FROM tenant_faq f
+        WHERE f.tenant_id = p_tenant_id
+          AND f.keywords @> ARRAY[v_text]
+          AND f.is_active = true
+        ORDER BY f.view_count DESC
+        LIMIT p_limit;
+        IF FOUND THEN RETURN; END IF;
+
+        -- The <% operator reads its cut-off from this GUC; set it for this
+        -- transaction only so the trigram index prunes at our threshold
+        PERFORM set_config('pg_trgm.word_similarity_threshold', v_threshold::TEXT, true);
+        v_query := plainto_tsquery('portuguese', v_text);
+
+        RETURN QUERY
+        SELECT m.faq_id, m.answer, m.view_count, m.question_original, m.intent,
+               m.score, 'fuzzy'::VARCHAR
+        FROM (
+            SELECT f.faq_id, f.answer, f.view_count, f.question_original, f.intent,
+                   GREATEST(
+                       word_similarity(v_text, f.question_normalized),
+                       CASE WHEN f.question_tsv @@ v_query THEN v_threshold ELSE 0 END
+                   )::REAL AS score
+            FROM tenant_faq f
+            WHERE f.tenant_id = p_tenant_id
+              AND f.is_active = true
+              AND (v_text <% f.question_normalized OR f.question_tsv @@ v_query)
+        ) m
+        WHERE m.score >= v_threshold
+        ORDER BY m.score DESC, m.view_count DESC
+        LIMIT p_limit;
+        IF FOUND THEN RETURN; END IF;
+    END IF;
+
+    IF COALESCE(p_intent, '') <> '' THEN
+        RETURN QUERY
+        SELECT f.faq_id, f.answer, f.view_count, f.question_original, f.intent,
+               0.0::REAL, 'intent'::VARCHAR
+        FROM tenant_faq f
+        WHERE f.tenant_id = p_tenant_id
+          AND f.intent = p_intent
+          AND f.is_active = true
+        ORDER BY f.view_count DESC, COALESCE(f.last_used_at, f.created_at) DESC
+        LIMIT p_limit;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
 -- ============================================================================
 -- 16. SERVICE RESOLVER FUNCTIONS
 -- ============================================================================
 
+-- Function: Ranked catalog search
+-- Accent-insensitive and typo tolerant. Candidates come from two indexes only,
+-- so the cost follows the number of matches, not the catalog size:
+--   * stemmed Portuguese lexemes, any query word (idx_services_catalog_search_tsv)
+--   * trigram word similarity of each query word >= p_threshold
+--     (idx_services_catalog_search_trgm), e.g. "limpesa", "botoks"
+-- Scores: exact name 1.0, exact code 0.95, exact keyword 0.9, otherwise
+-- 0.85 x relevance, the average over query words of the best of: stemmed
+-- name hit 1.0, stemmed keyword hit 0.85, trigram similarity to the name, or
+-- 0.85 x trigram similarity to the whole document. Services matching more of
+-- the query rank first. Stop words and words under 3 letters are ignored.
+-- The trigram match compares word_similarity() with p_threshold itself; <%
+-- is only there for the index, and reads its cut-off from
+-- pg_trgm.word_similarity_threshold, lowered for the query (so the function
+-- is not STABLE). The SET clause gives the caller its own value back on
+-- return.
+CREATE OR REPLACE FUNCTION search_services(
+    p_search_text TEXT,
+    p_threshold REAL DEFAULT 0.45
+)
+RETURNS TABLE (
+    service_id UUID,
+    score REAL,
+    match_type VARCHAR
+) AS $$
+DECLARE
+    v_text TEXT := normalize_search_text(p_search_text);
+    v_code TEXT := upper(btrim(COALESCE(p_search_text, '')));
+    v_words TEXT[];
+    v_query TSQUERY;
+BEGIN
+    SELECT ARRAY_AGG(DISTINCT w) INTO v_words
+    FROM regexp_split_to_table(v_text, ' ') AS w
+    WHERE length(w) >= 3
+      AND COALESCE(cardinality(ts_lexize('portuguese_stem', w)), 1) > 0;
+
+    -- Only stop words / short words (e.g. a code like "RX"): exact matches only
+    IF v_words IS NULL THEN
+        RETURN QUERY
+        SELECT sc.service_id,
+               CASE WHEN sc.service_code = v_code THEN 0.95 ELSE 1.0 END::REAL,
+               CASE WHEN sc.service_code = v_code THEN 'code' ELSE 'name' END::VARCHAR
+        FROM services_catalog sc
+        WHERE sc.is_active = true
+          AND v_text <> ''
+          AND (sc.service_code = v_code OR normalize_search_text(sc.service_name) = v_text);
+        RETURN;
+    END IF;
+
+    -- Words are [a-z0-9] only, so the OR-query cannot contain tsquery syntax
+    v_query := to_tsquery('portuguese', array_to_string(v_words, ' | '));
+    PERFORM set_config('pg_trgm.word_similarity_threshold', p_threshold::TEXT, true);
+
+    RETURN QUERY
+    WITH candidates AS (
+        SELECT sc.service_id FROM services_catalog sc
+        WHERE sc.is_active = true AND sc.search_tsv @@ v_query
+        UNION
+        SELECT sc.service_id FROM unnest(v_words) AS w
+        JOIN services_catalog sc
+          ON w <% sc.search_document
+         AND word_similarity(w, sc.search_document) >= p_threshold
+         AND sc.is_active = true
+        UNION
+        SELECT sc.service_id FROM services_catalog sc
+        WHERE sc.is_active = true AND sc.service_code = v_code
+    )
+    SELECT r.service_id,
+           CASE
+               WHEN r.name_text = v_text THEN 1.0
+               WHEN r.service_code = v_code THEN 0.95
+               WHEN r.keyword_hit THEN 0.9
+               ELSE 0.85 * r.relevance
+           END::REAL,
+           CASE
+               WHEN r.name_text = v_text THEN 'name'
+               WHEN r.service_code = v_code THEN 'code'
+               WHEN r.keyword_hit THEN 'keyword'
+               WHEN r.search_tsv @@ v_query THEN 'stemmed'
+               ELSE 'fuzzy'
+           END::VARCHAR
+    FROM (
+        SELECT sc.service_id, sc.service_code, sc.search_tsv,
+               normalize_search_text(sc.service_name) AS name_text,
+               EXISTS (SELECT 1 FROM unnest(sc.service_keywords) kw
+                       WHERE normalize_search_text(kw) = v_text) AS keyword_hit,
+               (SELECT AVG(GREATEST(
+                           CASE
+                               WHEN ts_filter(sc.search_tsv, '{a}') @@ to_tsquery('portuguese', w) THEN 1.0
+                               WHEN sc.search_tsv @@ to_tsquery('portuguese', w) THEN 0.85
+                               ELSE 0.0
+                           END,
+                           word_similarity(w, normalize_search_text(sc.service_name)),
+                           0.85 * word_similarity(w, sc.search_document)))
+                FROM unnest(v_words) AS w) AS relevance
+        FROM candidates c
+        JOIN services_catalog sc ON sc.service_id = c.service_id
+    ) r
+    ORDER BY 2 DESC;
+END;
+$$ LANGUAGE plpgsql SET pg_trgm.word_similarity_threshold = 0.6;
+
 -- Function: Find professionals who offer a specific service
+-- Ranked by search_services() relevance; only the tenant's active offers of
+-- the matched services are joined, never the whole professional_services.
 CREATE OR REPLACE FUNCTION find_professionals_for_service(
     p_tenant_id UUID,
     p_search_text TEXT
@@ -863,32 +1930,14 @@ BEGIN
         ps.custom_duration_minutes as duration_minutes,
         ps.custom_price_cents as price_cents,
         ps.price_display,
-        CASE
-            WHEN LOWER(sc.service_name) = LOWER(p_search_text) THEN 1.0
-            WHEN LOWER(sc.service_code) = UPPER(p_search_text) THEN 0.95
-            WHEN LOWER(sc.service_name) ILIKE '%' || LOWER(p_search_text) || '%' THEN 0.8
-            WHEN EXISTS (
-                SELECT 1 FROM unnest(sc.service_keywords) kw 
-                WHERE LOWER(p_search_text) ILIKE '%' || LOWER(kw) || '%'
-            ) THEN 0.7
-            ELSE 0.5
-        END::NUMERIC as match_score
-    FROM professional_services ps
-    JOIN professionals p ON ps.professional_id = p.professional_id
-    JOIN services_catalog sc ON ps.service_id = sc.service_id
+        ROUND(m.score::NUMERIC, 3) as match_score
+    FROM search_services(p_search_text) m
+    JOIN services_catalog sc ON sc.service_id = m.service_id
+    JOIN professional_services ps ON ps.service_id = m.service_id AND ps.is_active = true
+    JOIN professionals p ON p.professional_id = ps.professional_id
     WHERE p.tenant_id = p_tenant_id
     AND p.is_active = true
-    AND ps.is_active = true
-    AND sc.is_active = true
-    AND (
-        LOWER(sc.service_name) ILIKE '%' || LOWER(p_search_text) || '%'
-        OR LOWER(sc.service_code) ILIKE '%' || LOWER(p_search_text) || '%'
-        OR EXISTS (
-            SELECT 1 FROM unnest(sc.service_keywords) kw 
-            WHERE LOWER(p_search_text) ILIKE '%' || LOWER(kw) || '%'
-        )
-    )
-    ORDER BY match_score DESC, p.display_order;
+    ORDER BY m.score DESC, p.display_order;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -962,6 +2011,29 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Function: Is a professional free over [p_start, p_end)?
+-- Same predicate as no_overlapping_appointments, so the lookup is one probe
+-- of its GiST index; answers locally before any Google Calendar call.
+CREATE OR REPLACE FUNCTION is_slot_available(
+    p_professional_id UUID,
+    p_start TIMESTAMPTZ,
+    p_end TIMESTAMPTZ,
+    p_ignore_appointment_id UUID DEFAULT NULL
+)
+RETURNS BOOLEAN AS $$
+    SELECT NOT EXISTS (
+        SELECT 1
+        FROM appointments a
+        WHERE a.professional_id = p_professional_id
+        AND a.period && tstzrange(p_start, p_end, '[)')
+        AND a.deleted_at IS NULL
+        AND a.status IN ('scheduled', 'confirmed', 'in_progress')
+        AND a.appointment_id IS DISTINCT FROM p_ignore_appointment_id
+    );
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION is_slot_available IS 'True when the professional has no active appointment overlapping the range (GiST index on appointments.period)';
+
 -- Function: Validate slot availability
 CREATE OR REPLACE FUNCTION validate_slot_for_service(
     p_slot_start TIMESTAMPTZ,
@@ -1000,7 +2072,15 @@ BEGIN
     v_slot_duration := EXTRACT(EPOCH FROM (p_slot_end - p_slot_start)) / 60;
     v_calculated_end := p_slot_start + (v_required_duration || ' minutes')::INTERVAL;
     
-    IF v_slot_duration >= v_required_duration THEN
+    IF v_slot_duration >= v_required_duration
+       AND NOT is_slot_available(p_professional_id, p_slot_start, v_calculated_end) THEN
+        RETURN QUERY SELECT 
+            false::BOOLEAN,
+            v_slot_duration,
+            v_required_duration,
+            v_calculated_end,
+            'Slot already booked for this professional'::TEXT;
+    ELSIF v_slot_duration >= v_required_duration THEN
         RETURN QUERY SELECT 
             true::BOOLEAN,
             v_slot_duration,
@@ -1051,59 +2131,9 @@ $$ LANGUAGE plpgsql;
 -- Function: Get services catalog for AI prompt (unique services, numbered)
 CREATE OR REPLACE FUNCTION get_services_catalog_for_prompt(p_tenant_id UUID)
 RETURNS TEXT AS $$
-DECLARE
-    v_catalog TEXT := '';
-    v_current_category TEXT := '';
-    v_category_emoji TEXT;
-    v_service_counter INTEGER := 0;
-    rec RECORD;
 BEGIN
-    FOR rec IN 
-        SELECT DISTINCT
-            sc.service_category,
-            sc.service_name,
-            sc.service_id,
-            sc.display_order
-        FROM services_catalog sc
-        WHERE sc.service_id IN (
-            SELECT DISTINCT ps.service_id
-            FROM professionals p
-            JOIN professional_services ps ON p.professional_id = ps.professional_id
-            WHERE p.tenant_id = p_tenant_id
-            AND p.is_active = true
-            AND ps.is_active = true
-        )
-        AND sc.is_active = true
-        ORDER BY sc.service_category, sc.display_order, sc.service_name
-    LOOP
-        IF v_current_category IS DISTINCT FROM rec.service_category THEN
-            v_category_emoji := CASE rec.service_category
-                WHEN 'Odontologia' THEN '🦷'
-                WHEN 'Estética' THEN '💆'
-                WHEN 'Cardiologia' THEN '❤️'
-                WHEN 'Clínico Geral' THEN '👨‍⚕️'
-                ELSE '📋'
-            END;
-            
-            IF v_catalog != '' THEN
-                v_catalog := v_catalog || E'\n';
-            END IF;
-            
-            v_catalog := v_catalog || format('%s *%s*',
-                v_category_emoji,
-                UPPER(rec.service_category)
-            );
-            v_current_category := rec.service_category;
-        END IF;
-        
-        v_service_counter := v_service_counter + 1;
-        v_catalog := v_catalog || E'\n' || format('%s. %s',
-            v_service_counter::TEXT,
-            rec.service_name
-        );
-    END LOOP;
-    
-    RETURN COALESCE(v_catalog, 'Nenhum serviço cadastrado.');
+    -- Rendered once per change by refresh_tenant_prompt_artifacts()
+    RETURN COALESCE((get_tenant_prompt_artifacts(p_tenant_id)).services_catalog, '');
 END;
 $$ LANGUAGE plpgsql;
 
@@ -1122,42 +2152,25 @@ RETURNS TABLE (
     service_number INTEGER
 ) AS $$
 DECLARE
-    v_service_counter INTEGER := 0;
-    rec RECORD;
+    v_entry JSONB;
 BEGIN
-    FOR rec IN 
-        SELECT DISTINCT
-            sc.service_id,
-            sc.service_name,
-            sc.service_code,
-            sc.service_category,
-            sc.display_order
-        FROM services_catalog sc
-        WHERE sc.service_id IN (
-            SELECT DISTINCT ps.service_id
-            FROM professionals p
-            JOIN professional_services ps ON p.professional_id = ps.professional_id
-            WHERE p.tenant_id = p_tenant_id
-            AND p.is_active = true
-            AND ps.is_active = true
-        )
-        AND sc.is_active = true
-        ORDER BY sc.service_category, sc.display_order, sc.service_name
-    LOOP
-        v_service_counter := v_service_counter + 1;
-        
-        IF v_service_counter = p_service_number THEN
-            RETURN QUERY SELECT 
-                rec.service_id,
-                rec.service_name,
-                rec.service_code,
-                rec.service_category,
-                v_service_counter;
-            RETURN;
-        END IF;
-    END LOOP;
-    
-    RETURN;
+    IF p_service_number IS NULL OR p_service_number < 1 THEN
+        RETURN;
+    END IF;
+
+    -- Same numbering as get_services_catalog_for_prompt (shared index)
+    v_entry := (get_tenant_prompt_artifacts(p_tenant_id)).service_index -> (p_service_number - 1);
+
+    IF v_entry IS NULL THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY SELECT
+        (v_entry->>'service_id')::UUID,
+        (v_entry->>'service_name')::VARCHAR,
+        (v_entry->>'service_code')::VARCHAR,
+        (v_entry->>'service_category')::VARCHAR,
+        p_service_number;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -1179,11 +2192,7 @@ DECLARE
     v_key TEXT;
     v_value TEXT;
 BEGIN
-    SELECT template_text INTO v_template
-    FROM response_templates
-    WHERE tenant_id = p_tenant_id 
-    AND template_key = p_template_key
-    AND is_active = true;
+    v_template := (get_tenant_prompt_artifacts(p_tenant_id)).templates ->> p_template_key;
     
     IF v_template IS NULL THEN
         RETURN NULL;
@@ -1363,13 +2372,226 @@ DECLARE
     v_count INTEGER;
 BEGIN
     DELETE FROM conversation_state
-    WHERE expires_at < NOW()
-    RETURNING COUNT(*) INTO v_count;
+    WHERE expires_at < NOW();
+    GET DIAGNOSTICS v_count = ROW_COUNT;
     
-    RETURN COALESCE(v_count, 0);
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Numbered list of the inputs a state accepts (invalid_option replies)
+CREATE OR REPLACE FUNCTION get_state_options_text(p_state_name VARCHAR)
+RETURNS TEXT AS $$
+DECLARE
+    v_inputs JSONB;
+    v_keys TEXT[];
+    v_lines TEXT[] := '{}';
+    v_keycap CONSTANT TEXT := chr(65039) || chr(8419);  -- '1' || v_keycap = 1️⃣
+    v_descriptions CONSTANT JSONB := '{
+        "schedule": "Agendar consulta",
+        "reschedule": "Reagendar consulta",
+        "cancel": "Cancelar consulta",
+        "services_info": "Informações sobre serviços",
+        "hours_location": "Horário e localização",
+        "select_service": "Selecionar serviço",
+        "select_professional": "Selecionar profissional",
+        "select_slot": "Selecionar horário",
+        "confirmed": "Confirmar",
+        "cancelled": "Cancelar",
+        "initial": "Voltar ao menu principal"
+    }';
+    i INTEGER;
+BEGIN
+    SELECT sd.valid_inputs INTO v_inputs
+    FROM state_definitions sd
+    WHERE sd.state_name = p_state_name;
+
+    -- Numbered inputs in numeric order; otherwise the words the state accepts
+    SELECT array_agg(k ORDER BY k::INTEGER) INTO v_keys
+    FROM jsonb_object_keys(COALESCE(v_inputs, '{}')) k
+    WHERE k ~ '^\d+$';
+    IF v_keys IS NULL THEN
+        SELECT array_agg(k) INTO v_keys
+        FROM jsonb_object_keys(COALESCE(v_inputs, '{}')) k
+        WHERE k NOT IN ('number', 'voltar');
+    END IF;
+
+    FOR i IN 1 .. COALESCE(array_length(v_keys, 1), 0) LOOP
+        v_lines := v_lines || format('%s%s %s', i, v_keycap,
+            COALESCE(v_descriptions ->> (v_inputs ->> v_keys[i]), v_inputs ->> v_keys[i]));
+    END LOOP;
+
+    IF array_length(v_lines, 1) > 0 THEN
+        RETURN array_to_string(v_lines, E'\n');
+    ELSIF p_state_name = 'initial' THEN
+        RETURN format(E'1%1$s Agendar consulta\n2%1$s Reagendar consulta\n3%1$s Cancelar consulta\n4%1$s Informações sobre serviços\n5%1$s Horário e localização', v_keycap);
+    END IF;
+    RETURN 'Por favor, digite o número da opção desejada.';
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Function: Resolve one inbound turn of the main workflow in a single round trip
+-- Runs the state machine, then picks the reply in this order:
+--   1. state template (not requires_ai), with the service list, the
+--      professionals of a just-selected service or the valid options filled in
+--   2. service picked by catalog number (intent service_selection)
+--   3. template for the classified intent (greeting, hours/location, help)
+--   4. FAQ cache (match_faq; the hit's view_count is bumped)
+--   5. AI
+-- Returns one JSON document: route ('template', 'service_selection', 'faq',
+-- 'ai'), response_text, the new state, and the FAQ hit / service /
+-- professionals behind the reply (for 'ai', the session's chat memory
+-- summary). Every input is a parameter. The route and the time spent here
+-- are counted in pipeline_counters.
+CREATE OR REPLACE FUNCTION process_inbound_turn(
+    p_tenant_id UUID,
+    p_remote_jid VARCHAR(50),
+    p_text TEXT,
+    p_intent VARCHAR DEFAULT NULL,
+    p_variables JSONB DEFAULT '{}'
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_turn RECORD;
+    v_input TEXT := btrim(COALESCE(p_text, ''));
+    v_vars JSONB;
+    v_route TEXT;
+    v_template_key VARCHAR(100);
+    v_text TEXT;
+    v_service JSONB;
+    v_professionals JSONB;
+    v_faq JSONB;
+    v_state_data JSONB;
+    v_keycap CONSTANT TEXT := chr(65039) || chr(8419);
+    v_started TIMESTAMPTZ := clock_timestamp();
+BEGIN
+    SELECT * INTO v_turn
+    FROM transition_conversation_state(p_tenant_id, p_remote_jid, v_input);
+    v_state_data := COALESCE(v_turn.state_data, '{}');
+
+    -- Template variables: clinic data, overridable by the caller (patient_name)
+    SELECT jsonb_build_object(
+        'patient_name', 'Paciente',
+        'clinic_name', tc.clinic_name,
+        'address', COALESCE(tc.clinic_address, ''),
+        'business_hours', format('%s às %s (%s)', to_char(tc.hours_start, 'HH24:MI'),
+                                 to_char(tc.hours_end, 'HH24:MI'), COALESCE(tc.days_open_display, 'Segunda–Sábado')),
+        'phone', COALESCE(tc.clinic_phone, '')
+    ) INTO v_vars
+    FROM tenant_config tc
+    WHERE tc.tenant_id = p_tenant_id;
+    v_vars := COALESCE(v_vars, '{}') || jsonb_strip_nulls(COALESCE(p_variables, '{}'));
+
+    -- 1. State machine reply
+    IF NOT COALESCE(v_turn.requires_ai, false) AND v_turn.template_key IS NOT NULL THEN
+        v_template_key := v_turn.template_key;
+
+        IF v_turn.new_state = 'awaiting_professional' AND v_input ~ '^\d{1,9}$' THEN
+            SELECT to_jsonb(s) INTO v_service
+            FROM get_service_by_number(p_tenant_id, v_input::INTEGER) s;
+
+            IF v_service IS NOT NULL THEN
+                v_state_data := v_state_data || jsonb_build_object('selected_service_name', v_service->>'service_name');
+                PERFORM update_conversation_state_data(
+                    p_tenant_id, p_remote_jid, (v_service->>'service_id')::UUID, NULL, NULL,
+                    jsonb_build_object('selected_service_name', v_service->>'service_name'));
+
+                SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                           'id', x.professional_id, 'name', x.professional_name,
+                           'specialty', x.specialty, 'number', x.n) ORDER BY x.n), '[]'),
+                       string_agg(format(E'%s%s *%s*\n   %s\n\n', x.n, v_keycap, x.professional_name,
+                                         COALESCE(x.specialty, '')), '' ORDER BY x.n)
+                INTO v_professionals, v_text
+                FROM (
+                    SELECT p.professional_id, p.professional_name, p.specialty,
+                           ROW_NUMBER() OVER (ORDER BY p.professional_name) AS n
+                    FROM professionals p
+                    JOIN professional_services ps ON ps.professional_id = p.professional_id
+                    WHERE p.tenant_id = p_tenant_id
+                    AND ps.service_id = (v_service->>'service_id')::UUID
+                    AND p.is_active = true
+                    AND ps.is_active = true
+                ) x;
+                v_vars := v_vars || jsonb_build_object('professional_list', COALESCE(v_text, ''));
+            END IF;
+        END IF;
+
+        IF v_template_key = 'service_catalog' THEN
+            v_vars := v_vars || jsonb_build_object('service_list', get_services_catalog_for_prompt(p_tenant_id));
+        ELSIF v_template_key = 'invalid_option' THEN
+            v_vars := v_vars || jsonb_build_object('available_options', get_state_options_text(v_turn.new_state));
+        END IF;
+
+        v_text := get_template_response(p_tenant_id, v_template_key, v_vars);
+        IF v_text IS NOT NULL THEN
+            v_route := 'template';
+        END IF;
+    END IF;
+
+    -- 2. Service picked by its number outside the state machine
+    IF v_route IS NULL AND p_intent = 'service_selection' AND v_input ~ '^\d{1,9}$' THEN
+        SELECT to_jsonb(s) INTO v_service
+        FROM get_service_by_number(p_tenant_id, v_input::INTEGER) s;
+        IF v_service IS NOT NULL THEN
+            v_route := 'service_selection';
+        END IF;
+    END IF;
+
+    -- 3. Template for the classified intent
+    IF v_route IS NULL THEN
+        v_template_key := CASE p_intent
+            WHEN 'greeting' THEN 'greeting_new'
+            WHEN 'hours' THEN 'hours_location'
+            WHEN 'location' THEN 'hours_location'
+            WHEN 'hours_location' THEN 'hours_location'
+            WHEN 'help' THEN 'invalid_option'
+        END;
+        IF v_template_key = 'invalid_option' THEN
+            v_vars := v_vars || jsonb_build_object('available_options', get_state_options_text(v_turn.new_state));
+        END IF;
+        v_text := get_template_response(p_tenant_id, v_template_key, v_vars);
+        IF v_text IS NOT NULL THEN
+            v_route := 'template';
+        END IF;
+    END IF;
+
+    -- 4. FAQ cache
+    IF v_route IS NULL THEN
+        SELECT to_jsonb(f) INTO v_faq
+        FROM match_faq(p_tenant_id, v_input, NULLIF(p_intent, '')) f
+        LIMIT 1;
+        IF v_faq IS NOT NULL THEN
+            UPDATE tenant_faq
+            SET view_count = view_count + 1, last_used_at = NOW()
+            WHERE faq_id = (v_faq->>'faq_id')::UUID;
+            v_text := v_faq->>'answer';
+            v_route := 'faq';
+        END IF;
+    END IF;
+
+    PERFORM record_pipeline_counter(
+        p_tenant_id, 'turn:' || COALESCE(v_route, 'ai'), 1,
+        EXTRACT(EPOCH FROM clock_timestamp() - v_started) * 1000);
+
+    RETURN jsonb_build_object(
+        'route', COALESCE(v_route, 'ai'),
+        'response_text', CASE WHEN v_route IN ('template', 'faq') THEN v_text END,
+        'template_key', CASE WHEN v_route = 'template' THEN v_template_key END,
+        'state', v_turn.new_state,
+        'state_requires_ai', v_turn.requires_ai,
+        'state_data', v_state_data,
+        'faq', v_faq - 'answer',
+        'service', v_service,
+        'professionals', v_professionals,
+        -- Older turns folded out of the agent's chat memory window
+        'memory_summary', CASE WHEN v_route IS NULL
+                               THEN get_chat_memory_summary(p_tenant_id::TEXT || '_' || p_remote_jid) END
+    );
 END;
 $$ LANGUAGE plpgsql;
 
+COMMENT ON FUNCTION process_inbound_turn IS 'State transition + reply (template, FAQ or AI route) for one inbound turn as one JSON document';
+
 -- ============================================================================
 -- 19. CALENDAR FUNCTIONS
 -- ============================================================================
@@ -1399,6 +2621,169 @@ $$;
 
 COMMENT ON FUNCTION calendar_token_needs_refresh IS 'Returns TRUE if calendar access token needs refresh (expired or near expiry)';
 
+-- ----------------------------------------------------------------------------
+-- Access token cache
+-- ----------------------------------------------------------------------------
+-- The Google Calendar Client reuses calendars.google_access_token until it is
+-- close to expiry. A refresh lease (google_token_refresh_lease_until) makes
+-- sure only one caller at a time talks to the token endpoint for a calendar:
+-- the lease holder refreshes and stores the new token, everyone else either
+-- keeps using the current token or waits briefly for the new one.
+-- scripts/ops/refresh_calendar_tokens.py refreshes tokens ahead of expiry so
+-- the request path normally never refreshes at all.
+
+-- Function: Get a usable access token, or a refresh lease with credentials
+CREATE OR REPLACE FUNCTION get_calendar_access_token(
+    p_tenant_id UUID,
+    p_calendar_id UUID DEFAULT NULL,
+    p_wait_ms INTEGER DEFAULT 5000
+)
+RETURNS TABLE (
+    calendar_id UUID,
+    access_token TEXT,
+    expires_at TIMESTAMPTZ,
+    refresh_required BOOLEAN,
+    google_client_id VARCHAR,
+    google_client_secret TEXT,
+    google_refresh_token TEXT
+) AS $$
+DECLARE
+    v_cal calendars;
+    v_min_ttl INTERVAL := INTERVAL '60 seconds';  -- never hand out tokens closer to expiry
+    v_lease INTERVAL := INTERVAL '30 seconds';
+    v_deadline TIMESTAMPTZ := clock_timestamp() + (GREATEST(p_wait_ms, 0) || ' milliseconds')::INTERVAL;
+BEGIN
+    LOOP
+        SELECT * INTO v_cal
+        FROM calendars c
+        WHERE c.tenant_id = p_tenant_id
+        AND (p_calendar_id IS NULL OR c.calendar_id = p_calendar_id)
+        AND c.google_refresh_token IS NOT NULL
+        AND c.is_active = true
+        ORDER BY c.is_primary DESC, c.created_at, c.calendar_id
+        LIMIT 1;
+
+        IF v_cal.calendar_id IS NULL THEN
+            RETURN;
+        END IF;
+
+        IF v_cal.google_access_token IS NOT NULL
+           AND v_cal.google_token_expires_at > clock_timestamp() + v_min_ttl THEN
+            RETURN QUERY SELECT
+                v_cal.calendar_id, v_cal.google_access_token, v_cal.google_token_expires_at,
+                false, NULL::VARCHAR, NULL::TEXT, NULL::TEXT;
+            RETURN;
+        END IF;
+
+        -- Token missing or about to expire: try to become the refresher.
+        -- Past the wait deadline a stuck lease is taken over. A failed attempt
+        -- can still leave the row locked (READ COMMITTED re-check), so it runs
+        -- in a subtransaction that is rolled back to release that lock.
+        BEGIN
+            UPDATE calendars c
+            SET google_token_refresh_lease_until = clock_timestamp() + v_lease
+            WHERE c.calendar_id = v_cal.calendar_id
+            AND (c.google_token_refresh_lease_until IS NULL
+                 OR c.google_token_refresh_lease_until < clock_timestamp()
+                 OR clock_timestamp() >= v_deadline);
+
+            IF NOT FOUND THEN
+                RAISE EXCEPTION USING ERRCODE = 'lock_not_available';
+            END IF;
+
+            RETURN QUERY SELECT
+                v_cal.calendar_id, v_cal.google_access_token, v_cal.google_token_expires_at,
+                true, v_cal.google_client_id, v_cal.google_client_secret, v_cal.google_refresh_token;
+            RETURN;
+        EXCEPTION WHEN lock_not_available THEN
+            NULL;
+        END;
+
+        -- Someone else is refreshing this calendar; wait for their result
+        PERFORM pg_sleep(0.1);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION get_calendar_access_token IS 'Cached Google access token for a tenant calendar; returns credentials and a refresh lease only when a refresh is needed';
+
+-- Function: Store the result of a token refresh and release the lease
+CREATE OR REPLACE FUNCTION store_calendar_access_token(
+    p_tenant_id UUID,
+    p_calendar_id UUID,
+    p_access_token TEXT,
+    p_expires_in INTEGER,
+    p_error TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+    access_token TEXT,
+    expires_at TIMESTAMPTZ,
+    error TEXT
+) AS $$
+BEGIN
+    IF p_access_token IS NULL OR p_access_token = '' THEN
+        -- Failed refresh: release the lease so waiters retry immediately
+        UPDATE calendars c
+        SET google_token_refresh_lease_until = NULL,
+            sync_error = COALESCE(p_error, 'Token refresh failed')
+        WHERE c.tenant_id = p_tenant_id
+        AND c.calendar_id = p_calendar_id;
+
+        RETURN QUERY SELECT NULL::TEXT, NULL::TIMESTAMPTZ, COALESCE(p_error, 'Token refresh failed');
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    UPDATE calendars c
+    SET google_access_token = p_access_token,
+        google_token_expires_at = NOW() + (COALESCE(NULLIF(p_expires_in, 0), 3600) || ' seconds')::INTERVAL,
+        google_token_refresh_lease_until = NULL,
+        sync_error = NULL
+    WHERE c.tenant_id = p_tenant_id
+    AND c.calendar_id = p_calendar_id
+    RETURNING c.google_access_token, c.google_token_expires_at, NULL::TEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION store_calendar_access_token IS 'Persists a refreshed access token (or the refresh error) and releases the refresh lease';
+
+-- Function: Claim calendars whose tokens expire soon (background refresher)
+CREATE OR REPLACE FUNCTION claim_calendar_token_refreshes(
+    p_ahead_seconds INTEGER DEFAULT 600,
+    p_limit INTEGER DEFAULT 50
+)
+RETURNS TABLE (
+    calendar_id UUID,
+    tenant_id UUID,
+    google_client_id VARCHAR,
+    google_client_secret TEXT,
+    google_refresh_token TEXT
+) AS $$
+BEGIN
+    RETURN QUERY
+    UPDATE calendars c
+    SET google_token_refresh_lease_until = NOW() + INTERVAL '30 seconds'
+    FROM (
+        SELECT d.calendar_id
+        FROM calendars d
+        WHERE d.google_refresh_token IS NOT NULL
+        AND d.is_active = true
+        AND d.sync_enabled = true
+        AND (d.google_token_expires_at IS NULL
+             OR d.google_token_expires_at < NOW() + (p_ahead_seconds || ' seconds')::INTERVAL)
+        AND (d.google_token_refresh_lease_until IS NULL
+             OR d.google_token_refresh_lease_until < NOW())
+        ORDER BY d.google_token_expires_at NULLS FIRST
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    ) AS due
+    WHERE c.calendar_id = due.calendar_id
+    RETURNING c.calendar_id, c.tenant_id, c.google_client_id, c.google_client_secret, c.google_refresh_token;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION claim_calendar_token_refreshes IS 'Leases calendars whose access token expires within p_ahead_seconds, for refresh-ahead';
+
 -- Function: Get calendar configuration for a professional
 CREATE OR REPLACE FUNCTION get_calendar_for_professional(
     p_tenant_id UUID,
@@ -1462,6 +2847,88 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Function: Scheduling inputs for every professional offering a service
+-- One row per professional with everything the availability engine needs:
+-- Google calendar, service duration, slot grid, working window (service
+-- overrides applied) and the professional's local appointments in the range
+-- as a start-sorted busy list. Feeds a single FreeBusy request for all of them.
+CREATE OR REPLACE FUNCTION get_availability_context(
+    p_tenant_id UUID,
+    p_service_id UUID,
+    p_start TIMESTAMPTZ DEFAULT NULL,
+    p_end TIMESTAMPTZ DEFAULT NULL,
+    p_professional_ids UUID[] DEFAULT NULL
+)
+RETURNS TABLE (
+    professional_id UUID,
+    professional_name VARCHAR,
+    display_order INTEGER,
+    google_calendar_id VARCHAR,
+    timezone VARCHAR,
+    duration_minutes INTEGER,
+    slot_interval_minutes INTEGER,
+    buffer_minutes INTEGER,
+    working_hours_start TIME,
+    working_hours_end TIME,
+    working_days JSONB,
+    lunch_break_start TIME,
+    lunch_break_end TIME,
+    min_notice_hours INTEGER,
+    price_display VARCHAR,
+    busy JSONB
+) AS $$
+DECLARE
+    v_start TIMESTAMPTZ := COALESCE(p_start, NOW());
+    v_end TIMESTAMPTZ := COALESCE(p_end, COALESCE(p_start, NOW()) + INTERVAL '7 days');
+BEGIN
+    RETURN QUERY
+    SELECT
+        p.professional_id,
+        p.professional_name,
+        p.display_order,
+        COALESCE(cal.google_calendar_id, p.google_calendar_id),
+        COALESCE(cal.timezone, tc.timezone),
+        ps.custom_duration_minutes,
+        p.slot_interval_minutes,
+        COALESCE(p.buffer_between_appointments, 0),
+        COALESCE(ps.available_hours_start, p.working_hours_start),
+        COALESCE(ps.available_hours_end, p.working_hours_end),
+        COALESCE(ps.available_days, p.working_days),
+        p.lunch_break_start,
+        p.lunch_break_end,
+        COALESCE(p.min_notice_hours, 0),
+        ps.price_display,
+        COALESCE((
+            SELECT jsonb_agg(jsonb_build_object('start', a.start_at, 'end', a.end_at) ORDER BY a.start_at)
+            FROM appointments a
+            WHERE a.professional_id = p.professional_id
+            AND a.period && tstzrange(v_start, v_end, '[)')
+            AND a.deleted_at IS NULL
+            AND a.status IN ('scheduled', 'confirmed', 'in_progress')
+        ), '[]'::jsonb)
+    FROM professionals p
+    JOIN tenant_config tc ON tc.tenant_id = p.tenant_id
+    JOIN professional_services ps ON ps.professional_id = p.professional_id
+    LEFT JOIN LATERAL (
+        SELECT c.google_calendar_id, c.timezone
+        FROM calendars c
+        WHERE c.tenant_id = p.tenant_id
+        AND c.professional_id = p.professional_id
+        AND c.is_active = true
+        ORDER BY c.is_primary DESC, c.created_at
+        LIMIT 1
+    ) cal ON true
+    WHERE p.tenant_id = p_tenant_id
+    AND ps.service_id = p_service_id
+    AND (p_professional_ids IS NULL OR p.professional_id = ANY(p_professional_ids))
+    AND p.is_active = true
+    AND ps.is_active = true
+    ORDER BY p.display_order, p.professional_name;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION get_availability_context IS 'Per-professional scheduling inputs and local busy intervals for a batched availability check';
+
 -- Function: Register a new calendar for a professional
 CREATE OR REPLACE FUNCTION register_professional_calendar(
     p_tenant_id UUID,
@@ -1637,6 +3104,17 @@ BEGIN
     
     v_end_at := p_start_at + (v_duration || ' minutes')::INTERVAL;
     
+    -- One booking at a time per professional: overlapping inserts would
+    -- otherwise wait on each other inside no_overlapping_appointments (and
+    -- can deadlock); under the lock a conflict is a plain check
+    PERFORM pg_advisory_xact_lock(hashtextextended('appointments:' || p_professional_id::text, 0));
+    
+    IF NOT is_slot_available(p_professional_id, p_start_at, v_end_at) THEN
+        RAISE EXCEPTION 'Slot already booked for this professional'
+            USING ERRCODE = 'exclusion_violation',
+                  DETAIL = format('%s - %s', p_start_at, v_end_at);
+    END IF;
+    
     INSERT INTO appointments (
         tenant_id,
         professional_id,
@@ -1712,9 +3190,9 @@ BEGIN
         RETURN;
     END IF;
     
-    SELECT google_calendar_id INTO v_google_calendar_id
-    FROM professionals
-    WHERE professional_id = v_appointment.professional_id;
+    SELECT p.google_calendar_id INTO v_google_calendar_id
+    FROM professionals p
+    WHERE p.professional_id = v_appointment.professional_id;
     
     UPDATE appointments
     SET 
@@ -1771,12 +3249,26 @@ BEGIN
         RETURN;
     END IF;
     
-    SELECT google_calendar_id INTO v_google_calendar_id
-    FROM professionals
-    WHERE professional_id = v_old_appointment.professional_id;
+    SELECT p.google_calendar_id INTO v_google_calendar_id
+    FROM professionals p
+    WHERE p.professional_id = v_old_appointment.professional_id;
     
     v_new_end_at := p_new_start_at + (v_old_appointment.duration_minutes || ' minutes')::INTERVAL;
     
+    -- Same per-professional lock as create_appointment(); the appointment
+    -- being moved does not count, so a patient may shift within their slot
+    PERFORM pg_advisory_xact_lock(hashtextextended('appointments:' || v_old_appointment.professional_id::text, 0));
+    
+    IF NOT is_slot_available(v_old_appointment.professional_id, p_new_start_at, v_new_end_at, p_appointment_id) THEN
+        RETURN QUERY SELECT 
+            NULL::UUID, 
+            NULL::TIMESTAMPTZ, 
+            NULL::VARCHAR, 
+            NULL::VARCHAR, 
+            'Slot already booked for this professional'::TEXT;
+        RETURN;
+    END IF;
+    
     UPDATE appointments
     SET 
         status = 'rescheduled',
@@ -1965,6 +3457,183 @@ BEGIN
         SET reminder_1h_sent_at = NOW()
         WHERE appointment_id = p_appointment_id;
     END IF;
+
+    PERFORM record_pipeline_counter(a.tenant_id, 'reminder:' || p_reminder_type)
+    FROM appointments a
+    WHERE a.appointment_id = p_appointment_id
+    AND p_reminder_type IN ('24h', '1h');
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Claim reminders that are due now (24h and 1h windows)
+-- Set-based and safe under overlapping runs: due rows are locked with
+-- SKIP LOCKED and leased via reminder_claimed_until, so a second run never
+-- picks them up again. Each tenant gets at most as many reminders as its
+-- token bucket (reminder_rate_limits) allows, and rows are ordered round-robin
+-- across tenants. 24h reminders are held back outside p_send_from..p_send_until
+-- in the tenant's local time; 1h reminders go out regardless. Every row of
+-- one run carries the same claim_token, which mark_reminders_sent() needs.
+DROP FUNCTION IF EXISTS claim_due_reminders(INTEGER, INTEGER, TIME, TIME);
+
+CREATE OR REPLACE FUNCTION claim_due_reminders(
+    p_limit INTEGER DEFAULT 500,
+    p_lease_seconds INTEGER DEFAULT 600,
+    p_send_from TIME DEFAULT '08:00',
+    p_send_until TIME DEFAULT '21:00'
+)
+RETURNS TABLE (
+    appointment_id UUID,
+    tenant_id UUID,
+    reminder_type VARCHAR,
+    patient_contact VARCHAR,
+    patient_name VARCHAR,
+    start_at TIMESTAMPTZ,
+    service_name VARCHAR,
+    professional_name VARCHAR,
+    clinic_name VARCHAR,
+    clinic_phone VARCHAR,
+    clinic_address TEXT,
+    evolution_instance_name VARCHAR,
+    timezone VARCHAR,
+    claim_token UUID
+) AS $$
+DECLARE
+    v_now TIMESTAMPTZ := NOW();
+    v_token UUID := gen_random_uuid();
+BEGIN
+    INSERT INTO reminder_rate_limits (tenant_id)
+    SELECT tc.tenant_id
+    FROM tenant_config tc
+    WHERE tc.is_active = true
+    AND NOT EXISTS (SELECT 1 FROM reminder_rate_limits rl WHERE rl.tenant_id = tc.tenant_id)
+    ON CONFLICT ON CONSTRAINT reminder_rate_limits_pkey DO NOTHING;
+
+    RETURN QUERY
+    WITH due AS (
+        SELECT
+            a.appointment_id,
+            a.tenant_id,
+            a.start_at,
+            CASE WHEN a.start_at <= v_now + INTERVAL '1 hour' THEN '1h' ELSE '24h' END::VARCHAR AS reminder_type
+        FROM appointments a
+        JOIN tenant_config tc ON tc.tenant_id = a.tenant_id AND tc.is_active = true
+        WHERE a.deleted_at IS NULL
+        AND a.status IN ('scheduled', 'confirmed')
+        AND a.start_at > v_now + INTERVAL '15 minutes'
+        AND a.start_at <= v_now + INTERVAL '24 hours'
+        AND NULLIF(a.patient_contact, '') IS NOT NULL
+        AND (a.reminder_claimed_until IS NULL OR a.reminder_claimed_until < v_now)
+        AND (
+            (a.start_at <= v_now + INTERVAL '1 hour' AND a.reminder_1h_sent_at IS NULL)
+            OR (a.start_at > v_now + INTERVAL '2 hours'
+                AND a.reminder_24h_sent_at IS NULL
+                AND (v_now AT TIME ZONE tc.timezone)::TIME BETWEEN p_send_from AND p_send_until)
+        )
+        FOR UPDATE OF a SKIP LOCKED
+    ),
+    ranked AS (
+        SELECT d.*, ROW_NUMBER() OVER (PARTITION BY d.tenant_id ORDER BY d.start_at, d.appointment_id) AS rn
+        FROM due d
+    ),
+    bucket AS (
+        SELECT
+            rl.tenant_id,
+            LEAST(rl.capacity, rl.tokens + rl.refill_per_minute * EXTRACT(EPOCH FROM (v_now - rl.refilled_at)) / 60.0) AS tokens
+        FROM reminder_rate_limits rl
+        WHERE rl.tenant_id IN (SELECT d.tenant_id FROM due d)
+        FOR UPDATE
+    ),
+    picked AS (
+        SELECT r.appointment_id, r.tenant_id, r.reminder_type, r.rn
+        FROM ranked r
+        JOIN bucket b ON b.tenant_id = r.tenant_id
+        WHERE r.rn <= FLOOR(b.tokens)
+        ORDER BY r.rn, r.start_at
+        LIMIT p_limit
+    ),
+    spent AS (
+        UPDATE reminder_rate_limits rl
+        SET tokens = b.tokens - COALESCE(c.n, 0),
+            refilled_at = v_now
+        FROM bucket b
+        LEFT JOIN (SELECT pk.tenant_id, COUNT(*) AS n FROM picked pk GROUP BY pk.tenant_id) c
+            ON c.tenant_id = b.tenant_id
+        WHERE rl.tenant_id = b.tenant_id
+    ),
+    claimed AS (
+        UPDATE appointments a
+        SET reminder_claimed_type = pk.reminder_type,
+            reminder_claimed_until = v_now + make_interval(secs => p_lease_seconds),
+            reminder_claim_token = v_token
+        FROM picked pk
+        WHERE a.appointment_id = pk.appointment_id
+        RETURNING a.*, pk.rn
+    )
+    SELECT
+        c.appointment_id,
+        c.tenant_id,
+        c.reminder_claimed_type,
+        c.patient_contact,
+        c.patient_name,
+        c.start_at,
+        c.service_name,
+        c.professional_name,
+        tc.clinic_name,
+        tc.clinic_phone,
+        tc.clinic_address,
+        tc.evolution_instance_name,
+        tc.timezone,
+        v_token
+    FROM claimed c
+    JOIN tenant_config tc ON tc.tenant_id = c.tenant_id
+    ORDER BY c.rn, c.start_at;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION claim_due_reminders(INTEGER, INTEGER, TIME, TIME) IS 'Leases due 24h/1h reminders, rate-limited per tenant; confirm with mark_reminders_sent()';
+
+-- Function: Mark a batch of claimed reminders as sent
+-- The reminder type comes from the claim. Only reminders still held by the
+-- run's claim are marked: a lease that expired (and may have been taken by
+-- another run) is left alone, and the reminder is sent again. Returns the
+-- reminders marked. Failed sends are simply left out: their claim expires
+-- and the next run retries them.
+DROP FUNCTION IF EXISTS mark_reminders_sent(UUID[]);
+
+CREATE OR REPLACE FUNCTION mark_reminders_sent(
+    p_appointment_ids UUID[],
+    p_claim_token UUID
+)
+RETURNS TABLE (
+    appointment_id UUID,
+    reminder_type VARCHAR
+) AS $$
+BEGIN
+    RETURN QUERY
+    WITH sent AS (
+        UPDATE appointments a
+        SET reminder_24h_sent_at = CASE WHEN a.reminder_claimed_type = '24h' THEN NOW() ELSE a.reminder_24h_sent_at END,
+            reminder_1h_sent_at = CASE WHEN a.reminder_claimed_type = '1h' THEN NOW() ELSE a.reminder_1h_sent_at END,
+            reminder_claimed_type = NULL,
+            reminder_claimed_until = NULL,
+            reminder_claim_token = NULL
+        FROM appointments old
+        WHERE old.appointment_id = a.appointment_id
+        AND a.appointment_id = ANY(p_appointment_ids)
+        AND a.reminder_claimed_type IS NOT NULL
+        AND a.reminder_claim_token = p_claim_token
+        AND a.reminder_claimed_until > NOW()
+        RETURNING a.appointment_id AS sent_id, a.tenant_id, old.reminder_claimed_type AS sent_type
+    ), counted AS (
+        SELECT s.tenant_id, s.sent_type,
+               record_pipeline_counter(s.tenant_id, 'reminder:' || s.sent_type, COUNT(*)::INTEGER)
+        FROM sent s
+        GROUP BY s.tenant_id, s.sent_type
+    )
+    -- Joined so the counters are recorded
+    SELECT s.sent_id, s.sent_type
+    FROM sent s
+    JOIN counted c ON c.tenant_id = s.tenant_id AND c.sent_type = s.sent_type;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -2189,6 +3858,9 @@ BEGIN
         GRANT SELECT, INSERT, UPDATE ON tenant_config TO n8n_user;
         GRANT SELECT, INSERT, UPDATE, DELETE ON tenant_secrets TO n8n_user;
         GRANT SELECT, INSERT ON tenant_activity_log TO n8n_user;
+        GRANT SELECT, INSERT, UPDATE ON tenant_context_cache TO n8n_user;
+        GRANT SELECT ON intent_rules TO n8n_user;
+        GRANT SELECT, INSERT, UPDATE ON tenant_prompt_artifacts TO n8n_user;
         GRANT USAGE, SELECT ON SEQUENCE tenant_activity_log_log_id_seq TO n8n_user;
         GRANT SELECT, INSERT, UPDATE, DELETE ON tenant_faq TO n8n_user;
         GRANT SELECT, INSERT, UPDATE ON services_catalog TO n8n_user;
@@ -2199,6 +3871,7 @@ BEGIN
         GRANT SELECT, INSERT, UPDATE, DELETE ON conversation_state TO n8n_user;
         GRANT SELECT, INSERT, UPDATE, DELETE ON calendars TO n8n_user;
         GRANT SELECT, INSERT, UPDATE, DELETE ON appointments TO n8n_user;
+        GRANT SELECT, INSERT, UPDATE ON reminder_rate_limits TO n8n_user;
         
         -- Views
         GRANT SELECT ON v_active_tenants TO n8n_user;
@@ -2212,12 +3885,18 @@ BEGIN
         
         -- Functions
         GRANT EXECUTE ON FUNCTION get_tenant_by_instance(VARCHAR) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION get_tenant_context(VARCHAR) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION get_intent_rules(UUID, VARCHAR) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION refresh_tenant_context(UUID) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION get_tenant_prompt_artifacts(UUID) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION refresh_tenant_prompt_artifacts(UUID) TO n8n_user;
         GRANT EXECUTE ON FUNCTION increment_message_count(UUID) TO n8n_user;
         GRANT EXECUTE ON FUNCTION reset_monthly_quotas() TO n8n_user;
         GRANT EXECUTE ON FUNCTION cleanup_stale_faqs() TO n8n_user;
         GRANT EXECUTE ON FUNCTION find_professionals_for_service(UUID, TEXT) TO n8n_user;
         GRANT EXECUTE ON FUNCTION get_professional_service_details(UUID, UUID) TO n8n_user;
         GRANT EXECUTE ON FUNCTION calculate_appointment_end_time(TIMESTAMPTZ, UUID, UUID) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION is_slot_available(UUID, TIMESTAMPTZ, TIMESTAMPTZ, UUID) TO n8n_user;
         GRANT EXECUTE ON FUNCTION validate_slot_for_service(TIMESTAMPTZ, TIMESTAMPTZ, UUID, UUID) TO n8n_user;
         GRANT EXECUTE ON FUNCTION get_professional_services_list(UUID) TO n8n_user;
         GRANT EXECUTE ON FUNCTION get_services_catalog_for_prompt(UUID) TO n8n_user;
@@ -2228,8 +3907,14 @@ BEGIN
         GRANT EXECUTE ON FUNCTION update_conversation_state_data(UUID, VARCHAR, UUID, UUID, JSONB, JSONB) TO n8n_user;
         GRANT EXECUTE ON FUNCTION reset_conversation_state(UUID, VARCHAR) TO n8n_user;
         GRANT EXECUTE ON FUNCTION cleanup_expired_conversation_states() TO n8n_user;
+        GRANT EXECUTE ON FUNCTION get_state_options_text(VARCHAR) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION process_inbound_turn(UUID, VARCHAR, TEXT, VARCHAR, JSONB) TO n8n_user;
         GRANT EXECUTE ON FUNCTION get_calendar_for_professional(UUID, UUID) TO n8n_user;
         GRANT EXECUTE ON FUNCTION get_tenant_calendars(UUID) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION get_availability_context(UUID, UUID, TIMESTAMPTZ, TIMESTAMPTZ, UUID[]) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION get_calendar_access_token(UUID, UUID, INTEGER) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION store_calendar_access_token(UUID, UUID, TEXT, INTEGER, TEXT) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION claim_calendar_token_refreshes(INTEGER, INTEGER) TO n8n_user;
         GRANT EXECUTE ON FUNCTION register_professional_calendar(UUID, UUID, VARCHAR, VARCHAR, BOOLEAN) TO n8n_user;
         GRANT EXECUTE ON FUNCTION migrate_professional_calendars() TO n8n_user;
         GRANT EXECUTE ON FUNCTION create_appointment(UUID, UUID, UUID, TIMESTAMPTZ, VARCHAR, VARCHAR, VARCHAR) TO n8n_user;
@@ -2239,42 +3924,57 @@ BEGIN
         GRANT EXECUTE ON FUNCTION get_patient_appointments(UUID, VARCHAR, BOOLEAN) TO n8n_user;
         GRANT EXECUTE ON FUNCTION get_appointments_for_reminders(VARCHAR) TO n8n_user;
         GRANT EXECUTE ON FUNCTION mark_reminder_sent(UUID, VARCHAR) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION claim_due_reminders(INTEGER, INTEGER, TIME, TIME) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION mark_reminders_sent(UUID[], UUID) TO n8n_user;
         GRANT EXECUTE ON FUNCTION get_appointment_stats(UUID, DATE, DATE) TO n8n_user;
     END IF;
 END $$;
 
--- ============================================================================
--- APPLICATION ROLE (replaces PUBLIC grants)
--- ============================================================================
-
-DO $$ BEGIN
-  IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = 'n8n_app') THEN
-    CREATE ROLE n8n_app LOGIN PASSWORD '{{N8N_APP_PASSWORD}}';
-  END IF;
-END $$;
-
-GRANT USAGE ON SCHEMA public TO n8n_app;
-GRANT SELECT, INSERT, UPDATE, DELETE ON ALL TABLES IN SCHEMA public TO n8n_app;
-GRANT USAGE, SELECT ON ALL SEQUENCES IN SCHEMA public TO n8n_app;
-GRANT EXECUTE ON ALL FUNCTIONS IN SCHEMA public TO n8n_app;
-REVOKE CREATE ON SCHEMA public FROM n8n_app;
-
 -- ============================================================================
 -- MESSAGE QUEUE & DEDUPLICATION
 -- ============================================================================
+-- message_queue is range-partitioned by day on created_at and expired whole
+-- by maintain_partitions(). A unique constraint on a partitioned table must
+-- include created_at, so (tenant_id, message_id) is deduplicated by
+-- enqueue_message() under an advisory lock instead, across all partitions
+-- still retained.
+--
+-- consumer says who finishes a row: 'inline' rows are answered by the webhook
+-- execution that enqueued them (workflow 01), 'worker' rows by claim_messages()
+-- consumers such as scripts/ops/queue_worker.py. Neither takes the other's.
+
+DO $$ BEGIN PERFORM retire_unpartitioned_table('message_queue'); END $$;
 
 CREATE TABLE IF NOT EXISTS message_queue (
-  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  id UUID NOT NULL DEFAULT gen_random_uuid(),
   tenant_id UUID NOT NULL REFERENCES tenant_config(tenant_id),
   phone VARCHAR(20) NOT NULL,
   message_id VARCHAR(100) NOT NULL,
   payload JSONB NOT NULL,
   status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'processing', 'completed', 'failed', 'duplicate')),
   lock_key VARCHAR(100),
-  created_at TIMESTAMPTZ DEFAULT NOW(),
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  consumer VARCHAR(20) NOT NULL DEFAULT 'inline' CHECK (consumer IN ('inline', 'worker')),
+  claimed_by VARCHAR(100),
+  claimed_at TIMESTAMPTZ,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  retry_at TIMESTAMPTZ,
   processed_at TIMESTAMPTZ,
-  UNIQUE (tenant_id, message_id)
-);
+  PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE IF NOT EXISTS message_queue_default
+PARTITION OF message_queue DEFAULT;
+
+-- Databases created before queue claims
+ALTER TABLE message_queue ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(100);
+ALTER TABLE message_queue ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMPTZ;
+ALTER TABLE message_queue ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE message_queue ADD COLUMN IF NOT EXISTS consumer VARCHAR(20) NOT NULL DEFAULT 'inline'
+  CHECK (consumer IN ('inline', 'worker'));
+
+-- Databases created before worker retries
+ALTER TABLE message_queue ADD COLUMN IF NOT EXISTS retry_at TIMESTAMPTZ;
 
 CREATE TABLE IF NOT EXISTS conversation_locks (
   tenant_id UUID NOT NULL REFERENCES tenant_config(tenant_id),
@@ -2286,65 +3986,330 @@ CREATE TABLE IF NOT EXISTS conversation_locks (
 
 CREATE INDEX IF NOT EXISTS idx_message_queue_status ON message_queue(status, created_at);
 CREATE INDEX IF NOT EXISTS idx_message_queue_tenant ON message_queue(tenant_id, message_id);
+CREATE INDEX IF NOT EXISTS idx_message_queue_conversation ON message_queue(tenant_id, phone, created_at)
+  WHERE status IN ('pending', 'processing');
+-- Finished messages in completion order (metrics_exporter.py reads from a watermark)
+CREATE INDEX IF NOT EXISTS idx_message_queue_processed ON message_queue(processed_at)
+  WHERE processed_at IS NOT NULL;
 CREATE INDEX IF NOT EXISTS idx_conversation_locks_expires ON conversation_locks(expires_at);
 
 -- Function: Enqueue message with deduplication
+-- Concurrent deliveries of the same message serialize on an advisory lock
+-- held until commit, so the second one sees the first one's row.
+-- p_consumer 'worker' hands the message to claim_messages(); the webhook path
+-- keeps the default and answers the message itself.
+DROP FUNCTION IF EXISTS enqueue_message(UUID, VARCHAR, VARCHAR, JSONB);
+
 CREATE OR REPLACE FUNCTION enqueue_message(
   p_tenant_id UUID,
   p_phone VARCHAR,
   p_message_id VARCHAR,
-  p_payload JSONB
+  p_payload JSONB,
+  p_consumer VARCHAR DEFAULT 'inline'
 )
 RETURNS TABLE (queue_id UUID, status VARCHAR) AS $$
+DECLARE
+  v_id UUID;
 BEGIN
-  INSERT INTO message_queue (tenant_id, phone, message_id, payload, status)
-  VALUES (p_tenant_id, p_phone, p_message_id, p_payload, 'pending')
-  ON CONFLICT (tenant_id, message_id) DO NOTHING;
+  PERFORM pg_advisory_xact_lock(hashtextextended(p_tenant_id::text || ':msg:' || p_message_id, 0));
+
+  SELECT mq.id INTO v_id
+  FROM message_queue mq
+  WHERE mq.tenant_id = p_tenant_id AND mq.message_id = p_message_id
+  LIMIT 1;
 
-  IF NOT FOUND THEN
-    RETURN QUERY SELECT id, 'duplicate'::VARCHAR FROM message_queue
-      WHERE tenant_id = p_tenant_id AND message_id = p_message_id LIMIT 1;
-  ELSE
-    RETURN QUERY SELECT id, 'queued'::VARCHAR FROM message_queue
-      WHERE tenant_id = p_tenant_id AND message_id = p_message_id LIMIT 1;
+  IF v_id IS NOT NULL THEN
+    RETURN QUERY SELECT v_id, 'duplicate'::VARCHAR;
+    RETURN;
   END IF;
+
+  INSERT INTO message_queue (tenant_id, phone, message_id, payload, status, consumer)
+  VALUES (p_tenant_id, p_phone, p_message_id, p_payload, 'pending', p_consumer)
+  RETURNING id INTO v_id;
+
+  RETURN QUERY SELECT v_id, 'queued'::VARCHAR;
 END;
 $$ LANGUAGE plpgsql;
 
--- Function: Acquire conversation lock
-CREATE OR REPLACE FUNCTION acquire_conversation_lock(
+-- Function: Advisory lock key for a conversation (tenant + phone)
+CREATE OR REPLACE FUNCTION conversation_lock_key(
   p_tenant_id UUID,
   p_phone VARCHAR
 )
-RETURNS BOOLEAN AS $$
+RETURNS BIGINT AS $$
+  SELECT hashtextextended(p_tenant_id::text || ':' || p_phone, 0);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Function: Claim a batch of queued messages for one worker
+-- Only consumer = 'worker' rows are claimed. At most one message per
+-- conversation is in flight: only the oldest pending worker message of a
+-- conversation is eligible, and only while nothing else of that conversation
+-- (an inline turn included) is processing. Concurrent claimers serialize per
+-- conversation on a transaction-scoped advisory lock and skip (never wait on)
+-- conversations and rows another worker holds. Messages left in 'processing'
+-- longer than p_stale_after are treated as abandoned and claimed again.
+CREATE OR REPLACE FUNCTION claim_messages(
+  p_batch_size INTEGER DEFAULT 10,
+  p_worker_id VARCHAR DEFAULT NULL,
+  p_stale_after INTERVAL DEFAULT INTERVAL '5 minutes'
+)
+RETURNS TABLE (
+  queue_id UUID,
+  tenant_id UUID,
+  phone VARCHAR,
+  message_id VARCHAR,
+  payload JSONB,
+  attempts INTEGER,
+  created_at TIMESTAMPTZ
+) AS $$
+DECLARE
+  v_stale_before TIMESTAMPTZ := NOW() - p_stale_after;
+  v_candidate RECORD;
+  v_claimed INTEGER := 0;
 BEGIN
-  -- Clean expired locks first
-  DELETE FROM conversation_locks WHERE expires_at < NOW();
-
-  -- Try to acquire
-  INSERT INTO conversation_locks (tenant_id, phone)
-  VALUES (p_tenant_id, p_phone)
-  ON CONFLICT (tenant_id, phone) DO NOTHING;
+  FOR v_candidate IN
+    SELECT h.id, h.tenant_id, h.phone
+    FROM (
+      SELECT DISTINCT ON (mq.tenant_id, mq.phone) mq.id, mq.tenant_id, mq.phone, mq.status, mq.claimed_at,
+             mq.retry_at, mq.created_at
+      FROM message_queue mq
+      WHERE mq.status IN ('pending', 'processing')
+      AND mq.consumer = 'worker'
+      ORDER BY mq.tenant_id, mq.phone, mq.created_at, mq.id
+    ) h
+    WHERE (h.status = 'pending' AND (h.retry_at IS NULL OR h.retry_at <= NOW()))
+    OR (h.status = 'processing' AND h.claimed_at < v_stale_before)
+    ORDER BY h.created_at
+    LIMIT p_batch_size * 4
+  LOOP
+    EXIT WHEN v_claimed >= p_batch_size;
+    CONTINUE WHEN NOT pg_try_advisory_xact_lock(conversation_lock_key(v_candidate.tenant_id, v_candidate.phone));
+
+    -- Re-check with a fresh snapshot now that the conversation is ours
+    RETURN QUERY
+    UPDATE message_queue mq
+    SET status = 'processing',
+        claimed_by = p_worker_id,
+        claimed_at = NOW(),
+        attempts = mq.attempts + 1
+    WHERE mq.id = (
+      SELECT c.id FROM message_queue c
+      WHERE c.id = v_candidate.id
+      AND c.consumer = 'worker'
+      AND ((c.status = 'pending' AND (c.retry_at IS NULL OR c.retry_at <= NOW()))
+           OR (c.status = 'processing' AND c.claimed_at < v_stale_before))
+      AND NOT EXISTS (
+        SELECT 1 FROM message_queue o
+        WHERE o.tenant_id = c.tenant_id AND o.phone = c.phone AND o.id <> c.id
+        AND o.status IN ('pending', 'processing') AND o.consumer = 'worker'
+        AND (o.created_at, o.id) < (c.created_at, c.id)
+      )
+      AND NOT EXISTS (
+        SELECT 1 FROM message_queue o
+        WHERE o.tenant_id = c.tenant_id AND o.phone = c.phone AND o.id <> c.id
+        AND o.status = 'processing' AND o.claimed_at >= v_stale_before
+      )
+      FOR UPDATE SKIP LOCKED
+    )
+    RETURNING mq.id, mq.tenant_id, mq.phone, mq.message_id, mq.payload, mq.attempts, mq.created_at;
 
-  RETURN FOUND;
+    IF FOUND THEN
+      v_claimed := v_claimed + 1;
+    END IF;
+  END LOOP;
 END;
 $$ LANGUAGE plpgsql;
 
--- Function: Release conversation lock
-CREATE OR REPLACE FUNCTION release_conversation_lock(
-  p_tenant_id UUID,
-  p_phone VARCHAR
+-- Function: Retry failed worker messages with backoff
+-- Messages claimed fewer than p_max_attempts times go back to 'pending' and
+-- become claimable after p_backoff, doubled for every earlier attempt; the
+-- rest are marked 'failed'. A retried message stays the head of its
+-- conversation, so the patient's later messages wait behind it.
+CREATE OR REPLACE FUNCTION retry_messages(
+  p_queue_ids UUID[],
+  p_max_attempts INTEGER DEFAULT 5,
+  p_backoff INTERVAL DEFAULT INTERVAL '30 seconds'
 )
-RETURNS VOID AS $$
+RETURNS TABLE (retried INTEGER, failed INTEGER) AS $$
 BEGIN
-  DELETE FROM conversation_locks
-  WHERE tenant_id = p_tenant_id AND phone = p_phone;
+  UPDATE message_queue mq
+  SET status = 'pending',
+      claimed_by = NULL,
+      claimed_at = NULL,
+      retry_at = NOW() + p_backoff * power(2, GREATEST(LEAST(mq.attempts, 11) - 1, 0))
+  WHERE mq.id = ANY(p_queue_ids)
+  AND mq.status = 'processing'
+  AND mq.attempts < p_max_attempts;
+
+  GET DIAGNOSTICS retried = ROW_COUNT;
+  failed := complete_messages(p_queue_ids, 'failed');
+  RETURN NEXT;
 END;
 $$ LANGUAGE plpgsql;
 
--- Function: Cleanup expired locks (for scheduler)
-CREATE OR REPLACE FUNCTION cleanup_expired_locks()
-RETURNS INTEGER AS $$
+-- Function: Claim a coalesced conversation turn (webhook path)
+-- Every inbound text message is enqueued and its execution waits the tenant's
+-- message_coalesce_window_ms, then calls this. The execution of the newest
+-- pending message takes all pending text messages of the conversation as one
+-- turn; older executions get 'deferred' (a later message extends the window)
+-- or 'merged' (their message is already part of a turn). Once the oldest
+-- pending message is older than p_max_window_ms, whoever arrives first takes
+-- the turn, so a steady stream of messages cannot postpone the reply forever.
+-- 'busy' means a previous turn of the conversation is still being answered;
+-- the caller waits and retries, which keeps replies from interleaving. The
+-- caller bounds its retries: its last attempt passes a zero p_stale_after, so
+-- a turn that never finished cannot hold the conversation any longer.
+CREATE OR REPLACE FUNCTION claim_conversation_turn(
+  p_tenant_id UUID,
+  p_phone VARCHAR,
+  p_queue_id UUID,
+  p_max_window_ms INTEGER DEFAULT 8000,
+  p_stale_after INTERVAL DEFAULT INTERVAL '5 minutes'
+)
+RETURNS TABLE (
+  turn_status VARCHAR,
+  message_text TEXT,
+  message_count INTEGER,
+  queue_ids UUID[]
+) AS $$
+DECLARE
+  v_status VARCHAR;
+  v_oldest TIMESTAMPTZ;
+  v_newest UUID;
+BEGIN
+  PERFORM pg_advisory_xact_lock(conversation_lock_key(p_tenant_id, p_phone));
+
+  SELECT mq.status INTO v_status FROM message_queue mq WHERE mq.id = p_queue_id;
+  IF v_status IS DISTINCT FROM 'pending' THEN
+    RETURN QUERY SELECT 'merged'::VARCHAR, NULL::TEXT, 0, NULL::UUID[];
+    RETURN;
+  END IF;
+
+  IF EXISTS (
+    SELECT 1 FROM message_queue mq
+    WHERE mq.tenant_id = p_tenant_id AND mq.phone = p_phone
+    AND mq.status = 'processing' AND mq.claimed_at >= NOW() - p_stale_after
+  ) THEN
+    RETURN QUERY SELECT 'busy'::VARCHAR, NULL::TEXT, 0, NULL::UUID[];
+    RETURN;
+  END IF;
+
+  SELECT MIN(mq.created_at), (ARRAY_AGG(mq.id ORDER BY mq.created_at DESC, mq.id DESC))[1]
+  INTO v_oldest, v_newest
+  FROM message_queue mq
+  WHERE mq.tenant_id = p_tenant_id AND mq.phone = p_phone
+  AND mq.status = 'pending' AND mq.consumer = 'inline'
+  AND mq.payload ? 'message_text';
+
+  IF v_newest <> p_queue_id AND v_oldest > NOW() - make_interval(secs => p_max_window_ms / 1000.0) THEN
+    RETURN QUERY SELECT 'deferred'::VARCHAR, NULL::TEXT, 0, NULL::UUID[];
+    RETURN;
+  END IF;
+
+  RETURN QUERY
+  WITH claimed AS (
+    UPDATE message_queue mq
+    SET status = 'processing',
+        claimed_by = 'turn:' || p_queue_id,
+        claimed_at = NOW(),
+        attempts = mq.attempts + 1
+    WHERE mq.tenant_id = p_tenant_id AND mq.phone = p_phone
+    AND mq.status = 'pending' AND mq.consumer = 'inline'
+    AND mq.payload ? 'message_text'
+    RETURNING mq.id, mq.created_at, mq.payload
+  )
+  SELECT
+    'process'::VARCHAR,
+    STRING_AGG(NULLIF(c.payload->>'message_text', ''), E'\n' ORDER BY c.created_at),
+    COUNT(*)::INTEGER,
+    ARRAY_AGG(c.id ORDER BY c.created_at)
+  FROM claimed c;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Claim one inline message as its own turn (webhook path)
+-- Media messages and tenants with coalescing disabled skip
+-- claim_conversation_turn(); their execution takes its own row so that
+-- complete_messages() finishes it like any other turn and the conversation
+-- reads as busy meanwhile. Returns no ids if the row is no longer pending.
+CREATE OR REPLACE FUNCTION claim_inline_message(
+  p_tenant_id UUID,
+  p_queue_id UUID
+)
+RETURNS TABLE (queue_ids UUID[]) AS $$
+  WITH claimed AS (
+    UPDATE message_queue mq
+    SET status = 'processing',
+        claimed_by = 'turn:' || p_queue_id,
+        claimed_at = NOW(),
+        attempts = mq.attempts + 1
+    WHERE mq.tenant_id = p_tenant_id AND mq.id = p_queue_id
+    AND mq.status = 'pending' AND mq.consumer = 'inline'
+    RETURNING mq.id
+  )
+  SELECT COALESCE(ARRAY_AGG(c.id), '{}') FROM claimed c;
+$$ LANGUAGE sql;
+
+-- Function: Finish claimed messages ('completed' or 'failed')
+CREATE OR REPLACE FUNCTION complete_messages(
+  p_queue_ids UUID[],
+  p_status VARCHAR DEFAULT 'completed'
+)
+RETURNS INTEGER AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  IF p_status NOT IN ('completed', 'failed') THEN
+    RAISE EXCEPTION 'Invalid completion status: %', p_status;
+  END IF;
+
+  UPDATE message_queue mq
+  SET status = p_status,
+      processed_at = NOW()
+  WHERE mq.id = ANY(p_queue_ids)
+  AND mq.status = 'processing';
+
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Acquire conversation lock
+-- Only this conversation's row is touched: an expired lock is taken over in
+-- place, so there is no table-wide cleanup on the hot path
+-- (cleanup_expired_locks() does that from the scheduler).
+CREATE OR REPLACE FUNCTION acquire_conversation_lock(
+  p_tenant_id UUID,
+  p_phone VARCHAR
+)
+RETURNS BOOLEAN AS $$
+BEGIN
+  INSERT INTO conversation_locks (tenant_id, phone)
+  VALUES (p_tenant_id, p_phone)
+  ON CONFLICT (tenant_id, phone) DO UPDATE
+    SET locked_at = NOW(),
+        expires_at = NOW() + INTERVAL '5 minutes'
+    WHERE conversation_locks.expires_at < NOW();
+
+  RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Release conversation lock
+CREATE OR REPLACE FUNCTION release_conversation_lock(
+  p_tenant_id UUID,
+  p_phone VARCHAR
+)
+RETURNS VOID AS $$
+BEGIN
+  DELETE FROM conversation_locks
+  WHERE tenant_id = p_tenant_id AND phone = p_phone;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Cleanup expired locks (for scheduler)
+CREATE OR REPLACE FUNCTION cleanup_expired_locks()
+RETURNS INTEGER AS $$
 DECLARE
   v_count INTEGER;
 BEGIN
@@ -2354,6 +4319,1654 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- ============================================================================
+-- MEDIA RESULT CACHE
+-- ============================================================================
+-- Transcriptions (Audio Transcription Tool) and OCR results (Image OCR Tool)
+-- keyed by the SHA-256 of the media bytes, per tenant. Forwarded voice notes,
+-- retries and duplicate webhook deliveries carry the same media, so they are
+-- answered from here instead of downloading and sending it to Gemini again.
+-- The key is WhatsApp's fileSha256 when the webhook has it, otherwise the hash
+-- the tool computes after download. Entries expire after the tenant's
+-- media_cache_ttl_days; past media_cache_budget_bytes the least recently used
+-- are evicted on store.
+
+CREATE TABLE IF NOT EXISTS media_cache (
+    tenant_id UUID NOT NULL REFERENCES tenant_config(tenant_id) ON DELETE CASCADE,
+    media_kind VARCHAR(10) NOT NULL,
+    content_hash CHAR(64) NOT NULL,
+    result_text TEXT NOT NULL,
+    result_bytes INTEGER NOT NULL,
+    media_bytes BIGINT,
+    hit_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_hit_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (tenant_id, media_kind, content_hash),
+    CONSTRAINT valid_media_kind CHECK (media_kind IN ('audio', 'image')),
+    CONSTRAINT valid_content_hash CHECK (content_hash ~ '^[0-9a-f]{64}$')
+);
+
+COMMENT ON TABLE media_cache IS 'Audio transcriptions and image OCR results by tenant and SHA-256 of the media bytes';
+COMMENT ON COLUMN media_cache.result_bytes IS 'octet_length(result_text), counted against media_cache_budget_bytes';
+COMMENT ON COLUMN media_cache.hit_count IS 'Cache hits, counted at most once a minute per entry';
+
+CREATE INDEX IF NOT EXISTS idx_media_cache_expires ON media_cache(expires_at);
+CREATE INDEX IF NOT EXISTS idx_media_cache_lru ON media_cache(tenant_id, last_hit_at DESC);
+
+-- Function: Look up a cached media result and the tenant's media size limit
+-- Always returns one row. size_allowed is false when the declared size
+-- (WhatsApp fileLength) is over media_max_bytes, so the tool can refuse the
+-- media without downloading it.
+CREATE OR REPLACE FUNCTION lookup_media_result(
+    p_tenant_id UUID,
+    p_media_kind VARCHAR,
+    p_content_hash TEXT,
+    p_media_bytes BIGINT DEFAULT NULL
+)
+RETURNS TABLE (
+    cached BOOLEAN,
+    result_text TEXT,
+    media_max_bytes INTEGER,
+    size_allowed BOOLEAN
+) AS $$
+DECLARE
+    v_max INTEGER;
+    v_text TEXT;
+    v_last_hit TIMESTAMPTZ;
+BEGIN
+    SELECT tc.media_max_bytes INTO v_max
+    FROM tenant_config tc
+    WHERE tc.tenant_id = p_tenant_id;
+    v_max := COALESCE(v_max, 16777216);
+
+    IF p_content_hash IS NOT NULL AND p_content_hash <> '' THEN
+        SELECT mc.result_text, mc.last_hit_at INTO v_text, v_last_hit
+        FROM media_cache mc
+        WHERE mc.tenant_id = p_tenant_id
+        AND mc.media_kind = p_media_kind
+        AND mc.content_hash = LOWER(p_content_hash)
+        AND mc.expires_at > NOW();
+
+        -- Touch the entry for LRU at most once a minute: a burst of duplicate
+        -- deliveries stays read-only and counts as one hit
+        IF v_last_hit < NOW() - INTERVAL '1 minute' THEN
+            UPDATE media_cache mc
+            SET hit_count = mc.hit_count + 1,
+                last_hit_at = NOW()
+            WHERE mc.tenant_id = p_tenant_id
+            AND mc.media_kind = p_media_kind
+            AND mc.content_hash = LOWER(p_content_hash);
+        END IF;
+    END IF;
+
+    RETURN QUERY SELECT
+        v_text IS NOT NULL,
+        v_text,
+        v_max,
+        v_text IS NOT NULL OR p_media_bytes IS NULL OR p_media_bytes <= v_max;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Store a media result and evict past the tenant's budget
+-- Returns false when nothing was stored (no hash, empty result, unknown
+-- tenant, cache disabled or a single result larger than the budget).
+CREATE OR REPLACE FUNCTION store_media_result(
+    p_tenant_id UUID,
+    p_media_kind VARCHAR,
+    p_content_hash TEXT,
+    p_result_text TEXT,
+    p_media_bytes BIGINT DEFAULT NULL
+)
+RETURNS BOOLEAN AS $$
+DECLARE
+    v_ttl_days INTEGER;
+    v_budget BIGINT;
+    v_result_bytes INTEGER := octet_length(p_result_text);
+BEGIN
+    IF p_content_hash IS NULL OR p_content_hash = '' OR NULLIF(BTRIM(p_result_text), '') IS NULL THEN
+        RETURN false;
+    END IF;
+
+    SELECT tc.media_cache_ttl_days, tc.media_cache_budget_bytes
+    INTO v_ttl_days, v_budget
+    FROM tenant_config tc
+    WHERE tc.tenant_id = p_tenant_id;
+
+    IF v_ttl_days IS NULL OR v_result_bytes > v_budget THEN
+        RETURN false;
+    END IF;
+
+    INSERT INTO media_cache (
+        tenant_id, media_kind, content_hash, result_text, result_bytes, media_bytes, expires_at
+    ) VALUES (
+        p_tenant_id, p_media_kind, LOWER(p_content_hash), p_result_text, v_result_bytes, p_media_bytes,
+        NOW() + make_interval(days => v_ttl_days)
+    )
+    ON CONFLICT (tenant_id, media_kind, content_hash) DO UPDATE
+    SET result_text = EXCLUDED.result_text,
+        result_bytes = EXCLUDED.result_bytes,
+        media_bytes = COALESCE(EXCLUDED.media_bytes, media_cache.media_bytes),
+        last_hit_at = NOW(),
+        expires_at = EXCLUDED.expires_at;
+
+    -- Expired entries of this tenant, then least recently used past the budget
+    DELETE FROM media_cache mc
+    USING (
+        SELECT
+            m.media_kind,
+            m.content_hash,
+            m.expires_at,
+            SUM(m.result_bytes) OVER (ORDER BY m.last_hit_at DESC, m.created_at DESC, m.content_hash) AS kept_bytes
+        FROM media_cache m
+        WHERE m.tenant_id = p_tenant_id
+    ) lru
+    WHERE mc.tenant_id = p_tenant_id
+    AND mc.media_kind = lru.media_kind
+    AND mc.content_hash = lru.content_hash
+    AND (lru.kept_bytes > v_budget OR lru.expires_at <= NOW());
+
+    RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Cleanup expired media results (for scheduler)
+CREATE OR REPLACE FUNCTION cleanup_expired_media_cache()
+RETURNS INTEGER AS $$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    DELETE FROM media_cache WHERE expires_at <= NOW();
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================================
+-- PARTITION MAINTENANCE
+-- ============================================================================
+-- tenant_activity_log (monthly) and message_queue (daily) are range
+-- partitioned on created_at. maintain_partitions(), run daily from
+-- scripts/ops/partition_maintenance.py, creates partitions `premake` periods
+-- ahead and expires partitions whose whole range is older than `retention`:
+-- dropped, or detached and listed in partition_archive when the policy
+-- archives them (the ops script exports those to compressed files and then
+-- drops them). Either way old rows leave with a catalog operation, not DELETE.
+
+CREATE TABLE IF NOT EXISTS partition_policies (
+    parent_table VARCHAR(63) PRIMARY KEY,
+    partition_unit VARCHAR(10) NOT NULL,
+    premake INTEGER NOT NULL,
+    retention INTERVAL NOT NULL,
+    archive BOOLEAN NOT NULL DEFAULT false,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    CONSTRAINT valid_partition_unit CHECK (partition_unit IN ('day', 'week', 'month')),
+    CONSTRAINT valid_premake CHECK (premake >= 1),
+    CONSTRAINT valid_retention CHECK (retention > INTERVAL '0')
+);
+
+COMMENT ON TABLE partition_policies IS 'Partition size, lookahead and retention per partitioned table';
+COMMENT ON COLUMN partition_policies.archive IS 'Detach expired partitions for export (partition_archive) instead of dropping them';
+
+INSERT INTO partition_policies (parent_table, partition_unit, premake, retention, archive) VALUES
+    ('tenant_activity_log', 'month', 3, INTERVAL '12 months', true),
+    ('message_queue', 'day', 7, INTERVAL '14 days', false)
+ON CONFLICT (parent_table) DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS partition_archive (
+    partition_name VARCHAR(63) PRIMARY KEY,
+    parent_table VARCHAR(63) NOT NULL,
+    range_from TIMESTAMPTZ,
+    range_to TIMESTAMPTZ,
+    detached_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    archived_at TIMESTAMPTZ,
+    archive_path TEXT,
+    row_count BIGINT
+);
+
+COMMENT ON TABLE partition_archive IS 'Detached partitions awaiting (or done with) export to a compressed file';
+
+CREATE INDEX IF NOT EXISTS idx_partition_archive_pending
+ON partition_archive(detached_at)
+WHERE archived_at IS NULL;
+
+-- Function: Create missing partitions up to `premake` periods ahead
+-- p_from also covers older periods (clamped to the retention window), e.g.
+-- before copying existing rows in. Rows sitting in the default partition for
+-- a new range are moved into it.
+CREATE OR REPLACE FUNCTION create_partitions(
+    p_parent_table VARCHAR DEFAULT NULL,
+    p_from TIMESTAMPTZ DEFAULT NULL
+)
+RETURNS TABLE (parent_table VARCHAR, partition_name VARCHAR, action VARCHAR) AS $$
+DECLARE
+    v_policy partition_policies;
+    v_step INTERVAL;
+    v_start TIMESTAMPTZ;
+    v_end TIMESTAMPTZ;
+    v_name VARCHAR;
+    v_default TEXT;
+    v_moved BIGINT;
+BEGIN
+    FOR v_policy IN
+        SELECT * FROM partition_policies pp
+        WHERE p_parent_table IS NULL OR pp.parent_table = p_parent_table
+        ORDER BY pp.parent_table
+    LOOP
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_class c
+            WHERE c.oid = to_regclass(v_policy.parent_table) AND c.relkind = 'p'
+        ) THEN
+            RAISE NOTICE '% is not partitioned, skipped', v_policy.parent_table;
+            CONTINUE;
+        END IF;
+
+        v_default := v_policy.parent_table || '_default';
+        v_step := ('1 ' || v_policy.partition_unit)::INTERVAL;
+        v_start := date_trunc(v_policy.partition_unit,
+                              GREATEST(LEAST(COALESCE(p_from, NOW()), NOW()), NOW() - v_policy.retention),
+                              'UTC');
+        v_end := date_trunc(v_policy.partition_unit, NOW(), 'UTC') + v_step * (v_policy.premake + 1);
+
+        WHILE v_start < v_end LOOP
+            v_name := v_policy.parent_table || '_p' || to_char(
+                v_start AT TIME ZONE 'UTC',
+                CASE v_policy.partition_unit WHEN 'month' THEN 'YYYYMM' ELSE 'YYYYMMDD' END);
+
+            IF to_regclass(v_name) IS NULL THEN
+                EXECUTE format(
+                    'SELECT COUNT(*) FROM %I WHERE created_at >= $1 AND created_at < $2',
+                    v_default)
+                INTO v_moved USING v_start, v_start + v_step;
+
+                IF v_moved = 0 THEN
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                        v_name, v_policy.parent_table, v_start, v_start + v_step);
+                    action := 'created';
+                ELSE
+                    -- Attaching over rows in the default partition fails, so
+                    -- move them into the new table first
+                    EXECUTE format(
+                        'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                        v_name, v_policy.parent_table);
+                    EXECUTE format(
+                        'WITH moved AS (DELETE FROM %I WHERE created_at >= $1 AND created_at < $2 RETURNING *) '
+                        'INSERT INTO %I SELECT * FROM moved',
+                        v_default, v_name)
+                    USING v_start, v_start + v_step;
+                    EXECUTE format(
+                        'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                        v_policy.parent_table, v_name, v_start, v_start + v_step);
+                    action := 'created, moved ' || v_moved || ' rows';
+                END IF;
+
+                parent_table := v_policy.parent_table;
+                partition_name := v_name;
+                RETURN NEXT;
+            END IF;
+
+            v_start := v_start + v_step;
+        END LOOP;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Drop or detach partitions entirely past their retention
+CREATE OR REPLACE FUNCTION expire_partitions(p_parent_table VARCHAR DEFAULT NULL)
+RETURNS TABLE (parent_table VARCHAR, partition_name VARCHAR, action VARCHAR) AS $$
+DECLARE
+    v_policy partition_policies;
+    v_part RECORD;
+    v_from TIMESTAMPTZ;
+    v_to TIMESTAMPTZ;
+    v_purged BIGINT;
+    v_default TEXT;
+    v_name VARCHAR;
+    v_expired BOOLEAN;
+    v_unfinished TEXT;
+BEGIN
+    FOR v_policy IN
+        SELECT * FROM partition_policies pp
+        WHERE p_parent_table IS NULL OR pp.parent_table = p_parent_table
+        ORDER BY pp.parent_table
+    LOOP
+        FOR v_part IN
+            SELECT c.relname::VARCHAR AS relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(v_policy.parent_table)
+            ORDER BY c.relname
+        LOOP
+            CONTINUE WHEN v_part.bound = 'DEFAULT';
+            v_from := substring(v_part.bound FROM 'FROM \(''([^'']+)''\)')::TIMESTAMPTZ;
+            v_to := substring(v_part.bound FROM 'TO \(''([^'']+)''\)')::TIMESTAMPTZ;
+            CONTINUE WHEN v_to IS NULL OR v_to > NOW() - v_policy.retention;
+
+            IF v_policy.archive THEN
+                EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', v_policy.parent_table, v_part.relname);
+                INSERT INTO partition_archive (partition_name, parent_table, range_from, range_to)
+                VALUES (v_part.relname, v_policy.parent_table, v_from, v_to)
+                ON CONFLICT ON CONSTRAINT partition_archive_pkey DO NOTHING;
+                action := 'detached';
+            ELSE
+                EXECUTE format('DROP TABLE %I', v_part.relname);
+                action := 'dropped';
+            END IF;
+
+            parent_table := v_policy.parent_table;
+            partition_name := v_part.relname;
+            RETURN NEXT;
+        END LOOP;
+
+        -- Expired rows that landed in the default partition (no partition
+        -- existed for them) are purged, or moved to a table of their own and
+        -- listed in partition_archive when the policy archives. Unfinished
+        -- queue rows are kept: adopt_unpartitioned_rows() copies them at any
+        -- age, and those older than the retention land here.
+        v_default := v_policy.parent_table || '_default';
+        v_unfinished := CASE WHEN v_policy.parent_table = 'message_queue'
+                             THEN ' AND status NOT IN (''pending'', ''processing'')' ELSE '' END;
+        IF to_regclass(v_default) IS NOT NULL THEN
+            IF v_policy.archive THEN
+                EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE created_at < $1%s)', v_default, v_unfinished)
+                INTO v_expired USING NOW() - v_policy.retention;
+                IF v_expired THEN
+                    v_name := v_default || '_' || to_char(NOW() AT TIME ZONE 'UTC', 'YYYYMMDDHH24MISS');
+                    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                                   v_name, v_policy.parent_table);
+                    EXECUTE format(
+                        'WITH moved AS (DELETE FROM %I WHERE created_at < $1%s RETURNING *) '
+                        'INSERT INTO %I SELECT * FROM moved',
+                        v_default, v_unfinished, v_name)
+                    USING NOW() - v_policy.retention;
+                    GET DIAGNOSTICS v_purged = ROW_COUNT;
+                    INSERT INTO partition_archive (partition_name, parent_table, range_to)
+                    VALUES (v_name, v_policy.parent_table, NOW() - v_policy.retention)
+                    ON CONFLICT ON CONSTRAINT partition_archive_pkey DO NOTHING;
+                    action := 'moved ' || v_purged || ' rows to ' || v_name;
+                END IF;
+            ELSE
+                EXECUTE format('DELETE FROM %I WHERE created_at < $1%s', v_default, v_unfinished)
+                USING NOW() - v_policy.retention;
+                GET DIAGNOSTICS v_purged = ROW_COUNT;
+                v_expired := v_purged > 0;
+                action := 'purged ' || v_purged || ' rows';
+            END IF;
+
+            IF v_expired THEN
+                parent_table := v_policy.parent_table;
+                partition_name := v_default;
+                RETURN NEXT;
+            END IF;
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Daily partition maintenance (create ahead, then expire)
+CREATE OR REPLACE FUNCTION maintain_partitions()
+RETURNS TABLE (parent_table VARCHAR, partition_name VARCHAR, action VARCHAR) AS $$
+BEGIN
+    RETURN QUERY SELECT * FROM create_partitions();
+    RETURN QUERY SELECT * FROM expire_partitions();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Copy rows of a table retired by retire_unpartitioned_table()
+-- Rows within the retention window (and, for the queue, anything not yet
+-- finished, kept in the default partition until done) go into the
+-- partitioned table; the old table is then renamed to
+-- <table>_legacy and listed in partition_archive for export.
+CREATE OR REPLACE FUNCTION adopt_unpartitioned_rows(p_parent_table VARCHAR)
+RETURNS BIGINT AS $$
+DECLARE
+    v_old TEXT := p_parent_table || '_unpartitioned';
+    v_retention INTERVAL;
+    v_from TIMESTAMPTZ;
+    v_filter TEXT;
+    v_columns TEXT;
+    v_values TEXT;
+    v_count BIGINT;
+BEGIN
+    IF to_regclass(v_old) IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    SELECT pp.retention INTO v_retention
+    FROM partition_policies pp
+    WHERE pp.parent_table = p_parent_table;
+
+    -- Legacy rows without created_at count as new (it is the partition key)
+    v_filter := format('COALESCE(created_at, %L) >= %L', NOW(), NOW() - v_retention);
+    IF p_parent_table = 'message_queue' THEN
+        v_filter := v_filter || ' OR status IN (''pending'', ''processing'')';
+    END IF;
+
+    EXECUTE format('SELECT MIN(COALESCE(created_at, %L)) FROM %I WHERE %s', NOW(), v_old, v_filter)
+    INTO v_from;
+    PERFORM create_partitions(p_parent_table, v_from);
+
+    -- Only columns both tables have: older installs lack columns added since
+    -- (they take their defaults)
+    SELECT string_agg(quote_ident(a.attname), ', ' ORDER BY a.attnum),
+           string_agg(CASE WHEN a.attname = 'created_at'
+                           THEN format('COALESCE(created_at, %L)', NOW())
+                           ELSE quote_ident(a.attname) END, ', ' ORDER BY a.attnum)
+    INTO v_columns, v_values
+    FROM pg_attribute a
+    JOIN pg_attribute o
+      ON o.attrelid = to_regclass(v_old) AND o.attname = a.attname
+     AND o.attnum > 0 AND NOT o.attisdropped
+    WHERE a.attrelid = to_regclass(p_parent_table) AND a.attnum > 0 AND NOT a.attisdropped;
+
+    EXECUTE format('INSERT INTO %I (%s) SELECT %s FROM %I WHERE %s',
+                   p_parent_table, v_columns, v_values, v_old, v_filter);
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+
+    IF p_parent_table = 'tenant_activity_log' THEN
+        PERFORM setval(pg_get_serial_sequence('tenant_activity_log', 'log_id'),
+                       GREATEST((SELECT MAX(log_id) FROM tenant_activity_log), 1));
+    END IF;
+
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', v_old, p_parent_table || '_legacy');
+    INSERT INTO partition_archive (partition_name, parent_table)
+    VALUES (p_parent_table || '_legacy', p_parent_table)
+    ON CONFLICT ON CONSTRAINT partition_archive_pkey DO NOTHING;
+
+    RAISE NOTICE '% rows copied into %; % listed for archiving', v_count, p_parent_table, p_parent_table || '_legacy';
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    PERFORM adopt_unpartitioned_rows('tenant_activity_log');
+    PERFORM adopt_unpartitioned_rows('message_queue');
+    PERFORM create_partitions();
+END $$;
+
+-- ============================================================================
+-- CHAT MEMORY COMPACTION
+-- ============================================================================
+-- The agents' Postgres Chat Memory nodes append every message to
+-- n8n_chat_histories and read a session back whole (WHERE session_id = $1
+-- ORDER BY id) before cutting it to their window, so reads grow with the
+-- patient's history. compact_chat_memory(), run from
+-- scripts/ops/chat_memory_compaction.py, keeps the newest
+-- chat_memory_keep_messages rows of every session and folds older ones into
+-- the session's chat_memory_summaries row: a rolling digest of the folded
+-- turns, capped at chat_memory_summary_chars, that the prompts read back
+-- instead. Folded rows are deleted, or moved to chat_memory_archive (monthly
+-- partitions, exported by partition maintenance) when the tenant archives.
+-- Sessions idle past chat_memory_retention_days are removed entirely.
+-- Session keys start with the tenant id: <tenant_id>_<remote_jid> (WhatsApp)
+-- and <tenant_id>_telegram_<chat_id> (internal assistant).
+
+-- Same shape n8n creates on first use, plus created_at for retention
+CREATE TABLE IF NOT EXISTS n8n_chat_histories (
+    id SERIAL PRIMARY KEY,
+    session_id VARCHAR(255) NOT NULL,
+    message JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Tables n8n created (no created_at): stamping every row with the upgrade time
+-- would restart each session's retention clock. Ids only grow, so a message is
+-- no newer than the earliest conversation_state.last_interaction known for a
+-- session whose last message has an equal or higher id; rows past the newest
+-- known activity are recent and get the upgrade time.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_attribute
+        WHERE attrelid = 'n8n_chat_histories'::regclass AND attname = 'created_at' AND NOT attisdropped
+    ) THEN
+        ALTER TABLE n8n_chat_histories ADD COLUMN created_at TIMESTAMPTZ;
+
+        WITH anchors AS (
+            SELECT MAX(h.id) AS id, MAX(cs.last_interaction) AS at
+            FROM n8n_chat_histories h
+            JOIN conversation_state cs ON h.session_id = cs.tenant_id::TEXT || '_' || cs.remote_jid
+            WHERE cs.last_interaction IS NOT NULL
+            GROUP BY h.session_id
+        ),
+        bounds AS (
+            SELECT COALESCE(LAG(a.id) OVER (ORDER BY a.id), 0) AS lo, a.id AS hi,
+                   MIN(a.at) OVER (ORDER BY a.id DESC) AS at
+            FROM anchors a
+        )
+        UPDATE n8n_chat_histories h
+        SET created_at = b.at
+        FROM bounds b
+        WHERE h.id > b.lo AND h.id <= b.hi;
+
+        UPDATE n8n_chat_histories SET created_at = NOW() WHERE created_at IS NULL;
+
+        ALTER TABLE n8n_chat_histories ALTER COLUMN created_at SET DEFAULT NOW();
+        ALTER TABLE n8n_chat_histories ALTER COLUMN created_at SET NOT NULL;
+    END IF;
+END $$;
+
+-- Session reads and the per-session window (newest ids) are index scans
+CREATE INDEX IF NOT EXISTS idx_chat_histories_session
+ON n8n_chat_histories(session_id, id);
+
+CREATE TABLE IF NOT EXISTS chat_memory_summaries (
+    session_id VARCHAR(255) PRIMARY KEY,
+    tenant_id UUID REFERENCES tenant_config(tenant_id) ON DELETE CASCADE,
+    summary TEXT NOT NULL DEFAULT '',
+    folded_messages INTEGER NOT NULL DEFAULT 0,
+    folded_through_id INTEGER NOT NULL DEFAULT 0,
+    first_message_at TIMESTAMPTZ,
+    last_folded_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE chat_memory_summaries IS 'Digest of the chat memory messages folded out of each session''s window';
+COMMENT ON COLUMN chat_memory_summaries.folded_through_id IS 'Highest n8n_chat_histories.id folded into the summary';
+COMMENT ON COLUMN chat_memory_summaries.last_folded_at IS 'created_at of the newest folded message';
+
+CREATE INDEX IF NOT EXISTS idx_chat_memory_summaries_tenant
+ON chat_memory_summaries(tenant_id, last_folded_at);
+
+CREATE TABLE IF NOT EXISTS chat_memory_archive (
+    id INTEGER NOT NULL,
+    session_id VARCHAR(255) NOT NULL,
+    tenant_id UUID REFERENCES tenant_config(tenant_id) ON DELETE CASCADE,
+    message JSONB NOT NULL,
+    message_created_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+) PARTITION BY RANGE (created_at);
+
+COMMENT ON TABLE chat_memory_archive IS 'Folded chat memory messages of tenants with chat_memory_archive (partitioned by archive time)';
+
+CREATE TABLE IF NOT EXISTS chat_memory_archive_default
+PARTITION OF chat_memory_archive DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_chat_memory_archive_session
+ON chat_memory_archive(session_id, id);
+
+INSERT INTO partition_policies (parent_table, partition_unit, premake, retention, archive) VALUES
+    ('chat_memory_archive', 'month', 2, INTERVAL '12 months', true)
+ON CONFLICT (parent_table) DO NOTHING;
+
+DO $$ BEGIN PERFORM create_partitions('chat_memory_archive'); END $$;
+
+-- Where compact_chat_memory() resumes: one row per tenant filter ('*' for all)
+CREATE TABLE IF NOT EXISTS chat_memory_compaction_cursors (
+    scope VARCHAR(36) NOT NULL,
+    after_session VARCHAR(255),
+    pass_started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    CONSTRAINT chat_memory_compaction_cursors_pkey PRIMARY KEY (scope)
+);
+
+COMMENT ON TABLE chat_memory_compaction_cursors IS 'Checkpoint of compact_chat_memory(): last session finished in the current pass';
+COMMENT ON COLUMN chat_memory_compaction_cursors.after_session IS 'Sessions up to this session_id are done; NULL starts a new pass';
+
+-- Function: One summary line for a stored chat message
+-- n8n stores LangChain messages as {"type": "human" | "ai" | ..., "content": ...};
+-- tool calls and empty turns yield NULL and are left out of the summary.
+CREATE OR REPLACE FUNCTION chat_memory_line(p_message JSONB)
+RETURNS TEXT AS $$
+    SELECT CASE p_message->>'type'
+               WHEN 'human' THEN 'Usuário: '
+               WHEN 'ai' THEN 'Assistente: '
+           END
+           || CASE WHEN length(m.content) > 300 THEN left(m.content, 299) || '…' ELSE m.content END
+    FROM (
+        SELECT NULLIF(regexp_replace(btrim(COALESCE(p_message->>'content', p_message#>>'{data,content}', '')),
+                                     '\s+', ' ', 'g'), '') AS content
+    ) m;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Function: Tenant of a chat memory session key (NULL when it has none)
+CREATE OR REPLACE FUNCTION chat_memory_tenant(p_session_id VARCHAR)
+RETURNS UUID AS $$
+    SELECT substring(p_session_id FROM '^([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})_')::UUID;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Function: Fold chat memory past each session's window, purge idle sessions
+-- Walks sessions in session_id order from the checkpoint in
+-- chat_memory_compaction_cursors (one per tenant filter): each call takes the
+-- next p_batch_size sessions with a skip scan of idx_chat_histories_session,
+-- counts only their messages, purges the idle ones and folds at most
+-- p_batch_size messages, oldest session first. The checkpoint moves past the
+-- sessions the call finished; `more` is true until a pass reaches the last
+-- session, so callers repeat until it is false and the next pass starts over.
+-- Each call is one short transaction. Only one compaction runs at a time: a
+-- concurrent call returns zeros at once. Sessions without a tenant prefix use
+-- the column defaults (20 messages, 2000 chars, 365 days, no archive).
+CREATE OR REPLACE FUNCTION compact_chat_memory(
+    p_batch_size INTEGER DEFAULT 1000,
+    p_tenant_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    sessions INTEGER,
+    folded_messages INTEGER,
+    archived_messages INTEGER,
+    purged_sessions INTEGER,
+    more BOOLEAN
+) AS $$
+DECLARE
+    v_scope VARCHAR(36) := COALESCE(p_tenant_id::TEXT, '*');
+    v_limit INTEGER := GREATEST(p_batch_size, 1);
+    v_after VARCHAR(255);
+    v_sessions VARCHAR(255)[];
+    v_last_folded VARCHAR(255);
+    v_expired INTEGER := 0;
+BEGIN
+    sessions := 0;
+    folded_messages := 0;
+    archived_messages := 0;
+    purged_sessions := 0;
+    more := false;
+
+    IF NOT pg_try_advisory_xact_lock(hashtextextended('chat_memory_compaction', 0)) THEN
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    SELECT cc.after_session INTO v_after
+    FROM chat_memory_compaction_cursors cc
+    WHERE cc.scope = v_scope;
+
+    -- Next sessions after the checkpoint, one index probe each
+    WITH RECURSIVE walk AS (
+        (SELECT h.session_id, 1 AS n
+         FROM n8n_chat_histories h
+         WHERE h.session_id > COALESCE(v_after, p_tenant_id::TEXT, '')
+         ORDER BY h.session_id
+         LIMIT 1)
+        UNION ALL
+        SELECT nx.session_id, w.n + 1
+        FROM walk w
+        CROSS JOIN LATERAL (
+            SELECT h.session_id
+            FROM n8n_chat_histories h
+            WHERE h.session_id > w.session_id
+            ORDER BY h.session_id
+            LIMIT 1
+        ) nx
+        WHERE w.n < v_limit
+        AND (p_tenant_id IS NULL OR chat_memory_tenant(w.session_id) = p_tenant_id)
+    )
+    SELECT ARRAY_AGG(w.session_id ORDER BY w.session_id) INTO v_sessions
+    FROM walk w
+    WHERE p_tenant_id IS NULL OR chat_memory_tenant(w.session_id) = p_tenant_id;
+
+    v_sessions := COALESCE(v_sessions, '{}');
+
+    -- 1. Idle sessions: raw messages (archived when the tenant archives) and summary
+    WITH stats AS (
+        SELECT s.session_id, h.created_at AS last_at, chat_memory_tenant(s.session_id) AS tenant_id
+        FROM unnest(v_sessions) AS s(session_id)
+        CROSS JOIN LATERAL (
+            SELECT MAX(hh.id) AS last_id
+            FROM n8n_chat_histories hh
+            WHERE hh.session_id = s.session_id
+        ) l
+        JOIN n8n_chat_histories h ON h.id = l.last_id
+    ),
+    idle AS (
+        SELECT st.session_id, tc.tenant_id, COALESCE(tc.chat_memory_archive, false) AS archive
+        FROM stats st
+        LEFT JOIN tenant_config tc ON tc.tenant_id = st.tenant_id
+        WHERE st.last_at < NOW() - make_interval(days => COALESCE(tc.chat_memory_retention_days, 365))
+    ),
+    removed AS (
+        DELETE FROM n8n_chat_histories h
+        USING idle i
+        WHERE h.session_id = i.session_id
+        RETURNING h.id, h.session_id, h.message, h.created_at, i.tenant_id, i.archive
+    ),
+    archived AS (
+        INSERT INTO chat_memory_archive (id, session_id, tenant_id, message, message_created_at)
+        SELECT r.id, r.session_id, r.tenant_id, r.message, r.created_at
+        FROM removed r
+        WHERE r.archive
+        RETURNING 1
+    ),
+    dropped AS (
+        DELETE FROM chat_memory_summaries cs
+        USING idle i
+        WHERE cs.session_id = i.session_id
+    )
+    SELECT (SELECT COUNT(*) FROM idle), (SELECT COUNT(*) FROM archived)
+    INTO purged_sessions, archived_messages;
+
+    -- 2. Messages past the window, oldest session first, folded into the summary
+    WITH counts AS (
+        SELECT s.session_id, c.n
+        FROM unnest(v_sessions) AS s(session_id)
+        CROSS JOIN LATERAL (
+            SELECT COUNT(*) AS n
+            FROM n8n_chat_histories hh
+            WHERE hh.session_id = s.session_id
+        ) c
+    ),
+    candidates AS (
+        SELECT c.session_id, tc.tenant_id,
+               COALESCE(tc.chat_memory_keep_messages, 20) AS keep,
+               COALESCE(tc.chat_memory_summary_chars, 2000) AS cap,
+               COALESCE(tc.chat_memory_archive, false) AS archive
+        FROM counts c
+        LEFT JOIN tenant_config tc ON tc.tenant_id = chat_memory_tenant(c.session_id)
+        WHERE c.n > COALESCE(tc.chat_memory_keep_messages, 20)
+    ),
+    picked AS (
+        SELECT r.id
+        FROM (
+            SELECT h.id, h.session_id, c.keep,
+                   ROW_NUMBER() OVER (PARTITION BY h.session_id ORDER BY h.id DESC) AS rn
+            FROM n8n_chat_histories h
+            JOIN candidates c ON c.session_id = h.session_id
+        ) r
+        WHERE r.rn > r.keep
+        ORDER BY r.session_id, r.id
+        LIMIT v_limit
+    ),
+    folded AS (
+        DELETE FROM n8n_chat_histories h
+        USING picked p
+        WHERE h.id = p.id
+        RETURNING h.id, h.session_id, h.message, h.created_at
+    ),
+    archived AS (
+        INSERT INTO chat_memory_archive (id, session_id, tenant_id, message, message_created_at)
+        SELECT f.id, f.session_id, c.tenant_id, f.message, f.created_at
+        FROM folded f
+        JOIN candidates c ON c.session_id = f.session_id
+        WHERE c.archive
+        RETURNING 1
+    ),
+    digest AS (
+        SELECT f.session_id, c.tenant_id, c.cap,
+               COUNT(*) AS n,
+               MAX(f.id) AS through_id,
+               MIN(f.created_at) AS first_at,
+               MAX(f.created_at) AS last_at,
+               string_agg(chat_memory_line(f.message), E'\n' ORDER BY f.id) AS lines
+        FROM folded f
+        JOIN candidates c ON c.session_id = f.session_id
+        GROUP BY f.session_id, c.tenant_id, c.cap
+    ),
+    upserted AS (
+        INSERT INTO chat_memory_summaries AS cs (
+            session_id, tenant_id, summary, folded_messages, folded_through_id,
+            first_message_at, last_folded_at
+        )
+        SELECT d.session_id, d.tenant_id,
+               -- Newest lines within the cap; a line cut at the front is dropped whole
+               CASE WHEN length(t.text) <= d.cap THEN t.text
+                    WHEN substr(t.text, length(t.text) - d.cap, 1) = E'\n' THEN right(t.text, d.cap)
+                    ELSE regexp_replace(right(t.text, d.cap), '^[^\n]*(\n|$)', '')
+               END,
+               d.n, d.through_id, d.first_at, d.last_at
+        FROM digest d
+        LEFT JOIN chat_memory_summaries old ON old.session_id = d.session_id
+        CROSS JOIN LATERAL (
+            SELECT concat_ws(E'\n', NULLIF(old.summary, ''), d.lines) AS text
+        ) t
+        ON CONFLICT (session_id) DO UPDATE
+        SET summary = EXCLUDED.summary,
+            folded_messages = cs.folded_messages + EXCLUDED.folded_messages,
+            folded_through_id = GREATEST(cs.folded_through_id, EXCLUDED.folded_through_id),
+            first_message_at = LEAST(cs.first_message_at, EXCLUDED.first_message_at),
+            last_folded_at = GREATEST(cs.last_folded_at, EXCLUDED.last_folded_at),
+            updated_at = NOW()
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM upserted), (SELECT COUNT(*) FROM folded),
+           archived_messages + (SELECT COUNT(*) FROM archived),
+           (SELECT MAX(f.session_id) FROM folded f)
+    INTO sessions, folded_messages, archived_messages, v_last_folded;
+
+    IF folded_messages >= v_limit THEN
+        -- The last folded session may have more past its window: resume at it
+        SELECT COALESCE(MAX(s.session_id), v_after) INTO v_after
+        FROM unnest(v_sessions) AS s(session_id)
+        WHERE s.session_id < v_last_folded;
+        more := true;
+    ELSIF cardinality(v_sessions) >= v_limit THEN
+        v_after := v_sessions[cardinality(v_sessions)];
+        more := true;
+    ELSE
+        v_after := NULL;
+
+        -- End of the pass: summaries whose raw messages are all gone and that went idle too
+        DELETE FROM chat_memory_summaries cs
+        USING tenant_config tc
+        WHERE tc.tenant_id = cs.tenant_id
+        AND (p_tenant_id IS NULL OR cs.tenant_id = p_tenant_id)
+        AND cs.last_folded_at < NOW() - make_interval(days => tc.chat_memory_retention_days)
+        AND NOT EXISTS (SELECT 1 FROM n8n_chat_histories h WHERE h.session_id = cs.session_id);
+        GET DIAGNOSTICS v_expired = ROW_COUNT;
+        purged_sessions := purged_sessions + v_expired;
+    END IF;
+
+    INSERT INTO chat_memory_compaction_cursors AS cc (scope, after_session)
+    VALUES (v_scope, v_after)
+    ON CONFLICT ON CONSTRAINT chat_memory_compaction_cursors_pkey DO UPDATE
+    SET after_session = EXCLUDED.after_session,
+        pass_started_at = CASE WHEN cc.after_session IS NULL THEN NOW() ELSE cc.pass_started_at END,
+        updated_at = NOW();
+
+    RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION compact_chat_memory IS 'Fold chat memory past the per-tenant window into chat_memory_summaries and purge idle sessions, p_batch_size at a time';
+
+-- Function: Folded-history summary of a chat memory session (NULL if none)
+CREATE OR REPLACE FUNCTION get_chat_memory_summary(p_session_id VARCHAR)
+RETURNS TEXT AS $$
+    SELECT NULLIF(cs.summary, '')
+    FROM chat_memory_summaries cs
+    WHERE cs.session_id = p_session_id;
+$$ LANGUAGE sql STABLE;
+
+-- ============================================================================
+-- PIPELINE METRICS
+-- ============================================================================
+-- Per-minute event counters for what the tables do not record by themselves:
+-- which route answered each inbound turn (with the database time it took)
+-- and reminder sends. scripts/ops/metrics_exporter.py reads them, together
+-- with message_queue timestamps, from a watermark. Partitioned by day on the
+-- minute bucket and expired by maintain_partitions(). Like
+-- tenant_message_usage, each minute is split over counter_shards() rows
+-- picked by backend pid, so concurrent turns of one tenant do not queue
+-- on the same row; readers sum the shards.
+
+CREATE TABLE IF NOT EXISTS pipeline_counters (
+    created_at TIMESTAMPTZ NOT NULL,
+    tenant_id UUID NOT NULL REFERENCES tenant_config(tenant_id) ON DELETE CASCADE,
+    metric VARCHAR(40) NOT NULL,
+    shard SMALLINT NOT NULL DEFAULT 0,
+    events BIGINT NOT NULL DEFAULT 0,
+    total_ms DOUBLE PRECISION NOT NULL DEFAULT 0,
+    CONSTRAINT pipeline_counters_pkey PRIMARY KEY (created_at, tenant_id, metric, shard)
+) PARTITION BY RANGE (created_at);
+
+-- Databases created before sharded counters
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_attribute
+        WHERE attrelid = 'pipeline_counters'::regclass AND attname = 'shard' AND NOT attisdropped
+    ) THEN
+        ALTER TABLE pipeline_counters ADD COLUMN shard SMALLINT NOT NULL DEFAULT 0;
+        ALTER TABLE pipeline_counters DROP CONSTRAINT pipeline_counters_pkey;
+        ALTER TABLE pipeline_counters ADD CONSTRAINT pipeline_counters_pkey
+            PRIMARY KEY (created_at, tenant_id, metric, shard);
+    END IF;
+END $$;
+
+COMMENT ON TABLE pipeline_counters IS 'Per-tenant, per-minute event counts (turn routes, reminder sends) for the metrics exporter';
+COMMENT ON COLUMN pipeline_counters.created_at IS 'Start of the minute the events belong to';
+COMMENT ON COLUMN pipeline_counters.metric IS 'turn:<route> (template, service_selection, faq, ai) or reminder:<24h|1h>';
+COMMENT ON COLUMN pipeline_counters.total_ms IS 'Database time of the counted events (turns only)';
+COMMENT ON COLUMN pipeline_counters.shard IS 'Backend pid modulo counter_shards(); sum over shards for the minute''s count';
+
+CREATE TABLE IF NOT EXISTS pipeline_counters_default
+PARTITION OF pipeline_counters DEFAULT;
+
+INSERT INTO partition_policies (parent_table, partition_unit, premake, retention, archive) VALUES
+    ('pipeline_counters', 'day', 7, INTERVAL '7 days', false)
+ON CONFLICT (parent_table) DO NOTHING;
+
+DO $$ BEGIN PERFORM create_partitions('pipeline_counters'); END $$;
+
+-- Replaced by counter_shards(), shared with tenant_message_usage
+DROP FUNCTION IF EXISTS pipeline_counter_shards();
+
+-- Function: Add events to this backend's shard of the current minute's counter
+CREATE OR REPLACE FUNCTION record_pipeline_counter(
+    p_tenant_id UUID,
+    p_metric VARCHAR,
+    p_events INTEGER DEFAULT 1,
+    p_ms DOUBLE PRECISION DEFAULT 0
+)
+RETURNS VOID AS $$
+    INSERT INTO pipeline_counters (created_at, tenant_id, metric, shard, events, total_ms)
+    VALUES (date_trunc('minute', NOW()), p_tenant_id, p_metric,
+            pg_backend_pid() % counter_shards(), p_events, p_ms)
+    ON CONFLICT ON CONSTRAINT pipeline_counters_pkey DO UPDATE
+    SET events = pipeline_counters.events + EXCLUDED.events,
+        total_ms = pipeline_counters.total_ms + EXCLUDED.total_ms;
+$$ LANGUAGE sql;
+
+-- ============================================================================
+-- MESSAGE USAGE COUNTERS
+-- ============================================================================
+-- Monthly message usage per tenant, split over counter_shards() rows
+-- picked by backend pid, so messages of one tenant arriving at once on
+-- different connections never wait on each other. The rows are narrow and
+-- nothing indexed changes on increment, so updates stay HOT instead of
+-- rewriting the wide tenant_config row (prompts included) per message.
+-- rollup_message_usage() copies the sums into
+-- tenant_config.current_message_count; the message_usage_rollup maintenance
+-- job does the same in batches on every maintenance run. Quota checks read
+-- that rolled-up value (get_message_quota_remaining()).
+
+CREATE TABLE IF NOT EXISTS tenant_message_usage (
+    tenant_id UUID NOT NULL REFERENCES tenant_config(tenant_id) ON DELETE CASCADE,
+    period DATE NOT NULL,
+    shard SMALLINT NOT NULL,
+    message_count BIGINT NOT NULL DEFAULT 0,
+    CONSTRAINT tenant_message_usage_pkey PRIMARY KEY (tenant_id, period, shard)
+) WITH (fillfactor = 50);
+
+COMMENT ON TABLE tenant_message_usage IS 'Sharded monthly message counters per tenant (increment_message_count)';
+COMMENT ON COLUMN tenant_message_usage.period IS 'First day of the counted month';
+
+-- Replaced by counter_shards(), shared with pipeline_counters
+DROP FUNCTION IF EXISTS message_usage_shards();
+
+-- Carry the counts of an upgraded database over to the current month
+INSERT INTO tenant_message_usage (tenant_id, period, shard, message_count)
+SELECT tc.tenant_id, DATE_TRUNC('month', CURRENT_DATE)::DATE, 0, tc.current_message_count
+FROM tenant_config tc
+WHERE tc.current_message_count > 0
+AND tc.last_quota_reset >= DATE_TRUNC('month', CURRENT_DATE)
+AND NOT EXISTS (SELECT 1 FROM tenant_message_usage u WHERE u.tenant_id = tc.tenant_id)
+ON CONFLICT ON CONSTRAINT tenant_message_usage_pkey DO NOTHING;
+
+-- Function: Copy this month's usage into tenant_config.current_message_count
+-- Only rows whose count changed are written, once per run rather than once per
+-- message. Tenants not reset for the month yet are left to
+-- reset_monthly_quotas(). Returns the number of tenants updated.
+CREATE OR REPLACE FUNCTION rollup_message_usage()
+RETURNS INTEGER AS $$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    UPDATE tenant_config tc
+    SET current_message_count = u.total
+    FROM (
+        SELECT mu.tenant_id, SUM(mu.message_count)::INTEGER AS total
+        FROM tenant_message_usage mu
+        WHERE mu.period = DATE_TRUNC('month', CURRENT_DATE)::DATE
+        GROUP BY mu.tenant_id
+    ) u
+    WHERE tc.tenant_id = u.tenant_id
+    AND tc.last_quota_reset >= DATE_TRUNC('month', CURRENT_DATE)
+    AND tc.current_message_count IS DISTINCT FROM u.total;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Messages left this month (NULL without a limit)
+-- Reads the rolled-up count, so it can lag by one rollup interval; one
+-- primary-key lookup, cheap enough for every message.
+CREATE OR REPLACE FUNCTION get_message_quota_remaining(p_tenant_id UUID)
+RETURNS INTEGER AS $$
+    SELECT GREATEST(tc.monthly_message_limit
+                    - CASE WHEN tc.last_quota_reset >= DATE_TRUNC('month', CURRENT_DATE)
+                           THEN COALESCE(tc.current_message_count, 0) ELSE 0 END, 0)
+    FROM tenant_config tc
+    WHERE tc.tenant_id = p_tenant_id;
+$$ LANGUAGE sql STABLE;
+
+-- ============================================================================
+-- ERROR AGGREGATION
+-- ============================================================================
+-- The error handler (04) records every failed execution with
+-- record_workflow_error() instead of alerting each time. Errors are grouped
+-- by fingerprint (tenant, workflow, node, message with ids/numbers/quoted
+-- values masked); the first occurrence in an alert window alerts, with the
+-- number of occurrences suppressed since the previous alert, and the rest
+-- stop there. Patient fallback messages are limited the same way, per
+-- conversation.
+
+CREATE TABLE IF NOT EXISTS error_fingerprints (
+    fingerprint CHAR(32) PRIMARY KEY,
+    tenant_id UUID REFERENCES tenant_config(tenant_id) ON DELETE CASCADE,
+    workflow_name VARCHAR(200) NOT NULL,
+    node_name VARCHAR(200) NOT NULL,
+    normalized_message TEXT NOT NULL,
+    sample_message TEXT,
+    last_execution_id VARCHAR(100),
+    occurrences BIGINT NOT NULL DEFAULT 1,
+    first_seen_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_seen_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_alert_at TIMESTAMPTZ,
+    alerted_occurrences BIGINT NOT NULL DEFAULT 0,
+    alerts_sent INTEGER NOT NULL DEFAULT 0
+);
+
+COMMENT ON TABLE error_fingerprints IS 'Failed executions grouped by tenant, workflow, node and normalized message (04 error handler)';
+COMMENT ON COLUMN error_fingerprints.alerted_occurrences IS 'occurrences at the last alert; the difference is what the next alert reports as suppressed';
+
+CREATE INDEX IF NOT EXISTS idx_error_fingerprints_last_seen
+ON error_fingerprints(last_seen_at DESC);
+
+CREATE TABLE IF NOT EXISTS error_patient_fallbacks (
+    tenant_id UUID NOT NULL REFERENCES tenant_config(tenant_id) ON DELETE CASCADE,
+    remote_jid VARCHAR(50) NOT NULL,
+    sent_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (tenant_id, remote_jid)
+);
+
+COMMENT ON TABLE error_patient_fallbacks IS 'Last "technical difficulty" message sent to each patient by the error handler';
+
+-- Function: Error message with the parts that vary per occurrence masked
+-- UUIDs, timestamps, quoted values, hex ids and numbers become placeholders;
+-- three-digit numbers (HTTP statuses) are kept.
+CREATE OR REPLACE FUNCTION normalize_error_message(p_message TEXT)
+RETURNS TEXT AS $$
+    SELECT left(btrim(regexp_replace(regexp_replace(regexp_replace(regexp_replace(regexp_replace(regexp_replace(
+        lower(COALESCE(p_message, '')),
+        '[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', '<uuid>', 'g'),
+        '\d{4}-\d{2}-\d{2}[t ]\d{2}:\d{2}[0-9:.]*z?', '<time>', 'g'),
+        '"[^"]*"|''[^'']*''', '<str>', 'g'),
+        '\m(0x[0-9a-f]+|[0-9a-f]*\d[0-9a-f]*[a-f][0-9a-f]*|[0-9a-f]*[a-f][0-9a-f]*\d[0-9a-f]*)\M', '<hex>', 'g'),
+        '\d+\.\d+|\d{4,}|(?<![0-9a-z])\d{1,2}(?![0-9])', '<n>', 'g'),
+        '\s+', ' ', 'g')), 500);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Function: Record one failed execution and decide what the handler sends
+-- `alert` is true for the first occurrence of the fingerprint per
+-- p_alert_window; `suppressed` is how many occurrences were not alerted since
+-- the previous alert. `patient_fallback` is true when p_remote_jid has not
+-- received a fallback message within p_fallback_window. Concurrent calls for
+-- one fingerprint serialize on its row, so exactly one of them alerts. The
+-- tenant's alert settings come back in the same row.
+CREATE OR REPLACE FUNCTION record_workflow_error(
+    p_tenant_id UUID,
+    p_workflow_name VARCHAR,
+    p_node_name VARCHAR,
+    p_message TEXT,
+    p_execution_id VARCHAR DEFAULT NULL,
+    p_remote_jid VARCHAR DEFAULT NULL,
+    p_alert_window INTERVAL DEFAULT INTERVAL '15 minutes',
+    p_fallback_window INTERVAL DEFAULT INTERVAL '30 minutes'
+)
+RETURNS TABLE (
+    fingerprint CHAR(32),
+    alert BOOLEAN,
+    occurrences BIGINT,
+    suppressed BIGINT,
+    first_seen_at TIMESTAMPTZ,
+    patient_fallback BOOLEAN,
+    tenant_id UUID,
+    clinic_name VARCHAR,
+    clinic_phone VARCHAR,
+    telegram_internal_chat_id VARCHAR,
+    evolution_instance_name VARCHAR
+) AS $$
+DECLARE
+    v_workflow VARCHAR := left(COALESCE(NULLIF(p_workflow_name, ''), 'Unknown'), 200);
+    v_node VARCHAR := left(COALESCE(NULLIF(p_node_name, ''), 'Unknown'), 200);
+    v_normalized TEXT := normalize_error_message(p_message);
+    v_fingerprint CHAR(32);
+    v_row error_fingerprints;
+BEGIN
+    v_fingerprint := md5(concat_ws('|', p_tenant_id, v_workflow, v_node, v_normalized));
+    fingerprint := v_fingerprint;
+
+    INSERT INTO error_fingerprints (
+        fingerprint, tenant_id, workflow_name, node_name, normalized_message,
+        sample_message, last_execution_id, last_alert_at, alerted_occurrences, alerts_sent
+    ) VALUES (
+        v_fingerprint, p_tenant_id, v_workflow, v_node, v_normalized,
+        left(p_message, 2000), p_execution_id, NOW(), 1, 1
+    )
+    ON CONFLICT ON CONSTRAINT error_fingerprints_pkey DO NOTHING;
+
+    IF FOUND THEN
+        alert := true;
+        occurrences := 1;
+        suppressed := 0;
+        first_seen_at := NOW();
+    ELSE
+        SELECT * INTO v_row
+        FROM error_fingerprints ef
+        WHERE ef.fingerprint = v_fingerprint
+        FOR UPDATE;
+
+        alert := v_row.last_alert_at IS NULL OR v_row.last_alert_at <= NOW() - p_alert_window;
+        occurrences := v_row.occurrences + 1;
+        suppressed := v_row.occurrences - v_row.alerted_occurrences;
+        first_seen_at := v_row.first_seen_at;
+
+        UPDATE error_fingerprints ef
+        SET occurrences = ef.occurrences + 1,
+            last_seen_at = NOW(),
+            sample_message = left(p_message, 2000),
+            last_execution_id = p_execution_id,
+            last_alert_at = CASE WHEN alert THEN NOW() ELSE ef.last_alert_at END,
+            alerted_occurrences = CASE WHEN alert THEN ef.occurrences + 1 ELSE ef.alerted_occurrences END,
+            alerts_sent = ef.alerts_sent + CASE WHEN alert THEN 1 ELSE 0 END
+        WHERE ef.fingerprint = v_fingerprint;
+    END IF;
+
+    patient_fallback := false;
+    IF p_tenant_id IS NOT NULL AND NULLIF(p_remote_jid, '') IS NOT NULL THEN
+        INSERT INTO error_patient_fallbacks AS pf (tenant_id, remote_jid)
+        VALUES (p_tenant_id, p_remote_jid)
+        ON CONFLICT ON CONSTRAINT error_patient_fallbacks_pkey DO UPDATE
+        SET sent_at = NOW()
+        WHERE pf.sent_at <= NOW() - p_fallback_window;
+        patient_fallback := FOUND;
+    END IF;
+
+    SELECT tc.tenant_id, tc.clinic_name, tc.clinic_phone, tc.telegram_internal_chat_id, tc.evolution_instance_name
+    INTO tenant_id, clinic_name, clinic_phone, telegram_internal_chat_id, evolution_instance_name
+    FROM tenant_config tc
+    WHERE tc.tenant_id = p_tenant_id AND tc.is_active = true;
+
+    RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Forget fingerprints not seen for p_keep and old fallback marks
+CREATE OR REPLACE FUNCTION cleanup_error_fingerprints(p_keep INTERVAL DEFAULT INTERVAL '30 days')
+RETURNS INTEGER AS $$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    DELETE FROM error_fingerprints WHERE last_seen_at < NOW() - p_keep;
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+
+    DELETE FROM error_patient_fallbacks WHERE sent_at < NOW() - INTERVAL '1 day';
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================================
+-- MAINTENANCE JOBS
+-- ============================================================================
+-- The cleanup functions above (cleanup_expired_conversation_states,
+-- cleanup_expired_locks, cleanup_stale_faqs, cleanup_expired_media_cache,
+-- cleanup_error_fingerprints, reset_monthly_quotas, rollup_message_usage)
+-- each change every matching row in one statement: on a large table that is one long
+-- transaction holding row locks the message path may need, and a burst of
+-- WAL. run_maintenance_batch(), run from scripts/ops/maintenance_jobs.py, does
+-- the same work in bounded batches instead: each call walks the next
+-- batch_size primary keys after the job's checkpoint (cursor_key), changes the
+-- matching rows among them and saves the new checkpoint in the same short
+-- transaction. Rows locked by a running turn are skipped (SKIP LOCKED) and
+-- picked up by the next pass. When a batch comes back short the pass is
+-- complete and the next call starts over from the first key.
+
+CREATE TABLE IF NOT EXISTS maintenance_jobs (
+    job_name VARCHAR(40) PRIMARY KEY,
+    run_order INTEGER NOT NULL,
+    batch_size INTEGER NOT NULL DEFAULT 1000,
+    is_enabled BOOLEAN NOT NULL DEFAULT true,
+    cursor_key JSONB,
+    pass_started_at TIMESTAMPTZ,
+    pass_rows BIGINT NOT NULL DEFAULT 0,
+    last_batch_at TIMESTAMPTZ,
+    last_pass_finished_at TIMESTAMPTZ,
+    last_pass_rows BIGINT,
+    last_pass_duration INTERVAL,
+    total_rows BIGINT NOT NULL DEFAULT 0,
+    CONSTRAINT valid_maintenance_batch_size CHECK (batch_size > 0)
+);
+
+COMMENT ON TABLE maintenance_jobs IS 'Batched cleanup jobs of run_maintenance_batch(): order, batch size and pass checkpoint';
+COMMENT ON COLUMN maintenance_jobs.cursor_key IS 'Primary key (JSON array) of the last row examined in the current pass; NULL starts a new pass';
+COMMENT ON COLUMN maintenance_jobs.batch_size IS 'Primary keys examined per batch (rows changed are at most this many)';
+
+INSERT INTO maintenance_jobs (job_name, run_order, batch_size) VALUES
+    ('conversation_locks', 10, 1000),
+    ('conversation_states', 20, 1000),
+    ('media_cache', 30, 500),
+    ('stale_faqs', 40, 1000),
+    ('error_fingerprints', 50, 1000),
+    ('error_patient_fallbacks', 60, 1000),
+    ('monthly_quotas', 70, 200),
+    ('message_usage_rollup', 75, 1000),
+    ('message_usage', 80, 1000)
+ON CONFLICT (job_name) DO NOTHING;
+
+-- Function: One batch of a maintenance job
+-- Examines at most p_batch_size (default: the job's batch_size) primary keys
+-- after the checkpoint and returns how many rows it deleted or updated.
+-- `more` is true while the pass has keys left, so callers repeat until it is
+-- false. A job already running elsewhere returns zeros at once. The
+-- conditions match the one-statement cleanup functions.
+CREATE OR REPLACE FUNCTION run_maintenance_batch(
+    p_job VARCHAR,
+    p_batch_size INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+    rows_processed INTEGER,
+    rows_scanned INTEGER,
+    more BOOLEAN
+) AS $$
+DECLARE
+    v_job maintenance_jobs;
+    v_limit INTEGER;
+    v_last JSONB;
+    v_nil CONSTANT UUID := '00000000-0000-0000-0000-000000000000';
+BEGIN
+    rows_processed := 0;
+    rows_scanned := 0;
+    more := false;
+
+    SELECT * INTO v_job
+    FROM maintenance_jobs mj
+    WHERE mj.job_name = p_job
+    FOR UPDATE SKIP LOCKED;
+
+    IF NOT FOUND THEN
+        IF NOT EXISTS (SELECT 1 FROM maintenance_jobs mj WHERE mj.job_name = p_job) THEN
+            RAISE EXCEPTION 'Unknown maintenance job: %', p_job;
+        END IF;
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    v_limit := GREATEST(COALESCE(p_batch_size, v_job.batch_size), 1);
+
+    CASE p_job
+    WHEN 'conversation_locks' THEN
+        WITH scan AS (
+            SELECT cl.tenant_id, cl.phone
+            FROM conversation_locks cl
+            WHERE (cl.tenant_id, cl.phone) > (COALESCE((v_job.cursor_key->>0)::UUID, v_nil),
+                                              COALESCE(v_job.cursor_key->>1, ''))
+            ORDER BY cl.tenant_id, cl.phone
+            LIMIT v_limit
+        ),
+        victims AS (
+            SELECT cl.tenant_id, cl.phone
+            FROM conversation_locks cl
+            JOIN scan s ON s.tenant_id = cl.tenant_id AND s.phone = cl.phone
+            WHERE cl.expires_at < NOW()
+            FOR UPDATE OF cl SKIP LOCKED
+        ),
+        deleted AS (
+            DELETE FROM conversation_locks cl
+            USING victims v
+            WHERE cl.tenant_id = v.tenant_id AND cl.phone = v.phone
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM deleted), (SELECT COUNT(*) FROM scan),
+               (SELECT jsonb_build_array(s.tenant_id, s.phone) FROM scan s
+                ORDER BY s.tenant_id DESC, s.phone DESC LIMIT 1)
+        INTO rows_processed, rows_scanned, v_last;
+
+    WHEN 'conversation_states' THEN
+        WITH scan AS (
+            SELECT cs.id
+            FROM conversation_state cs
+            WHERE cs.id > COALESCE((v_job.cursor_key->>0)::UUID, v_nil)
+            ORDER BY cs.id
+            LIMIT v_limit
+        ),
+        victims AS (
+            SELECT cs.id
+            FROM conversation_state cs
+            JOIN scan s ON s.id = cs.id
+            WHERE cs.expires_at < NOW()
+            FOR UPDATE OF cs SKIP LOCKED
+        ),
+        deleted AS (
+            DELETE FROM conversation_state cs
+            USING victims v
+            WHERE cs.id = v.id
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM deleted), (SELECT COUNT(*) FROM scan),
+               (SELECT jsonb_build_array(s.id) FROM scan s ORDER BY s.id DESC LIMIT 1)
+        INTO rows_processed, rows_scanned, v_last;
+
+    WHEN 'media_cache' THEN
+        WITH scan AS (
+            SELECT mc.tenant_id, mc.media_kind, mc.content_hash
+            FROM media_cache mc
+            WHERE (mc.tenant_id, mc.media_kind, mc.content_hash)
+                > (COALESCE((v_job.cursor_key->>0)::UUID, v_nil),
+                   COALESCE(v_job.cursor_key->>1, ''),
+                   COALESCE(v_job.cursor_key->>2, ''))
+            ORDER BY mc.tenant_id, mc.media_kind, mc.content_hash
+            LIMIT v_limit
+        ),
+        victims AS (
+            SELECT mc.tenant_id, mc.media_kind, mc.content_hash
+            FROM media_cache mc
+            JOIN scan s ON s.tenant_id = mc.tenant_id AND s.media_kind = mc.media_kind
+                       AND s.content_hash = mc.content_hash
+            WHERE mc.expires_at <= NOW()
+            FOR UPDATE OF mc SKIP LOCKED
+        ),
+        deleted AS (
+            DELETE FROM media_cache mc
+            USING victims v
+            WHERE mc.tenant_id = v.tenant_id AND mc.media_kind = v.media_kind
+            AND mc.content_hash = v.content_hash
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM deleted), (SELECT COUNT(*) FROM scan),
+               (SELECT jsonb_build_array(s.tenant_id, s.media_kind, s.content_hash) FROM scan s
+                ORDER BY s.tenant_id DESC, s.media_kind DESC, s.content_hash DESC LIMIT 1)
+        INTO rows_processed, rows_scanned, v_last;
+
+    WHEN 'stale_faqs' THEN
+        WITH scan AS (
+            SELECT f.faq_id
+            FROM tenant_faq f
+            WHERE f.faq_id > COALESCE((v_job.cursor_key->>0)::UUID, v_nil)
+            ORDER BY f.faq_id
+            LIMIT v_limit
+        ),
+        victims AS (
+            SELECT f.faq_id
+            FROM tenant_faq f
+            JOIN scan s ON s.faq_id = f.faq_id
+            WHERE f.view_count < 3
+            AND f.last_used_at < NOW() - INTERVAL '90 days'
+            FOR UPDATE OF f SKIP LOCKED
+        ),
+        deleted AS (
+            DELETE FROM tenant_faq f
+            USING victims v
+            WHERE f.faq_id = v.faq_id
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM deleted), (SELECT COUNT(*) FROM scan),
+               (SELECT jsonb_build_array(s.faq_id) FROM scan s ORDER BY s.faq_id DESC LIMIT 1)
+        INTO rows_processed, rows_scanned, v_last;
+
+    WHEN 'error_fingerprints' THEN
+        WITH scan AS (
+            SELECT ef.fingerprint
+            FROM error_fingerprints ef
+            WHERE ef.fingerprint > COALESCE(v_job.cursor_key->>0, '')
+            ORDER BY ef.fingerprint
+            LIMIT v_limit
+        ),
+        victims AS (
+            SELECT ef.fingerprint
+            FROM error_fingerprints ef
+            JOIN scan s ON s.fingerprint = ef.fingerprint
+            WHERE ef.last_seen_at < NOW() - INTERVAL '30 days'
+            FOR UPDATE OF ef SKIP LOCKED
+        ),
+        deleted AS (
+            DELETE FROM error_fingerprints ef
+            USING victims v
+            WHERE ef.fingerprint = v.fingerprint
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM deleted), (SELECT COUNT(*) FROM scan),
+               (SELECT jsonb_build_array(s.fingerprint) FROM scan s ORDER BY s.fingerprint DESC LIMIT 1)
+        INTO rows_processed, rows_scanned, v_last;
+
+    WHEN 'error_patient_fallbacks' THEN
+        WITH scan AS (
+            SELECT pf.tenant_id, pf.remote_jid
+            FROM error_patient_fallbacks pf
+            WHERE (pf.tenant_id, pf.remote_jid) > (COALESCE((v_job.cursor_key->>0)::UUID, v_nil),
+                                                   COALESCE(v_job.cursor_key->>1, ''))
+            ORDER BY pf.tenant_id, pf.remote_jid
+            LIMIT v_limit
+        ),
+        victims AS (
+            SELECT pf.tenant_id, pf.remote_jid
+            FROM error_patient_fallbacks pf
+            JOIN scan s ON s.tenant_id = pf.tenant_id AND s.remote_jid = pf.remote_jid
+            WHERE pf.sent_at < NOW() - INTERVAL '1 day'
+            FOR UPDATE OF pf SKIP LOCKED
+        ),
+        deleted AS (
+            DELETE FROM error_patient_fallbacks pf
+            USING victims v
+            WHERE pf.tenant_id = v.tenant_id AND pf.remote_jid = v.remote_jid
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM deleted), (SELECT COUNT(*) FROM scan),
+               (SELECT jsonb_build_array(s.tenant_id, s.remote_jid) FROM scan s
+                ORDER BY s.tenant_id DESC, s.remote_jid DESC LIMIT 1)
+        INTO rows_processed, rows_scanned, v_last;
+
+    WHEN 'monthly_quotas' THEN
+        -- reset_monthly_quotas(), a batch of tenants at a time
+        WITH scan AS (
+            SELECT tc.tenant_id
+            FROM tenant_config tc
+            WHERE tc.tenant_id > COALESCE((v_job.cursor_key->>0)::UUID, v_nil)
+            ORDER BY tc.tenant_id
+            LIMIT v_limit
+        ),
+        victims AS (
+            SELECT tc.tenant_id
+            FROM tenant_config tc
+            JOIN scan s ON s.tenant_id = tc.tenant_id
+            WHERE tc.last_quota_reset < DATE_TRUNC('month', CURRENT_DATE)
+            AND tc.is_active = true
+            FOR UPDATE OF tc SKIP LOCKED
+        ),
+        updated AS (
+            UPDATE tenant_config tc
+            SET
+                current_message_count = COALESCE((
+                    SELECT SUM(u.message_count)
+                    FROM tenant_message_usage u
+                    WHERE u.tenant_id = tc.tenant_id
+                    AND u.period = DATE_TRUNC('month', CURRENT_DATE)::DATE
+                ), 0),
+                last_quota_reset = CURRENT_DATE
+            FROM victims v
+            WHERE tc.tenant_id = v.tenant_id
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM updated), (SELECT COUNT(*) FROM scan),
+               (SELECT jsonb_build_array(s.tenant_id) FROM scan s ORDER BY s.tenant_id DESC LIMIT 1)
+        INTO rows_processed, rows_scanned, v_last;
+
+    WHEN 'message_usage_rollup' THEN
+        -- rollup_message_usage(), a batch of tenants at a time
+        WITH scan AS (
+            SELECT tc.tenant_id
+            FROM tenant_config tc
+            WHERE tc.tenant_id > COALESCE((v_job.cursor_key->>0)::UUID, v_nil)
+            ORDER BY tc.tenant_id
+            LIMIT v_limit
+        ),
+        usage AS (
+            SELECT s.tenant_id, SUM(mu.message_count)::INTEGER AS total
+            FROM scan s
+            JOIN tenant_message_usage mu
+              ON mu.tenant_id = s.tenant_id
+             AND mu.period = DATE_TRUNC('month', CURRENT_DATE)::DATE
+            GROUP BY s.tenant_id
+        ),
+        victims AS (
+            SELECT tc.tenant_id, u.total
+            FROM tenant_config tc
+            JOIN usage u ON u.tenant_id = tc.tenant_id
+            WHERE tc.last_quota_reset >= DATE_TRUNC('month', CURRENT_DATE)
+            AND tc.current_message_count IS DISTINCT FROM u.total
+            FOR UPDATE OF tc SKIP LOCKED
+        ),
+        updated AS (
+            UPDATE tenant_config tc
+            SET current_message_count = v.total
+            FROM victims v
+            WHERE tc.tenant_id = v.tenant_id
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM updated), (SELECT COUNT(*) FROM scan),
+               (SELECT jsonb_build_array(s.tenant_id) FROM scan s ORDER BY s.tenant_id DESC LIMIT 1)
+        INTO rows_processed, rows_scanned, v_last;
+
+    WHEN 'message_usage' THEN
+        -- The retention half of reset_monthly_quotas(): usage older than 13 months
+        WITH scan AS (
+            SELECT mu.tenant_id, mu.period, mu.shard
+            FROM tenant_message_usage mu
+            WHERE (mu.tenant_id, mu.period, mu.shard)
+                > (COALESCE((v_job.cursor_key->>0)::UUID, v_nil),
+                   COALESCE((v_job.cursor_key->>1)::DATE, '-infinity'::DATE),
+                   COALESCE((v_job.cursor_key->>2)::SMALLINT, -1::SMALLINT))
+            ORDER BY mu.tenant_id, mu.period, mu.shard
+            LIMIT v_limit
+        ),
+        victims AS (
+            SELECT mu.tenant_id, mu.period, mu.shard
+            FROM tenant_message_usage mu
+            JOIN scan s ON s.tenant_id = mu.tenant_id AND s.period = mu.period AND s.shard = mu.shard
+            WHERE mu.period < DATE_TRUNC('month', CURRENT_DATE) - INTERVAL '13 months'
+            FOR UPDATE OF mu SKIP LOCKED
+        ),
+        deleted AS (
+            DELETE FROM tenant_message_usage mu
+            USING victims v
+            WHERE mu.tenant_id = v.tenant_id AND mu.period = v.period AND mu.shard = v.shard
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM deleted), (SELECT COUNT(*) FROM scan),
+               (SELECT jsonb_build_array(s.tenant_id, s.period, s.shard) FROM scan s
+                ORDER BY s.tenant_id DESC, s.period DESC, s.shard DESC LIMIT 1)
+        INTO rows_processed, rows_scanned, v_last;
+
+    ELSE
+        RAISE EXCEPTION 'Maintenance job % has no batch implementation', p_job;
+    END CASE;
+
+    more := rows_scanned = v_limit;
+
+    IF more THEN
+        UPDATE maintenance_jobs mj
+        SET cursor_key = v_last,
+            pass_started_at = COALESCE(mj.pass_started_at, NOW()),
+            pass_rows = mj.pass_rows + rows_processed,
+            last_batch_at = NOW(),
+            total_rows = mj.total_rows + rows_processed
+        WHERE mj.job_name = p_job;
+    ELSE
+        UPDATE maintenance_jobs mj
+        SET cursor_key = NULL,
+            pass_started_at = NULL,
+            pass_rows = 0,
+            last_batch_at = NOW(),
+            last_pass_finished_at = NOW(),
+            last_pass_rows = mj.pass_rows + rows_processed,
+            last_pass_duration = NOW() - COALESCE(mj.pass_started_at, NOW()),
+            total_rows = mj.total_rows + rows_processed
+        WHERE mj.job_name = p_job;
+    END IF;
+
+    RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION run_maintenance_batch IS 'One bounded, checkpointed batch of a maintenance_jobs cleanup job (scripts/ops/maintenance_jobs.py)';
+
+-- ============================================================================
+-- PERMISSIONS (sections after 22)
+-- ============================================================================
+-- Tables and functions created after section 22; the workflows reach them
+-- through the queue, lock, media cache, chat memory, metrics, quota and error
+-- functions, which run with the caller's privileges.
+
+-- Message queue and conversation locks
+DO $$
+BEGIN
+    IF EXISTS (SELECT FROM pg_roles WHERE rolname = 'n8n_user') THEN
+        GRANT SELECT, INSERT, UPDATE ON message_queue TO n8n_user;
+        GRANT SELECT, INSERT, UPDATE, DELETE ON conversation_locks TO n8n_user;
+
+        GRANT EXECUTE ON FUNCTION enqueue_message(UUID, VARCHAR, VARCHAR, JSONB, VARCHAR) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION conversation_lock_key(UUID, VARCHAR) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION claim_messages(INTEGER, VARCHAR, INTERVAL) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION claim_conversation_turn(UUID, VARCHAR, UUID, INTEGER, INTERVAL) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION claim_inline_message(UUID, UUID) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION complete_messages(UUID[], VARCHAR) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION retry_messages(UUID[], INTEGER, INTERVAL) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION acquire_conversation_lock(UUID, VARCHAR) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION release_conversation_lock(UUID, VARCHAR) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION cleanup_expired_locks() TO n8n_user;
+    END IF;
+END $$;
+
+-- Media cache
+DO $$
+BEGIN
+    IF EXISTS (SELECT FROM pg_roles WHERE rolname = 'n8n_user') THEN
+        GRANT SELECT, INSERT, UPDATE, DELETE ON media_cache TO n8n_user;
+
+        GRANT EXECUTE ON FUNCTION lookup_media_result(UUID, VARCHAR, TEXT, BIGINT) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION store_media_result(UUID, VARCHAR, TEXT, TEXT, BIGINT) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION cleanup_expired_media_cache() TO n8n_user;
+    END IF;
+END $$;
+
+-- Chat memory
+DO $$
+BEGIN
+    IF EXISTS (SELECT FROM pg_roles WHERE rolname = 'n8n_user') THEN
+        GRANT SELECT, INSERT, DELETE ON n8n_chat_histories TO n8n_user;
+        GRANT USAGE, SELECT ON SEQUENCE n8n_chat_histories_id_seq TO n8n_user;
+        GRANT SELECT ON chat_memory_summaries TO n8n_user;
+
+        GRANT EXECUTE ON FUNCTION chat_memory_tenant(VARCHAR) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION get_chat_memory_summary(VARCHAR) TO n8n_user;
+    END IF;
+END $$;
+
+-- Message usage counters
+DO $$
+BEGIN
+    IF EXISTS (SELECT FROM pg_roles WHERE rolname = 'n8n_user') THEN
+        GRANT SELECT, INSERT, UPDATE ON tenant_message_usage TO n8n_user;
+
+        GRANT EXECUTE ON FUNCTION counter_shards() TO n8n_user;
+        GRANT EXECUTE ON FUNCTION get_message_quota_remaining(UUID) TO n8n_user;
+    END IF;
+END $$;
+
+-- Error aggregation
+DO $$
+BEGIN
+    IF EXISTS (SELECT FROM pg_roles WHERE rolname = 'n8n_user') THEN
+        GRANT SELECT, INSERT, UPDATE ON error_fingerprints TO n8n_user;
+        GRANT SELECT, INSERT, UPDATE ON error_patient_fallbacks TO n8n_user;
+
+        GRANT EXECUTE ON FUNCTION normalize_error_message(TEXT) TO n8n_user;
+        GRANT EXECUTE ON FUNCTION record_workflow_error(UUID, VARCHAR, VARCHAR, TEXT, VARCHAR, VARCHAR, INTERVAL, INTERVAL) TO n8n_user;
+    END IF;
+END $$;
+
+-- Pipeline metrics
+DO $$
+BEGIN
+    IF EXISTS (SELECT FROM pg_roles WHERE rolname = 'n8n_user') THEN
+        GRANT SELECT, INSERT, UPDATE ON pipeline_counters TO n8n_user;
+
+        GRANT EXECUTE ON FUNCTION record_pipeline_counter(UUID, VARCHAR, INTEGER, DOUBLE PRECISION) TO n8n_user;
+    END IF;
+END $$;
+
+-- ============================================================================
+-- APPLICATION ROLE (replaces PUBLIC grants)
+-- ============================================================================
+-- After every section, so ALL TABLES / ALL FUNCTIONS covers the whole schema;
+-- default privileges cover objects later migrations create.
+
+DO $$ BEGIN
+  IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = 'n8n_app') THEN
+    CREATE ROLE n8n_app LOGIN PASSWORD '{{N8N_APP_PASSWORD}}';
+  END IF;
+END $$;
+
+GRANT USAGE ON SCHEMA public TO n8n_app;
+GRANT SELECT, INSERT, UPDATE, DELETE ON ALL TABLES IN SCHEMA public TO n8n_app;
+GRANT USAGE, SELECT ON ALL SEQUENCES IN SCHEMA public TO n8n_app;
+GRANT EXECUTE ON ALL FUNCTIONS IN SCHEMA public TO n8n_app;
+ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT SELECT, INSERT, UPDATE, DELETE ON TABLES TO n8n_app;
+ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT USAGE, SELECT ON SEQUENCES TO n8n_app;
+ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT EXECUTE ON FUNCTIONS TO n8n_app;
+REVOKE CREATE ON SCHEMA public FROM n8n_app;
+
 -- ============================================================================
 -- 23. SCHEMA MIGRATIONS TRACKING
 -- ============================================================================
@@ -2377,11 +5990,15 @@ BEGIN
     RAISE NOTICE '';
     RAISE NOTICE 'Tables created:';
     RAISE NOTICE '  • tenant_config, tenant_secrets, tenant_activity_log';
+    RAISE NOTICE '  • tenant_context_cache, tenant_prompt_artifacts, intent_rules';
     RAISE NOTICE '  • tenant_faq';
     RAISE NOTICE '  • services_catalog, professionals, professional_services';
     RAISE NOTICE '  • response_templates, state_definitions, conversation_state';
-    RAISE NOTICE '  • calendars, appointments';
-    RAISE NOTICE '  • message_queue, conversation_locks';
+    RAISE NOTICE '  • calendars, appointments, reminder_rate_limits';
+    RAISE NOTICE '  • message_queue, conversation_locks, media_cache';
+    RAISE NOTICE '  • partition_policies, partition_archive, pipeline_counters';
+    RAISE NOTICE '  • tenant_message_usage, error_fingerprints, error_patient_fallbacks';
+    RAISE NOTICE '  • maintenance_jobs';
     RAISE NOTICE '  • schema_migrations';
     RAISE NOTICE '';
     RAISE NOTICE 'Next steps:';
@@ -0,0 +1,172 @@
+-- ============================================================================
+-- SEED: INTENT RULES
+-- Description: Default intent classification rules (tenant_id NULL) for all
+--              clinics and per clinic type. Tenants override a pattern by
+--              inserting the same match_type + pattern with their tenant_id.
+-- Priorities:  100 menu option | 95 service number | 90 needs a human/AI
+--              60 cancel/reschedule | 50 appointment | 40 hours/location
+--              30 help/info | 20 greeting | 10 confirmation
+-- ============================================================================
+
+-- Defaults for every clinic type
+INSERT INTO intent_rules (clinic_type, intent, match_type, pattern, priority, confidence, max_words, menu_number) VALUES
+-- Main menu (same numbering as the greeting FAQ)
+(NULL, 'appointment',       'exact',   '1',       100, 0.95, NULL, 1),
+(NULL, 'appointment',       'exact',   'um',      100, 0.95, NULL, 1),
+(NULL, 'reschedule',        'exact',   '2',       100, 0.95, NULL, 2),
+(NULL, 'reschedule',        'exact',   'dois',    100, 0.95, NULL, 2),
+(NULL, 'info',              'exact',   '3',       100, 0.95, NULL, 3),
+(NULL, 'info',              'exact',   'tres',    100, 0.95, NULL, 3),
+(NULL, 'hours_location',    'exact',   '4',       100, 0.95, NULL, 4),
+(NULL, 'hours_location',    'exact',   'quatro',  100, 0.95, NULL, 4),
+-- Services catalog numbers (5 and up)
+(NULL, 'service_selection', 'regex',   '^(?:[5-9]|[1-9][0-9]+)$', 95, 0.95, NULL, NULL),
+
+-- Urgency, symptoms and explicit requests for a person always reach the AI
+(NULL, 'complex', 'keyword', 'urgente',            90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'urgencia',           90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'emergencia',         90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'socorro',            90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'dor',                90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'dores',              90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'doendo',             90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'febre',              90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'sangramento',        90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'sangrando',          90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'inchaco',            90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'inchado',            90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'inchada',            90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'alergia',            90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'atendente',          90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'falar com alguem',   90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'falar com uma pessoa', 90, 0.95, NULL, NULL),
+(NULL, 'complex', 'keyword', 'reclamacao',         90, 0.95, NULL, NULL),
+
+-- Cancel / reschedule outrank appointment: "cancelar minha consulta"
+(NULL, 'cancel',     'keyword', 'cancelar',             60, 0.9,  NULL, NULL),
+(NULL, 'cancel',     'keyword', 'cancela',              60, 0.9,  NULL, NULL),
+(NULL, 'cancel',     'keyword', 'cancelamento',         60, 0.9,  NULL, NULL),
+(NULL, 'cancel',     'keyword', 'desmarcar',            60, 0.9,  NULL, NULL),
+(NULL, 'cancel',     'keyword', 'desmarca',             60, 0.9,  NULL, NULL),
+(NULL, 'cancel',     'keyword', 'nao vou poder ir',     60, 0.9,  NULL, NULL),
+(NULL, 'cancel',     'keyword', 'nao vou conseguir ir', 60, 0.9,  NULL, NULL),
+(NULL, 'cancel',     'keyword', 'nao poderei ir',       60, 0.9,  NULL, NULL),
+(NULL, 'cancel',     'keyword', 'nao vou mais',         60, 0.9,  NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'remarcar',             60, 0.9,  NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'remarca',              60, 0.9,  NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'reagendar',            60, 0.9,  NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'reagendamento',        60, 0.9,  NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'adiar',                60, 0.9,  NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'mudar o horario',      60, 0.9,  NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'mudar o dia',          60, 0.9,  NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'mudar a data',         60, 0.9,  NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'mudar minha consulta', 60, 0.9,  NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'trocar o horario',     60, 0.9,  NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'trocar o dia',         60, 0.9,  NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'trocar a data',        60, 0.9,  NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'trocar dia',           60, 0.9,  NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'trocar hora',          60, 0.9,  NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'alterar',              60, 0.85, NULL, NULL),
+(NULL, 'reschedule', 'keyword', 'mudar',                60, 0.85, NULL, NULL),
+
+(NULL, 'appointment', 'keyword', 'agendar',             50, 0.9,  NULL, NULL),
+(NULL, 'appointment', 'keyword', 'agendamento',         50, 0.9,  NULL, NULL),
+(NULL, 'appointment', 'keyword', 'marcar',              50, 0.9,  NULL, NULL),
+(NULL, 'appointment', 'keyword', 'marcacao',            50, 0.9,  NULL, NULL),
+(NULL, 'appointment', 'keyword', 'consulta',            50, 0.85, NULL, NULL),
+(NULL, 'appointment', 'keyword', 'horario disponivel',  50, 0.9,  NULL, NULL),
+(NULL, 'appointment', 'keyword', 'horarios disponiveis', 50, 0.9, NULL, NULL),
+(NULL, 'appointment', 'keyword', 'tem horario',         50, 0.9,  NULL, NULL),
+(NULL, 'appointment', 'keyword', 'vaga',                50, 0.9,  NULL, NULL),
+(NULL, 'appointment', 'keyword', 'vagas',               50, 0.9,  NULL, NULL),
+
+(NULL, 'hours',    'keyword', 'horario',          40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'horarios',         40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'hora',             40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'que horas',        40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'funcionamento',    40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'funciona',         40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'funcionam',        40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'abre',             40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'abrem',            40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'fecha',            40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'fecham',           40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'aberto',           40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'aberta',           40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'abertos',          40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'abertas',          40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'atende',           40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'atendem',          40, 0.9, NULL, NULL),
+(NULL, 'hours',    'keyword', 'expediente',       40, 0.9, NULL, NULL),
+(NULL, 'location', 'keyword', 'endereco',         40, 0.9, NULL, NULL),
+(NULL, 'location', 'keyword', 'localizacao',      40, 0.9, NULL, NULL),
+(NULL, 'location', 'keyword', 'localizada',       40, 0.9, NULL, NULL),
+(NULL, 'location', 'keyword', 'localizado',       40, 0.9, NULL, NULL),
+(NULL, 'location', 'keyword', 'localizados',      40, 0.9, NULL, NULL),
+(NULL, 'location', 'keyword', 'onde fica',        40, 0.9, NULL, NULL),
+(NULL, 'location', 'keyword', 'onde ficam',       40, 0.9, NULL, NULL),
+(NULL, 'location', 'keyword', 'onde voces ficam', 40, 0.9, NULL, NULL),
+(NULL, 'location', 'keyword', 'fica onde',        40, 0.9, NULL, NULL),
+(NULL, 'location', 'keyword', 'onde e a clinica', 40, 0.9, NULL, NULL),
+(NULL, 'location', 'keyword', 'como chegar',      40, 0.9, NULL, NULL),
+(NULL, 'location', 'keyword', 'como chego',       40, 0.9, NULL, NULL),
+(NULL, 'location', 'keyword', 'estacionamento',   40, 0.9, NULL, NULL),
+
+(NULL, 'help', 'keyword', 'ajuda',        30, 0.9, NULL, NULL),
+(NULL, 'help', 'keyword', 'help',         30, 0.9, NULL, NULL),
+(NULL, 'help', 'keyword', 'nao entendi',  30, 0.9, NULL, NULL),
+(NULL, 'help', 'keyword', 'menu',         30, 0.9, 4,    NULL),
+(NULL, 'help', 'keyword', 'opcoes',       30, 0.9, 4,    NULL),
+(NULL, 'info', 'keyword', 'informacao',   30, 0.85, NULL, NULL),
+(NULL, 'info', 'keyword', 'informacoes',  30, 0.85, NULL, NULL),
+
+-- Greetings and confirmations only count for short messages; anything longer
+-- carries a request of its own
+(NULL, 'greeting', 'prefix', 'oi',         20, 0.9, 5, NULL),
+(NULL, 'greeting', 'prefix', 'oii',        20, 0.9, 5, NULL),
+(NULL, 'greeting', 'prefix', 'oie',        20, 0.9, 5, NULL),
+(NULL, 'greeting', 'prefix', 'ola',        20, 0.9, 5, NULL),
+(NULL, 'greeting', 'prefix', 'bom dia',    20, 0.9, 5, NULL),
+(NULL, 'greeting', 'prefix', 'boa tarde',  20, 0.9, 5, NULL),
+(NULL, 'greeting', 'prefix', 'boa noite',  20, 0.9, 5, NULL),
+(NULL, 'greeting', 'prefix', 'hey',        20, 0.9, 5, NULL),
+(NULL, 'greeting', 'prefix', 'hello',      20, 0.9, 5, NULL),
+(NULL, 'greeting', 'prefix', 'e ai',       20, 0.9, 5, NULL),
+(NULL, 'greeting', 'prefix', 'tudo bem',   20, 0.9, 5, NULL),
+(NULL, 'confirmation', 'keyword', 'sim',        10, 0.9, 4, NULL),
+(NULL, 'confirmation', 'keyword', 'confirmo',   10, 0.9, 4, NULL),
+(NULL, 'confirmation', 'keyword', 'confirmar',  10, 0.9, 4, NULL),
+(NULL, 'confirmation', 'keyword', 'confirmado', 10, 0.9, 4, NULL),
+(NULL, 'confirmation', 'keyword', 'ok',         10, 0.9, 4, NULL),
+(NULL, 'confirmation', 'keyword', 'certo',      10, 0.9, 4, NULL),
+(NULL, 'confirmation', 'keyword', 'combinado',  10, 0.9, 4, NULL),
+(NULL, 'confirmation', 'keyword', 'pode ser',   10, 0.9, 4, NULL),
+(NULL, 'confirmation', 'keyword', 'beleza',     10, 0.9, 4, NULL),
+(NULL, 'confirmation', 'keyword', 'perfeito',   10, 0.9, 4, NULL),
+(NULL, 'confirmation', 'exact',   'tudo bem',   10, 0.9, 4, NULL)
+ON CONFLICT ON CONSTRAINT intent_rules_unique DO NOTHING;
+
+-- Clinic-type specifics: complaints that need a professional's attention
+INSERT INTO intent_rules (clinic_type, intent, match_type, pattern, priority, confidence) VALUES
+('dental',    'complex', 'keyword', 'dente quebrado',    90, 0.95),
+('dental',    'complex', 'keyword', 'dente quebrou',     90, 0.95),
+('dental',    'complex', 'keyword', 'quebrou o dente',   90, 0.95),
+('dental',    'complex', 'keyword', 'abscesso',          90, 0.95),
+('dental',    'complex', 'keyword', 'aparelho quebrou',  90, 0.95),
+('dental',    'complex', 'keyword', 'caiu a restauracao', 90, 0.95),
+('medical',   'complex', 'keyword', 'falta de ar',       90, 0.95),
+('medical',   'complex', 'keyword', 'desmaio',           90, 0.95),
+('medical',   'complex', 'keyword', 'desmaiei',          90, 0.95),
+('medical',   'complex', 'keyword', 'pressao alta',      90, 0.95),
+('medical',   'complex', 'keyword', 'resultado do exame', 90, 0.95),
+('medical',   'complex', 'keyword', 'receita',           90, 0.95),
+('aesthetic', 'complex', 'keyword', 'hematoma',          90, 0.95),
+('aesthetic', 'complex', 'keyword', 'vermelhidao',       90, 0.95),
+('aesthetic', 'complex', 'keyword', 'manchas',           90, 0.95),
+('aesthetic', 'complex', 'keyword', 'reacao',            90, 0.95),
+('aesthetic', 'appointment', 'keyword', 'avaliacao',     50, 0.9),
+('mixed',     'complex', 'keyword', 'dente quebrado',    90, 0.95),
+('mixed',     'complex', 'keyword', 'falta de ar',       90, 0.95),
+('mixed',     'complex', 'keyword', 'receita',           90, 0.95),
+('mixed',     'complex', 'keyword', 'hematoma',          90, 0.95)
+ON CONFLICT ON CONSTRAINT intent_rules_unique DO NOTHING;
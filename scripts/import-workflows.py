@@ -2,12 +2,23 @@
 """
 Import workflows to n8n automatically
 Requires: requests library (pip install requests)
+
+Deploys are diff-aware: each workflow's canonical JSON is hashed and compared
+with the copy n8n already holds, unchanged workflows are skipped and the rest
+are pushed concurrently through a bounded worker pool.
+
+Usage:
+    python scripts/import-workflows.py [--workers N] [--force] [--dry-run]
 """
+import argparse
+import hashlib
 import json
 import os
 import sys
 import glob
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
@@ -16,6 +27,13 @@ from urllib3.util.retry import Retry
 N8N_URL = os.getenv("N8N_URL", "http://localhost:5678")
 N8N_API_KEY = os.getenv("N8N_API_KEY", "")
 WORKFLOWS_DIR = "workflows"
+DEPLOY_WORKERS = int(os.getenv("N8N_DEPLOY_WORKERS", "8"))
+PAGE_SIZE = 250  # Max page size accepted by the n8n public API
+
+# Only these fields define what a workflow does. Everything else (id,
+# versionId, active, tags, timestamps) is managed by n8n and must not make
+# an otherwise identical workflow look changed.
+HASHED_FIELDS = ("name", "nodes", "connections", "settings")
 
 # Colors for output
 class Colors:
@@ -37,15 +55,23 @@ def print_error(message):
 def print_warning(message):
     print_status(f"⚠️  {message}", Colors.YELLOW)
 
-def create_session():
-    """Create requests session with retry strategy"""
+def create_session(pool_size: int = 10):
+    """Create requests session with retry strategy
+
+    pool_size must be at least the number of deploy workers so threads
+    sharing the session never wait on a free keep-alive connection.
+    """
     session = requests.Session()
     retry_strategy = Retry(
         total=3,
         backoff_factor=1,
         status_forcelist=[429, 500, 502, 503, 504],
     )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
+    adapter = HTTPAdapter(
+        max_retries=retry_strategy,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+    )
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     return session
@@ -59,80 +85,157 @@ def check_n8n_health(session):
         print_error(f"n8n is not accessible: {e}")
         return False
 
-def get_existing_workflows(session):
-    """Get list of existing workflows"""
+def api_headers(json_body: bool = False) -> Dict[str, str]:
+    """Build n8n API headers"""
     headers = {}
+    if json_body:
+        headers["Content-Type"] = "application/json"
     if N8N_API_KEY:
         headers["X-N8N-API-KEY"] = N8N_API_KEY
-    
-    try:
-        response = session.get(f"{N8N_URL}/api/v1/workflows", headers=headers, timeout=10)
-        if response.status_code == 200:
-            return {wf["name"]: wf["id"] for wf in response.json().get("data", [])}
-        elif response.status_code == 401:
+    return headers
+
+def workflow_hash(workflow_data: dict) -> str:
+    """Hash the canonical JSON of the fields that define a workflow
+
+    Keys are sorted and whitespace stripped so formatting-only edits and
+    key reordering by n8n do not trigger a redeploy.
+    """
+    canonical = {
+        field: workflow_data.get(field)
+        for field in HASHED_FIELDS
+        if workflow_data.get(field) is not None
+    }
+    raw = json.dumps(canonical, sort_keys=True, separators=(",", ":"),
+                     ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def fetch_remote_workflows(session):
+    """Get every workflow held by n8n, following cursor pagination
+
+    Returns {name: {"id": ..., "hash": ...}}, or None when any page
+    fails: a partial list would make workflows on the missing pages look
+    new and get created twice.
+    """
+    remote = {}
+    params = {"limit": PAGE_SIZE}
+    while True:
+        response = session.get(
+            f"{N8N_URL}/api/v1/workflows",
+            headers=api_headers(),
+            params=params,
+            timeout=10,
+        )
+        if response.status_code == 401:
             print_warning("API requires authentication")
             return None
-        else:
+        if response.status_code != 200:
             print_warning(f"Could not fetch existing workflows: {response.status_code}")
-            return {}
-    except Exception as e:
-        print_warning(f"Error fetching workflows: {e}")
-        return {}
+            return None
+
+        body = response.json()
+        for wf in body.get("data", []):
+            remote[wf["name"]] = {"id": wf["id"], "hash": workflow_hash(wf)}
+
+        cursor = body.get("nextCursor")
+        if not cursor:
+            return remote
+        params = {"limit": PAGE_SIZE, "cursor": cursor}
+
+def load_workflow(workflow_path):
+    """Read a workflow file"""
+    with open(workflow_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def push_workflow(session, workflow_data, workflow_id=None):
+    """Create (POST) or update (PUT) a workflow in n8n"""
+    if workflow_id:
+        response = session.put(
+            f"{N8N_URL}/api/v1/workflows/{workflow_id}",
+            headers=api_headers(json_body=True),
+            json=workflow_data,
+            timeout=30
+        )
+        action = "updated"
+    else:
+        response = session.post(
+            f"{N8N_URL}/api/v1/workflows",
+            headers=api_headers(json_body=True),
+            json=workflow_data,
+            timeout=30
+        )
+        action = "created"
+    if response.status_code in [200, 201]:
+        return True, action
+    return False, f"HTTP {response.status_code}: {response.text[:100]}"
+
+def plan_deploy(workflow_files: List[str], remote: Dict[str, dict],
+                force: bool = False) -> Tuple[list, list, list]:
+    """Split local workflows into (to_push, unchanged, invalid)
+
+    to_push holds (path, workflow_data, remote_id or None) tuples; remote
+    workflows whose hash matches the local file are left untouched unless
+    force is set.
+    """
+    to_push, unchanged, invalid = [], [], []
+    for workflow_path in workflow_files:
+        try:
+            workflow_data = load_workflow(workflow_path)
+        except (OSError, json.JSONDecodeError) as e:
+            invalid.append((workflow_path, str(e)))
+            continue
 
-def import_workflow(session, workflow_path, existing_workflows=None):
-    """Import a single workflow"""
-    headers = {"Content-Type": "application/json"}
-    if N8N_API_KEY:
-        headers["X-N8N-API-KEY"] = N8N_API_KEY
-    
-    try:
-        # Read workflow file
-        with open(workflow_path, 'r', encoding='utf-8') as f:
-            workflow_data = json.load(f)
-        
         workflow_name = workflow_data.get("name", Path(workflow_path).stem)
-        
-        # Check if workflow already exists
-        if existing_workflows and workflow_name in existing_workflows:
-            workflow_id = existing_workflows[workflow_name]
-            # Update existing workflow
-            response = session.put(
-                f"{N8N_URL}/api/v1/workflows/{workflow_id}",
-                headers=headers,
-                json=workflow_data,
-                timeout=30
-            )
-            if response.status_code in [200, 201]:
-                return True, "updated"
-            else:
-                return False, f"HTTP {response.status_code}: {response.text[:100]}"
-        else:
-            # Create new workflow
-            response = session.post(
-                f"{N8N_URL}/api/v1/workflows",
-                headers=headers,
-                json=workflow_data,
-                timeout=30
-            )
-            if response.status_code in [200, 201]:
-                return True, "created"
-            else:
-                return False, f"HTTP {response.status_code}: {response.text[:100]}"
-    
-    except FileNotFoundError:
-        return False, "File not found"
-    except json.JSONDecodeError as e:
-        return False, f"Invalid JSON: {e}"
-    except Exception as e:
-        return False, str(e)
+        current = remote.get(workflow_name)
+        if current and not force and current["hash"] == workflow_hash(workflow_data):
+            unchanged.append(workflow_path)
+            continue
+        to_push.append(
+            (workflow_path, workflow_data, current["id"] if current else None)
+        )
+    return to_push, unchanged, invalid
+
+def deploy_workflows(session, to_push: list, workers: int) -> List[tuple]:
+    """Push workflows through a bounded thread pool
 
-def main():
+    n8n handles each workflow write independently, so the only limit is how
+    many concurrent writes the instance tolerates; the pool bounds that and
+    the shared session reuses keep-alive connections and the retry adapter.
+    Returns (path, success, message) per workflow.
+    """
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(push_workflow, session, data, workflow_id): path
+            for path, data, workflow_id in to_push
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                success, message = future.result()
+            except Exception as e:
+                success, message = False, str(e)
+            results.append((path, success, message))
+    return sorted(results)
+
+def parse_args(argv: Optional[List[str]] = None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Import workflows to n8n")
+    parser.add_argument("--workers", type=int, default=DEPLOY_WORKERS,
+                        help="Concurrent uploads (default: N8N_DEPLOY_WORKERS or 8)")
+    parser.add_argument("--force", action="store_true",
+                        help="Push every workflow even if unchanged")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Show what would be deployed without pushing")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
     print_status("🚀 n8n Workflow Importer", Colors.BLUE)
     print_status(f"n8n URL: {N8N_URL}")
     print()
     
     # Check n8n health
-    session = create_session()
+    session = create_session(pool_size=max(10, args.workers))
     if not check_n8n_health(session):
         print_error("n8n is not accessible. Make sure it's running.")
         sys.exit(1)
@@ -140,10 +243,14 @@ def main():
     
     # Get existing workflows
     print_status("📋 Checking existing workflows...")
-    existing_workflows = get_existing_workflows(session)
-    if existing_workflows is None:
-        print_warning("Could not authenticate. Trying import anyway...")
-        existing_workflows = {}
+    try:
+        remote = fetch_remote_workflows(session)
+    except Exception as e:
+        print_warning(f"Error fetching workflows: {e}")
+        remote = None
+    if remote is None:
+        print_error("Could not list existing workflows. Aborting so none is created twice.")
+        sys.exit(1)
     
     # Find all workflow JSON files
     workflow_files = sorted(glob.glob(f"{WORKFLOWS_DIR}/**/*.json", recursive=True))
@@ -151,20 +258,29 @@ def main():
         print_error(f"No workflow files found in {WORKFLOWS_DIR}/")
         sys.exit(1)
     
-    print_status(f"📦 Found {len(workflow_files)} workflows to import")
+    to_push, unchanged, invalid = plan_deploy(workflow_files, remote, args.force)
+    print_status(f"📦 Found {len(workflow_files)} workflows: "
+                 f"{len(to_push)} to deploy, {len(unchanged)} unchanged")
     print()
     
+    if args.dry_run:
+        for workflow_path, _, workflow_id in to_push:
+            action = "update" if workflow_id else "create"
+            print_status(f"Would {action}: {Path(workflow_path).name}")
+        return
+    
     # Import workflows
     imported = 0
     updated = 0
     failed = 0
+    skipped = len(unchanged)
     
-    for workflow_path in workflow_files:
+    for workflow_path, message in invalid:
+        print_error(f"Failed: {Path(workflow_path).name} - Invalid JSON: {message}")
+        failed += 1
+    
+    for workflow_path, success, message in deploy_workflows(session, to_push, args.workers):
         workflow_name = Path(workflow_path).name
-        print_status(f"Importing {workflow_name}...", Colors.BLUE)
-        
-        success, message = import_workflow(session, workflow_path, existing_workflows)
-        
         if success:
             if message == "updated":
                 print_success(f"Updated: {workflow_name}")
@@ -175,7 +291,7 @@ def main():
         else:
             print_error(f"Failed: {workflow_name} - {message}")
             failed += 1
-        print()
+    print()
     
     # Summary
     print_status("╔═══════════════════════════════════════════════════════════════╗", Colors.BLUE)
@@ -184,6 +300,8 @@ def main():
     print_success(f"Imported: {imported}")
     if updated > 0:
         print_status(f"Updated: {updated}", Colors.YELLOW)
+    if skipped > 0:
+        print_status(f"Unchanged (skipped): {skipped}")
     if failed > 0:
         print_error(f"Failed: {failed}")
         sys.exit(1)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Fold old chat memory into per-session summaries and purge idle sessions.
+
+The agents' Postgres Chat Memory nodes append every message to
+n8n_chat_histories and read a whole session back on each call. Each run calls
+compact_chat_memory() in batches: per session, messages older than the
+tenant's chat_memory_keep_messages newest ones are folded into
+chat_memory_summaries (and deleted, or moved to chat_memory_archive when the
+tenant archives), and sessions idle past chat_memory_retention_days are
+removed. Batches walk sessions from a checkpoint and count only the sessions
+they take, so a run stopped by --max-batches resumes where it left off.
+Every batch is its own short transaction, so the agents keep writing while
+it runs; a second copy of the job waits for nothing and exits.
+
+Usage:
+    python scripts/ops/chat_memory_compaction.py
+    python scripts/ops/chat_memory_compaction.py --batch-size 5000 --max-batches 20
+    python scripts/ops/chat_memory_compaction.py --tenant <uuid> --dry-run
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timezone
+
+from db import get_conn
+
+
+def backlog(cur, tenant_id=None):
+    """Sessions over their window and the messages that would be folded, per tenant."""
+    cur.execute("""
+        SELECT COALESCE(tc.tenant_slug, '(no tenant)'),
+               COUNT(*) FILTER (WHERE s.n > COALESCE(tc.chat_memory_keep_messages, 20)),
+               COALESCE(SUM(GREATEST(s.n - COALESCE(tc.chat_memory_keep_messages, 20), 0)), 0),
+               COUNT(*),
+               MAX(s.n)
+        FROM (
+            SELECT session_id, COUNT(*) AS n
+            FROM n8n_chat_histories
+            GROUP BY session_id
+        ) s
+        LEFT JOIN tenant_config tc ON tc.tenant_id = chat_memory_tenant(s.session_id)
+        WHERE %(tenant)s::uuid IS NULL OR tc.tenant_id = %(tenant)s::uuid
+        GROUP BY 1
+        ORDER BY 3 DESC
+    """, {"tenant": tenant_id})
+    return cur.fetchall()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compact Postgres Chat Memory history")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="Sessions examined and messages folded per transaction (default: 1000)")
+    parser.add_argument("--max-batches", type=int, default=100,
+                        help="Stop after this many batches; the next run continues (default: 100)")
+    parser.add_argument("--tenant", metavar="UUID", help="Only this tenant's sessions")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Show sessions over their window, change nothing")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    conn = get_conn("chat_memory_compaction")
+    started = time.monotonic()
+    totals = {"sessions": 0, "folded": 0, "archived": 0, "purged": 0}
+    batches = 0
+    more = False
+
+    try:
+        with conn.cursor() as cur:
+            if args.dry_run:
+                print(f"  {'tenant':<32} {'over window':>11} {'to fold':>9} {'sessions':>9} {'largest':>8}")
+                for slug, over, to_fold, sessions, largest in backlog(cur, args.tenant):
+                    print(f"  {slug:<32} {over:>11} {to_fold:>9} {sessions:>9} {largest:>8}")
+                return 0
+
+            while batches < args.max_batches:
+                cur.execute("SELECT * FROM compact_chat_memory(%s, %s)", (args.batch_size, args.tenant))
+                sessions, folded, archived, purged, more = cur.fetchone()
+                batches += 1
+                totals["sessions"] += sessions
+                totals["folded"] += folded
+                totals["archived"] += archived
+                totals["purged"] += purged
+                if not more:
+                    break
+
+        print(f"Folded: {totals['folded']} messages in {totals['sessions']} session updates  "
+              f"Archived: {totals['archived']}  Purged sessions: {totals['purged']}  "
+              f"Batches: {batches}{' (more pending)' if more else ''}  "
+              f"({(time.monotonic() - started) * 1000:.0f} ms, "
+              f"{datetime.now(timezone.utc):%Y-%m-%d %H:%M} UTC)")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
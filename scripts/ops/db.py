@@ -0,0 +1,36 @@
+"""
+Database connection shared by the scripts in scripts/ops.
+
+Connection settings follow scripts/cli/cli.py (PGHOST, PGPORT, PGDATABASE,
+PGUSER, PGPASSWORD). The scripts run as plain files, so they import this
+module by name from their own directory.
+"""
+
+import os
+import sys
+
+
+def get_conn(application_name: str = None, autocommit: bool = True):
+    """Get database connection using environment variables.
+
+    Connections are autocommit by default: every ops script commits each
+    claim, batch or partition change on its own so other sessions see it
+    right away.
+    """
+    try:
+        import psycopg2
+    except ImportError:
+        print("ERROR: psycopg2 not installed. Run: pip install psycopg2-binary", file=sys.stderr)
+        sys.exit(1)
+
+    conn = psycopg2.connect(
+        host=os.getenv("PGHOST", "localhost"),
+        port=os.getenv("PGPORT", "5432"),
+        dbname=os.getenv("PGDATABASE", os.getenv("POSTGRES_DB", "n8n_clinic_db")),
+        user=os.getenv("PGUSER", os.getenv("POSTGRES_USER", "n8n_clinic")),
+        password=os.getenv("PGPASSWORD", os.getenv("POSTGRES_PASSWORD", "")),
+        connect_timeout=5,
+        application_name=application_name,
+    )
+    conn.autocommit = autocommit
+    return conn
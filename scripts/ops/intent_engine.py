@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Reference implementation of the workflow's Intent Classifier.
+
+Mirrors the "Intent Classifier" Code node of workflows/main/01-whatsapp-main.json
+step by step: the same normalization, the same compiled matcher (one
+word-level Aho-Corasick automaton for keyword/prefix phrases, one combined
+regex, one dict for exact messages) and the same tie-breaking. Rules come from
+get_intent_rules() (table intent_rules), so scripts/bench/intent_classifier.py
+can score rule changes before they reach the workflow.
+
+Usage:
+    python scripts/ops/intent_engine.py --clinic-type dental "quero remarcar minha consulta"
+    python scripts/ops/intent_engine.py --tenant-slug clinica-demo --json "oi, bom dia"
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import unicodedata
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+_COMBINING = re.compile("[\u0300-\u036f]")
+_NON_WORD = re.compile("[^a-z0-9]+")
+# Named group per regex rule; the workflow uses the JS spelling (?<r0>...)
+_GROUP = "(?P<r{}>{})"
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and collapse punctuation to single spaces."""
+    text = _COMBINING.sub("", unicodedata.normalize("NFD", (text or "").lower()))
+    return _NON_WORD.sub(" ", text).strip()
+
+
+class IntentMatcher:
+    """Rules compiled for one tenant version; build once, classify many times."""
+
+    def __init__(self, rules: List[Dict]):
+        self.rules = rules
+        self.exact: Dict[str, Dict] = {}
+        self.phrases: List[Dict] = []
+        regex_rules: List[Dict] = []
+
+        # Rules arrive highest priority first; `order` keeps that as last tie-break
+        for order, rule in enumerate(rules):
+            rule = dict(rule, order=order)
+            if rule["match_type"] == "regex":
+                try:
+                    re.compile(rule["pattern"])
+                except re.error:
+                    continue
+                regex_rules.append(rule)
+                continue
+            rule["pattern"] = normalize(rule["pattern"])
+            if not rule["pattern"]:
+                continue
+            if rule["match_type"] == "exact":
+                self.exact.setdefault(rule["pattern"], rule)
+            else:
+                rule["words"] = rule["pattern"].count(" ") + 1
+                self.phrases.append(rule)
+
+        self._build_automaton()
+        self.regex_rules = regex_rules
+        self.regex = re.compile("|".join(
+            _GROUP.format(i, r["pattern"]) for i, r in enumerate(regex_rules))) if regex_rules else None
+
+    def _build_automaton(self):
+        """Aho-Corasick over phrase words: goto, failure and output tables.
+
+        Phrases always start and end on word boundaries, so the alphabet is
+        words rather than characters: one step per word of the message.
+        """
+        self.next: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[List[int]] = [[]]
+        for i, rule in enumerate(self.phrases):
+            state = 0
+            for word in rule["pattern"].split(" "):
+                target = self.next[state].get(word)
+                if target is None:
+                    target = len(self.next)
+                    self.next[state][word] = target
+                    self.next.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                state = target
+            self.out[state].append(i)
+
+        queue = deque(self.next[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, target in self.next[state].items():
+                f = self.fail[state]
+                while f and word not in self.next[f]:
+                    f = self.fail[f]
+                self.fail[target] = self.next[f].get(word, 0)
+                self.out[target] = self.out[target] + self.out[self.fail[target]]
+                queue.append(target)
+
+    def candidates(self, norm: str) -> List[Tuple[Dict, int]]:
+        """Every rule matching the normalized text, with its match length."""
+        found = []
+        rule = self.exact.get(norm)
+        if rule:
+            found.append((rule, len(norm)))
+
+        state = 0
+        for i, word in enumerate(norm.split(" ") if norm else ()):
+            while state and word not in self.next[state]:
+                state = self.fail[state]
+            state = self.next[state].get(word, 0)
+            for p in self.out[state]:
+                rule = self.phrases[p]
+                if rule["match_type"] == "prefix" and i + 1 != rule["words"]:
+                    continue
+                found.append((rule, len(rule["pattern"])))
+
+        if self.regex:
+            for m in self.regex.finditer(norm):
+                group = next(k for k, v in m.groupdict().items() if v is not None)
+                found.append((self.regex_rules[int(group[1:])], len(m.group(0))))
+        return found
+
+    def classify(self, text: str) -> Dict:
+        """Best rule for a message: priority, then confidence, then longest match."""
+        norm = normalize(text)
+        words = len(norm.split()) if norm else 0
+        best, best_key = None, None
+        for rule, length in self.candidates(norm):
+            if rule.get("max_words") is not None and words > rule["max_words"]:
+                continue
+            key = (rule["priority"], rule["confidence"], length, -rule["order"])
+            if best_key is None or key > best_key:
+                best, best_key = rule, key
+
+        if best is None:
+            return {"intent": "complex", "confidence": 0, "menu_number": None,
+                    "service_number": None, "rule": None}
+        service_number = int(norm) if best["intent"] == "service_selection" and norm.isdigit() else None
+        return {
+            "intent": best["intent"],
+            "confidence": best["confidence"],
+            "menu_number": str(best["menu_number"]) if best.get("menu_number") is not None else None,
+            "service_number": service_number,
+            "rule": f"{best['match_type']}:{best['pattern']}",
+        }
+
+
+def requires_ai(result: Dict) -> bool:
+    """Same routing rule as the workflow: unknown or low-confidence goes to the LLM."""
+    return result["intent"] == "complex" or (
+        result["intent"] != "service_selection" and result["confidence"] < 0.8)
+
+
+def load_rules(cur, tenant_id: Optional[str] = None, clinic_type: Optional[str] = None) -> List[Dict]:
+    """Effective rules as served to the workflow by get_tenant_context()."""
+    cur.execute("SELECT get_intent_rules(%s::uuid, %s)", (tenant_id, clinic_type))
+    return cur.fetchone()[0] or []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify messages with the tenant's intent rules")
+    parser.add_argument("messages", nargs="+", help="Message text(s) to classify")
+    scope = parser.add_mutually_exclusive_group()
+    scope.add_argument("--tenant-slug", help="Use the effective rules of this tenant")
+    scope.add_argument("--clinic-type", help="Use the default rules of this clinic type")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        import psycopg2
+    except ImportError:
+        print("ERROR: psycopg2 not installed. Run: pip install psycopg2-binary", file=sys.stderr)
+        return 1
+    conn = psycopg2.connect(
+        host=os.getenv("PGHOST", "localhost"),
+        port=os.getenv("PGPORT", "5432"),
+        dbname=os.getenv("PGDATABASE", os.getenv("POSTGRES_DB", "n8n_clinic_db")),
+        user=os.getenv("PGUSER", os.getenv("POSTGRES_USER", "n8n_clinic")),
+        password=os.getenv("PGPASSWORD", os.getenv("POSTGRES_PASSWORD", "")),
+        connect_timeout=5,
+    )
+    try:
+        with conn.cursor() as cur:
+            tenant_id = None
+            if args.tenant_slug:
+                cur.execute("SELECT tenant_id FROM tenant_config WHERE tenant_slug = %s", (args.tenant_slug,))
+                row = cur.fetchone()
+                if not row:
+                    print(f"❌ Tenant not found: {args.tenant_slug}", file=sys.stderr)
+                    return 1
+                tenant_id = str(row[0])
+            matcher = IntentMatcher(load_rules(cur, tenant_id, args.clinic_type))
+    finally:
+        conn.close()
+
+    results = []
+    for message in args.messages:
+        result = matcher.classify(message)
+        result["requires_ai"] = requires_ai(result)
+        results.append(dict(message=message, **result))
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        for r in results:
+            print(f"{r['intent']:<18} {r['confidence']:<5} {'AI' if r['requires_ai'] else '--':<3} "
+                  f"{r['rule'] or '-':<28} {r['message']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
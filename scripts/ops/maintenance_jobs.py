@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Run the schema's cleanup jobs in small, checkpointed batches.
+
+Expired conversation states and locks, expired media results, stale FAQs,
+old error fingerprints, the monthly quota reset, the message usage roll-up
+and old message usage used to be one DELETE/UPDATE each
+(cleanup_expired_conversation_states() and friends): one long transaction
+over every matching row. This runner calls run_maintenance_batch() for each
+job in maintenance_jobs (run_order), which walks the table's primary key from
+the job's checkpoint, a batch at a time, each batch its own short transaction
+that skips rows a running turn holds.
+
+Between batches the runner sleeps at least as long as the batch took, so a
+job never keeps more than half of one backend busy; a batch slower than
+--slow-ms halves the batch size for the rest of the run. Each job stops at its
+--budget and the next run resumes from the saved checkpoint. Lock and
+statement timeouts make a job give up instead of queueing behind the message
+path.
+
+Usage:
+    python scripts/ops/maintenance_jobs.py
+    python scripts/ops/maintenance_jobs.py --jobs conversation_states,stale_faqs --budget 120
+    python scripts/ops/maintenance_jobs.py --status
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timezone
+
+from db import get_conn
+
+# Give up on a batch rather than wait behind the message path
+LOCK_TIMEOUT = "2s"
+STATEMENT_TIMEOUT = "30s"
+MIN_BATCH_SIZE = 50
+
+
+def load_jobs(cur, names=None):
+    """(job_name, batch_size) to run, in run_order: the named ones or every enabled job."""
+    cur.execute("""
+        SELECT job_name, batch_size
+        FROM maintenance_jobs
+        WHERE CASE WHEN %(names)s::text[] IS NULL THEN is_enabled
+                   ELSE job_name = ANY(%(names)s::text[]) END
+        ORDER BY run_order, job_name
+    """, {"names": names})
+    jobs = cur.fetchall()
+    unknown = sorted(set(names or []) - {name for name, _ in jobs})
+    if unknown:
+        raise SystemExit(f"ERROR: unknown job(s): {', '.join(unknown)}")
+    return jobs
+
+
+def run_job(cur, job: str, batch_size: int, budget: float, pause: float, slow_ms: float) -> dict:
+    """Batches of one job until its pass completes or the budget runs out."""
+    import psycopg2
+
+    stats = {"rows": 0, "scanned": 0, "batches": 0, "state": "done"}
+    started = time.monotonic()
+    while True:
+        batch_started = time.monotonic()
+        try:
+            cur.execute("SELECT * FROM run_maintenance_batch(%s, %s)", (job, batch_size))
+        except psycopg2.errors.LockNotAvailable:
+            stats["state"] = "lock timeout"
+            break
+        except psycopg2.errors.QueryCanceled:
+            stats["state"] = "statement timeout"
+            break
+        rows, scanned, more = cur.fetchone()
+        batch_s = time.monotonic() - batch_started
+        stats["rows"] += rows
+        stats["scanned"] += scanned
+        stats["batches"] += 1
+        if not more:
+            break
+        if time.monotonic() - started >= budget:
+            stats["state"] = "budget (resumes next run)"
+            break
+        if batch_s * 1000 > slow_ms and batch_size > MIN_BATCH_SIZE:
+            batch_size = max(batch_size // 2, MIN_BATCH_SIZE)
+        # Yield: never busier than idle
+        time.sleep(max(pause, batch_s))
+    stats["ms"] = (time.monotonic() - started) * 1000
+    stats["batch_size"] = batch_size
+    return stats
+
+
+def print_status(cur):
+    cur.execute("""
+        SELECT job_name, is_enabled, batch_size, cursor_key IS NOT NULL, pass_rows,
+               last_pass_finished_at, last_pass_rows, last_pass_duration, total_rows
+        FROM maintenance_jobs
+        ORDER BY run_order, job_name
+    """)
+    print(f"  {'job':<24} {'on':>3} {'batch':>6} {'in pass':>8} {'pass rows':>10} "
+          f"{'last pass':>17} {'rows':>8} {'took':>9} {'total':>10}")
+    for name, enabled, size, in_pass, pass_rows, finished, last_rows, took, total in cur.fetchall():
+        finished_s = f"{finished:%Y-%m-%d %H:%M}" if finished else "-"
+        took_s = f"{took.total_seconds():.1f} s" if took is not None else "-"
+        print(f"  {name:<24} {'yes' if enabled else 'no':>3} {size:>6} {'yes' if in_pass else 'no':>8} "
+              f"{pass_rows:>10} {finished_s:>17} {last_rows if last_rows is not None else '-':>8} "
+              f"{took_s:>9} {total:>10}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run batched cleanup jobs (maintenance_jobs)")
+    parser.add_argument("--jobs", metavar="NAMES",
+                        help="Comma-separated jobs to run, enabled or not (default: every enabled job)")
+    parser.add_argument("--batch-size", type=int,
+                        help="Primary keys examined per batch (default: the job's batch_size)")
+    parser.add_argument("--budget", type=float, default=60,
+                        help="Seconds per job; an unfinished pass resumes next run (default: 60)")
+    parser.add_argument("--pause", type=float, default=50,
+                        help="Minimum sleep between batches in ms (default: 50)")
+    parser.add_argument("--slow-ms", type=float, default=250,
+                        help="Halve the batch size after a batch slower than this (default: 250)")
+    parser.add_argument("--status", action="store_true",
+                        help="Show each job's checkpoint and last pass, run nothing")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    conn = get_conn("maintenance_jobs")
+    started = time.monotonic()
+    totals = {"rows": 0, "failed": 0}
+
+    try:
+        with conn.cursor() as cur:
+            if args.status:
+                print_status(cur)
+                return 0
+
+            cur.execute("SET lock_timeout = %s", (LOCK_TIMEOUT,))
+            cur.execute("SET statement_timeout = %s", (STATEMENT_TIMEOUT,))
+            names = [n.strip() for n in args.jobs.split(",") if n.strip()] if args.jobs else None
+
+            jobs = load_jobs(cur, names)
+            print(f"  {'job':<24} {'rows':>8} {'scanned':>9} {'batches':>8} {'ms':>8}  state")
+            for job, batch_size in jobs:
+                try:
+                    stats = run_job(cur, job, args.batch_size or batch_size, args.budget,
+                                    args.pause / 1000, args.slow_ms)
+                except Exception as e:
+                    totals["failed"] += 1
+                    print(f"❌ {job}: {e}", file=sys.stderr)
+                    continue
+                totals["rows"] += stats["rows"]
+                state = stats["state"]
+                if stats["batch_size"] != (args.batch_size or batch_size):
+                    state += f", batch size lowered to {stats['batch_size']}"
+                print(f"  {job:<24} {stats['rows']:>8} {stats['scanned']:>9} {stats['batches']:>8} "
+                      f"{stats['ms']:>8.0f}  {state}")
+
+        print(f"Processed: {totals['rows']} rows  Failed jobs: {totals['failed']}  "
+              f"({(time.monotonic() - started) * 1000:.0f} ms, "
+              f"{datetime.now(timezone.utc):%Y-%m-%d %H:%M} UTC)")
+    finally:
+        conn.close()
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Expose hot-path latency and throughput metrics of the clinic pipeline.
+
+Serves Prometheus text on /metrics and a JSON snapshot on /metrics.json.
+Every refresh only reads what changed since the previous one:
+
+- message_queue rows finished since the last watermark (idx_message_queue_processed):
+  queue wait (created_at -> claimed_at) and processing time
+  (claimed_at -> processed_at) histograms, completed/failed counts per tenant
+- pipeline_counters minutes since the last watermark: turns per route
+  (template, service_selection, faq, ai) with the database time spent in
+  process_inbound_turn(), and reminder sends
+- tenant_activity_log rows since the last watermark, per activity type
+- current queue depth (worker backlog and turns being answered) and the age
+  of the oldest message waiting for a worker
+
+Counters accumulate in memory from the start of the exporter (or
+--lookback seconds before it), so Prometheus rate() works across scrapes and
+exporter restarts show up as ordinary counter resets. Rows are only read
+--settle seconds after their timestamp, so transactions that commit a little
+after NOW() are not skipped. Scrapes closer together than --min-interval
+reuse the last refresh.
+
+Processing time covers the LLM and Evolution API calls; the database share of
+each turn is clinic_turn_db_seconds_total, so a slowdown can be attributed.
+
+Usage:
+    python scripts/ops/metrics_exporter.py --port 9188
+    python scripts/ops/metrics_exporter.py --once --lookback 3600
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from db import get_conn
+
+# Upper bounds in seconds; queue wait includes the message coalescing window
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+ACTIVITY_TYPES = ("message_received", "message_sent", "workflow_executed",
+                  "error", "quota_exceeded", "unknown_instance", "config_updated")
+
+
+class Histogram:
+    """Prometheus-style histogram filled from per-bucket counts."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, bucket: int, count: int, total: float):
+        self.buckets[min(bucket, len(LATENCY_BUCKETS))] += count
+        self.count += count
+        self.sum += total
+
+    def cumulative(self):
+        running = 0
+        for bound, n in zip(LATENCY_BUCKETS + (float("inf"),), self.buckets):
+            running += n
+            yield bound, running
+
+    def quantile(self, q: float):
+        """Estimate a quantile by linear interpolation inside its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower, seen = 0.0, 0
+        for bound, n in zip(LATENCY_BUCKETS, self.buckets):
+            if n and seen + n >= rank:
+                return lower + (bound - lower) * (rank - seen) / n
+            lower, seen = bound, seen + n
+        return LATENCY_BUCKETS[-1]
+
+    def to_dict(self):
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        return {
+            "count": self.count,
+            "avg_ms": round(self.sum / self.count * 1000, 1) if self.count else None,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+class Collector:
+    """Watermarks, accumulated counters and the last gauges."""
+
+    def __init__(self, conn, settle: float, lookback: float):
+        self.conn = conn
+        self.settle = timedelta(seconds=settle)
+        self.lock = threading.Lock()
+        self.tenants = {}
+        self.queue_wait = {}
+        self.processing = {}
+        self.processed = {}
+        self.counters = {}
+        self.counters_seen = {}
+        self.activity = {}
+        self.depth = {}
+        self.oldest_pending = {}
+        self.refreshed_at = None
+        self.refresh_seconds = 0.0
+        self.up = 0
+
+        with conn.cursor() as cur:
+            cur.execute("SELECT NOW() - make_interval(secs => %s)", (lookback,))
+            start = cur.fetchone()[0]
+        self.started_at = start
+        self.watermarks = {"message_queue": start, "pipeline_counters": start, "tenant_activity_log": start}
+
+    def tenant(self, tenant_id) -> str:
+        return self.tenants.get(tenant_id, tenant_id)
+
+    def refresh(self):
+        started = time.monotonic()
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT NOW() - %s", (self.settle,))
+                until = cur.fetchone()[0]
+                cur.execute("SELECT tenant_id::text, tenant_slug FROM tenant_config")
+                self.tenants = dict(cur.fetchall())
+                self.read_queue(cur, until)
+                self.read_counters(cur, until)
+                self.read_activity(cur, until)
+                self.read_depth(cur)
+            self.up = 1
+        except Exception as e:
+            self.up = 0
+            print(f"❌ refresh failed: {e}", file=sys.stderr)
+            self.reconnect()
+        self.refreshed_at = datetime.now(timezone.utc)
+        self.refresh_seconds = time.monotonic() - started
+
+    def reconnect(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        try:
+            self.conn = get_conn("metrics_exporter")
+        except Exception as e:
+            print(f"❌ reconnect failed: {e}", file=sys.stderr)
+
+    def read_queue(self, cur, until):
+        """Finished messages since the watermark, bucketed in the database."""
+        cur.execute("""
+            SELECT t.tenant_id::text, t.status,
+                   width_bucket(t.wait_s, %(bounds)s::float8[]), width_bucket(t.proc_s, %(bounds)s::float8[]),
+                   COUNT(*), SUM(t.wait_s), SUM(t.proc_s)
+            FROM (
+                SELECT mq.tenant_id, mq.status,
+                       EXTRACT(EPOCH FROM COALESCE(mq.claimed_at, mq.created_at) - mq.created_at)::float8 AS wait_s,
+                       EXTRACT(EPOCH FROM mq.processed_at - COALESCE(mq.claimed_at, mq.created_at))::float8 AS proc_s
+                FROM message_queue mq
+                WHERE mq.processed_at >= %(since)s AND mq.processed_at < %(until)s
+            ) t
+            GROUP BY 1, 2, 3, 4
+        """, {"bounds": list(LATENCY_BUCKETS), "since": self.watermarks["message_queue"], "until": until})
+        for tenant_id, status, wait_b, proc_b, n, wait_s, proc_s in cur.fetchall():
+            self.queue_wait.setdefault(tenant_id, Histogram()).add(wait_b, n, wait_s)
+            self.processing.setdefault(tenant_id, Histogram()).add(proc_b, n, proc_s)
+            self.processed[(tenant_id, status)] = self.processed.get((tenant_id, status), 0) + n
+        self.watermarks["message_queue"] = max(self.watermarks["message_queue"], until)
+
+    def read_counters(self, cur, until):
+        """pipeline_counters minutes still open at the watermark; only deltas are added."""
+        since = self.watermarks["pipeline_counters"].replace(second=0, microsecond=0)
+        cur.execute("""
+            SELECT created_at, tenant_id::text, metric, SUM(events)::bigint, SUM(total_ms)
+            FROM pipeline_counters
+            WHERE created_at >= %s
+            GROUP BY 1, 2, 3
+        """, (since,))
+        for bucket, tenant_id, metric, events, total_ms in cur.fetchall():
+            key = (bucket, tenant_id, metric)
+            seen_events, seen_ms = self.counters_seen.get(key, (0, 0.0))
+            events_total, ms_total = self.counters.get((tenant_id, metric), (0, 0.0))
+            self.counters[(tenant_id, metric)] = (events_total + events - seen_events,
+                                                  ms_total + total_ms - seen_ms)
+            self.counters_seen[key] = (events, total_ms)
+        # A minute can still change until every transaction that started in it committed
+        self.watermarks["pipeline_counters"] = max(since, until - timedelta(minutes=1))
+        open_from = self.watermarks["pipeline_counters"].replace(second=0, microsecond=0)
+        self.counters_seen = {k: v for k, v in self.counters_seen.items() if k[0] >= open_from}
+
+    def read_activity(self, cur, until):
+        cur.execute("""
+            SELECT tenant_id::text, activity_type, COUNT(*)
+            FROM tenant_activity_log
+            WHERE activity_type = ANY(%s) AND created_at >= %s AND created_at < %s
+            GROUP BY 1, 2
+        """, (list(ACTIVITY_TYPES), self.watermarks["tenant_activity_log"], until))
+        for tenant_id, activity_type, n in cur.fetchall():
+            self.activity[(tenant_id, activity_type)] = self.activity.get((tenant_id, activity_type), 0) + n
+        self.watermarks["tenant_activity_log"] = max(self.watermarks["tenant_activity_log"], until)
+
+    def read_depth(self, cur):
+        """Rows a consumer holds: worker backlog and webhook turns being answered.
+
+        Inline rows still pending sit in their execution's coalescing window
+        (or were left behind by an old install) and would only inflate the
+        depth and the oldest pending age.
+        """
+        cur.execute("""
+            SELECT tenant_id::text, status, COUNT(*), EXTRACT(EPOCH FROM NOW() - MIN(created_at))::float8
+            FROM message_queue
+            WHERE status IN ('pending', 'processing')
+            AND (consumer = 'worker' OR status = 'processing')
+            GROUP BY 1, 2
+        """)
+        self.depth, self.oldest_pending = {}, {}
+        for tenant_id, status, n, oldest_s in cur.fetchall():
+            self.depth[(tenant_id, status)] = n
+            if status == "pending":
+                self.oldest_pending[tenant_id] = oldest_s
+
+    def prometheus(self) -> str:
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def sample(name, labels, value):
+            text = ",".join(f'{k}="{escape(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{text}}} {value}" if text else f"{name} {value}")
+
+        for name, histograms, help_text in (
+            ("clinic_queue_wait_seconds", self.queue_wait, "Time from enqueue to claim of finished messages"),
+            ("clinic_processing_seconds", self.processing, "Time from claim to completion of finished messages"),
+        ):
+            family(name, "histogram", help_text)
+            for tenant_id, h in sorted(histograms.items()):
+                labels = {"tenant": self.tenant(tenant_id)}
+                for bound, running in h.cumulative():
+                    sample(f"{name}_bucket", {**labels, "le": "+Inf" if bound == float("inf") else f"{bound:g}"},
+                           running)
+                sample(f"{name}_sum", labels, f"{h.sum:.6f}")
+                sample(f"{name}_count", labels, h.count)
+
+        family("clinic_messages_processed_total", "counter", "Queued messages finished, by outcome")
+        for (tenant_id, status), n in sorted(self.processed.items()):
+            sample("clinic_messages_processed_total", {"tenant": self.tenant(tenant_id), "status": status}, n)
+
+        family("clinic_turns_total", "counter", "Inbound turns by the route that answered them")
+        db_time, reminders = [], []
+        for (tenant_id, metric), (events, total_ms) in sorted(self.counters.items()):
+            kind, _, value = metric.partition(":")
+            if kind == "turn":
+                labels = {"tenant": self.tenant(tenant_id), "route": value}
+                sample("clinic_turns_total", labels, events)
+                db_time.append((labels, total_ms))
+            elif kind == "reminder":
+                reminders.append(({"tenant": self.tenant(tenant_id), "type": value}, events))
+
+        family("clinic_turn_db_seconds_total", "counter", "Database time spent in process_inbound_turn()")
+        for labels, total_ms in db_time:
+            sample("clinic_turn_db_seconds_total", labels, f"{total_ms / 1000:.6f}")
+
+        family("clinic_reminders_sent_total", "counter", "Appointment reminders marked as sent")
+        for labels, events in reminders:
+            sample("clinic_reminders_sent_total", labels, events)
+
+        family("clinic_activity_events_total", "counter", "tenant_activity_log rows by activity type")
+        for (tenant_id, activity_type), n in sorted(self.activity.items()):
+            sample("clinic_activity_events_total", {"tenant": self.tenant(tenant_id), "type": activity_type}, n)
+
+        family("clinic_queue_messages", "gauge", "Messages waiting for a worker or being processed")
+        for (tenant_id, status), n in sorted(self.depth.items()):
+            sample("clinic_queue_messages", {"tenant": self.tenant(tenant_id), "status": status}, n)
+
+        family("clinic_queue_oldest_pending_seconds", "gauge", "Age of the oldest message waiting for a worker")
+        for tenant_id, age in sorted(self.oldest_pending.items()):
+            sample("clinic_queue_oldest_pending_seconds", {"tenant": self.tenant(tenant_id)}, f"{age:.3f}")
+
+        family("clinic_exporter_up", "gauge", "Whether the last refresh reached the database")
+        sample("clinic_exporter_up", {}, self.up)
+        family("clinic_exporter_refresh_seconds", "gauge", "Duration of the last refresh")
+        sample("clinic_exporter_refresh_seconds", {}, f"{self.refresh_seconds:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        tenants = {}
+
+        def entry(tenant_id):
+            return tenants.setdefault(self.tenant(tenant_id), {
+                "queue_wait": None, "processing": None, "processed": {}, "turns": {},
+                "turn_db_ms_avg": {}, "faq_hit_ratio": None, "ai_ratio": None, "reminders_sent": {},
+                "activity": {}, "queue": {"pending": 0, "processing": 0, "oldest_pending_s": None},
+            })
+
+        for tenant_id, h in self.queue_wait.items():
+            entry(tenant_id)["queue_wait"] = h.to_dict()
+        for tenant_id, h in self.processing.items():
+            entry(tenant_id)["processing"] = h.to_dict()
+        for (tenant_id, status), n in self.processed.items():
+            entry(tenant_id)["processed"][status] = n
+        for (tenant_id, metric), (events, total_ms) in self.counters.items():
+            kind, _, value = metric.partition(":")
+            if kind == "turn":
+                entry(tenant_id)["turns"][value] = events
+                entry(tenant_id)["turn_db_ms_avg"][value] = round(total_ms / events, 2) if events else None
+            elif kind == "reminder":
+                entry(tenant_id)["reminders_sent"][value] = events
+        for (tenant_id, activity_type), n in self.activity.items():
+            entry(tenant_id)["activity"][activity_type] = n
+        for (tenant_id, status), n in self.depth.items():
+            entry(tenant_id)["queue"][status] = n
+        for tenant_id, age in self.oldest_pending.items():
+            entry(tenant_id)["queue"]["oldest_pending_s"] = round(age, 1)
+
+        for data in tenants.values():
+            turns = data["turns"]
+            total = sum(turns.values())
+            # Only turns that got past the templates reach the FAQ lookup
+            looked_up = turns.get("faq", 0) + turns.get("ai", 0)
+            data["faq_hit_ratio"] = round(turns.get("faq", 0) / looked_up, 3) if looked_up else None
+            data["ai_ratio"] = round(turns.get("ai", 0) / total, 3) if total else None
+
+        window = (self.watermarks["message_queue"] - self.started_at).total_seconds()
+        return {
+            "up": bool(self.up),
+            "refreshed_at": self.refreshed_at.isoformat() if self.refreshed_at else None,
+            "refresh_ms": round(self.refresh_seconds * 1000, 1),
+            "since": self.started_at.isoformat(),
+            "window_s": round(window, 1),
+            "watermarks": {k: v.isoformat() for k, v in self.watermarks.items()},
+            "tenants": tenants,
+        }
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def make_handler(collector: Collector, min_interval: float):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/metrics", "/metrics.json"):
+                self.send_error(404)
+                return
+            with collector.lock:
+                if (collector.refreshed_at is None
+                        or (datetime.now(timezone.utc) - collector.refreshed_at).total_seconds() >= min_interval):
+                    collector.refresh()
+                if self.path == "/metrics":
+                    body, content_type = collector.prometheus(), "text/plain; version=0.0.4; charset=utf-8"
+                else:
+                    body, content_type = json.dumps(collector.snapshot(), indent=2), "application/json"
+            payload = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Prometheus/JSON metrics for the clinic pipeline")
+    parser.add_argument("--host", default=os.getenv("METRICS_EXPORTER_HOST", "0.0.0.0"),
+                        help="Listen address (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=int(os.getenv("METRICS_EXPORTER_PORT", "9188")),
+                        help="Listen port (default: 9188)")
+    parser.add_argument("--min-interval", type=float, default=5.0,
+                        help="Scrapes closer together reuse the last refresh (default: 5 s)")
+    parser.add_argument("--settle", type=float, default=5.0,
+                        help="Only read rows at least this old, for late commits (default: 5 s)")
+    parser.add_argument("--lookback", type=float, default=0.0,
+                        help="Start the counters this many seconds in the past (default: 0)")
+    parser.add_argument("--once", action="store_true",
+                        help="Refresh once, print the JSON snapshot and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    collector = Collector(get_conn("metrics_exporter"), args.settle, args.lookback)
+
+    if args.once:
+        collector.refresh()
+        print(json.dumps(collector.snapshot(), indent=2))
+        collector.conn.close()
+        return 0 if collector.up else 1
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(collector, args.min_interval))
+    print(f"Serving /metrics and /metrics.json on {args.host}:{args.port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        collector.conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
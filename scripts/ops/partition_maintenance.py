@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Create upcoming partitions, expire old ones and archive what was detached.
+
+tenant_activity_log and message_queue are range-partitioned by created_at
+(policies in partition_policies). Each run calls maintain_partitions(), which
+pre-creates the next partitions and detaches or drops those past retention,
+then exports every detached partition still listed as pending in
+partition_archive to <archive-dir>/<parent>/<partition>.csv.gz and drops it.
+
+Expiring a partition is a DETACH/DROP of a whole table, so retention no longer
+costs a large DELETE and the vacuum that follows it.
+
+--dry-run runs maintain_partitions() in a transaction that is rolled back, so
+it prints exactly what a real run would create and expire, and lists the
+partitions waiting for export.
+
+Usage:
+    python scripts/ops/partition_maintenance.py --archive-dir /var/backups/n8n-clinic/partitions
+    python scripts/ops/partition_maintenance.py --dry-run
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from db import get_conn
+
+ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "./partition-archive")
+
+
+def pending_archives(cur):
+    """Detached partitions that were not exported yet, oldest first."""
+    cur.execute("""
+        SELECT partition_name, parent_table
+        FROM partition_archive
+        WHERE archived_at IS NULL
+          AND to_regclass(partition_name) IS NOT NULL
+        ORDER BY range_from NULLS FIRST, partition_name
+    """)
+    return cur.fetchall()
+
+
+def archive_partition(conn, partition: str, parent: str, archive_dir: str, keep: bool) -> int:
+    """Export one detached partition as gzipped CSV; returns the row count."""
+    target_dir = os.path.join(archive_dir, parent)
+    os.makedirs(target_dir, exist_ok=True)
+    path = os.path.join(target_dir, f"{partition}.csv.gz")
+    tmp_path = path + ".tmp"
+
+    with conn.cursor() as cur:
+        with gzip.open(tmp_path, "wb") as f:
+            cur.copy_expert(f'COPY "{partition}" TO STDOUT WITH (FORMAT csv, HEADER)', f)
+        cur.execute(f'SELECT count(*) FROM "{partition}"')
+        row_count = cur.fetchone()[0]
+    # Only a complete file gets the final name
+    os.replace(tmp_path, path)
+
+    # Marking it archived and dropping it commit together (or not at all)
+    conn.autocommit = False
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute("""
+                UPDATE partition_archive
+                SET archived_at = NOW(), archive_path = %s, row_count = %s
+                WHERE partition_name = %s
+            """, (os.path.abspath(path), row_count, partition))
+            if not keep:
+                cur.execute(f'DROP TABLE "{partition}"')
+    finally:
+        conn.autocommit = True
+    return row_count
+
+
+def planned_maintenance(conn):
+    """What maintain_partitions() would do now, without keeping any of it."""
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            # A preview should fail rather than queue behind the queue's traffic
+            cur.execute("SET LOCAL lock_timeout = '2s'")
+            cur.execute("SELECT * FROM maintain_partitions()")
+            return cur.fetchall()
+    finally:
+        conn.rollback()
+        conn.autocommit = True
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain and archive time partitions")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR,
+                        help=f"Where detached partitions are exported (default: {ARCHIVE_DIR})")
+    parser.add_argument("--keep", action="store_true",
+                        help="Keep detached tables after exporting them")
+    parser.add_argument("--skip-maintain", action="store_true",
+                        help="Only export pending partitions, do not call maintain_partitions()")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Show partitions that would be created, expired or archived, "
+                             "without changing anything")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    conn = get_conn("partition_maintenance")
+    started = time.monotonic()
+    failed = 0
+
+    try:
+        if args.dry_run and not args.skip_maintain:
+            for parent, partition, action in planned_maintenance(conn):
+                print(f"  {parent:<22} {partition:<36} {action} (dry run)")
+
+        with conn.cursor() as cur:
+            if not args.dry_run and not args.skip_maintain:
+                cur.execute("SELECT * FROM maintain_partitions()")
+                for parent, partition, action in cur.fetchall():
+                    print(f"  {parent:<22} {partition:<36} {action}")
+            pending = pending_archives(cur)
+
+        for partition, parent in pending:
+            if args.dry_run:
+                print(f"  would archive {partition} -> {args.archive_dir}/{parent}/{partition}.csv.gz")
+                continue
+            try:
+                rows = archive_partition(conn, partition, parent, args.archive_dir, args.keep)
+                print(f"✅ Archived {partition}: {rows} rows")
+            except Exception as e:
+                failed += 1
+                print(f"❌ {partition}: {e}", file=sys.stderr)
+
+        print(f"Archived: {0 if args.dry_run else len(pending) - failed}  Failed: {failed}  "
+              f"({(time.monotonic() - started) * 1000:.0f} ms, "
+              f"{datetime.now(timezone.utc):%Y-%m-%d %H:%M} UTC)")
+    finally:
+        conn.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Reference worker for message_queue.
+
+Runs N worker processes. Each one claims a batch with claim_messages(),
+handles the messages and finishes them with complete_messages(). Only rows
+enqueued with consumer 'worker' are claimed; the webhook path answers its own
+('inline') rows. The claim guarantees at most one in-flight message per
+conversation (tenant + phone), in arrival order, so any number of workers (or
+hosts) can drain the queue without two of them answering the same patient.
+
+A message whose handling fails goes back to the queue through
+retry_messages() and is claimed again after a backoff that doubles per
+attempt (--retry-backoff); after --max-attempts claims it is marked 'failed'.
+The conversation's later messages wait behind it, so order is kept.
+
+Handling is either a POST of the queued payload to an n8n webhook
+(--webhook) or simulated work (--work-ms), which is what the benchmark in
+scripts/bench/message_queue.py uses.
+
+Usage:
+    python scripts/ops/queue_worker.py --processes 4 --webhook http://localhost:5678/webhook/<path>
+    python scripts/ops/queue_worker.py --processes 8 --work-ms 50 --exit-when-idle
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+from db import get_conn
+
+CLAIM_SQL = "SELECT queue_id, tenant_id, phone, message_id, payload, attempts FROM claim_messages(%s, %s, %s::interval)"
+COMPLETE_SQL = "SELECT complete_messages(%s::uuid[], %s)"
+RETRY_SQL = "SELECT retried, failed FROM retry_messages(%s::uuid[], %s, %s::interval)"
+COLUMNS = ("queue_id", "tenant_id", "phone", "message_id", "payload", "attempts")
+
+
+def claim(cur, batch_size: int, worker_id: str, stale_after: str = "5 minutes") -> List[Dict]:
+    """Claim up to batch_size messages (one per conversation)."""
+    cur.execute(CLAIM_SQL, (batch_size, worker_id, stale_after))
+    return [dict(zip(COLUMNS, row)) for row in cur.fetchall()]
+
+
+def complete(cur, queue_ids: List[str], status: str = "completed") -> int:
+    """Mark claimed messages as completed or failed."""
+    if not queue_ids:
+        return 0
+    cur.execute(COMPLETE_SQL, (queue_ids, status))
+    return cur.fetchone()[0]
+
+
+def retry(cur, queue_ids: List[str], max_attempts: int = 5, backoff: str = "30 seconds") -> Tuple[int, int]:
+    """Requeue failed messages with backoff; returns (retried, failed)."""
+    if not queue_ids:
+        return 0, 0
+    cur.execute(RETRY_SQL, (queue_ids, max_attempts, backoff))
+    return cur.fetchone()
+
+
+def make_handler(webhook: str = None, work_ms: float = 0.0) -> Callable[[Dict], bool]:
+    """Build the per-message handler; returns True when the message was handled."""
+    if webhook:
+        import requests
+
+        session = requests.Session()
+
+        def post(message: Dict) -> bool:
+            try:
+                response = session.post(webhook, json=message["payload"], timeout=60)
+                return response.status_code < 400
+            except requests.RequestException as e:
+                print(f"❌ {message['queue_id']}: {e}", file=sys.stderr)
+                return False
+
+        return post
+
+    def simulate(message: Dict) -> bool:
+        if work_ms:
+            time.sleep(work_ms / 1000.0)
+        return True
+
+    return simulate
+
+
+def worker_loop(worker_id: str, args, stop: multiprocessing.Event = None) -> Dict[str, int]:
+    """Claim, handle and complete until stopped (or idle with --exit-when-idle)."""
+    handler = make_handler(args.webhook, args.work_ms)
+    conn = get_conn("queue_worker")
+    done = retried = failed = 0
+    try:
+        with conn.cursor() as cur:
+            while not (stop and stop.is_set()):
+                messages = claim(cur, args.batch, worker_id, args.stale_after)
+                if not messages:
+                    if args.exit_when_idle:
+                        break
+                    time.sleep(args.poll_interval)
+                    continue
+
+                ok, bad = [], []
+                for message in messages:
+                    (ok if handler(message) else bad).append(message["queue_id"])
+                complete(cur, ok, "completed")
+                requeued, gave_up = retry(cur, bad, args.max_attempts, args.retry_backoff)
+                done += len(ok)
+                retried += requeued
+                failed += gave_up
+    finally:
+        conn.close()
+    return {"worker_id": worker_id, "completed": done, "retried": retried, "failed": failed}
+
+
+def _run_worker(worker_id: str, args, stop, results):
+    try:
+        results.put(worker_loop(worker_id, args, stop))
+    except KeyboardInterrupt:
+        pass
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Drain message_queue with several worker processes")
+    parser.add_argument("--processes", type=int, default=4, help="Worker processes (default: 4)")
+    parser.add_argument("--batch", type=int, default=10, help="Messages claimed per round (default: 10)")
+    parser.add_argument("--webhook", help="POST each payload to this n8n webhook URL")
+    parser.add_argument("--work-ms", type=float, default=0.0, help="Simulated work per message when no --webhook")
+    parser.add_argument("--stale-after", default="5 minutes",
+                        help="Reclaim messages stuck in 'processing' this long (default: 5 minutes)")
+    parser.add_argument("--max-attempts", type=int, default=5,
+                        help="Claims before a failing message is marked 'failed' (default: 5)")
+    parser.add_argument("--retry-backoff", default="30 seconds",
+                        help="Wait before the first retry, doubled per attempt (default: 30 seconds)")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds to sleep when the queue is empty")
+    parser.add_argument("--exit-when-idle", action="store_true", help="Stop once the queue is drained")
+    parser.add_argument("--json", action="store_true", help="Print the per-worker summary as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    host = socket.gethostname()
+    processes = [
+        multiprocessing.Process(target=_run_worker, args=(f"{host}-{os.getpid()}-{i}", args, stop, results))
+        for i in range(args.processes)
+    ]
+
+    started = time.monotonic()
+    for p in processes:
+        p.start()
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for p in processes:
+            p.join()
+
+    elapsed = time.monotonic() - started
+    summary = []
+    for _ in processes:
+        try:
+            summary.append(results.get(timeout=1))
+        except queue.Empty:
+            break
+    total = sum(s["completed"] + s["failed"] for s in summary)
+    if args.json:
+        print(json.dumps({"elapsed_s": round(elapsed, 3), "workers": summary}, indent=2))
+    else:
+        for s in summary:
+            print(f"{s['worker_id']}: {s['completed']} completed, {s['retried']} retried, {s['failed']} failed")
+        print(f"Processed: {total} in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} msg/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Refresh Google Calendar access tokens ahead of expiry.
+
+The Google Calendar Client workflow reuses calendars.google_access_token until
+it is about to expire. This job keeps those tokens fresh so tool calls on the
+request path never wait on the OAuth token endpoint: every run leases the
+calendars whose token expires within --ahead seconds
+(claim_calendar_token_refreshes), refreshes them concurrently and stores the
+result with store_calendar_access_token, which also releases the lease.
+
+Leases are shared with the workflow, so the job and in-flight tool calls never
+refresh the same calendar twice.
+
+Usage:
+    python scripts/ops/refresh_calendar_tokens.py            # one pass (cron)
+    python scripts/ops/refresh_calendar_tokens.py --loop 60  # run forever
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from db import get_conn
+
+# Configuration
+TOKEN_URL = os.getenv("GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token")
+REFRESH_AHEAD_SECONDS = int(os.getenv("CALENDAR_TOKEN_REFRESH_AHEAD", "600"))
+REQUEST_TIMEOUT = 15
+
+
+def create_session(pool_size: int) -> requests.Session:
+    """Session with one keep-alive connection per worker."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def refresh_token(session: requests.Session, token_url: str,
+                  calendar: Dict) -> Tuple[Optional[str], int, Optional[str]]:
+    """Exchange a refresh token; returns (access_token, expires_in, error)."""
+    try:
+        response = session.post(
+            token_url,
+            data={
+                "grant_type": "refresh_token",
+                "client_id": calendar["google_client_id"],
+                "client_secret": calendar["google_client_secret"],
+                "refresh_token": calendar["google_refresh_token"],
+            },
+            timeout=REQUEST_TIMEOUT,
+        )
+        payload = response.json()
+    except (requests.RequestException, ValueError) as e:
+        return None, 0, f"Token refresh failed: {e}"
+
+    access_token = payload.get("access_token")
+    if not access_token:
+        error = payload.get("error_description") or payload.get("error") or f"HTTP {response.status_code}"
+        return None, 0, f"Google OAuth token refresh failed: {error}"
+    return access_token, int(payload.get("expires_in") or 0), None
+
+
+def run_once(conn, session: requests.Session, token_url: str, ahead: int,
+             batch_size: int, workers: int) -> Tuple[int, int]:
+    """Refresh every calendar due within `ahead` seconds; returns (ok, failed)."""
+    columns = ("calendar_id", "tenant_id", "google_client_id",
+               "google_client_secret", "google_refresh_token")
+    refreshed = failed = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute("SELECT * FROM claim_calendar_token_refreshes(%s, %s)",
+                            (ahead, batch_size))
+                calendars = [dict(zip(columns, row)) for row in cur.fetchall()]
+            if not calendars:
+                break
+
+            results = pool.map(lambda c: refresh_token(session, token_url, c), calendars)
+            with conn.cursor() as cur:
+                for calendar, (access_token, expires_in, error) in zip(calendars, results):
+                    cur.execute("SELECT * FROM store_calendar_access_token(%s, %s, %s, %s, %s)",
+                                (calendar["tenant_id"], calendar["calendar_id"],
+                                 access_token, expires_in, error))
+                    if error:
+                        failed += 1
+                        print(f"❌ {calendar['calendar_id']} (tenant {calendar['tenant_id']}): {error}",
+                              file=sys.stderr)
+                    else:
+                        refreshed += 1
+
+            # Failed calendars are released and would be claimed again at
+            # once; leave them for the next run.
+            if len(calendars) < batch_size or failed:
+                break
+
+    return refreshed, failed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Refresh Google Calendar access tokens ahead of expiry")
+    parser.add_argument("--ahead", type=int, default=REFRESH_AHEAD_SECONDS,
+                        help=f"Refresh tokens expiring within this many seconds (default: {REFRESH_AHEAD_SECONDS})")
+    parser.add_argument("--batch", type=int, default=50, help="Calendars leased per round (default: 50)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent token requests (default: 4)")
+    parser.add_argument("--loop", type=int, default=0, metavar="SECONDS",
+                        help="Repeat every SECONDS instead of running once")
+    parser.add_argument("--token-url", default=TOKEN_URL, help="OAuth token endpoint (default: Google)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    session = create_session(args.workers)
+    conn = get_conn("refresh_calendar_tokens")
+
+    try:
+        while True:
+            started = time.monotonic()
+            refreshed, failed = run_once(conn, session, args.token_url, args.ahead,
+                                         args.batch, args.workers)
+            if refreshed or failed or not args.loop:
+                print(f"Refreshed: {refreshed}  Failed: {failed}  "
+                      f"({(time.monotonic() - started) * 1000:.0f} ms)")
+            if not args.loop:
+                return 1 if failed else 0
+            time.sleep(args.loop)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,627 @@
+#!/usr/bin/env python3
+"""
+Webhook Load Generator
+Replays tests/sample-payloads against the WhatsApp webhook under load.
+
+Each request picks a scenario (a sample payload) from a weighted mix,
+rewrites it with a random patient phone, tenant instance and a fresh
+message id, and POSTs it. Load is driven either open-loop at a target rate
+(--rps; latency is measured from the scheduled send time, so a stalled
+server cannot hide queueing delay) or closed-loop with a fixed number of
+concurrent senders (--concurrency).
+
+The duplicate-message scenario re-sends the same message id right after the
+first send. The dedup hit rate is the share of those re-sends the system
+reported as duplicates (response "status": "duplicate", as the local stub
+does) or, with --verify-db, the share that did not create a second
+message_queue row.
+
+The report has HDR-style latency percentiles (log-bucketed histogram, <1%
+relative error), error rates and dedup hit rates, overall and per scenario.
+
+The `stub` command runs a local webhook stand-in (configurable latency,
+error rate, in-memory dedup) so the generator itself can be baselined
+offline; `run --stub` starts one in-process.
+
+Usage:
+    python tests/load-test.py run --url http://localhost:5678/webhook/whatsapp-main --rps 50 --duration 60
+    python tests/load-test.py run --stub --concurrency 32 --requests 5000 --json -
+    python tests/load-test.py run --url ... --mix greeting-simple=5,faq-cache-hit=3,duplicate-message=1
+    python tests/load-test.py stub --port 8099 --latency-ms 80 --jitter-ms 40
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import math
+import os
+import random
+import ssl
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+PAYLOADS_DIR = Path(__file__).parent / "sample-payloads"
+DUPLICATE_SCENARIO = "duplicate-message"
+DEFAULT_MIX = "greeting-simple=4,faq-cache-hit=3,faq-hours-query=2,scheduling-full-flow=2,duplicate-message=1"
+REPORT_PERCENTILES = (50.0, 75.0, 90.0, 95.0, 99.0, 99.9, 99.99)
+
+
+# ============================================================================
+# Latency histogram
+# ============================================================================
+
+class Histogram:
+    """Log-bucketed latency histogram (HdrHistogram-style, microseconds).
+
+    Values keep their top SUB_BUCKET_BITS significant bits, so every bucket
+    is within 1/2**(SUB_BUCKET_BITS-1) of the recorded value.
+    """
+
+    SUB_BUCKET_BITS = 8
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+        self.max_us = 0
+        self.sum_us = 0
+
+    def _bucket(self, value_us: int) -> int:
+        shift = max(0, value_us.bit_length() - self.SUB_BUCKET_BITS)
+        return (value_us >> shift) << shift
+
+    def record(self, seconds: float):
+        value_us = max(0, int(seconds * 1_000_000))
+        bucket = self._bucket(value_us)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+        self.sum_us += value_us
+        self.max_us = max(self.max_us, value_us)
+
+    def merge(self, other: "Histogram"):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.total += other.total
+        self.sum_us += other.sum_us
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, pct: float) -> float:
+        """Value (ms) at or below which pct percent of samples fall."""
+        if not self.total:
+            return 0.0
+        rank = max(1, math.ceil(pct / 100.0 * self.total))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                # Highest value equivalent to the bucket, as HdrHistogram reports
+                shift = max(0, bucket.bit_length() - self.SUB_BUCKET_BITS)
+                return min(bucket + (1 << shift) - 1, self.max_us) / 1000.0
+        return self.max_us / 1000.0
+
+    def summary(self) -> Dict[str, float]:
+        result = {
+            "count": self.total,
+            "mean_ms": round(self.sum_us / self.total / 1000.0, 3) if self.total else 0.0,
+        }
+        for pct in REPORT_PERCENTILES:
+            result[f"p{pct:g}_ms"] = round(self.percentile(pct), 3)
+        result["max_ms"] = round(self.max_us / 1000.0, 3)
+        return result
+
+    def spectrum(self) -> List[Dict[str, float]]:
+        """Percentile distribution at halving tail steps (50, 75, 87.5, ...)."""
+        points, pct = [], 0.0
+        while self.total and pct < 99.999:
+            points.append({"percentile": round(pct, 4), "value_ms": round(self.percentile(pct), 3)})
+            pct = 100.0 - (100.0 - pct) / 2.0
+        points.append({"percentile": 100.0, "value_ms": round(self.max_us / 1000.0, 3)})
+        return points
+
+
+# ============================================================================
+# Scenarios
+# ============================================================================
+
+def load_scenarios(mix: str) -> List[Tuple[str, float, dict]]:
+    """Parse 'name=weight,...' (or 'all') into (name, weight, payload)."""
+    available = {p.stem: p for p in sorted(PAYLOADS_DIR.glob("*.json"))}
+    if mix == "all":
+        wanted = [(name, 1.0) for name in available]
+    else:
+        wanted = []
+        for part in filter(None, (p.strip() for p in mix.split(","))):
+            name, _, weight = part.partition("=")
+            wanted.append((name, float(weight or 1)))
+
+    scenarios = []
+    for name, weight in wanted:
+        if name not in available:
+            raise SystemExit(f"ERROR: unknown scenario '{name}' (available: {', '.join(available)})")
+        if weight > 0:
+            with open(available[name], encoding="utf-8") as f:
+                scenarios.append((name, weight, json.load(f)))
+    if not scenarios:
+        raise SystemExit("ERROR: empty scenario mix")
+    return scenarios
+
+
+def render_payload(template: dict, instance: Optional[str], phone: str, message_id: str) -> dict:
+    """Copy a sample payload with the given sender, tenant and message id."""
+    payload = copy.deepcopy(template)
+    payload.pop("description", None)
+    root = payload.get("body", payload)
+    if instance:
+        root["instance"] = instance
+    key = root.setdefault("data", {}).setdefault("key", {})
+    key["remoteJid"] = f"{phone}@s.whatsapp.net"
+    key["id"] = message_id
+    return payload
+
+
+def random_phone(rng: random.Random) -> str:
+    return f"55{rng.randint(11, 99)}9{rng.randint(0, 99_999_999):08d}"
+
+
+# ============================================================================
+# HTTP client (asyncio streams, keep-alive pool)
+# ============================================================================
+
+class HttpClient:
+    """Minimal HTTP/1.1 JSON POST client with a bounded keep-alive pool."""
+
+    def __init__(self, url: str, pool_size: int, timeout: float):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.ssl = ssl.create_default_context() if parts.scheme == "https" else None
+        self.timeout = timeout
+        self.idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self.slots = asyncio.Semaphore(pool_size)
+
+    async def post(self, payload: dict) -> Tuple[int, bytes]:
+        body = json.dumps(payload).encode()
+        request = (
+            f"POST {self.path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: keep-alive\r\n\r\n"
+        ).encode() + body
+
+        async with self.slots:
+            # A pooled connection may have been closed by the server; retry once fresh
+            for attempt in range(2):
+                reused = bool(self.idle)
+                conn = self.idle.pop() if reused else await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout)
+                try:
+                    status, data, keep = await asyncio.wait_for(self._exchange(conn, request), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    conn[1].close()
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                except BaseException:
+                    conn[1].close()
+                    raise
+                if keep:
+                    self.idle.append(conn)
+                else:
+                    conn[1].close()
+                return status, data
+        raise ConnectionError("unreachable")
+
+    @staticmethod
+    async def _exchange(conn, request: bytes) -> Tuple[int, bytes, bool]:
+        reader, writer = conn
+        writer.write(request)
+        await writer.drain()
+        head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        status = int(head[0].split(" ", 2)[1])
+        headers = {}
+        for line in head[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip().lower()
+
+        if headers.get("transfer-encoding") == "chunked":
+            data = b""
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if not size:
+                    break
+                data += chunk[:-2]
+        elif "content-length" in headers:
+            data = await reader.readexactly(int(headers["content-length"]))
+        else:
+            return status, await reader.read(), False
+        return status, data, headers.get("connection") != "close"
+
+    async def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        await asyncio.gather(*(w.wait_closed() for _, w in self.idle), return_exceptions=True)
+        self.idle.clear()
+
+
+# ============================================================================
+# Load generator
+# ============================================================================
+
+class Stats:
+    """Per-scenario counters and histograms."""
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.service = Histogram()
+        self.requests = 0
+        self.errors = 0
+        self.by_status: Dict[str, int] = {}
+        self.duplicate_sends = 0
+        self.duplicates_detected = 0
+
+
+class LoadGenerator:
+    def __init__(self, args, scenarios):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.names = [s[0] for s in scenarios]
+        self.weights = [s[1] for s in scenarios]
+        self.templates = {s[0]: s[2] for s in scenarios}
+        self.instances = [i for i in (args.instances or "").split(",") if i] or [None]
+        self.phones = [random_phone(self.rng) for _ in range(args.phones)]
+        self.run_id = uuid.uuid4().hex[:8]
+        self.sequence = 0
+        self.stats: Dict[str, Stats] = {name: Stats() for name in self.names}
+        self.sent_ids: Dict[str, int] = {}
+        self.measure_from = 0.0
+        self.client: Optional[HttpClient] = None
+
+    def next_request(self) -> Tuple[str, dict, str]:
+        name = self.rng.choices(self.names, self.weights)[0]
+        self.sequence += 1
+        message_id = f"load-{self.run_id}-{self.sequence}"
+        payload = render_payload(self.templates[name], self.rng.choice(self.instances),
+                                 self.rng.choice(self.phones), message_id)
+        return name, payload, message_id
+
+    async def send(self, name: str, payload: dict, message_id: str, scheduled: float):
+        stats = self.stats[name]
+        measured = scheduled >= self.measure_from
+        sends = 2 if name == DUPLICATE_SCENARIO else 1
+        for n in range(sends):
+            started = time.perf_counter()
+            try:
+                status, body = await self.client.post(payload)
+                outcome = str(status)
+                ok = status < 400
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                body, outcome, ok = b"", type(e).__name__, False
+            finished = time.perf_counter()
+            if not measured:
+                continue
+
+            stats.requests += 1
+            stats.by_status[outcome] = stats.by_status.get(outcome, 0) + 1
+            stats.errors += int(not ok)
+            # Only the first send is measured from its schedule; the re-send follows it
+            stats.latency.record(finished - (scheduled if n == 0 else started))
+            stats.service.record(finished - started)
+            self.sent_ids[message_id] = self.sent_ids.get(message_id, 0) + 1
+            if n == 1:
+                stats.duplicate_sends += 1
+                stats.duplicates_detected += int(ok and _is_duplicate(body))
+
+    async def run(self) -> float:
+        args = self.args
+        self.client = HttpClient(args.url, args.connections, args.timeout)
+        start = time.perf_counter()
+        self.measure_from = start + args.warmup
+        deadline = start + args.warmup + args.duration if args.duration else None
+        try:
+            if args.rps:
+                await self._open_loop(start, deadline)
+            else:
+                await self._closed_loop(deadline)
+        finally:
+            await self.client.close()
+        return time.perf_counter() - self.measure_from
+
+    def _budget_left(self, deadline: Optional[float]) -> bool:
+        if deadline is not None:
+            return time.perf_counter() < deadline
+        return self.sequence < self.args.requests
+
+    async def _open_loop(self, start: float, deadline: Optional[float]):
+        interval = 1.0 / self.args.rps
+        pending = set()
+        i = 0
+        while self._budget_left(deadline):
+            scheduled = start + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.ensure_future(self.send(*self.next_request(), scheduled))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            i += 1
+        if pending:
+            await asyncio.gather(*pending)
+
+    async def _closed_loop(self, deadline: Optional[float]):
+        async def sender():
+            while self._budget_left(deadline):
+                await self.send(*self.next_request(), time.perf_counter())
+
+        await asyncio.gather(*(sender() for _ in range(self.args.concurrency)))
+
+    def report(self, elapsed: float, db: Optional[Dict] = None) -> Dict:
+        total = Stats()
+        scenarios = {}
+        for name, s in self.stats.items():
+            total.latency.merge(s.latency)
+            total.service.merge(s.service)
+            total.requests += s.requests
+            total.errors += s.errors
+            total.duplicate_sends += s.duplicate_sends
+            total.duplicates_detected += s.duplicates_detected
+            for k, v in s.by_status.items():
+                total.by_status[k] = total.by_status.get(k, 0) + v
+            if s.requests:
+                scenarios[name] = _stats_dict(s)
+
+        report = {
+            "target": self.args.url,
+            "mode": f"rps={self.args.rps:g}" if self.args.rps else f"concurrency={self.args.concurrency}",
+            "run_id": self.run_id,
+            "elapsed_s": round(elapsed, 3),
+            "achieved_rps": round(total.requests / elapsed, 1) if elapsed else 0.0,
+            **_stats_dict(total),
+            "latency_spectrum": total.latency.spectrum(),
+            "scenarios": scenarios,
+        }
+        if db is not None:
+            report["dedup"].update(db)
+        return report
+
+
+def _is_duplicate(body: bytes) -> bool:
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError:
+        return False
+    if isinstance(data, list):
+        data = data[0] if data else {}
+    return isinstance(data, dict) and data.get("status") == "duplicate"
+
+
+def _stats_dict(s: Stats) -> Dict:
+    return {
+        "requests": s.requests,
+        "errors": s.errors,
+        "error_rate": round(s.errors / s.requests, 4) if s.requests else 0.0,
+        "by_status": dict(sorted(s.by_status.items())),
+        "latency": s.latency.summary(),
+        "service_time": s.service.summary(),
+        "dedup": {
+            "duplicate_sends": s.duplicate_sends,
+            "detected": s.duplicates_detected,
+            "hit_rate": round(s.duplicates_detected / s.duplicate_sends, 4) if s.duplicate_sends else None,
+        },
+    }
+
+
+def verify_dedup(run_id: str, sent_ids: Dict[str, int]) -> Dict:
+    """Check message_queue: every id sent twice must have exactly one row."""
+    try:
+        import psycopg2
+    except ImportError:
+        print("ERROR: psycopg2 not installed. Run: pip install psycopg2-binary", file=sys.stderr)
+        sys.exit(1)
+
+    conn = psycopg2.connect(
+        host=os.getenv("PGHOST", "localhost"),
+        port=os.getenv("PGPORT", "5432"),
+        dbname=os.getenv("PGDATABASE", os.getenv("POSTGRES_DB", "n8n_clinic_db")),
+        user=os.getenv("PGUSER", os.getenv("POSTGRES_USER", "n8n_clinic")),
+        password=os.getenv("PGPASSWORD", os.getenv("POSTGRES_PASSWORD", "")),
+        connect_timeout=5,
+    )
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT message_id, COUNT(*) FROM message_queue WHERE message_id LIKE %s GROUP BY message_id",
+                (f"load-{run_id}-%",),
+            )
+            stored = dict(cur.fetchall())
+    finally:
+        conn.close()
+
+    resent = [mid for mid, n in sent_ids.items() if n > 1]
+    deduped = sum(1 for mid in resent if stored.get(mid) == 1)
+    return {
+        "db_messages_sent": len(sent_ids),
+        "db_messages_stored": len(stored),
+        "db_hit_rate": round(deduped / len(resent), 4) if resent else None,
+    }
+
+
+def print_report(report: Dict):
+    pcts = ("p50", "p90", "p99", "p99.9")
+    print(f"Target: {report['target']}  ({report['mode']})", file=sys.stderr)
+    print(f"{'Scenario':<24} {'req':>7} {'err%':>6} " + " ".join(f"{p:>9}" for p in pcts)
+          + f" {'max':>9} {'dedup':>6}", file=sys.stderr)
+    print("─" * 96, file=sys.stderr)
+    rows = list(report["scenarios"].items()) + [("TOTAL", report)]
+    for name, r in rows:
+        lat = r["latency"]
+        hit = r["dedup"]["hit_rate"]
+        print(f"{name:<24} {r['requests']:>7} {r['error_rate'] * 100:>6.2f} "
+              + " ".join(f"{lat[p + '_ms']:>9.1f}" for p in pcts)
+              + f" {lat['max_ms']:>9.1f} {'-' if hit is None else f'{hit:.0%}':>6}", file=sys.stderr)
+    print(f"(milliseconds) {report['requests']} requests in {report['elapsed_s']}s "
+          f"= {report['achieved_rps']} req/s", file=sys.stderr)
+
+
+# ============================================================================
+# Local webhook stub
+# ============================================================================
+
+class WebhookStub:
+    """Stand-in for the n8n webhook: fixed latency + jitter, errors, dedup."""
+
+    def __init__(self, latency_ms: float, jitter_ms: float, error_rate: float, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.seen = set()
+        self.handled = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+                    break
+                length = 0
+                for line in head[1:]:
+                    name, _, value = line.partition(":")
+                    if name.strip().lower() == "content-length":
+                        length = int(value)
+                body = await reader.readexactly(length) if length else b""
+
+                status, response = await self.respond(body)
+                data = json.dumps(response).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def respond(self, body: bytes) -> Tuple[int, dict]:
+        delay = self.latency_ms + self.rng.uniform(0, self.jitter_ms)
+        await asyncio.sleep(delay / 1000.0)
+        self.handled += 1
+        if self.rng.random() < self.error_rate:
+            return 500, {"status": "error"}
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return 400, {"status": "invalid"}
+        root = payload.get("body", payload)
+        key = (root.get("instance"), (root.get("data") or {}).get("key", {}).get("id"))
+        if key in self.seen:
+            return 200, {"status": "duplicate"}
+        self.seen.add(key)
+        return 200, {"status": "queued"}
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle, host, port)
+
+
+# ============================================================================
+# Main
+# ============================================================================
+
+async def run_command(args) -> int:
+    scenarios = load_scenarios(args.mix)
+    server = None
+    if args.stub:
+        stub = WebhookStub(args.stub_latency_ms, args.stub_jitter_ms, args.stub_error_rate, args.seed)
+        server = await stub.start("127.0.0.1", 0)
+        args.url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/webhook/whatsapp-main"
+    elif not args.url:
+        print("ERROR: --url or --stub is required", file=sys.stderr)
+        return 2
+
+    generator = LoadGenerator(args, scenarios)
+    try:
+        elapsed = await generator.run()
+    finally:
+        if server:
+            server.close()
+            await server.wait_closed()
+
+    db = verify_dedup(generator.run_id, generator.sent_ids) if args.verify_db else None
+    report = generator.report(elapsed, db)
+    print_report(report)
+    if args.json:
+        text = json.dumps(report, indent=2)
+        if args.json == "-":
+            print(text)
+        else:
+            with open(args.json, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+
+    if args.max_error_rate is not None and report["error_rate"] > args.max_error_rate:
+        return 1
+    return 0
+
+
+async def stub_command(args) -> int:
+    stub = WebhookStub(args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    server = await stub.start(args.host, args.port)
+    print(f"Webhook stub listening on http://{args.host}:{args.port}/ "
+          f"(latency {args.latency_ms:g}+{args.jitter_ms:g} ms, error rate {args.error_rate:g})",
+          file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the WhatsApp webhook with sample payloads")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Generate load and report latency")
+    run.add_argument("--url", default=os.getenv("WEBHOOK_URL"), help="Webhook URL (default: $WEBHOOK_URL)")
+    run.add_argument("--stub", action="store_true", help="Target an in-process webhook stub")
+    run.add_argument("--mix", default=DEFAULT_MIX,
+                     help="Weighted scenarios 'name=weight,...' or 'all' (default: %(default)s)")
+    load = run.add_mutually_exclusive_group()
+    load.add_argument("--rps", type=float, help="Open-loop target request rate")
+    load.add_argument("--concurrency", type=int, default=8, help="Closed-loop concurrent senders (default: 8)")
+    run.add_argument("--duration", type=float, help="Seconds to run after warmup (default: use --requests)")
+    run.add_argument("--requests", type=int, default=1000, help="Scenarios to send when no --duration")
+    run.add_argument("--warmup", type=float, default=0.0, help="Seconds of load excluded from the report")
+    run.add_argument("--instances", help="Comma-separated tenant instances (default: keep the payload's)")
+    run.add_argument("--phones", type=int, default=1000, help="Distinct random patient phones (default: 1000)")
+    run.add_argument("--connections", type=int, default=64, help="Keep-alive connection pool size (default: 64)")
+    run.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    run.add_argument("--seed", type=int, help="Random seed for reproducible mixes")
+    run.add_argument("--verify-db", action="store_true", help="Check dedup in message_queue (PG* env vars)")
+    run.add_argument("--json", metavar="PATH", help="Write the report as JSON ('-' for stdout)")
+    run.add_argument("--max-error-rate", type=float, help="Exit 1 when the error rate exceeds this (0-1)")
+    run.add_argument("--stub-latency-ms", type=float, default=50.0, help="In-process stub base latency")
+    run.add_argument("--stub-jitter-ms", type=float, default=25.0, help="In-process stub extra random latency")
+    run.add_argument("--stub-error-rate", type=float, default=0.0, help="In-process stub HTTP 500 rate (0-1)")
+
+    stub = sub.add_parser("stub", help="Run a local webhook stub")
+    stub.add_argument("--host", default="127.0.0.1")
+    stub.add_argument("--port", type=int, default=8099)
+    stub.add_argument("--latency-ms", type=float, default=50.0, help="Base response latency")
+    stub.add_argument("--jitter-ms", type=float, default=25.0, help="Extra uniform random latency")
+    stub.add_argument("--error-rate", type=float, default=0.0, help="Share of HTTP 500 responses (0-1)")
+    stub.add_argument("--seed", type=int)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        return asyncio.run(run_command(args) if args.command == "run" else stub_command(args))
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Unit tests for workflows/tools/calendar/google-calendar-availability-tool.json
+
+Runs the tool's Code nodes under Node.js with $input and $() stubbed the way
+n8n passes items, and checks the FreeBusy fan-out: more than 50 calendars are
+split into requests of at most 50, every chunk goes to the Google Calendar
+Client (one call per item), and the busy periods of all chunks reach the
+availability engine. Skipped when node is not installed.
+
+Usage:
+    python tests/test-availability-tool.py [-v]
+"""
+
+import json
+import shutil
+import subprocess
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+WORKFLOW = (Path(__file__).parent.parent / "workflows" / "tools" / "calendar"
+            / "google-calendar-availability-tool.json")
+
+# Runs one Code node ("Run Once for All Items") and prints its output items
+HARNESS = r"""
+const { code, input, nodes } = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+const items = list => list.map(json => ({ json }));
+const $input = { all: () => items(input), first: () => ({ json: input[0] }) };
+const $ = name => ({ all: () => items(nodes[name]), first: () => ({ json: nodes[name][0] }) });
+const out = new Function('$input', '$', code)($input, $);
+const list = Array.isArray(out) ? out : [out];
+console.log(JSON.stringify(list.map(i => (i && i.json) ? i.json : i)));
+"""
+
+with open(WORKFLOW, encoding="utf-8") as f:
+    workflow = json.load(f)
+
+
+def node(name):
+    return next(n for n in workflow["nodes"] if n["name"] == name)
+
+
+def run_code(name, input_items, nodes=None):
+    """Output items of the Code node `name` for the given input items."""
+    payload = {"code": node(name)["parameters"]["jsCode"], "input": input_items, "nodes": nodes or {}}
+    result = subprocess.run(["node", "-e", HARNESS], input=json.dumps(payload),
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def professional_rows(count):
+    """get_availability_context() rows: one professional and calendar each."""
+    return [{
+        "professional_id": f"prof-{i:03d}",
+        "professional_name": f"Dr. {i:03d}",
+        "display_order": i,
+        "google_calendar_id": f"cal-{i:03d}@group.calendar.google.com",
+        "timezone": "UTC",
+        "duration_minutes": 30,
+        "slot_interval_minutes": 30,
+        "working_hours_start": "08:00",
+        "working_hours_end": "18:00",
+        "working_days": ["0", "1", "2", "3", "4", "5", "6"],
+    } for i in range(count)]
+
+
+@unittest.skipUnless(shutil.which("node"), "node is not installed")
+class FreeBusyChunkTests(unittest.TestCase):
+    def setUp(self):
+        day = (datetime.now(timezone.utc) + timedelta(days=2)).date()
+        self.start = f"{day}T00:00:00Z"
+        self.end = f"{day}T23:59:00Z"
+        self.params = {"tenant_id": "tenant-1", "service_id": "service-1", "start_time": self.start,
+                       "end_time": self.end, "max_results": 500, "timezone": "UTC"}
+
+    def build(self, count):
+        return run_code("Build FreeBusy Request", professional_rows(count),
+                        {"Extract Parameters": [self.params]})
+
+    def test_more_than_50_calendars_are_split(self):
+        requests = self.build(120)
+        self.assertEqual([r["_calendar_count"] for r in requests], [50, 50, 20])
+        ids = [item["id"] for r in requests for item in r["body"]["items"]]
+        self.assertEqual(len(ids), 120)
+        self.assertEqual(len(set(ids)), 120)
+
+    def test_client_is_called_once_per_chunk(self):
+        self.assertEqual(node("Call Google Calendar Client")["parameters"].get("mode"), "each")
+
+    def test_busy_periods_of_every_chunk_are_used(self):
+        requests = self.build(120)
+        busy = [{"start": self.start, "end": self.end}]
+        # One FreeBusy response per chunk, as the client returns for each item
+        responses = [{"kind": "calendar#freeBusy",
+                      "calendars": {item["id"]: {"busy": busy} for item in r["body"]["items"]}}
+                     for r in requests]
+        # Only the last calendar is free, and it is in the last chunk
+        del responses[-1]["calendars"]["cal-119@group.calendar.google.com"]["busy"]
+
+        result = run_code("Process Availability", responses, {"Build FreeBusy Request": requests})[0]
+        by_id = {p["professional_id"]: p for p in result["professionals"]}
+        self.assertEqual(len(by_id), 120)
+        self.assertNotIn("error", by_id["prof-000"])
+        self.assertNotIn("error", by_id["prof-075"])
+        self.assertEqual(by_id["prof-075"]["available_count"], 0)
+        self.assertGreater(by_id["prof-119"]["available_count"], 0)
+        self.assertEqual({s["professional_id"] for s in result["available_slots"]}, {"prof-119"})
+
+    def test_failed_chunk_is_reported_per_professional(self):
+        requests = self.build(120)
+        responses = [{"calendars": {item["id"]: {"busy": []} for item in r["body"]["items"]}}
+                     for r in requests[:2]]
+        responses.append({"success": False, "error": "Google API call failed"})
+
+        result = run_code("Process Availability", responses, {"Build FreeBusy Request": requests})[0]
+        by_id = {p["professional_id"]: p for p in result["professionals"]}
+        self.assertGreater(by_id["prof-099"]["available_count"], 0)
+        self.assertEqual(by_id["prof-100"]["error"], "Agenda indisponível no Google Calendar")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the import command of scripts/cli/cli.py
+
+Record parsing (read_records, parse_services, normalize_*) is tested on its
+own. The import itself runs against a database with
+scripts/db/schema/schema.sql and the seeds loaded, reached through the same
+PG* variables as the CLI: a clean import, a batch where one record is
+rejected by the database while the rest commit, and the failure report.
+Those tests are skipped unless PGDATABASE is set; the rows they commit are
+deleted afterwards.
+
+Usage:
+    PGHOST=localhost PGDATABASE=n8n_clinic_db python tests/test-cli-import.py [-v]
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import unittest
+import uuid
+from pathlib import Path
+
+SCRIPT = Path(__file__).parent.parent / "scripts" / "cli" / "cli.py"
+
+spec = importlib.util.spec_from_file_location("clinic_cli", SCRIPT)
+cli = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(cli)
+
+SERVICE_CODE = "CLEANING_DENTAL"
+
+
+def write_file(directory, name, lines):
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write((line if isinstance(line, str) else json.dumps(line, ensure_ascii=False)) + "\n")
+    return path
+
+
+class RecordTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_invalid_json_line_is_kept_as_an_error(self):
+        path = write_file(self.tmp.name, "t.jsonl", [{"name": "A"}, "", "{broken"])
+        records = list(cli.read_records(path, "jsonl"))
+        self.assertEqual([line_no for line_no, _ in records], [1, 3])
+        self.assertIn("__error__", records[1][1])
+
+    def test_csv_services_column(self):
+        self.assertEqual(cli.parse_services("A:30:5000; B ;"), [
+            {"code": "A", "duration": "30", "price_cents": "5000"},
+            {"code": "B", "duration": None, "price_cents": None},
+        ])
+
+    def test_tenant_defaults(self):
+        row = dict(zip(cli.TENANT_COLUMNS, cli.normalize_tenant(7, {"name": "Clínica Sol"})))
+        self.assertEqual(row["line_no"], 7)
+        self.assertEqual(row["evolution_instance_name"], "clínica_sol_instance")
+        self.assertEqual(row["clinic_type"], "mixed")
+        self.assertIsNone(row["apikey"])
+
+    def test_professional_service_listed_twice_is_rejected(self):
+        record = {"name": "Dr. A", "clinic": "X", "services": [{"code": "A"}, {"code": "A"}]}
+        with self.assertRaisesRegex(cli.RecordError, "listed twice"):
+            cli.normalize_professional(1, record)
+
+    def test_out_of_range_slot_is_rejected(self):
+        with self.assertRaisesRegex(cli.RecordError, "between 5 and 120"):
+            cli.normalize_professional(1, {"name": "Dr. A", "clinic": "X", "slot_minutes": "3"})
+
+
+@unittest.skipUnless(os.getenv("PGDATABASE"), "PGDATABASE not set")
+class ImportTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # Unique names, so reruns and existing tenants do not collide
+        self.prefix = f"Import Test {uuid.uuid4().hex[:8]}"
+        self.conn = cli.get_conn()
+        self.addCleanup(self.conn.close)
+        self.addCleanup(self.delete_imported)
+
+    def delete_imported(self):
+        with self.conn, self.conn.cursor() as cur:
+            cur.execute("DELETE FROM tenant_config WHERE tenant_name LIKE %s", (self.prefix + "%",))
+
+    def tenant(self, suffix, **fields):
+        return {"name": f"{self.prefix} {suffix}", **fields}
+
+    def run_import(self, lines, dry_run=False):
+        """Run cmd_import; returns (exit code, stdout, stderr)."""
+        args = argparse.Namespace(file=write_file(self.tmp.name, "import.jsonl", lines),
+                                  format=None, dry_run=dry_run)
+        out, err = io.StringIO(), io.StringIO()
+        code = 0
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            try:
+                cli.cmd_import(args)
+            except SystemExit as e:
+                code = e.code
+        return code, out.getvalue(), err.getvalue()
+
+    def imported_tenants(self):
+        with self.conn, self.conn.cursor() as cur:
+            cur.execute("SELECT tenant_name FROM tenant_config WHERE tenant_name LIKE %s ORDER BY 1",
+                        (self.prefix + "%",))
+            return [name for (name,) in cur.fetchall()]
+
+    def test_clean_import(self):
+        code, out, err = self.run_import([
+            self.tenant("A", apikey="key-a"),
+            self.tenant("B"),
+            {"name": "Dr. Test", "clinic": f"{self.prefix} A",
+             "services": [{"code": SERVICE_CODE, "duration": 45}]},
+        ])
+        self.assertEqual((code, err), (0, ""))
+        self.assertIn("Imported 2 tenants (1 API keys), 1 professionals, 1 professional services", out)
+        self.assertEqual(self.imported_tenants(), [f"{self.prefix} A", f"{self.prefix} B"])
+        with self.conn, self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT ps.custom_duration_minutes
+                FROM professionals p
+                JOIN tenant_config t ON t.tenant_id = p.tenant_id
+                JOIN professional_services ps ON ps.professional_id = p.professional_id
+                WHERE t.tenant_name = %s
+            """, (f"{self.prefix} A",))
+            self.assertEqual(cur.fetchall(), [(45,)])
+
+    def test_bad_record_is_reported_and_the_rest_committed(self):
+        # The database rejects line 2 (whatsapp_number is VARCHAR(20)), so the
+        # batch insert fails and the import falls back to one row at a time
+        code, out, err = self.run_import([
+            self.tenant("A"),
+            self.tenant("B", whatsapp="5511" * 10),
+            self.tenant("C"),
+        ])
+        self.assertEqual(code, 1)
+        self.assertIn("Imported 2 tenants", out)
+        self.assertEqual(self.imported_tenants(), [f"{self.prefix} A", f"{self.prefix} C"])
+        self.assertIn("❌ 1 of 3 records failed:", err)
+        self.assertIn("   line 2: value too long", err)
+
+    def test_failure_report(self):
+        code, out, err = self.run_import([
+            self.tenant("A"),
+            "{broken",
+            {"kind": "tenant"},
+            self.tenant("A"),
+            {"name": "Dr. Test", "clinic": f"{self.prefix} Missing"},
+            {"name": "Dr. Test", "clinic": f"{self.prefix} A", "services": "NO_SUCH_CODE"},
+        ], dry_run=True)
+        self.assertEqual(code, 1)
+        self.assertIn("Would import 1 tenants (0 API keys), 0 professionals", out)
+        self.assertEqual(err.splitlines(), [
+            "❌ 5 of 6 records failed:",
+            "   line 2: Invalid JSON: Expecting property name enclosed in double quotes",
+            "   line 3: 'name' is required",
+            "   line 4: Duplicate tenant name, instance or slug earlier in the file.",
+            f"   line 5: Clinic '{self.prefix} Missing' not found.",
+            "   line 6: Unknown service code(s): NO_SUCH_CODE",
+        ])
+        # A dry run commits nothing
+        self.assertEqual(self.imported_tenants(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Unit tests for scripts/import-workflows.py
+
+Covers what decides a deploy without a running n8n: workflow_hash() (which
+edits count as a change), plan_deploy() (push, skip or reject each file) and
+fetch_remote_workflows() (pagination, and no partial list on a failed page).
+HTTP calls go to a scripted session object.
+
+Usage:
+    python tests/test-import-workflows.py [-v]
+"""
+
+import copy
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+SCRIPT = Path(__file__).parent.parent / "scripts" / "import-workflows.py"
+
+spec = importlib.util.spec_from_file_location("import_workflows", SCRIPT)
+import_workflows = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(import_workflows)
+
+WORKFLOW = {
+    "name": "01 - WhatsApp Main Handler",
+    "nodes": [
+        {"id": "webhook", "name": "Webhook", "type": "n8n-nodes-base.webhook",
+         "typeVersion": 2, "position": [0, 0], "parameters": {"path": "whatsapp-main"}},
+    ],
+    "connections": {},
+    "settings": {"executionOrder": "v1"},
+}
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body or {}
+        self.text = json.dumps(self._body)
+
+    def json(self):
+        return self._body
+
+
+class FakeSession:
+    """Returns the scripted responses in order and records the query params."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        self.calls.append(dict(params or {}))
+        return self.responses.pop(0)
+
+
+def remote_wf(workflow_id, data):
+    """A workflow as the n8n API lists it: the file plus n8n-managed fields."""
+    wf = copy.deepcopy(data)
+    wf.update({"id": workflow_id, "versionId": "v-" + workflow_id, "active": True,
+               "tags": [], "updatedAt": "2026-01-01T00:00:00.000Z"})
+    return wf
+
+
+class WorkflowHashTests(unittest.TestCase):
+    def test_ignores_fields_managed_by_n8n(self):
+        self.assertEqual(import_workflows.workflow_hash(WORKFLOW),
+                         import_workflows.workflow_hash(remote_wf("abc", WORKFLOW)))
+
+    def test_ignores_key_order_and_formatting(self):
+        reordered = json.loads(json.dumps(WORKFLOW, indent=4, sort_keys=True))
+        reordered = dict(reversed(list(reordered.items())))
+        self.assertEqual(import_workflows.workflow_hash(WORKFLOW),
+                         import_workflows.workflow_hash(reordered))
+
+    def test_node_change_changes_hash(self):
+        changed = copy.deepcopy(WORKFLOW)
+        changed["nodes"][0]["parameters"]["path"] = "whatsapp-other"
+        self.assertNotEqual(import_workflows.workflow_hash(WORKFLOW),
+                            import_workflows.workflow_hash(changed))
+
+    def test_settings_change_changes_hash(self):
+        changed = copy.deepcopy(WORKFLOW)
+        changed["settings"]["errorWorkflow"] = "{{ERROR_WORKFLOW_ID}}"
+        self.assertNotEqual(import_workflows.workflow_hash(WORKFLOW),
+                            import_workflows.workflow_hash(changed))
+
+
+class PlanDeployTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(data if isinstance(data, str) else json.dumps(data))
+        return path
+
+    def test_unchanged_workflow_is_skipped(self):
+        path = self.write("01.json", WORKFLOW)
+        remote = {WORKFLOW["name"]: {"id": "abc", "hash": import_workflows.workflow_hash(WORKFLOW)}}
+        to_push, unchanged, invalid = import_workflows.plan_deploy([path], remote)
+        self.assertEqual((to_push, unchanged, invalid), ([], [path], []))
+
+    def test_changed_workflow_updates_remote_id(self):
+        changed = copy.deepcopy(WORKFLOW)
+        changed["nodes"][0]["position"] = [200, 0]
+        path = self.write("01.json", changed)
+        remote = {WORKFLOW["name"]: {"id": "abc", "hash": import_workflows.workflow_hash(WORKFLOW)}}
+        to_push, unchanged, invalid = import_workflows.plan_deploy([path], remote)
+        self.assertEqual(to_push, [(path, changed, "abc")])
+        self.assertEqual((unchanged, invalid), ([], []))
+
+    def test_new_workflow_is_created(self):
+        path = self.write("01.json", WORKFLOW)
+        to_push, unchanged, invalid = import_workflows.plan_deploy([path], {})
+        self.assertEqual(to_push, [(path, WORKFLOW, None)])
+
+    def test_force_pushes_unchanged_workflow(self):
+        path = self.write("01.json", WORKFLOW)
+        remote = {WORKFLOW["name"]: {"id": "abc", "hash": import_workflows.workflow_hash(WORKFLOW)}}
+        to_push, unchanged, _ = import_workflows.plan_deploy([path], remote, force=True)
+        self.assertEqual(to_push, [(path, WORKFLOW, "abc")])
+        self.assertEqual(unchanged, [])
+
+    def test_unnamed_workflow_matches_by_file_stem(self):
+        unnamed = {k: v for k, v in WORKFLOW.items() if k != "name"}
+        path = self.write("helper.json", unnamed)
+        remote = {"helper": {"id": "h1", "hash": "stale"}}
+        to_push, _, _ = import_workflows.plan_deploy([path], remote)
+        self.assertEqual(to_push[0][2], "h1")
+
+    def test_invalid_json_is_reported(self):
+        path = self.write("broken.json", "{not json")
+        to_push, unchanged, invalid = import_workflows.plan_deploy([path], {})
+        self.assertEqual((to_push, unchanged), ([], []))
+        self.assertEqual([p for p, _ in invalid], [path])
+
+
+class FetchRemoteWorkflowsTests(unittest.TestCase):
+    def setUp(self):
+        # Keep the fetch's warnings out of the test output
+        devnull = open(os.devnull, "w")
+        self.addCleanup(devnull.close)
+        stdout, sys.stdout = sys.stdout, devnull
+        self.addCleanup(setattr, sys, "stdout", stdout)
+
+    def test_follows_cursor_pages(self):
+        other = dict(WORKFLOW, name="04 - Error Handler")
+        session = FakeSession([
+            FakeResponse(200, {"data": [remote_wf("a", WORKFLOW)], "nextCursor": "page2"}),
+            FakeResponse(200, {"data": [remote_wf("b", other)], "nextCursor": None}),
+        ])
+        remote = import_workflows.fetch_remote_workflows(session)
+        self.assertEqual(set(remote), {WORKFLOW["name"], other["name"]})
+        self.assertEqual(remote[other["name"]]["id"], "b")
+        self.assertEqual(remote[WORKFLOW["name"]]["hash"], import_workflows.workflow_hash(WORKFLOW))
+        self.assertEqual(session.calls[1]["cursor"], "page2")
+
+    def test_failed_later_page_returns_none(self):
+        session = FakeSession([
+            FakeResponse(200, {"data": [remote_wf("a", WORKFLOW)], "nextCursor": "page2"}),
+            FakeResponse(503),
+        ])
+        self.assertIsNone(import_workflows.fetch_remote_workflows(session))
+
+    def test_unauthorized_returns_none(self):
+        session = FakeSession([FakeResponse(401)])
+        self.assertIsNone(import_workflows.fetch_remote_workflows(session))
+
+
+if __name__ == "__main__":
+    unittest.main()
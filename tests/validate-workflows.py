@@ -11,18 +11,38 @@ Checks:
 5. Placeholder syntax for credentials
 6. No $env fallbacks in tool workflows
 7. Disabled nodes report
+
+Each workflow is parsed once and its node tree walked once; every check
+reads from the facts collected by that single traversal. Files are
+validated in parallel across a process pool and results are cached on disk,
+keyed by file content hash plus VALIDATOR_VERSION, so repeated runs only
+re-check files that changed.
+
+Usage:
+    python tests/validate-workflows.py [--jobs N] [--no-cache]
 """
 
+import argparse
+import hashlib
 import json
 import os
 import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 WORKFLOWS_DIR = Path(__file__).parent.parent / "workflows"
 MAIN_DIR = WORKFLOWS_DIR / "main"
 TOOLS_DIR = WORKFLOWS_DIR / "tools"
 SUB_DIR = WORKFLOWS_DIR / "sub"
+CACHE_FILE = Path(__file__).parent.parent / ".cache" / "validate-workflows.json"
+
+# Bump whenever a check changes so cached results are invalidated
+VALIDATOR_VERSION = "2"
+
+# Below this many files to (re)check, process startup costs more than it saves
+PARALLEL_MIN_FILES = 8
 
 FORBIDDEN_NODE_TYPES = [
     "n8n-nodes-base.googleCalendar",
@@ -42,10 +62,10 @@ ALLOWED_ENV_REFS = [
 
 
 class ValidationResult:
-    def __init__(self):
-        self.errors = []
-        self.warnings = []
-        self.info = []
+    def __init__(self, errors=None, warnings=None, info=None):
+        self.errors = list(errors or [])
+        self.warnings = list(warnings or [])
+        self.info = list(info or [])
 
     def error(self, file: str, msg: str):
         self.errors.append(f"ERROR [{file}]: {msg}")
@@ -56,19 +76,92 @@ class ValidationResult:
     def note(self, file: str, msg: str):
         self.info.append(f"INFO  [{file}]: {msg}")
 
+    def extend(self, other: "ValidationResult"):
+        self.errors.extend(other.errors)
+        self.warnings.extend(other.warnings)
+        self.info.extend(other.info)
+
+    def to_dict(self) -> Dict[str, List[str]]:
+        return {"errors": self.errors, "warnings": self.warnings, "info": self.info}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, List[str]]) -> "ValidationResult":
+        return cls(data.get("errors"), data.get("warnings"), data.get("info"))
+
     @property
     def ok(self):
         return len(self.errors) == 0
 
 
-def load_workflow(path: Path):
+class WorkflowFacts:
+    """Everything the checks need, collected in one pass over a workflow."""
+
+    def __init__(self):
+        self.nodes = []          # (name, type, node dict) per node
+        self.postgres_nodes = [] # (name, query, operation)
+        self.credentials = []    # (node name, credential type, credential id)
+        self.disabled_nodes = [] # (name, type)
+        self.env_refs = []       # context snippet around each $env. reference
+        self.settings = {}
+
+
+def load_workflow(raw: bytes):
     try:
-        with open(path) as f:
-            return json.load(f)
-    except json.JSONDecodeError as e:
+        return json.loads(raw)
+    except (json.JSONDecodeError, UnicodeDecodeError):
         return None
 
 
+def collect_env_refs(value, refs: List[str]):
+    """Walk a JSON value, recording the surroundings of every $env. hit.
+
+    The allowed-reference test needs ~50 chars before and ~80 after each
+    occurrence; finditer gives the position of the current match directly.
+    """
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            if "$env." not in item:
+                continue
+            for m in ENV_FALLBACK_PATTERN.finditer(item):
+                refs.append(item[max(0, m.start() - 50):m.start() + 80])
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+
+
+def scan_workflow(wf: dict) -> WorkflowFacts:
+    """Single traversal of the workflow feeding every check."""
+    facts = WorkflowFacts()
+    facts.settings = wf.get("settings", {}) or {}
+
+    for node in wf.get("nodes", []):
+        name = node.get("name")
+        node_type = node.get("type", "")
+        facts.nodes.append((name, node_type, node))
+
+        if node.get("disabled"):
+            facts.disabled_nodes.append((name, node_type))
+
+        for cred_type, cred_val in (node.get("credentials") or {}).items():
+            facts.credentials.append((name, cred_type, cred_val.get("id", "")))
+
+        params = node.get("parameters", {}) or {}
+        if "postgres" in node_type.lower():
+            facts.postgres_nodes.append(
+                (name, params.get("query", ""), params.get("operation"))
+            )
+
+        collect_env_refs(node, facts.env_refs)
+
+    for key, value in wf.items():
+        if key != "nodes":
+            collect_env_refs(value, facts.env_refs)
+    return facts
+
+
 def check_naming(path: Path, result: ValidationResult):
     """Check workflow file naming conventions."""
     name = path.stem
@@ -82,41 +175,33 @@ def check_naming(path: Path, result: ValidationResult):
             result.note(path.name, f"Tool workflow name does not end with '-tool': {name}")
 
 
-def check_forbidden_nodes(wf: dict, filename: str, result: ValidationResult):
+def check_forbidden_nodes(facts: WorkflowFacts, filename: str, result: ValidationResult):
     """Check for forbidden node types."""
-    for node in wf.get("nodes", []):
-        node_type = node.get("type", "")
+    for name, node_type, _ in facts.nodes:
         if node_type in FORBIDDEN_NODE_TYPES:
-            result.error(filename, f"Forbidden node type '{node_type}' in node '{node.get('name')}'")
+            result.error(filename, f"Forbidden node type '{node_type}' in node '{name}'")
 
 
-def check_tenant_id_in_sql(wf: dict, filename: str, result: ValidationResult):
+def check_tenant_id_in_sql(facts: WorkflowFacts, filename: str, result: ValidationResult):
     """Check that Postgres nodes include tenant_id in queries."""
-    for node in wf.get("nodes", []):
-        node_type = node.get("type", "")
-        if "postgres" not in node_type.lower():
-            continue
-
-        params = node.get("parameters", {})
-        query = params.get("query", "")
-
+    for node_name, query, operation in facts.postgres_nodes:
         # Skip nodes that don't run queries
-        if not query or params.get("operation") not in ("executeQuery", None):
+        if not query or operation not in ("executeQuery", None):
             continue
 
         # Check for tenant_id in query
-        if "tenant_id" not in query.lower() and "tenant" not in query.lower():
-            node_name = node.get("name", "unknown")
+        lowered = query.lower()
+        if "tenant_id" not in lowered and "tenant" not in lowered:
+            node_name = node_name or "unknown"
             # Skip system-level queries (e.g., cleanup functions)
-            if any(kw in query.lower() for kw in ["cleanup_expired", "release_conversation", "acquire_conversation", "enqueue_message"]):
+            if any(kw in lowered for kw in ["cleanup_expired", "release_conversation", "acquire_conversation", "enqueue_message"]):
                 continue
             result.warn(filename, f"Postgres node '{node_name}' query may be missing tenant_id filter")
 
 
-def check_error_workflow(wf: dict, filename: str, result: ValidationResult):
+def check_error_workflow(facts: WorkflowFacts, filename: str, result: ValidationResult):
     """Check that main workflows have errorWorkflow configured."""
-    settings = wf.get("settings", {})
-    error_wf = settings.get("errorWorkflow", "")
+    error_wf = facts.settings.get("errorWorkflow", "")
 
     if not error_wf:
         result.error(filename, "Missing settings.errorWorkflow")
@@ -124,100 +209,177 @@ def check_error_workflow(wf: dict, filename: str, result: ValidationResult):
         result.warn(filename, f"errorWorkflow may not point to canonical error handler: {error_wf}")
 
 
-def check_credentials(wf: dict, filename: str, result: ValidationResult):
+def check_credentials(facts: WorkflowFacts, filename: str, result: ValidationResult):
     """Check credential references use placeholder syntax."""
-    raw = json.dumps(wf)
-
-    # Check for raw credential IDs (16-char alphanumeric that aren't UUIDs)
-    for node in wf.get("nodes", []):
-        creds = node.get("credentials", {})
-        for cred_type, cred_val in creds.items():
-            cred_id = cred_val.get("id", "")
-            # Skip placeholders
-            if "{{" in cred_id and "}}" in cred_id:
-                continue
-            # Skip empty
-            if not cred_id:
-                continue
-            # Flag non-placeholder credential IDs
-            if re.match(r"^[A-Za-z0-9]{10,20}$", cred_id):
-                result.warn(filename, f"Credential '{cred_type}' in node '{node.get('name')}' has non-placeholder ID: {cred_id}")
+    for node_name, cred_type, cred_id in facts.credentials:
+        # Skip placeholders
+        if "{{" in cred_id and "}}" in cred_id:
+            continue
+        # Skip empty
+        if not cred_id:
+            continue
+        # Flag non-placeholder credential IDs
+        if re.match(r"^[A-Za-z0-9]{10,20}$", cred_id):
+            result.warn(filename, f"Credential '{cred_type}' in node '{node_name}' has non-placeholder ID: {cred_id}")
 
 
-def check_env_fallbacks(wf: dict, filename: str, result: ValidationResult):
+def check_env_fallbacks(facts: WorkflowFacts, filename: str, result: ValidationResult):
     """Check for $env fallbacks in tool workflows."""
-    raw = json.dumps(wf)
-
-    matches = ENV_FALLBACK_PATTERN.findall(raw)
-    for match in matches:
+    for context in facts.env_refs:
         # Check if this is an allowed $env reference
-        if any(allowed in raw[max(0, raw.index(match) - 50):raw.index(match) + 80] for allowed in ALLOWED_ENV_REFS):
+        if any(allowed in context for allowed in ALLOWED_ENV_REFS):
             continue
-        result.warn(filename, f"Found $env reference: ...{match}...")
+        result.warn(filename, "Found $env reference: ...$env....")
 
 
-def check_disabled_nodes(wf: dict, filename: str, result: ValidationResult):
+def check_disabled_nodes(facts: WorkflowFacts, filename: str, result: ValidationResult):
     """Report disabled nodes."""
-    for node in wf.get("nodes", []):
-        if node.get("disabled"):
-            result.note(filename, f"Disabled node: '{node.get('name')}' (type: {node.get('type')})")
+    for name, node_type in facts.disabled_nodes:
+        result.note(filename, f"Disabled node: '{name}' (type: {node_type})")
 
 
-def validate_file(path: Path, result: ValidationResult, is_main: bool = False, is_tool: bool = False):
-    """Validate a single workflow file."""
-    wf = load_workflow(path)
+def validate_source(path: Path, raw: bytes, is_main: bool = False, is_tool: bool = False) -> ValidationResult:
+    """Validate one workflow's bytes and return its own result."""
+    result = ValidationResult()
+    wf = load_workflow(raw)
     if wf is None:
         result.error(path.name, "Invalid JSON")
-        return
+        return result
 
     filename = path.name
+    facts = scan_workflow(wf)
 
     check_naming(path, result)
-    check_forbidden_nodes(wf, filename, result)
-    check_tenant_id_in_sql(wf, filename, result)
-    check_credentials(wf, filename, result)
-    check_disabled_nodes(wf, filename, result)
+    check_forbidden_nodes(facts, filename, result)
+    check_tenant_id_in_sql(facts, filename, result)
+    check_credentials(facts, filename, result)
+    check_disabled_nodes(facts, filename, result)
 
     if is_main:
         # Skip error handler itself for errorWorkflow check
         if "error-handler" not in filename:
-            check_error_workflow(wf, filename, result)
+            check_error_workflow(facts, filename, result)
 
     if is_tool:
-        check_env_fallbacks(wf, filename, result)
+        check_env_fallbacks(facts, filename, result)
+    return result
 
 
-def main():
-    result = ValidationResult()
-    files_checked = 0
+def validate_file(path: Path, result: ValidationResult, is_main: bool = False, is_tool: bool = False):
+    """Validate a single workflow file."""
+    result.extend(validate_source(path, path.read_bytes(), is_main, is_tool))
+
+
+def _validate_job(job: Tuple[str, bytes, bool, bool]) -> Dict[str, List[str]]:
+    """Process-pool entry point; results cross the process boundary as dicts."""
+    path, raw, is_main, is_tool = job
+    return validate_source(Path(path), raw, is_main, is_tool).to_dict()
+
+
+def cache_key(path: Path, raw: bytes, is_main: bool, is_tool: bool) -> str:
+    """Content hash plus everything else the result depends on."""
+    h = hashlib.sha256(raw)
+    h.update(f"\0{VALIDATOR_VERSION}\0{path.parent.name}/{path.name}\0{is_main}\0{is_tool}".encode())
+    return h.hexdigest()
 
-    print("=" * 60)
-    print("  n8n Workflow Validation")
-    print("=" * 60)
-    print()
+
+def load_cache(cache_file: Path) -> Dict[str, dict]:
+    try:
+        data = json.loads(cache_file.read_text())
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != VALIDATOR_VERSION:
+        return {}
+    return data.get("entries", {})
+
+
+def save_cache(cache_file: Path, entries: Dict[str, dict]):
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"version": VALIDATOR_VERSION, "entries": entries}))
+        os.replace(tmp, cache_file)
+    except OSError as e:
+        # A read-only checkout must still validate; it just won't be faster next time
+        print(f"  (could not write cache: {e})", file=sys.stderr)
+
+
+def discover_files() -> List[Tuple[Path, bool, bool]]:
+    """List (path, is_main, is_tool) in reporting order."""
+    files = []
 
     # Validate main workflows
     if MAIN_DIR.exists():
         for f in sorted(MAIN_DIR.glob("*.json")):
-            validate_file(f, result, is_main=True)
-            files_checked += 1
+            files.append((f, True, False))
 
     # Validate sub workflows
     if SUB_DIR.exists():
         for f in sorted(SUB_DIR.glob("*.json")):
-            validate_file(f, result)
-            files_checked += 1
+            files.append((f, False, False))
 
     # Validate tool workflows (recursive)
     if TOOLS_DIR.exists():
         for f in sorted(TOOLS_DIR.rglob("*.json")):
             if ".claude" in str(f):
                 continue
-            validate_file(f, result, is_tool=True)
-            files_checked += 1
+            files.append((f, False, True))
+    return files
+
+
+def validate_all(files: List[Tuple[Path, bool, bool]], jobs: int,
+                 cache_file: Optional[Path]) -> Tuple[ValidationResult, int]:
+    """Validate files, reusing cached results; returns (result, cache hits)."""
+    cache = load_cache(cache_file) if cache_file else {}
+    keys, per_file, pending = [], {}, []
+
+    for path, is_main, is_tool in files:
+        raw = path.read_bytes()
+        key = cache_key(path, raw, is_main, is_tool)
+        keys.append(key)
+        if key in cache:
+            per_file[key] = cache[key]
+        else:
+            pending.append((key, (str(path), raw, is_main, is_tool)))
+
+    if len(pending) >= PARALLEL_MIN_FILES and jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            outputs = pool.map(_validate_job, [job for _, job in pending], chunksize=4)
+            for (key, _), output in zip(pending, outputs):
+                per_file[key] = output
+    else:
+        for key, job in pending:
+            per_file[key] = _validate_job(job)
+
+    result = ValidationResult()
+    for key in keys:
+        result.extend(ValidationResult.from_dict(per_file[key]))
+
+    if cache_file and pending:
+        # Only keep entries for the current tree so the cache cannot grow forever
+        save_cache(cache_file, {key: per_file[key] for key in keys})
+    return result, len(files) - len(pending)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Validate n8n workflow JSON files")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignore and do not update the result cache")
+    args = parser.parse_args(argv)
+
+    print("=" * 60)
+    print("  n8n Workflow Validation")
+    print("=" * 60)
+    print()
+
+    files = discover_files()
+    result, cached = validate_all(files, args.jobs, None if args.no_cache else CACHE_FILE)
+    files_checked = len(files)
 
     # Print results
-    print(f"Files checked: {files_checked}")
+    print(f"Files checked: {files_checked} ({cached} cached)")
     print()
 
     if result.info: